@@ -243,7 +243,7 @@ class NNConfig(ConfigBase):
         # number of annots before a new multi-indexer is built
         # nn_cfg.max_subindexers = 2
         # nn_cfg.valid_index_methods = ['single', 'multi', 'name']
-        nn_cfg.valid_index_methods = ['single']
+        nn_cfg.valid_index_methods = ['single', 'incremental']
         nn_cfg.update(**kwargs)
 
     def make_feasible(nn_cfg):
@@ -297,6 +297,10 @@ class SpatialVerifyConfig(ConfigBase):
         sv_cfg.refine_method = 'homog'
         # weight feature scores with sver errors
         sv_cfg.weight_inliers = True
+        # number of workers used to verify shortlists (0 or 1 is serial)
+        sv_cfg.sver_workers = 0
+        # worker pool type: 'process' or 'thread'
+        sv_cfg.sver_parallel = 'process'
         sv_cfg.update(**kwargs)
 
     def get_cfgstr_list(sv_cfg, **kwargs):
@@ -930,6 +934,11 @@ class OtherConfig(ConfigBase):
         other_cfg.hots_batch_size = 256
         other_cfg.use_augmented_indexer = True
         other_cfg.show_shipped_imagesets = ut.is_developer()
+        # Cache decorated controller getters in memory. Only turn this on when
+        # a single controller writes to the database.
+        other_cfg.api_cache = False
+        # None uses --api-cache-maxbytes (64MB by default)
+        other_cfg.api_cache_maxbytes = None
         other_cfg.update(**kwargs)
 
 
@@ -3,10 +3,14 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import utool as ut
 import networkx as nx
 import itertools as it
+import random
 from wbia.algo.graph.nx_utils import edges_inside, e_
 
 print, rrr, profile = ut.inject2(__name__)
 
+# Treap priorities only need to be random, seed them for reproducible layouts
+_TREAP_RNG = random.Random(0)
+
 
 class GraphHelperMixin(ut.NiceRepr):
     def __nice__(self):
@@ -116,6 +120,435 @@ class nx_UnionFind(object):
                 self.parents[x] = x
 
 
+def _update(x):
+    """ recomputes the aggregate fields of a treap node from its children """
+    size = x.is_vertex
+    aflag = x.flag
+    vmin = x.key if size else None
+    left, right = x.left, x.right
+    if left is not None:
+        size += left.size
+        aflag |= left.aflag
+        if left.vmin is not None and (vmin is None or left.vmin < vmin):
+            vmin = left.vmin
+    if right is not None:
+        size += right.size
+        aflag |= right.aflag
+        if right.vmin is not None and (vmin is None or right.vmin < vmin):
+            vmin = right.vmin
+    x.size = size
+    x.aflag = aflag
+    x.vmin = vmin
+
+
+def _root(x):
+    while x.parent is not None:
+        x = x.parent
+    return x
+
+
+def _merge(a, b):
+    """ concatenates two treaps and returns the new root """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        a.right = _merge(a.right, b)
+        a.right.parent = a
+        _update(a)
+        return a
+    else:
+        b.left = _merge(a, b.left)
+        b.left.parent = b
+        _update(b)
+        return b
+
+
+def _split(x, before=True):
+    """
+    Splits the treap containing x into the sequence before and after x.
+    If before is True, x starts the right part, otherwise x ends the left part.
+    Works bottom up, so it only touches the path from x to the root.
+    """
+    if before:
+        left, right = x.left, x
+        x.left = None
+    else:
+        left, right = x, x.right
+        x.right = None
+    other = left if before else right
+    if other is not None:
+        other.parent = None
+    _update(x)
+    cur, parent = x, x.parent
+    while parent is not None:
+        grandparent = parent.parent
+        if parent.left is cur:
+            parent.left = right
+            if right is not None:
+                right.parent = parent
+            right = parent
+        else:
+            parent.right = left
+            if left is not None:
+                left.parent = parent
+            left = parent
+        _update(parent)
+        cur, parent = parent, grandparent
+    if left is not None:
+        left.parent = None
+    if right is not None:
+        right.parent = None
+    return left, right
+
+
+class _EulerTourNode(object):
+    """
+    A node in the treap representing an Euler tour. Vertex nodes are keyed by
+    the vertex, and each tree edge (u, v) has one node per direction.
+    """
+
+    __slots__ = (
+        'key',
+        'is_vertex',
+        'prio',
+        'left',
+        'right',
+        'parent',
+        'flag',
+        'aflag',
+        'size',
+        'vmin',
+    )
+
+    def __init__(self, key, is_vertex):
+        self.key = key
+        self.is_vertex = int(is_vertex)
+        self.prio = _TREAP_RNG.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.flag = 0
+        self.aflag = 0
+        self.size = self.is_vertex
+        self.vmin = key if is_vertex else None
+
+
+class EulerTourForest(object):
+    """
+    Spanning forest where each tree is stored as its Euler tour in a treap.
+
+    Link, cut, and connectivity queries are O(log(n)) expected. Each vertex
+    node carries a small bit flag that is aggregated over the treap, so the
+    vertices of a tree that have a flag set can be enumerated without visiting
+    the rest of the tree. Vertices are added lazily and a vertex without a
+    node is a singleton tree.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.graph.nx_dynamic_graph import *  # NOQA
+        >>> forest = EulerTourForest()
+        >>> forest.link(1, 2)
+        >>> forest.link(2, 3)
+        >>> forest.link(4, 5)
+        >>> assert forest.connected(1, 3) and not forest.connected(3, 4)
+        >>> assert forest.tree_size(1) == 3 and forest.tree_min(5) == 4
+        >>> forest.set_flag(3, 1, True)
+        >>> assert list(forest.flagged_vertices(1, 1)) == [3]
+        >>> forest.cut(2, 1)
+        >>> assert sorted(forest.tree_vertices(3)) == [2, 3]
+        >>> assert forest.tree_size(1) == 1 and forest.tree_min(3) == 2
+    """
+
+    def __init__(forest):
+        forest.vertex_nodes = {}
+        forest.edge_nodes = {}
+
+    def _vertex_node(forest, v):
+        node = forest.vertex_nodes.get(v)
+        if node is None:
+            node = forest.vertex_nodes[v] = _EulerTourNode(v, True)
+        return node
+
+    def _reroot(forest, v):
+        """ rotates the tour of v so it starts at v and returns its root """
+        left, right = _split(forest._vertex_node(v), before=True)
+        return _merge(right, left)
+
+    def remove_vertex(forest, v):
+        """ removes a vertex that is not incident to any tree edge """
+        forest.vertex_nodes.pop(v, None)
+
+    def connected(forest, u, v):
+        if u == v:
+            return True
+        node1 = forest.vertex_nodes.get(u)
+        node2 = forest.vertex_nodes.get(v)
+        if node1 is None or node2 is None:
+            return False
+        return _root(node1) is _root(node2)
+
+    def tree_size(forest, v):
+        """ number of vertices in the tree containing v """
+        node = forest.vertex_nodes.get(v)
+        return 1 if node is None else _root(node).size
+
+    def tree_min(forest, v):
+        """ smallest vertex in the tree containing v """
+        node = forest.vertex_nodes.get(v)
+        return v if node is None else _root(node).vmin
+
+    def link(forest, u, v):
+        """ joins the trees of u and v (which must be different) by edge (u, v) """
+        root1 = forest._reroot(u)
+        root2 = forest._reroot(v)
+        fwd = forest.edge_nodes[(u, v)] = _EulerTourNode((u, v), False)
+        rev = forest.edge_nodes[(v, u)] = _EulerTourNode((v, u), False)
+        _merge(_merge(_merge(root1, fwd), root2), rev)
+
+    def cut(forest, u, v):
+        """ removes tree edge (u, v), which splits its tree in two """
+        fwd = forest.edge_nodes.pop((u, v))
+        rev = forest.edge_nodes.pop((v, u))
+        # Rotate the tour so it starts with fwd. It then reads
+        # [fwd, <tour of v's side>, rev, <tour of u's side>]
+        left, right = _split(fwd, before=True)
+        _merge(right, left)
+        _split(rev, before=True)
+        _split(fwd, before=False)
+        _split(rev, before=False)
+
+    def set_flag(forest, v, bit, flag):
+        node = forest._vertex_node(v)
+        new = (node.flag | bit) if flag else (node.flag & ~bit)
+        if new != node.flag:
+            node.flag = new
+            # Only the flag aggregate changes, stop once it is unaffected
+            while node is not None:
+                aflag = node.flag
+                if node.left is not None:
+                    aflag |= node.left.aflag
+                if node.right is not None:
+                    aflag |= node.right.aflag
+                if aflag == node.aflag:
+                    break
+                node.aflag = aflag
+                node = node.parent
+
+    def flagged_vertices(forest, v, bit):
+        """ vertices in the tree of v that have the flag bit set """
+        node = forest.vertex_nodes.get(v)
+        if node is None:
+            return []
+        found = []
+        stack = [_root(node)]
+        while stack:
+            node = stack.pop()
+            if node.is_vertex and node.flag & bit:
+                found.append(node.key)
+            for child in (node.left, node.right):
+                if child is not None and child.aflag & bit:
+                    stack.append(child)
+        return found
+
+    def tree_vertices(forest, v):
+        """ all vertices in the tree containing v """
+        node = forest.vertex_nodes.get(v)
+        if node is None:
+            return [v]
+        found = []
+        stack = [_root(node)]
+        while stack:
+            node = stack.pop()
+            if node.is_vertex:
+                found.append(node.key)
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        return found
+
+
+class DynamicConnectivity(object):
+    """
+    Fully dynamic connectivity of Holm, de Lichtenberg, and Thorup.
+
+    Every edge has a level. The forest at level i is a spanning forest of the
+    edges with level >= i, and a tree at level i never has more than
+    n / 2 ** i vertices. When a tree edge is removed the smaller of the two
+    halves pushes its level-i edges one level up while it looks for a
+    replacement edge, which bounds the amortized cost of an update to
+    O(log(n) ** 2) treap operations.
+
+    References:
+        https://doi.org/10.1145/502090.502095
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.graph.nx_dynamic_graph import *  # NOQA
+        >>> conn = DynamicConnectivity()
+        >>> [conn.insert(u, v) for u, v in [(1, 2), (2, 3), (3, 1), (4, 5)]]
+        [True, True, False, True]
+        >>> assert conn.connected(1, 3) and not conn.connected(1, 4)
+        >>> conn.delete(1, 2)  # replaced by the non-tree edge (3, 1)
+        False
+        >>> assert conn.connected(1, 2)
+        >>> conn.delete(2, 3)
+        True
+        >>> assert not conn.connected(1, 2)
+    """
+
+    TREE = 1
+    NONTREE = 2
+
+    def __init__(conn):
+        conn.clear()
+
+    def clear(conn):
+        conn.forests = []
+        conn.tree_adj = []
+        conn.nontree_adj = []
+        conn.tree_level = {}
+        conn.nontree_level = {}
+        conn._ensure_level(0)
+
+    def _ensure_level(conn, level):
+        while len(conn.forests) <= level:
+            conn.forests.append(EulerTourForest())
+            conn.tree_adj.append({})
+            conn.nontree_adj.append({})
+
+    def _add_adj(conn, adj, bit, level, u, v):
+        conn._ensure_level(level)
+        level_adj = adj[level]
+        for a, b in ((u, v), (v, u)):
+            nbrs = level_adj.get(a)
+            if nbrs is None:
+                nbrs = level_adj[a] = set()
+                conn.forests[level].set_flag(a, bit, True)
+            nbrs.add(b)
+
+    def _remove_adj(conn, adj, bit, level, u, v):
+        level_adj = adj[level]
+        for a, b in ((u, v), (v, u)):
+            nbrs = level_adj[a]
+            nbrs.remove(b)
+            if not nbrs:
+                del level_adj[a]
+                conn.forests[level].set_flag(a, bit, False)
+
+    def connected(conn, u, v):
+        return conn.forests[0].connected(u, v)
+
+    def component_size(conn, v):
+        return conn.forests[0].tree_size(v)
+
+    def component_min(conn, v):
+        return conn.forests[0].tree_min(v)
+
+    def component_nodes(conn, v):
+        return conn.forests[0].tree_vertices(v)
+
+    def remove_vertex(conn, v):
+        """ removes a vertex after all of its edges have been deleted """
+        for forest in conn.forests:
+            forest.remove_vertex(v)
+
+    def insert(conn, u, v):
+        """
+        Adds edge (u, v). Returns True if it joined two components.
+        """
+        edge = e_(u, v)
+        if u == v or edge in conn.tree_level or edge in conn.nontree_level:
+            return False
+        if conn.forests[0].connected(u, v):
+            conn.nontree_level[edge] = 0
+            conn._add_adj(conn.nontree_adj, conn.NONTREE, 0, u, v)
+            return False
+        conn.tree_level[edge] = 0
+        conn._add_adj(conn.tree_adj, conn.TREE, 0, u, v)
+        conn.forests[0].link(u, v)
+        return True
+
+    def delete(conn, u, v):
+        """
+        Removes edge (u, v). Returns True if it split a component.
+        """
+        edge = e_(u, v)
+        level = conn.nontree_level.pop(edge, None)
+        if level is not None:
+            conn._remove_adj(conn.nontree_adj, conn.NONTREE, level, u, v)
+            return False
+        level = conn.tree_level.pop(edge, None)
+        if level is None:
+            return False
+        conn._remove_adj(conn.tree_adj, conn.TREE, level, u, v)
+        for forest in conn.forests[: level + 1]:
+            forest.cut(u, v)
+        for i in range(level, -1, -1):
+            if conn._replace(i, u, v):
+                return False
+        return True
+
+    def _replace(conn, i, u, v):
+        """
+        Looks for a level-i edge that reconnects the trees of u and v in the
+        level-i forest, moving searched edges of the smaller tree up a level.
+        """
+        forest = conn.forests[i]
+        if forest.tree_size(u) > forest.tree_size(v):
+            u, v = v, u
+        # The smaller tree is at most half as large, so its edges may move up
+        conn._ensure_level(i + 1)
+        for x in forest.flagged_vertices(u, conn.TREE):
+            for y in list(conn.tree_adj[i].get(x, ())):
+                conn.tree_level[e_(x, y)] = i + 1
+                conn._remove_adj(conn.tree_adj, conn.TREE, i, x, y)
+                conn._add_adj(conn.tree_adj, conn.TREE, i + 1, x, y)
+                conn.forests[i + 1].link(x, y)
+        root = _root(forest.vertex_nodes[u])
+        for x in forest.flagged_vertices(u, conn.NONTREE):
+            for y in list(conn.nontree_adj[i].get(x, ())):
+                edge = e_(x, y)
+                conn._remove_adj(conn.nontree_adj, conn.NONTREE, i, x, y)
+                if _root(forest.vertex_nodes[y]) is root:
+                    conn.nontree_level[edge] = i + 1
+                    conn._add_adj(conn.nontree_adj, conn.NONTREE, i + 1, x, y)
+                else:
+                    del conn.nontree_level[edge]
+                    conn.tree_level[edge] = i
+                    conn._add_adj(conn.tree_adj, conn.TREE, i, x, y)
+                    for forest_ in conn.forests[: i + 1]:
+                        forest_.link(x, y)
+                    return True
+        return False
+
+
+class _NodeLabels(object):
+    """
+    Read only mapping from a node to the label of its connected component
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, node):
+        cc = self.graph._node_to_cc.get(node)
+        if cc is None:
+            return node
+        return self.graph._cc_labels[id(cc)]
+
+    def __contains__(self, node):
+        return node in self.graph._node_to_cc
+
+    def __iter__(self):
+        return iter(self.graph._node_to_cc)
+
+    def __len__(self):
+        return len(self.graph._node_to_cc)
+
+
 class DynConnGraph(nx.Graph, GraphHelperMixin):
     """
     Dynamically connected graph.
@@ -131,7 +564,10 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
     * UnionFind2       |    n*     |    n     |  1
     * EulerTourForest  | lg^2(n)   | lg^2(n)  |  lg(n) / lglg(n) - - Ammortized
 
-    * it seems to be very quick
+    Connectivity is maintained by DynamicConnectivity (an Euler tour forest
+    per level). The node sets of each component are kept alongside it. Sets
+    are merged small into large, and a split only moves the nodes of the
+    smaller half. Each component is labeled by its smallest node.
 
     References:
         https://courses.csail.mit.edu/6.851/spring14/lectures/L20.pdf
@@ -168,15 +604,47 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
     """
 
     def __init__(self, *args, **kwargs):
-        # raise NotImplementedError('unfinished')
-        self._ccs = {}
-        self._union_find = nx_UnionFind()
+        self._init_connectivity()
         super(DynConnGraph, self).__init__(*args, **kwargs)
 
+    def _init_connectivity(self):
+        self._ccs = {}
+        self._node_to_cc = {}
+        self._cc_labels = {}
+        self._node_to_label = _NodeLabels(self)
+        self._conn = DynamicConnectivity()
+
+    def __getstate__(self):
+        # The component bookkeeping is keyed by object ids, so it is rebuilt
+        # from the graph instead of being pickled or deep copied
+        state = self.__dict__.copy()
+        for key in ['_ccs', '_node_to_cc', '_cc_labels', '_node_to_label', '_conn']:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.algo.graph.nx_dynamic_graph import *  # NOQA
+            >>> import copy
+            >>> self = DynConnGraph()
+            >>> self.add_edges_from([(1, 2), (2, 3), (4, 5), (6, 7), (7, 4)])
+            >>> other = copy.deepcopy(self)
+            >>> other.remove_edge(1, 2)
+            >>> assert other._ccs == {1: {1}, 2: {2, 3}, 4: {4, 5, 6, 7}}
+            >>> assert self._ccs == {1: {1, 2, 3}, 4: {4, 5, 6, 7}}
+        """
+        self.__dict__.update(state)
+        self._init_connectivity()
+        for n in self.nodes():
+            self._add_node(n)
+        for u, v in self.edges():
+            self._union(u, v)
+
     def clear(self):
         super(DynConnGraph, self).clear()
-        self._ccs = {}
-        self._union_find.clear()
+        self._init_connectivity()
 
     def __nice__(self):
         return 'nNodes={}, nEdges={}, nCCs={}'.format(
@@ -192,7 +660,7 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
     component_nodes = component
 
     def connected_to(self, node):
-        return self._ccs[self._union_find[node]]
+        return self._node_to_cc[node]
 
     def node_label(self, node):
         """
@@ -204,13 +672,13 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
             >>> assert self.node_label(2) == self.node_label(1)
             >>> assert self.node_label(2) != self.node_label(4)
         """
-        return self._union_find[node]
+        return self._node_to_label[node]
 
     def node_labels(self, *nodes):
-        return [self._union_find[node] for node in nodes]
+        return [self._node_to_label[node] for node in nodes]
 
     def are_nodes_connected(self, u, v):
-        return ut.allsame(self.node_labels(u, v))
+        return self._node_to_label[u] == self._node_to_label[v]
 
     def connected_components(self):
         """
@@ -234,49 +702,62 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
     # -----
 
     def _cut(self, u, v):
-        """ Decremental connectivity (slow) """
-        old_nid1 = self._union_find[u]
-        old_nid2 = self._union_find[v]
-        if old_nid1 != old_nid2:
+        """ Decremental connectivity (polylog) """
+        if not self._conn.delete(u, v):
             return
-        # Need to break appart entire component and then reconstruct it
-        old_cc = self._ccs[old_nid1]
-        del self._ccs[old_nid1]
-        self._union_find.remove_entire_cc(old_cc)
-        # Might be faster to just do DFS to find the CC
-        internal_edges = edges_inside(self, old_cc)
-        # Add nodes in case there are no edges to it
-        for n in old_cc:
-            self._add_node(n)
-        for edge in internal_edges:
-            self._union(*edge)
+        # Only the nodes of the smaller half change their component
+        if self._conn.component_size(u) > self._conn.component_size(v):
+            u, v = v, u
+        old_cc = self._node_to_cc[u]
+        old_label = self._cc_labels.pop(id(old_cc))
+        del self._ccs[old_label]
+        new_cc = set(self._conn.component_nodes(u))
+        old_cc.difference_update(new_cc)
+        for n in new_cc:
+            self._node_to_cc[n] = new_cc
+        if old_label in new_cc:
+            self._set_label(new_cc, old_label)
+            self._set_label(old_cc, self._conn.component_min(v))
+        else:
+            self._set_label(new_cc, min(new_cc))
+            self._set_label(old_cc, old_label)
 
     def _union(self, u, v):
         """ Incremental connectivity (fast) """
-        # print('Union ({})'.format((u, v)))
         self._add_node(u)
         self._add_node(v)
-        old_nid1 = self._union_find[u]
-        old_nid2 = self._union_find[v]
-        self._union_find.union(u, v)
-        new_nid = self._union_find[u]
-        for old_nid in [old_nid1, old_nid2]:
-            if new_nid != old_nid:
-                parts = self._ccs.pop(old_nid)
-                # FIXME: this step can be quite bad for time complexity.
-                # An Euler Tour Tree might solve the issue
-                self._ccs[new_nid].update(parts)
+        if not self._conn.insert(u, v):
+            return
+        cc1 = self._node_to_cc[u]
+        cc2 = self._node_to_cc[v]
+        if len(cc1) < len(cc2):
+            cc1, cc2 = cc2, cc1
+        label1 = self._cc_labels.pop(id(cc1))
+        label2 = self._cc_labels.pop(id(cc2))
+        del self._ccs[label1]
+        del self._ccs[label2]
+        # Merge the smaller set into the larger one
+        cc1.update(cc2)
+        for n in cc2:
+            self._node_to_cc[n] = cc1
+        self._set_label(cc1, min(label1, label2))
+
+    def _set_label(self, cc, label):
+        self._ccs[label] = cc
+        self._cc_labels[id(cc)] = label
 
     def _add_node(self, n):
-        if self._union_find.add_element(n):
-            # print('Add ({})'.format((n)))
-            self._ccs[n] = {n}
+        if n not in self._node_to_cc:
+            cc = {n}
+            self._node_to_cc[n] = cc
+            self._set_label(cc, n)
 
     def _remove_node(self, n):
-        if n in self._union_find.parents:
-            del self._union_find.weights[n]
-            del self._union_find.parents[n]
-            del self._ccs[n]
+        # Assumes all edges of n have already been removed
+        if n in self._node_to_cc:
+            cc = self._node_to_cc.pop(n)
+            del self._ccs[self._cc_labels.pop(id(cc))]
+            self._conn.remove_vertex(n)
 
     def add_edge(self, u, v, **attr):
         """
@@ -332,7 +813,6 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
     def remove_edges_from(self, ebunch):
         ebunch = list(ebunch)
         super(DynConnGraph, self).remove_edges_from(ebunch)
-        # Can do this more efficiently for bulk edges
         for e in ebunch:
             self._cut(*e)
 
@@ -388,6 +868,119 @@ class DynConnGraph(nx.Graph, GraphHelperMixin):
         return H
 
 
+def benchmark_dynconn_review(
+    num_annots=50000, num_cands=4, accuracy=0.95, seed=0, graph_cls=None
+):
+    r"""
+    Replays a simulated review session on the positive review graph.
+
+    Ground truth names are drawn with a few annotations each and every
+    annotation gets num_cands candidate edges, roughly half of them true
+    matches. A UserOracle reviews each candidate, positive decisions are
+    added to the graph and other decisions remove the edge, just like
+    AnnotInference._add_review_edge. The same connectivity queries the
+    inference makes are issued per review. A second pass fixes every
+    mistake the oracle made, which splits the names it wrongly merged.
+
+    CommandLine:
+        python -m wbia.algo.graph.nx_dynamic_graph benchmark_dynconn_review
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.graph.nx_dynamic_graph import *  # NOQA
+        >>> result = benchmark_dynconn_review()
+        >>> print(ut.repr3(result, precision=3))
+    """
+    from wbia.algo.graph.mixin_simulation import UserOracle
+    from wbia.algo.graph.state import POSTV, NEGTV
+
+    if graph_cls is None:
+        graph_cls = DynConnGraph
+
+    class _ReplaySession(object):
+        # The parts of AnnotInference the oracle looks at
+        def is_recovering(self):
+            return False
+
+        def print(self, *args, **kwargs):
+            pass
+
+    rng = random.Random(seed)
+    aid_to_nid = {}
+    nid_to_aids = {}
+    aid = 1
+    while aid <= num_annots:
+        size = min(int(rng.expovariate(1 / 4.0)) + 1, num_annots - aid + 1)
+        nid_to_aids[aid] = list(range(aid, aid + size))
+        for aid_ in nid_to_aids[aid]:
+            aid_to_nid[aid_] = aid
+        aid += size
+
+    cand_edges = set()
+    for aid1 in range(1, num_annots + 1):
+        same = nid_to_aids[aid_to_nid[aid1]]
+        for _ in range(num_cands):
+            if len(same) > 1 and rng.random() < 0.5:
+                aid2 = rng.choice(same)
+            else:
+                aid2 = rng.randint(1, num_annots)
+            if aid1 != aid2:
+                cand_edges.add(e_(aid1, aid2))
+    cand_edges = sorted(cand_edges)
+    rng.shuffle(cand_edges)
+    edge_truth = {
+        edge: POSTV if aid_to_nid[edge[0]] == aid_to_nid[edge[1]] else NEGTV
+        for edge in cand_edges
+    }
+
+    session = _ReplaySession()
+    oracle = UserOracle(accuracy, rng=seed)
+    pos_graph = graph_cls()
+    pos_graph.add_nodes_from(range(1, num_annots + 1))
+    counts = ut.ddict(int)
+
+    def review(edge, accuracy):
+        truth = edge_truth[edge]
+        decision = oracle.review(edge, truth, session, accuracy)['evidence_decision']
+        pos_graph.are_nodes_connected(*edge)
+        if decision == POSTV:
+            pos_graph.add_edge(*edge)
+            counts['add'] += 1
+        elif pos_graph.has_edge(*edge):
+            pos_graph.remove_edge(*edge)
+            counts['remove'] += 1
+        pos_graph.connected_to(edge[0])
+        return decision
+
+    mistakes = []
+    with ut.Timer(verbose=False) as t1:
+        for edge in cand_edges:
+            if review(edge, accuracy) != edge_truth[edge]:
+                mistakes.append(edge)
+    num_ccs_before = pos_graph.number_of_components()
+    biggest_before = max(len(cc) for cc in pos_graph.connected_components())
+    with ut.Timer(verbose=False) as t2:
+        for edge in mistakes:
+            review(edge, 1.0)
+
+    expected = {frozenset(cc) for cc in nx.connected_components(pos_graph)}
+    assert expected == {frozenset(cc) for cc in pos_graph.connected_components()}
+    result = ut.odict(
+        [
+            ('num_annots', num_annots),
+            ('num_reviews', len(cand_edges) + len(mistakes)),
+            ('num_add', counts['add']),
+            ('num_remove', counts['remove']),
+            ('biggest_cc_before_fix', biggest_before),
+            ('num_ccs_before_fix', num_ccs_before),
+            ('num_ccs_after_fix', pos_graph.number_of_components()),
+            ('review_seconds', t1.ellapsed),
+            ('fix_seconds', t2.ellapsed),
+        ]
+    )
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
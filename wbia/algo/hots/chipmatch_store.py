@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked columnar on-disk cache for ChipMatch query results.
+
+Instead of one pickle per query, the chipmatches of a query chunk are written
+to a single file. Every array attribute of a ChipMatch (daid_list, fm_list,
+fsv_list, ...) is concatenated over the whole chunk into one flat buffer and
+the per-query layout (offsets, shapes, list item lengths) is kept in a small
+json header. Loading reads the header and memory maps the file, so a cache
+hit costs one open per chunk and a chipmatch is only materialized (as views
+into the mapped buffers) when its qaid is requested.
+
+File layout::
+
+    MAGIC | uint64 header length | json header | padding | aligned buffers
+
+CommandLine:
+    python -m wbia.algo.hots.chipmatch_store --allexamples
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import struct
+import numpy as np
+import utool as ut
+import six
+from six.moves import cPickle as pickle
+from os.path import basename, exists, join
+from wbia.algo.hots import chip_match
+
+(print, rrr, profile) = ut.inject2(__name__)
+
+
+CHUNK_EXT = '.cmchunk'
+MAGIC = b'WBIACMC1'
+ALIGN = 64
+
+# Attributes rebuilt on load instead of being stored
+REEVALUATABLE_ATTRS = ['daid2_idx', 'nid2_nidx', 'name_groupxs']
+# Attributes stored in the json header
+SCALAR_ATTRS = ['qaid', 'qnid', 'fsv_col_lbls']
+# Attributes that map score names to arrays
+DICT_ATTRS = ['algo_annot_scores', 'algo_name_scores']
+# Attributes that hold a list (per filter) of lists (per daid) of arrays
+NESTED_ATTRS = ['filtnorm_aids', 'filtnorm_fxs']
+
+
+def _is_array(val):
+    return isinstance(val, np.ndarray) and val.dtype != object
+
+
+def _is_array_list(val):
+    if not isinstance(val, (list, tuple)):
+        return False
+    items = [item for item in val if item is not None]
+    if not all(_is_array(item) for item in items):
+        return False
+    # all items must share trailing dimensions
+    return len(set(item.shape[1:] for item in items)) <= 1 and all(
+        item.ndim > 0 for item in items
+    )
+
+
+def _to_jsonable(val):
+    if isinstance(val, np.generic):
+        return val.item()
+    if isinstance(val, (list, tuple)):
+        return [_to_jsonable(v) for v in val]
+    return val
+
+
+class _ChunkWriter(object):
+    """ accumulates the flat buffers of a chunk """
+
+    def __init__(self):
+        self.pieces = ut.ddict(list)
+        self.sizes = ut.ddict(int)
+
+    def add(self, key, arr):
+        arr = np.asarray(arr)
+        offset = self.sizes[key]
+        self.pieces[key].append(arr.ravel())
+        self.sizes[key] += arr.size
+        return offset
+
+    def encode_array(self, key, arr):
+        offset = self.add(key, arr)
+        return ['a', offset, list(arr.shape)]
+
+    def encode_list(self, key, arr_list):
+        lens = np.array(
+            [-1 if item is None else len(item) for item in arr_list], dtype=np.int64
+        )
+        items = [item for item in arr_list if item is not None]
+        trailing = list(items[0].shape[1:]) if len(items) > 0 else []
+        len_offset = self.add(key + '#lens', lens)
+        offset = self.sizes[key]
+        for item in items:
+            self.add(key, item)
+        return ['l', offset, len_offset, len(lens), trailing]
+
+    def encode_value(self, key, val):
+        """ returns a header spec or None if the value is not columnar """
+        if val is None:
+            return ['n']
+        if _is_array(val):
+            return self.encode_array(key, val)
+        if _is_array_list(val):
+            return self.encode_list(key, val)
+        return None
+
+    def buffers(self):
+        for key, pieces in self.pieces.items():
+            dtype = np.result_type(*[p.dtype for p in pieces])
+            if len(pieces) == 1:
+                yield key, pieces[0].astype(dtype, copy=False)
+            else:
+                yield key, np.concatenate(pieces).astype(dtype, copy=False)
+
+
+class ChipMatchChunk(ut.NiceRepr):
+    r"""
+    A single memory mapped file holding the chipmatches of a query chunk
+
+    Args:
+        fpath (str): path to the chunk file
+
+    CommandLine:
+        python -m wbia.algo.hots.chipmatch_store ChipMatchChunk
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.chipmatch_store import *  # NOQA
+        >>> from wbia.algo.hots import _pipeline_helpers as plh
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('PZ_MTEST', qaid_list=[18, 19])
+        >>> for cm in cm_list:
+        >>>     cm.score_name_nsum(qreq_)
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_cmstore')
+        >>> fpath = join(dpath, 'test' + CHUNK_EXT)
+        >>> chunk = ChipMatchChunk.write(fpath, cm_list)
+        >>> chunk2 = ChipMatchChunk(fpath)
+        >>> assert chunk2.qaids == [18, 19]
+        >>> cm2 = chunk2.load_chipmatch(19)
+        >>> assert cm2 == cm_list[1]
+        >>> assert np.all(cm2.fsv_list[0] == cm_list[1].fsv_list[0])
+        >>> assert np.all(cm2.get_annot_scores() == cm_list[1].get_annot_scores())
+        >>> ut.delete(fpath)
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self._header = None
+        self._mmap = None
+        self._qaid_to_qx = None
+
+    def __nice__(self):
+        return '%s nQ=%d' % (basename(self.fpath), len(self))
+
+    def __len__(self):
+        return len(self.header['queries'])
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = self._read_header()
+        return self._header
+
+    @property
+    def qaids(self):
+        return [query['qaid'] for query in self.header['queries']]
+
+    @property
+    def qauuids(self):
+        return [query['qauuid'] for query in self.header['queries']]
+
+    @property
+    def cfgstr(self):
+        return self.header.get('cfgstr')
+
+    def _read_header(self):
+        with open(self.fpath, 'rb') as file_:
+            magic = file_.read(len(MAGIC))
+            if magic != MAGIC:
+                raise IOError('not a chipmatch chunk: %r' % (self.fpath,))
+            (header_len,) = struct.unpack('<Q', file_.read(8))
+            header_bytes = file_.read(header_len)
+        if len(header_bytes) != header_len:
+            raise IOError('truncated chipmatch chunk: %r' % (self.fpath,))
+        return ut.from_json(header_bytes.decode('utf8'))
+
+    def _get_buffer(self, key):
+        if self._mmap is None:
+            # copy-on-write so chipmatch modifications never reach the file
+            self._mmap = np.memmap(self.fpath, dtype=np.uint8, mode='c')
+        info = self.header['buffers'][key]
+        dtype = np.dtype(info['dtype'])
+        start = self.header['data_offset'] + info['offset']
+        stop = start + info['size'] * dtype.itemsize
+        return self._mmap[start:stop].view(dtype)
+
+    def _decode_value(self, key, spec):
+        kind = spec[0]
+        if kind == 'n':
+            return None
+        elif kind == 'a':
+            _, offset, shape = spec
+            size = int(np.prod(shape))
+            return self._get_buffer(key)[offset : offset + size].reshape(shape)
+        elif kind == 'l':
+            _, offset, len_offset, num, trailing = spec
+            lens = self._get_buffer(key + '#lens')[len_offset : len_offset + num]
+            stride = int(np.prod(trailing))
+            items = []
+            if num > 0 and (lens >= 0).any():
+                flat = self._get_buffer(key)
+            for len_ in lens:
+                if len_ < 0:
+                    items.append(None)
+                else:
+                    size = int(len_) * stride
+                    items.append(flat[offset : offset + size].reshape([len_] + trailing))
+                    offset += size
+            return items
+        else:
+            raise ValueError('unknown chipmatch chunk spec %r' % (kind,))
+
+    def get_qx(self, qaid, qauuid=None):
+        if self._qaid_to_qx is None:
+            self._qaid_to_qx = {
+                (query['qaid'], query['qauuid']): qx
+                for qx, query in enumerate(self.header['queries'])
+            }
+            self._qaid_to_qx.update(
+                {query['qaid']: qx for qx, query in enumerate(self.header['queries'])}
+            )
+        key = qaid if qauuid is None else (qaid, six.text_type(qauuid))
+        return self._qaid_to_qx.get(key, None)
+
+    @profile
+    def load_chipmatch(self, qaid, qauuid=None):
+        """ materializes a single chipmatch from the mapped buffers """
+        qx = self.get_qx(qaid, qauuid)
+        if qx is None:
+            raise KeyError('qaid=%r is not in %s' % (qaid, self))
+        return self._load_qx(qx)
+
+    def _load_qx(self, qx):
+        query = self.header['queries'][qx]
+        state = {}
+        for attr in SCALAR_ATTRS:
+            state[attr] = query['scalars'].get(attr)
+        for attr, spec in query['fields'].items():
+            state[attr] = self._decode_value(attr, spec)
+        for attr, key_specs in query['dicts'].items():
+            state[attr] = {
+                key: self._decode_value(attr + '.' + key, spec)
+                for key, spec in key_specs.items()
+            }
+        for attr, filt_specs in query['nested'].items():
+            if filt_specs is None:
+                state[attr] = None
+            else:
+                state[attr] = [
+                    self._decode_value('%s.%d' % (attr, fx), spec)
+                    for fx, spec in enumerate(filt_specs)
+                ]
+        if query['extra'] is not None:
+            blob = self._decode_value('#extra', query['extra'])
+            state.update(pickle.loads(blob.tobytes()))
+        cm = chip_match.ChipMatch()
+        cm.__setstate__(state)
+        reeval = query['reeval']
+        if reeval.get('daid2_idx'):
+            cm._update_daid_index()
+        if reeval.get('nid2_nidx') and cm.dnid_list is not None:
+            cm._update_unique_nid_index()
+        return cm
+
+    def load_all(self):
+        return [self._load_qx(qx) for qx in range(len(self))]
+
+    @classmethod
+    @profile
+    def write(cls, fpath, cm_list, qauuid_list=None, cfgstr=None):
+        r"""
+        Writes a list of chipmatches into a new chunk file
+
+        Args:
+            fpath (str): destination of the chunk
+            cm_list (list): chipmatches to store
+            qauuid_list (list): query uuids used as part of the lookup key
+            cfgstr (str): config the results were computed with
+        """
+        if qauuid_list is None:
+            qauuid_list = [None] * len(cm_list)
+        writer = _ChunkWriter()
+        queries = []
+        for cm, qauuid in zip(cm_list, qauuid_list):
+            state = cm.__getstate__()
+            query = {
+                'qaid': _to_jsonable(cm.qaid),
+                'qauuid': None if qauuid is None else six.text_type(qauuid),
+                'scalars': {},
+                'fields': {},
+                'dicts': {},
+                'nested': {},
+                'reeval': {},
+                'extra': None,
+            }
+            extra = {}
+            for attr, val in state.items():
+                if attr in REEVALUATABLE_ATTRS:
+                    query['reeval'][attr] = val is not None
+                elif attr in SCALAR_ATTRS:
+                    query['scalars'][attr] = _to_jsonable(val)
+                elif attr in DICT_ATTRS and isinstance(val, dict):
+                    key_specs = {}
+                    for key, subval in val.items():
+                        spec = writer.encode_value(attr + '.' + key, subval)
+                        if spec is None:
+                            extra.setdefault(attr, {})[key] = subval
+                        else:
+                            key_specs[key] = spec
+                    query['dicts'][attr] = key_specs
+                elif attr in NESTED_ATTRS and (val is None or isinstance(val, list)):
+                    if val is None:
+                        query['nested'][attr] = None
+                        continue
+                    filt_specs = [
+                        writer.encode_value('%s.%d' % (attr, fx), subval)
+                        for fx, subval in enumerate(val)
+                    ]
+                    if any(spec is None for spec in filt_specs):
+                        extra[attr] = val
+                    else:
+                        query['nested'][attr] = filt_specs
+                else:
+                    spec = writer.encode_value(attr, val)
+                    if spec is None:
+                        extra[attr] = val
+                    else:
+                        query['fields'][attr] = spec
+            if len(extra) > 0:
+                blob = np.frombuffer(
+                    pickle.dumps(extra, protocol=pickle.HIGHEST_PROTOCOL), np.uint8
+                )
+                query['extra'] = writer.encode_array('#extra', blob)
+            queries.append(query)
+
+        # Lay out the buffers at aligned offsets
+        buffer_infos = {}
+        buffer_list = []
+        offset = 0
+        for key, arr in writer.buffers():
+            buffer_infos[key] = {'dtype': arr.dtype.str, 'offset': offset, 'size': arr.size}
+            buffer_list.append((offset, arr))
+            offset += -(-arr.nbytes // ALIGN) * ALIGN
+        header = {
+            'cfgstr': cfgstr,
+            'queries': queries,
+            'buffers': buffer_infos,
+            'data_offset': 0,
+        }
+        # The data offset is part of the header, so grow it until it fits
+        header_bytes = ut.to_json(header).encode('utf8')
+        while True:
+            prefix_len = len(MAGIC) + 8 + len(header_bytes)
+            data_offset = -(-prefix_len // ALIGN) * ALIGN
+            if header['data_offset'] == data_offset:
+                break
+            header['data_offset'] = data_offset
+            header_bytes = ut.to_json(header).encode('utf8')
+
+        dpath = os.path.dirname(fpath)
+        if dpath:
+            ut.ensuredir(dpath)
+        tmp_fpath = '%s.%d.tmp' % (fpath, os.getpid())
+        with open(tmp_fpath, 'wb') as file_:
+            file_.write(MAGIC)
+            file_.write(struct.pack('<Q', len(header_bytes)))
+            file_.write(header_bytes)
+            for buf_offset, arr in buffer_list:
+                file_.seek(data_offset + buf_offset)
+                file_.write(np.ascontiguousarray(arr).tobytes())
+            file_.truncate(data_offset + offset)
+        os.rename(tmp_fpath, fpath)
+        return cls(fpath)
+
+
+class ChipMatchStore(ut.NiceRepr):
+    r"""
+    Directory of chipmatch chunks computed with the same config
+
+    Each call to save writes one chunk, named after the queries it holds, and
+    records it in a json manifest that maps each qaid to the qauuid and chunk
+    of its latest result. Loading reads the manifest and only opens the chunks
+    that hold the requested chipmatches. Chunks that no longer hold the latest
+    result of any query are deleted when they are superseded.
+
+    Args:
+        dpath (str): query result directory
+        cfgstr (str): config of the stored results
+
+    CommandLine:
+        python -m wbia.algo.hots.chipmatch_store ChipMatchStore
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.chipmatch_store import *  # NOQA
+        >>> from wbia.algo.hots import _pipeline_helpers as plh
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('PZ_MTEST', qaid_list=[18, 19, 20])
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_cmstore')
+        >>> store = ChipMatchStore(dpath, 'test_cfgstr')
+        >>> store.delete()
+        >>> qauuids = list(qreq_.get_qreq_pcc_uuids([18, 19, 20]))
+        >>> store.save(cm_list[0:2], qauuids[0:2])
+        >>> store.save(cm_list[2:3], qauuids[2:3])
+        >>> qaid2_cm = store.load([18, 19, 20, 21], qauuids + [None])
+        >>> assert sorted(qaid2_cm.keys()) == [18, 19, 20]
+        >>> assert all(qaid2_cm[cm.qaid] == cm for cm in cm_list)
+        >>> print(store)
+        <ChipMatchStore(nChunks=2)>
+        >>> # Saving a query again supersedes its old result
+        >>> new_cm = cm_list[0].take_annots([0])
+        >>> store.save([new_cm], qauuids[0:1])
+        >>> assert store.load([18], qauuids[0:1])[18] == new_cm
+        >>> assert store.load([19], qauuids[1:2])[19] == cm_list[1]
+        >>> # Repeated saves do not pile up chunks
+        >>> for _ in range(3):
+        >>>     store.save(cm_list[0:2], qauuids[0:2])
+        >>> assert store.load([18], qauuids[0:1])[18] == cm_list[0]
+        >>> assert len(store.get_chunk_fpaths()) == 2
+        >>> store.delete()
+    """
+
+    prefix = 'cmstore'
+    manifest_fname = 'manifest.json'
+
+    def __init__(self, dpath, cfgstr):
+        self.cfgstr = cfgstr
+        self.dpath = join(dpath, '%s_%s' % (self.prefix, ut.hashstr27(cfgstr)))
+
+    def __nice__(self):
+        return 'nChunks=%d' % (len(self.get_chunks()),)
+
+    def get_chunk_fpaths(self):
+        if not exists(self.dpath):
+            return []
+        return sorted(ut.glob(self.dpath, '*' + CHUNK_EXT))
+
+    def get_manifest_fpath(self):
+        return join(self.dpath, self.manifest_fname)
+
+    def read_manifest(self):
+        """
+        Returns:
+            dict: maps str(qaid) to [qauuid, chunk fname] of its latest result
+        """
+        fpath = self.get_manifest_fpath()
+        if exists(fpath):
+            try:
+                return ut.from_json(ut.read_from(fpath, verbose=False))
+            except ValueError as ex:
+                ut.printex(ex, 'rebuilding chipmatch manifest', iswarning=True)
+        return self._rebuild_manifest()
+
+    def _rebuild_manifest(self):
+        """ indexes the existing chunks, newer chunks win """
+        manifest = {}
+        for fpath in sorted(self.get_chunk_fpaths(), key=os.path.getmtime):
+            chunk = ChipMatchChunk(fpath)
+            try:
+                if chunk.cfgstr != self.cfgstr:
+                    continue
+                for qaid, qauuid in zip(chunk.qaids, chunk.qauuids):
+                    manifest[six.text_type(qaid)] = [qauuid, basename(fpath)]
+            except (IOError, ValueError) as ex:
+                ut.printex(ex, 'skipping unreadable chipmatch chunk', iswarning=True)
+        return manifest
+
+    def _write_manifest(self, manifest):
+        ut.ensuredir(self.dpath)
+        fpath = self.get_manifest_fpath()
+        tmp_fpath = '%s.%d.tmp' % (fpath, os.getpid())
+        ut.write_to(tmp_fpath, ut.to_json(manifest), verbose=False)
+        os.rename(tmp_fpath, fpath)
+
+    def get_chunks(self):
+        """ chunks that hold the latest result of at least one query """
+        fnames = sorted(set(fname for _, fname in self.read_manifest().values()))
+        return [ChipMatchChunk(join(self.dpath, fname)) for fname in fnames]
+
+    @profile
+    def load(self, qaid_list, qauuid_list=None, verbose=False):
+        r"""
+        Returns:
+            dict: qaid2_cm - the chipmatches found in the store
+        """
+        if qauuid_list is None:
+            qauuid_list = [None] * len(qaid_list)
+        manifest = self.read_manifest()
+        # Group the wanted results by the chunk that holds them
+        fname_to_keys = ut.ddict(list)
+        for qaid, qauuid in zip(qaid_list, qauuid_list):
+            entry = manifest.get(six.text_type(qaid))
+            if entry is None:
+                continue
+            stored_qauuid, fname = entry
+            if qauuid is not None and six.text_type(qauuid) != stored_qauuid:
+                continue
+            fname_to_keys[fname].append((qaid, stored_qauuid))
+        qaid2_cm = {}
+        for fname, keys in fname_to_keys.items():
+            chunk = ChipMatchChunk(join(self.dpath, fname))
+            try:
+                if chunk.cfgstr != self.cfgstr:
+                    # Guard against hash collisions
+                    continue
+                for qaid, qauuid in keys:
+                    qaid2_cm[qaid] = chunk.load_chipmatch(qaid, qauuid)
+            except (IOError, KeyError, ValueError) as ex:
+                ut.printex(ex, 'skipping unreadable chipmatch chunk', iswarning=True)
+        if verbose:
+            print(
+                '[cmstore] loaded %d / %d chipmatches' % (len(qaid2_cm), len(qaid_list))
+            )
+        return qaid2_cm
+
+    def save(self, cm_list, qauuid_list=None):
+        if qauuid_list is None:
+            qauuid_list = [None] * len(cm_list)
+        keys = [
+            (six.text_type(cm.qaid), None if qauuid is None else six.text_type(qauuid))
+            for cm, qauuid in zip(cm_list, qauuid_list)
+        ]
+        # Saving the same queries again replaces their chunk
+        fname = 'chunk_%s%s' % (ut.hashstr27(ut.repr2(keys)), CHUNK_EXT)
+        fpath = join(self.dpath, fname)
+        chunk = ChipMatchChunk.write(fpath, cm_list, qauuid_list, cfgstr=self.cfgstr)
+        old_manifest = self.read_manifest()
+        manifest = old_manifest.copy()
+        for qaid, qauuid in keys:
+            manifest[qaid] = [qauuid, fname]
+        self._write_manifest(manifest)
+        # Remove chunks whose results have all been superseded
+        old_fnames = set(fname_ for _, fname_ in old_manifest.values())
+        live_fnames = set(fname_ for _, fname_ in manifest.values())
+        for fname_ in old_fnames - live_fnames:
+            ut.delete(join(self.dpath, fname_), verbose=False)
+        return chunk
+
+    def delete(self):
+        for fpath in self.get_chunk_fpaths():
+            ut.delete(fpath, verbose=False)
+        if exists(self.get_manifest_fpath()):
+            ut.delete(self.get_manifest_fpath(), verbose=False)
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m wbia.algo.hots.chipmatch_store
+        python -m wbia.algo.hots.chipmatch_store --allexamples
+    """
+    import multiprocessing
+
+    multiprocessing.freeze_support()  # for win32
+    ut.doctest_funcs()
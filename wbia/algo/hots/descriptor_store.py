@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+On disk, memory mappable storage for the support data of a NeighborIndex.
+
+The stacked descriptors (idx2_vec) and their inverted index sidecars
+(idx2_ax, idx2_fx, idx2_fgw) are written once, one annotation at a time, into
+contiguous .npy files keyed by the nnindex cfgstr. Loading maps the files
+copy-on-write, so building an indexer never materializes a second stacked copy
+of the descriptors and every process that maps the same store shares the same
+physical pages.
+
+CommandLine:
+    python -m wbia.algo.hots.descriptor_store --allexamples
+"""
+from __future__ import absolute_import, division, print_function
+import os
+import numpy as np
+import utool as ut
+from os.path import exists, join
+from six.moves import zip
+
+(print, rrr, profile) = ut.inject2(__name__)
+
+
+class DescriptorStore(ut.NiceRepr):
+    r"""
+    Append-only descriptor store for one nnindex cfgstr
+
+    Files are written to temporary paths and renamed into place. The json
+    metadata file is written last and marks the store as complete, so a reader
+    never maps a partially written store.
+
+    Args:
+        dpath (str): directory of the store (usually the flann cachedir)
+        cfgstr (str): nnindex cfgstr that uniquely identifies the support data
+
+    CommandLine:
+        python -m wbia.algo.hots.descriptor_store DescriptorStore
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.descriptor_store import *  # NOQA
+        >>> from wbia.algo.hots.neighbor_index import invert_index
+        >>> rng = np.random.RandomState(0)
+        >>> aid_list = [1, 2, 3, 4]
+        >>> nFeat_list = [3, 0, 4, 1]
+        >>> vecs_list = [rng.randint(0, 255, (n, 16)).astype(np.uint8) for n in nFeat_list]
+        >>> fgws_list = [rng.rand(n).astype(np.float32) for n in nFeat_list]
+        >>> fxs_list = [np.arange(n) for n in nFeat_list]
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_descriptor_store')
+        >>> store = DescriptorStore(dpath, 'test_cfgstr')
+        >>> store.delete()
+        >>> assert not store.exists()
+        >>> store.write(aid_list, vecs_list, fgws_list, fxs_list, verbose=False)
+        >>> assert store.exists()
+        >>> data = store.load()
+        >>> tup = invert_index(vecs_list, fgws_list, np.arange(4), fxs_list, verbose=False)
+        >>> assert np.all(data['idx2_vec'] == tup[0])
+        >>> assert np.all(data['idx2_fgw'] == tup[1])
+        >>> assert np.all(data['idx2_ax'] == tup[2])
+        >>> assert np.all(data['idx2_fx'] == tup[3])
+        >>> assert np.all(data['ax2_aid'] == aid_list)
+        >>> assert isinstance(data['idx2_vec'], np.memmap)
+        >>> print(store)
+        <DescriptorStore(nVecs=8, nAnnots=4)>
+        >>> store.delete()
+        >>> store.write_arrays(np.array(aid_list), *tup)
+        >>> data2 = store.load()
+        >>> assert all(np.all(data[key] == data2[key]) for key in data.keys())
+        >>> store.delete()
+    """
+
+    prefix = 'nnstore'
+    array_keys = ['idx2_vec', 'idx2_fgw', 'idx2_ax', 'idx2_fx', 'ax2_aid']
+
+    def __init__(self, dpath, cfgstr):
+        self.dpath = dpath
+        self.cfgstr = cfgstr
+        self.hashid = ut.hashstr27(cfgstr)
+        self._meta = None
+
+    def __nice__(self):
+        meta = self.get_meta()
+        if meta is None:
+            return 'missing'
+        return 'nVecs=%d, nAnnots=%d' % (meta['num_vecs'], meta['num_annots'])
+
+    def get_fpath(self, key):
+        fname = '%s_%s_%s.npy' % (self.prefix, self.hashid, key)
+        return join(self.dpath, fname)
+
+    def get_meta_fpath(self):
+        fname = '%s_%s_meta.json' % (self.prefix, self.hashid)
+        return join(self.dpath, fname)
+
+    def get_meta(self):
+        if self._meta is None and exists(self.get_meta_fpath()):
+            meta = ut.from_json(ut.read_from(self.get_meta_fpath(), verbose=False))
+            # Guard against hash collisions
+            if meta.get('cfgstr') == self.cfgstr:
+                self._meta = meta
+        return self._meta
+
+    def exists(self):
+        meta = self.get_meta()
+        if meta is None:
+            return False
+        return all(exists(self.get_fpath(key)) for key in meta['keys'])
+
+    def delete(self):
+        self._meta = None
+        ut.delete(self.get_meta_fpath(), verbose=False)
+        for key in self.array_keys:
+            ut.delete(self.get_fpath(key), verbose=False)
+
+    @profile
+    def write(self, aid_list, vecs_list, fgws_list, fxs_list, verbose=ut.NOT_QUIET):
+        r"""
+        Streams the support data of each annotation into the store without
+        stacking it in memory first. The layout is the same as invert_index.
+
+        Args:
+            aid_list (list): indexed annotation ids
+            vecs_list (list): descriptors for each annotation
+            fgws_list (list): foreground weights for each annotation or None
+            fxs_list (list): feature indices for each annotation
+        """
+        nFeat_list = np.array([len(vecs) for vecs in vecs_list], dtype=np.int64)
+        num_vecs = int(nFeat_list.sum())
+        assert num_vecs > 0, 'cannot store support data without features'
+        first_ax = np.nonzero(nFeat_list)[0][0]
+        has_fgw = fgws_list is not None
+        if verbose:
+            print(
+                '[nnstore] writing %d vecs from %d annots to %s'
+                % (num_vecs, len(aid_list), ut.path_ndir_split(self.dpath, n=2))
+            )
+        ut.ensuredir(self.dpath)
+        vec_shape = (num_vecs,) + vecs_list[first_ax].shape[1:]
+        shapes = {
+            'idx2_vec': (vec_shape, vecs_list[first_ax].dtype),
+            'idx2_ax': ((num_vecs,), np.int32),
+            'idx2_fx': ((num_vecs,), np.int32),
+        }
+        if has_fgw:
+            shapes['idx2_fgw'] = ((num_vecs,), np.asarray(fgws_list[first_ax]).dtype)
+        tmp_fpaths = {key: self._get_tmp_fpath(key) for key in shapes}
+        arrs = {
+            key: np.lib.format.open_memmap(
+                tmp_fpaths[key], mode='w+', dtype=dtype, shape=shape
+            )
+            for key, (shape, dtype) in shapes.items()
+        }
+        offsets = np.zeros(len(nFeat_list) + 1, dtype=np.int64)
+        np.cumsum(nFeat_list, out=offsets[1:])
+        for ax, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+            if start == stop:
+                continue
+            arrs['idx2_vec'][start:stop] = vecs_list[ax]
+            arrs['idx2_ax'][start:stop] = ax
+            arrs['idx2_fx'][start:stop] = fxs_list[ax]
+            if has_fgw:
+                arrs['idx2_fgw'][start:stop] = fgws_list[ax]
+        for arr in arrs.values():
+            arr.flush()
+        del arrs
+        tmp_fpaths['ax2_aid'] = self._get_tmp_fpath('ax2_aid')
+        np.save(tmp_fpaths['ax2_aid'], np.array(aid_list))
+        self._commit(tmp_fpaths, num_vecs, len(aid_list))
+
+    def write_arrays(self, ax2_aid, idx2_vec, idx2_fgw, idx2_ax, idx2_fx):
+        """
+        Writes support data that is already stacked (e.g. a compacted indexer)
+        """
+        arrays = {
+            'ax2_aid': ax2_aid,
+            'idx2_vec': idx2_vec,
+            'idx2_fgw': idx2_fgw,
+            'idx2_ax': idx2_ax,
+            'idx2_fx': idx2_fx,
+        }
+        ut.ensuredir(self.dpath)
+        tmp_fpaths = {}
+        for key, arr in arrays.items():
+            if arr is not None:
+                tmp_fpaths[key] = self._get_tmp_fpath(key)
+                np.save(tmp_fpaths[key], arr)
+        self._commit(tmp_fpaths, len(idx2_vec), len(ax2_aid))
+
+    def _get_tmp_fpath(self, key):
+        # np.save appends .npy to paths that do not already end with it
+        return '%s.%d.tmp.npy' % (self.get_fpath(key), os.getpid())
+
+    def _commit(self, tmp_fpaths, num_vecs, num_annots):
+        """ moves written files into place and marks the store complete """
+        for key, tmp_fpath in tmp_fpaths.items():
+            os.rename(tmp_fpath, self.get_fpath(key))
+        meta = {
+            'cfgstr': self.cfgstr,
+            'keys': sorted(tmp_fpaths.keys()),
+            'num_vecs': num_vecs,
+            'num_annots': num_annots,
+        }
+        meta_tmp = '%s.%d.tmp' % (self.get_meta_fpath(), os.getpid())
+        ut.write_to(meta_tmp, ut.to_json(meta), verbose=False)
+        os.rename(meta_tmp, self.get_meta_fpath())
+        self._meta = meta
+
+    @profile
+    def load(self, mmap_mode='c'):
+        r"""
+        Maps the stored arrays.
+
+        The default copy-on-write mode shares pages between processes while
+        still allowing in-place edits (e.g. NeighborIndex.remove_support),
+        which only ever touch private copies of the modified pages.
+
+        Returns:
+            dict: idx2_vec, idx2_fgw (or None), idx2_ax, idx2_fx, ax2_aid
+        """
+        meta = self.get_meta()
+        if meta is None:
+            raise IOError('descriptor store does not exist: %s' % (self.cfgstr,))
+        data = {}
+        for key in self.array_keys:
+            if key not in meta['keys']:
+                data[key] = None
+            elif key == 'ax2_aid':
+                # small and frequently modified, keep a private copy
+                data[key] = np.load(self.get_fpath(key))
+            else:
+                data[key] = np.load(self.get_fpath(key), mmap_mode=mmap_mode)
+        return data
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m wbia.algo.hots.descriptor_store
+        python -m wbia.algo.hots.descriptor_store --allexamples
+    """
+    import multiprocessing
+
+    multiprocessing.freeze_support()  # for win32
+    ut.doctest_funcs()
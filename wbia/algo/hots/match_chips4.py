@@ -7,6 +7,7 @@ import ubelt as ub
 import utool as ut
 from os.path import exists
 from wbia.algo.hots import chip_match
+from wbia.algo.hots import chipmatch_store
 from wbia.algo.hots import pipeline
 
 (print, rrr, profile) = ut.inject2(__name__)
@@ -28,6 +29,8 @@ USE_SUPERCACHE = (
     and ut.USE_CACHE
 )
 SAVE_CACHE = not ut.get_argflag('--nocache-save')
+# Cache chipmatches in chunked columnar files instead of one pickle per query
+USE_CHIPMATCH_STORE = not ut.get_argflag('--cpkl-qcache')
 # MIN_BIGCACHE_BUNDLE = 20
 # MIN_BIGCACHE_BUNDLE = 150
 MIN_BIGCACHE_BUNDLE = 64
@@ -107,16 +110,14 @@ def submit_query_request(
         # Do not use bigcache single queries
         is_big = len(qreq_.qaids) > MIN_BIGCACHE_BUNDLE
         use_bigcache_ = use_bigcache and use_cache and is_big
-        if use_bigcache_ or save_qcache:
-            cacher = qreq_.get_big_cacher()
-            if use_bigcache_:
-                try:
-                    qaid2_cm = cacher.load()
-                    cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
-                except (IOError, AttributeError):
-                    pass
-                else:
-                    return cm_list
+        if use_bigcache_:
+            try:
+                qaid2_cm = load_bigcache(qreq_)
+                cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
+            except (IOError, AttributeError):
+                pass
+            else:
+                return cm_list
         # ------------
         # Execute query request
         qaid2_cm = execute_query_and_save_L1(
@@ -129,12 +130,41 @@ def submit_query_request(
         )
         # ------------
         if save_qcache and is_big:
-            cacher.save(qaid2_cm)
+            save_bigcache(qreq_, qaid2_cm)
 
         cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
     return cm_list
 
 
+def load_bigcache(qreq_):
+    """
+    Loads the chipmatches of an entire query request. Raises IOError on a miss.
+    """
+    if not USE_CHIPMATCH_STORE:
+        return qreq_.get_big_cacher().load()
+    chunk = qreq_.get_bigcache_chunk()
+    if not exists(chunk.fpath):
+        raise IOError('bigcache miss')
+    try:
+        if chunk.cfgstr != qreq_.get_full_cfgstr():
+            raise IOError('bigcache cfgstr mismatch')
+        qaid2_cm = {qaid: chunk.load_chipmatch(qaid) for qaid in qreq_.qaids}
+    except (KeyError, ValueError) as ex:
+        raise IOError('bad bigcache: %s' % (ex,))
+    return qaid2_cm
+
+
+def save_bigcache(qreq_, qaid2_cm):
+    if not USE_CHIPMATCH_STORE:
+        qreq_.get_big_cacher().save(qaid2_cm)
+        return
+    chunk = qreq_.get_bigcache_chunk()
+    cm_list = [qaid2_cm[qaid] for qaid in qreq_.qaids]
+    chipmatch_store.ChipMatchChunk.write(
+        chunk.fpath, cm_list, cfgstr=qreq_.get_full_cfgstr()
+    )
+
+
 @profile
 def execute_query_and_save_L1(
     qreq_,
@@ -222,20 +252,17 @@ def execute_query_and_save_L1(
         >>> qaid2_cm = execute_query_and_save_L1(qreq_, use_cache,
         >>>                                      save_qcache, verbose,
         >>>                                      batch_size=3)
-        >>> cm = qaid2_cm[1]
-        >>> ut.delete(cm.get_fpath(qreq_))
-        >>> cm = qaid2_cm[4]
-        >>> ut.delete(cm.get_fpath(qreq_))
-        >>> cm = qaid2_cm[5]
-        >>> ut.delete(cm.get_fpath(qreq_))
-        >>> cm = qaid2_cm[6]
-        >>> ut.delete(cm.get_fpath(qreq_))
+        >>> # Remove the chunk holding queries 4, 5, and 6
+        >>> store = qreq_.get_chipmatch_store()
+        >>> for chunk in store.get_chunks():
+        >>>     if 4 in chunk.qaids:
+        >>>         ut.delete(chunk.fpath)
         >>> print('Re-execute')
         >>> qaid2_cm_ = execute_query_and_save_L1(qreq_, use_cache,
         >>>                                       save_qcache, verbose,
         >>>                                       batch_size=3)
         >>> assert all([qaid2_cm_[qaid] == qaid2_cm[qaid] for qaid in qreq_.qaids])
-        >>> [ut.delete(fpath) for fpath in qreq_.get_chipmatch_fpaths(qreq_.qaids)]
+        >>> store.delete()
 
     Ignore:
         other = cm_ = qaid2_cm_[qaid]
@@ -246,6 +273,7 @@ def execute_query_and_save_L1(
         fpath_list = ut.glob('%s/*_cm_supercache_*' % (dpath,))
         for fpath in fpath_list:
             ut.delete(fpath)
+        qreq_.get_chipmatch_store(super_qres_cache=True).delete()
 
     if use_cache:
         if verbose:
@@ -253,54 +281,13 @@ def execute_query_and_save_L1(
         if use_supercache:
             print('[mc4] supercache-query is on')
         # Try loading as many cached results as possible
-        qaid2_cm_hit = {}
         external_qaids = qreq_.qaids
-        fpath_list = list(
-            qreq_.get_chipmatch_fpaths(external_qaids, super_qres_cache=use_supercache)
-        )
-        exists_flags = [exists(fpath) for fpath in fpath_list]
-        qaids_hit = ut.compress(external_qaids, exists_flags)
-        fpaths_hit = ut.compress(fpath_list, exists_flags)
-        fpath_iter = ut.ProgIter(
-            fpaths_hit,
-            length=len(fpaths_hit),
-            enabled=len(fpaths_hit) > 1,
-            label='loading cache hits',
-            adjust=True,
-            freq=1,
-        )
-        try:
-            cm_hit_list = [
-                chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
-                for fpath in fpath_iter
-            ]
-            assert all(
-                [qaid == cm.qaid for qaid, cm in zip(qaids_hit, cm_hit_list)]
-            ), 'inconsistent qaid and cm.qaid'
-            qaid2_cm_hit = {cm.qaid: cm for cm in cm_hit_list}
-        except chip_match.NeedRecomputeError:
-            print('NeedRecomputeError: Some cached chips need to recompute')
-            fpath_iter = ut.ProgIter(
-                fpaths_hit,
-                length=len(fpaths_hit),
-                enabled=len(fpaths_hit) > 1,
-                label='checking chipmatch cache',
-                adjust=True,
-                freq=1,
-            )
-            # Recompute those that fail loading
-            qaid2_cm_hit = {}
-            for fpath in fpath_iter:
-                try:
-                    cm = chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
-                except chip_match.NeedRecomputeError:
-                    pass
-                else:
-                    qaid2_cm_hit[cm.qaid] = cm
-            print(
-                '%d / %d cached matches need to be recomputed'
-                % (len(qaids_hit) - len(qaid2_cm_hit), len(qaids_hit))
-            )
+        if USE_CHIPMATCH_STORE:
+            store = qreq_.get_chipmatch_store(super_qres_cache=use_supercache)
+            qauuid_list = list(qreq_.get_qreq_pcc_uuids(external_qaids))
+            qaid2_cm_hit = store.load(external_qaids, qauuid_list)
+        else:
+            qaid2_cm_hit = load_cpkl_cache_hits(qreq_, external_qaids, use_supercache)
         if len(qaid2_cm_hit) == len(external_qaids):
             return qaid2_cm_hit
         else:
@@ -324,6 +311,59 @@ def execute_query_and_save_L1(
     return qaid2_cm
 
 
+def load_cpkl_cache_hits(qreq_, external_qaids, use_supercache):
+    """
+    Loads the per-query pickled chipmatches (used with --cpkl-qcache)
+    """
+    fpath_list = list(
+        qreq_.get_chipmatch_fpaths(external_qaids, super_qres_cache=use_supercache)
+    )
+    exists_flags = [exists(fpath) for fpath in fpath_list]
+    qaids_hit = ut.compress(external_qaids, exists_flags)
+    fpaths_hit = ut.compress(fpath_list, exists_flags)
+    fpath_iter = ut.ProgIter(
+        fpaths_hit,
+        length=len(fpaths_hit),
+        enabled=len(fpaths_hit) > 1,
+        label='loading cache hits',
+        adjust=True,
+        freq=1,
+    )
+    try:
+        cm_hit_list = [
+            chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
+            for fpath in fpath_iter
+        ]
+        assert all(
+            [qaid == cm.qaid for qaid, cm in zip(qaids_hit, cm_hit_list)]
+        ), 'inconsistent qaid and cm.qaid'
+        qaid2_cm_hit = {cm.qaid: cm for cm in cm_hit_list}
+    except chip_match.NeedRecomputeError:
+        print('NeedRecomputeError: Some cached chips need to recompute')
+        fpath_iter = ut.ProgIter(
+            fpaths_hit,
+            length=len(fpaths_hit),
+            enabled=len(fpaths_hit) > 1,
+            label='checking chipmatch cache',
+            adjust=True,
+            freq=1,
+        )
+        # Recompute those that fail loading
+        qaid2_cm_hit = {}
+        for fpath in fpath_iter:
+            try:
+                cm = chip_match.ChipMatch.load_from_fpath(fpath, verbose=False)
+            except chip_match.NeedRecomputeError:
+                pass
+            else:
+                qaid2_cm_hit[cm.qaid] = cm
+        print(
+            '%d / %d cached matches need to be recomputed'
+            % (len(qaids_hit) - len(qaid2_cm_hit), len(qaids_hit))
+        )
+    return qaid2_cm_hit
+
+
 @profile
 def execute_query2(qreq_, verbose, save_qcache, batch_size=None, use_supercache=False):
     """
@@ -374,7 +414,11 @@ def execute_query2(qreq_, verbose, save_qcache, batch_size=None, use_supercache=
         assert all(
             [qaid == cm.qaid for qaid, cm in zip(sub_qreq_.qaids, sub_cm_list)]
         ), 'not corresonding'
-        if save_qcache:
+        if save_qcache and USE_CHIPMATCH_STORE:
+            store = qreq_.get_chipmatch_store(super_qres_cache=use_supercache)
+            qauuid_list = list(qreq_.get_qreq_pcc_uuids(sub_qreq_.qaids))
+            store.save(sub_cm_list, qauuid_list)
+        elif save_qcache:
             fpath_list = list(
                 qreq_.get_chipmatch_fpaths(
                     sub_qreq_.qaids, super_qres_cache=use_supercache
@@ -7,6 +7,7 @@ multi_index.py as well
 https://github.com/spotify/annoy
 """
 from __future__ import absolute_import, division, print_function
+import os
 import six
 import numpy as np
 import utool as ut
@@ -15,7 +16,7 @@ from vtool._pyflann_backend import pyflann as pyflann
 
 # import itertools as it
 # import lockfile
-from os.path import basename
+from os.path import basename, exists
 from six.moves import range, zip, map  # NOQA
 from wbia.algo.hots import hstypes
 from wbia.algo.hots import _pipeline_helpers as plh  # NOQA
@@ -25,6 +26,8 @@ from wbia.algo.hots import _pipeline_helpers as plh  # NOQA
 USE_HOTSPOTTER_CACHE = not ut.get_argflag('--nocache-hs')
 NOSAVE_FLANN = ut.get_argflag('--nosave-flann')
 NOCACHE_FLANN = ut.get_argflag('--nocache-flann') and USE_HOTSPOTTER_CACHE
+# Maximum number of stacked query descriptors sent to FLANN in a single call
+KNN_MANY_CHUNKSIZE = ut.get_argval('--knn-chunksize', type_=int, default=2 ** 16)
 
 
 def get_support_data(qreq_, daid_list):
@@ -99,6 +102,70 @@ def get_support_data(qreq_, daid_list):
     return vecs_list, fgws_list, fxs_list
 
 
+def group_query_chunks(qvecs_list, key_list, chunksize=KNN_MANY_CHUNKSIZE):
+    r"""
+    Groups queries that share the same search parameters into chunks that can
+    be stacked into a single contiguous buffer.
+
+    Args:
+        qvecs_list (list): query descriptors for each query
+        key_list (list): hashable search parameters (e.g. K) for each query
+        chunksize (int): maximum number of stacked descriptors per chunk.
+            A chunk always contains at least one query.
+
+    Yields:
+        tuple: (key, qx_list) the shared key and the indices of the queries in
+            the chunk. Queries without descriptors are skipped.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+        >>> qvecs_list = [np.zeros((n, 2)) for n in [3, 0, 4, 1, 2]]
+        >>> key_list = [2, 2, 2, 3, 2]
+        >>> chunks = list(group_query_chunks(qvecs_list, key_list, chunksize=5))
+        >>> result = ut.repr2(chunks, nl=0)
+        >>> print(result)
+        [(2, [0]), (2, [2]), (2, [4]), (3, [3])]
+        >>> chunks = list(group_query_chunks(qvecs_list, key_list, chunksize=10))
+        >>> print(ut.repr2(chunks, nl=0))
+        [(2, [0, 2, 4]), (3, [3])]
+    """
+    key_to_qxs = ut.group_items(range(len(qvecs_list)), key_list)
+    for key in sorted(key_to_qxs.keys()):
+        chunk_qxs = []
+        chunk_size = 0
+        for qx in key_to_qxs[key]:
+            num = len(qvecs_list[qx])
+            if num == 0:
+                continue
+            if len(chunk_qxs) > 0 and chunk_size + num > chunksize:
+                yield key, chunk_qxs
+                chunk_qxs = []
+                chunk_size = 0
+            chunk_qxs.append(qx)
+            chunk_size += num
+        if len(chunk_qxs) > 0:
+            yield key, chunk_qxs
+
+
+def stack_query_chunk(qvecs_list, chunk_qxs):
+    """
+    Stacks the descriptors of a chunk of queries into one contiguous buffer
+
+    Returns:
+        tuple: (qvecs_stack, offsets) where the descriptors of the i-th query
+            in the chunk are ``qvecs_stack[offsets[i]:offsets[i + 1]]``
+    """
+    nvecs_list = [len(qvecs_list[qx]) for qx in chunk_qxs]
+    offsets = np.zeros(len(chunk_qxs) + 1, dtype=np.int64)
+    np.cumsum(nvecs_list, out=offsets[1:])
+    first = qvecs_list[chunk_qxs[0]]
+    qvecs_stack = np.empty((offsets[-1],) + first.shape[1:], dtype=first.dtype)
+    for qx, start, stop in zip(chunk_qxs, offsets[:-1], offsets[1:]):
+        qvecs_stack[start:stop] = qvecs_list[qx]
+    return qvecs_stack, offsets
+
+
 def invert_index(vecs_list, fgws_list, ax_list, fxs_list, verbose=ut.NOT_QUIET):
     r"""
     Aggregates descriptors of input annotations and returns inverted information
@@ -240,6 +307,7 @@ class NeighborIndex(object):
         nnindexer.num_indexed = None
         nnindexer.flann_fpath = None
         nnindexer.max_distance_sqrd = None  # max possible distance^2 for normalization
+        nnindexer._ax2_nvecs = None  # (A x 1) Number of vectors of each annot
 
     def init_support(indexer, aid_list, vecs_list, fgws_list, fxs_list, verbose=True):
         r"""
@@ -264,7 +332,29 @@ class NeighborIndex(object):
         idx2_vec, idx2_fgw, idx2_ax, idx2_fx = tup
 
         ax2_aid = np.array(aid_list)
+        indexer._set_support(ax2_aid, idx2_vec, idx2_fgw, idx2_ax, idx2_fx)
+
+    def init_support_from_store(indexer, store, verbose=True):
+        r"""
+        Maps prestacked support data from a DescriptorStore instead of
+        inverting the per-annotation data in memory.
 
+        Args:
+            store (DescriptorStore): a complete store for this indexer's cfgstr
+        """
+        assert indexer.flann is None, 'already initalized'
+        if verbose:
+            print('[nnindex] Mapping support data from %s' % (store,))
+        data = store.load()
+        indexer._set_support(
+            data['ax2_aid'],
+            data['idx2_vec'],
+            data['idx2_fgw'],
+            data['idx2_ax'],
+            data['idx2_fx'],
+        )
+
+    def _set_support(indexer, ax2_aid, idx2_vec, idx2_fgw, idx2_ax, idx2_fx):
         indexer.flann = pyflann.FLANN()  # Approximate search structure
         indexer.ax2_aid = ax2_aid  # (A x 1) Mapping to original annot ids
         indexer.idx2_vec = idx2_vec  # (M x D) Descriptors to index
@@ -273,6 +363,7 @@ class NeighborIndex(object):
         indexer.idx2_fx = idx2_fx  # (M x 1) Index into the annot's features
         indexer.aid2_ax = ut.make_index_lookup(indexer.ax2_aid)
         indexer.num_indexed = indexer.idx2_vec.shape[0]
+        indexer._ax2_nvecs = None
         if indexer.idx2_vec.dtype == hstypes.VEC_TYPE:
             # these are sift descriptors
             indexer.max_distance_sqrd = hstypes.VEC_PSEUDO_MAX_DISTANCE_SQRD
@@ -434,7 +525,18 @@ class NeighborIndex(object):
         nAnnots = nnindexer.num_indexed_annots()
         nVecs = nnindexer.num_indexed_vecs()
         nNewAnnots = len(new_daid_list)
-        new_ax_list = np.arange(nAnnots, nAnnots + nNewAnnots)
+        # New annotations are appended after every existing ax, including the
+        # tombstoned ones left behind by remove_support
+        nAxs = len(nnindexer.ax2_aid)
+        new_ax_list = np.arange(nAxs, nAxs + nNewAnnots)
+        if nnindexer._ax2_nvecs is not None:
+            new_nvecs = np.array(list(map(len, new_vecs_list)), dtype=np.int64)
+            nnindexer._ax2_nvecs = np.hstack((nnindexer._ax2_nvecs, new_nvecs))
+        if sum(map(len, new_vecs_list)) == 0:
+            # Nothing to give to flann, but the annotations are still indexed
+            nnindexer.ax2_aid = np.hstack((nnindexer.ax2_aid, new_daid_list))
+            nnindexer.aid2_ax = ut.make_index_lookup(nnindexer.ax2_aid)
+            return
         tup = invert_index(
             new_vecs_list, new_fgws_list, new_ax_list, new_fxs_list, verbose=verbose
         )
@@ -471,6 +573,7 @@ class NeighborIndex(object):
         nnindexer.aid2_ax = ut.make_index_lookup(nnindexer.ax2_aid)
         if nnindexer.idx2_fgw is not None:
             nnindexer.idx2_fgw = _idx2_fgw
+        nnindexer.num_indexed = nnindexer.idx2_vec.shape[0]
         # nnindexer.idx2_kpts   = None
         # nnindexer.idx2_oris   = None
         # Add new points to flann structure
@@ -816,7 +919,7 @@ class NeighborIndex(object):
             (qfx2_idx, qfx2_dist) = indexer.empty_neighbors(0, K)
         else:
             # hack to try and make things a little bit faster
-            invalid_axs = np.array(ut.take(indexer.aid2_ax, impossible_aids))
+            invalid_axs = indexer.get_invalid_axs(impossible_aids)
             # pad += (len(invalid_axs) * 2)
 
             def get_neighbors(vecs, temp_K):
@@ -848,6 +951,161 @@ class NeighborIndex(object):
                 qfx2_dist = qfx2_raw_dist
         return qfx2_idx, qfx2_dist
 
+    @profile
+    def knn_many(indexer, qvecs_list, K_list, chunksize=KNN_MANY_CHUNKSIZE):
+        r"""
+        Batched version of `knn` for many query annotations.
+
+        Descriptors of queries with the same K are stacked into one contiguous
+        buffer and searched with a single FLANN call per chunk.  The results
+        are split back per query as views into the chunk results.  Each query
+        gets exactly the neighbors it would get from `knn`.
+
+        Args:
+            qvecs_list (list): of (N_i x D) query descriptor arrays
+            K_list (list): number of neighbors to find for each query
+            chunksize (int): maximum number of stacked descriptors per call
+
+        Returns:
+            list: of (qfx2_idx, qfx2_dist) tuples, one per query
+
+        CommandLine:
+            python -m wbia.algo.hots.neighbor_index knn_many
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+            >>> import wbia
+            >>> qreq_ = wbia.testdata_qreq_(defaultdb='testdb1', a='default')
+            >>> qreq_.load_indexer()
+            >>> indexer = qreq_.indexer
+            >>> qvecs_list = qreq_.internal_qannots.vecs[0:4]
+            >>> K_list = [3, 3, 4, 3]
+            >>> idx_dist_list = indexer.knn_many(qvecs_list, K_list, chunksize=2000)
+            >>> for qfx2_vec, K, (idxs, dists) in zip(qvecs_list, K_list, idx_dist_list):
+            >>>     idxs1, dists1 = indexer.knn(qfx2_vec, K)
+            >>>     assert np.all(idxs == idxs1)
+            >>>     assert np.all(dists == dists1)
+        """
+        idx_dist_list = [None] * len(qvecs_list)
+        for K, chunk_qxs in group_query_chunks(qvecs_list, K_list, chunksize):
+            qvecs_stack, offsets = stack_query_chunk(qvecs_list, chunk_qxs)
+            (idxs, dists) = indexer.knn(qvecs_stack, K)
+            for qx, start, stop in zip(chunk_qxs, offsets[:-1], offsets[1:]):
+                idx_dist_list[qx] = (idxs[start:stop], dists[start:stop])
+        # Queries without any descriptors are not stacked
+        for qx, idx_dist in enumerate(idx_dist_list):
+            if idx_dist is None:
+                idx_dist_list[qx] = indexer.knn(qvecs_list[qx], K_list[qx])
+        return idx_dist_list
+
+    @profile
+    def requery_knn_many(
+        indexer,
+        qvecs_list,
+        K_list,
+        pad_list,
+        impossible_aids_list,
+        recover=True,
+        chunksize=KNN_MANY_CHUNKSIZE,
+    ):
+        r"""
+        Batched version of `requery_knn` for many query annotations.
+
+        Queries with the same K and pad are stacked and requeried together.
+        Each stacked descriptor remembers which query it came from, so only
+        the impossible aids of its own query are rejected.
+
+        Args:
+            qvecs_list (list): of (N_i x D) query descriptor arrays
+            K_list (list): number of valid neighbors to find for each query
+            pad_list (list): initial padding for each query
+            impossible_aids_list (list): aids that each query may not match
+            recover (bool): see `requery_knn`
+            chunksize (int): maximum number of stacked descriptors per call
+
+        Returns:
+            list: of (qfx2_idx, qfx2_dist) tuples, one per query
+
+        CommandLine:
+            python -m wbia.algo.hots.neighbor_index requery_knn_many
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+            >>> import wbia
+            >>> qreq_ = wbia.testdata_qreq_(defaultdb='testdb1', a='default')
+            >>> qreq_.load_indexer()
+            >>> indexer = qreq_.indexer
+            >>> qannots = qreq_.internal_qannots[0:3]
+            >>> qvecs_list = qannots.vecs
+            >>> K_list = [3, 3, 3]
+            >>> pad_list = [1, 1, 2]
+            >>> impossible_aids_list = [np.array([1, 2, 3]), np.array([4, 5]), np.array([1])]
+            >>> idx_dist_list = indexer.requery_knn_many(
+            >>>     qvecs_list, K_list, pad_list, impossible_aids_list)
+            >>> zipped = zip(qvecs_list, K_list, pad_list, impossible_aids_list, idx_dist_list)
+            >>> for qfx2_vec, K, pad, impossible_aids, (idxs, dists) in zipped:
+            >>>     idxs1, dists1 = indexer.requery_knn(qfx2_vec, K, pad, impossible_aids)
+            >>>     assert np.all(idxs == idxs1)
+            >>>     assert np.all(dists == dists1)
+        """
+        from wbia.algo.hots import requery_knn
+
+        idx_dist_list = [None] * len(qvecs_list)
+        key_list = list(zip(K_list, pad_list))
+        for (K, pad), chunk_qxs in group_query_chunks(qvecs_list, key_list, chunksize):
+            if K == 0 or K > indexer.num_indexed:
+                # Degenerate cases are handled by the unbatched path below
+                continue
+            qvecs_stack, offsets = stack_query_chunk(qvecs_list, chunk_qxs)
+            # Remember which query in the chunk each stacked descriptor came from
+            qfx2_groupx = np.repeat(np.arange(len(chunk_qxs)), np.diff(offsets))
+            invalid_axs_list = [
+                indexer.get_invalid_axs(impossible_aids_list[qx]) for qx in chunk_qxs
+            ]
+
+            def get_neighbors(vecs, temp_K):
+                return indexer.flann.nn_index(
+                    vecs, temp_K, checks=indexer.checks, cores=indexer.cores
+                )
+
+            get_axs = indexer.get_nn_axs
+            try:
+                (idxs, raw_dists) = requery_knn.requery_knn(
+                    get_neighbors,
+                    get_axs,
+                    qvecs_stack,
+                    num_neighbs=K,
+                    pad=pad,
+                    invalid_axs=invalid_axs_list,
+                    limit=3,
+                    recover=recover,
+                    qfx2_groupx=qfx2_groupx,
+                )
+            except pyflann.FLANNException as ex:
+                ut.printex(
+                    ex,
+                    'probably misread the cached flann_fpath=%r' % (indexer.flann_fpath,),
+                )
+                raise
+            if indexer.max_distance_sqrd is not None:
+                dists = np.divide(raw_dists, indexer.max_distance_sqrd)
+            else:
+                dists = raw_dists
+            for qx, start, stop in zip(chunk_qxs, offsets[:-1], offsets[1:]):
+                idx_dist_list[qx] = (idxs[start:stop], dists[start:stop])
+        for qx, idx_dist in enumerate(idx_dist_list):
+            if idx_dist is None:
+                idx_dist_list[qx] = indexer.requery_knn(
+                    qvecs_list[qx],
+                    K_list[qx],
+                    pad_list[qx],
+                    impossible_aids_list[qx],
+                    recover=recover,
+                )
+        return idx_dist_list
+
     def batch_knn(indexer, vecs, K, chunksize=4096, label='batch knn'):
         """
         Works like `indexer.knn` but the input is split into batches and
@@ -895,6 +1153,31 @@ class NeighborIndex(object):
     def get_indexed_aids(nnindexer):
         return nnindexer.ax2_aid[nnindexer.ax2_aid != -1]
 
+    def get_nbytes(nnindexer):
+        r"""
+        Estimates the resident memory of this indexer in bytes: the support
+        arrays plus the memory reported by the FLANN index. If FLANN cannot
+        report its usage the size of the saved index file is used instead.
+        """
+        support_arrs = [
+            nnindexer.idx2_vec,
+            nnindexer.idx2_fgw,
+            nnindexer.idx2_ax,
+            nnindexer.idx2_fx,
+            nnindexer.ax2_aid,
+        ]
+        nbytes = sum(arr.nbytes for arr in support_arrs if arr is not None)
+        flann_nbytes = 0
+        if nnindexer.flann is not None:
+            try:
+                flann_nbytes = int(nnindexer.flann.used_memory())
+            except Exception:
+                flann_nbytes = 0
+        if flann_nbytes == 0 and nnindexer.flann_fpath is not None:
+            if exists(nnindexer.flann_fpath):
+                flann_nbytes = os.path.getsize(nnindexer.flann_fpath)
+        return nbytes + flann_nbytes
+
     def get_indexed_vecs(nnindexer):
         valid_idxs = nnindexer.ax2_aid[nnindexer.idx2_ax] != -1
         valid_idx2_vec = nnindexer.idx2_vec.compress(valid_idxs, axis=0)
@@ -909,6 +1192,79 @@ class NeighborIndex(object):
         invalid_idxs = np.nonzero(nnindexer.ax2_aid[nnindexer.idx2_ax] == -1)[0]
         return invalid_idxs
 
+    def get_tombstone_axs(nnindexer):
+        """ axs of annotations removed by remove_support """
+        return np.nonzero(nnindexer.ax2_aid == -1)[0]
+
+    def get_ax2_nvecs(nnindexer):
+        """ number of indexed vectors of each ax (cached) """
+        if nnindexer._ax2_nvecs is None:
+            nnindexer._ax2_nvecs = np.bincount(
+                nnindexer.idx2_ax, minlength=len(nnindexer.ax2_aid)
+            ).astype(np.int64)
+        return nnindexer._ax2_nvecs
+
+    def get_tombstone_ratio(nnindexer):
+        """ fraction of the indexed vectors that belong to removed annotations """
+        ax2_nvecs = nnindexer.get_ax2_nvecs()
+        num_vecs = ax2_nvecs.sum()
+        if num_vecs == 0:
+            return 0.0
+        num_removed = ax2_nvecs.take(nnindexer.get_tombstone_axs()).sum()
+        return num_removed / float(num_vecs)
+
+    def get_invalid_axs(nnindexer, impossible_aids):
+        """
+        axs that a requery must skip: the impossible aids that are indexed and
+        every tombstoned annotation.
+        """
+        aid2_ax = nnindexer.aid2_ax
+        invalid_axs = [aid2_ax[aid] for aid in impossible_aids if aid in aid2_ax]
+        tombstone_axs = nnindexer.get_tombstone_axs()
+        if len(tombstone_axs) > 0:
+            invalid_axs = np.union1d(invalid_axs, tombstone_axs).astype(np.int64)
+        return np.array(invalid_axs)
+
+    def compacted(nnindexer):
+        r"""
+        Returns a new unbuilt indexer containing only the live support data.
+        Tombstoned vectors are dropped and the remaining axs are renumbered.
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+            >>> rng = np.random.RandomState(0)
+            >>> nFeat_list = [3, 2, 4]
+            >>> vecs_list = [rng.randint(0, 255, (n, 8)).astype(np.uint8) for n in nFeat_list]
+            >>> fxs_list = [np.arange(n) for n in nFeat_list]
+            >>> nnindexer = NeighborIndex(None, 'test')
+            >>> nnindexer.init_support([7, 8, 9], vecs_list, None, fxs_list, verbose=False)
+            >>> nnindexer.ax2_aid[1] = -1
+            >>> assert np.isclose(nnindexer.get_tombstone_ratio(), 2 / 9.)
+            >>> compact = nnindexer.compacted()
+            >>> assert compact.ax2_aid.tolist() == [7, 9]
+            >>> assert compact.idx2_ax.tolist() == [0, 0, 0, 1, 1, 1, 1]
+            >>> assert compact.idx2_fx.tolist() == [0, 1, 2, 0, 1, 2, 3]
+            >>> assert np.all(compact.idx2_vec == np.vstack(ut.take(vecs_list, [0, 2])))
+        """
+        live_ax_flags = nnindexer.ax2_aid != -1
+        live_idx_flags = live_ax_flags[nnindexer.idx2_ax]
+        old_ax2_new_ax = np.cumsum(live_ax_flags) - 1
+        new_idx2_ax = old_ax2_new_ax[nnindexer.idx2_ax.compress(live_idx_flags)]
+        if nnindexer.idx2_fgw is None:
+            new_idx2_fgw = None
+        else:
+            new_idx2_fgw = nnindexer.idx2_fgw.compress(live_idx_flags)
+        new = NeighborIndex(nnindexer.flann_params.copy(), nnindexer.cfgstr)
+        new._set_support(
+            nnindexer.ax2_aid.compress(live_ax_flags),
+            nnindexer.idx2_vec.compress(live_idx_flags, axis=0),
+            new_idx2_fgw,
+            new_idx2_ax.astype(np.int32),
+            nnindexer.idx2_fx.compress(live_idx_flags),
+        )
+        return new
+
     def get_nn_vecs(nnindexer, qfx2_nnidx):
         r""" gets matching vectors """
         return nnindexer.idx2_vec.take(qfx2_nnidx, axis=0)
@@ -1009,6 +1365,180 @@ class NeighborIndex(object):
         return qfx2_nid
 
 
+class LockedFLANN(object):
+    r"""
+    Serializes searches of a FLANN index that another thread may add points to.
+    Everything else is forwarded to the wrapped index.
+    """
+
+    def __init__(self, flann, lock):
+        self._flann = flann
+        self._lock = lock
+
+    def nn_index(self, *args, **kwargs):
+        with self._lock:
+            return self._flann.nn_index(*args, **kwargs)
+
+    def __getattr__(self, key):
+        return getattr(self._flann, key)
+
+
+class NeighborIndexView(NeighborIndex):
+    r"""
+    Read-only view of a shared NeighborIndex restricted to some of its
+    annotations.
+
+    The view shares the support data and the FLANN index of its base and only
+    owns its ax2_aid mapping and cfgstr. Base annotations outside the view map
+    to aid -1, so they are skipped like tombstones by requery_knn and the
+    baseline neighbor filter. The base may only grow through add_support while
+    views of it exist; annotations added after the view was made are outside
+    of it. ``lock`` must be held while the base is modified.
+
+    Args:
+        base (NeighborIndex): shared indexer
+        aid_list (list): annotations visible through the view
+        cfgstr (str): nnindex cfgstr of aid_list
+        lock (threading.RLock): lock guarding the base
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+        >>> import threading
+        >>> rng = np.random.RandomState(0)
+        >>> nFeat_list = [3, 2, 4]
+        >>> vecs_list = [rng.randint(0, 255, (n, 8)).astype(np.uint8) for n in nFeat_list]
+        >>> fxs_list = [np.arange(n) for n in nFeat_list]
+        >>> base = NeighborIndex(None, 'test')
+        >>> base.init_support([7, 8, 9], vecs_list, None, fxs_list, verbose=False)
+        >>> base.reindex(verbose=False)
+        >>> view = NeighborIndexView(base, [7, 9], 'test_view', threading.RLock())
+        >>> assert view.get_indexed_aids().tolist() == [7, 9]
+        >>> assert view.get_invalid_axs([9]).tolist() == [1, 2]
+        >>> assert view.idx2_vec is base.idx2_vec
+        >>> # Annotations added to the base later are not part of the view
+        >>> new_vecs = rng.randint(0, 255, (2, 8)).astype(np.uint8)
+        >>> base.add_support([10], [new_vecs], None, [np.arange(2)], verbose=False)
+        >>> assert view.get_nn_aids(np.array([[0, 10]])).tolist() == [[7, -1]]
+        >>> assert view.get_indexed_aids().tolist() == [7, 9]
+        >>> assert base.get_indexed_aids().tolist() == [7, 8, 9, 10]
+        >>> assert view.cfgstr == 'test_view' and base.cfgstr == 'test'
+    """
+
+    def __init__(view, base, aid_list, cfgstr, lock):
+        view.base = base
+        view.cfgstr = cfgstr
+        view.flann = LockedFLANN(base.flann, lock)
+        ax2_aid = base.ax2_aid
+        view._ax2_aid = np.where(np.in1d(ax2_aid, aid_list), ax2_aid, -1)
+        view.aid2_ax = ut.make_index_lookup(view._ax2_aid)
+
+    def __getattr__(view, key):
+        # Support data and search parameters come from the base
+        if key == 'base':
+            raise AttributeError(key)
+        return getattr(view.base, key)
+
+    @property
+    def ax2_aid(view):
+        num_new = len(view.base.ax2_aid) - len(view._ax2_aid)
+        if num_new > 0:
+            padding = np.full(num_new, -1, dtype=view._ax2_aid.dtype)
+            view._ax2_aid = np.hstack((view._ax2_aid, padding))
+        return view._ax2_aid
+
+    def get_ax2_nvecs(view):
+        return view.base.get_ax2_nvecs()
+
+    @profile
+    def knn(view, qfx2_vec, K):
+        r"""
+        Like NeighborIndex.knn, but neighbors outside of the view are skipped.
+        The search is widened until every query vector has K neighbors in the
+        view, so the neighbors and normalizers are the ones an index of just the
+        view's annotations would return.
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.algo.hots.neighbor_index import *  # NOQA
+            >>> import threading
+            >>> rng = np.random.RandomState(0)
+            >>> aid_list = [1, 2, 3, 4, 5, 6]
+            >>> vecs_list = [rng.randint(0, 255, (40, 16)).astype(np.uint8)
+            >>>              for _ in aid_list]
+            >>> fxs_list = [np.arange(len(vecs)) for vecs in vecs_list]
+            >>> base = NeighborIndex({'algorithm': 'linear'}, 'base')
+            >>> base.init_support(aid_list, vecs_list, None, fxs_list, verbose=False)
+            >>> base.reindex(verbose=False)
+            >>> view = NeighborIndexView(base, [2, 3, 5], 'view', threading.RLock())
+            >>> # Compare against an index built from scratch over the same aids
+            >>> fresh = NeighborIndex({'algorithm': 'linear'}, 'fresh')
+            >>> fresh.init_support([2, 3, 5], ut.take(vecs_list, [1, 2, 4]), None,
+            >>>                    ut.take(fxs_list, [1, 2, 4]), verbose=False)
+            >>> fresh.reindex(verbose=False)
+            >>> qfx2_vec = rng.randint(0, 255, (50, 16)).astype(np.uint8)
+            >>> for K in [1, 4, 10]:
+            >>>     (idx1, dist1) = view.knn(qfx2_vec, K)
+            >>>     (idx2, dist2) = fresh.knn(qfx2_vec, K)
+            >>>     assert np.all(view.get_nn_aids(idx1) == fresh.get_nn_aids(idx2))
+            >>>     assert np.all(view.get_nn_featxs(idx1) == fresh.get_nn_featxs(idx2))
+            >>>     assert np.allclose(dist1, dist2)
+        """
+        ax2_nvecs = view.get_ax2_nvecs()
+        num_tombstones = ax2_nvecs.take(view.get_tombstone_axs()).sum()
+        if num_tombstones == 0:
+            return NeighborIndex.knn(view, qfx2_vec, K)
+        num_indexed = view.num_indexed
+        # Same degenerate cases as an index without the tombstones
+        if K == 0 or K > num_indexed - num_tombstones:
+            return view.empty_neighbors(len(qfx2_vec), 0)
+        elif len(qfx2_vec) == 0:
+            return view.empty_neighbors(0, K)
+        qfx2_idx = np.empty((len(qfx2_vec), K), dtype=np.int32)
+        qfx2_raw_dist = None
+        pending = np.arange(len(qfx2_vec))
+        # Expect the tombstone fraction of the neighbors to be tombstoned
+        temp_K = int(np.ceil(K * num_indexed / float(num_indexed - num_tombstones)))
+        while len(pending) > 0:
+            temp_K = min(temp_K + 1, num_indexed)
+            vecs = qfx2_vec.take(pending, axis=0)
+            (idxs, dists) = view.flann.nn_index(
+                vecs, temp_K, checks=view.checks, cores=view.cores
+            )
+            idxs = idxs.reshape(len(pending), temp_K)
+            dists = dists.reshape(len(pending), temp_K)
+            if qfx2_raw_dist is None:
+                qfx2_raw_dist = np.empty((len(qfx2_vec), K), dtype=dists.dtype)
+            liveflags = view.get_nn_aids(idxs) != -1
+            # Searching everything is as wide as it gets
+            done_flags = (liveflags.sum(axis=1) >= K) | (temp_K == num_indexed)
+            # Stable sort moves the first K live neighbors to the front in order
+            order = np.argsort(~liveflags[done_flags], axis=1, kind='stable')[:, 0:K]
+            done = pending.compress(done_flags)
+            qfx2_idx[done] = np.take_along_axis(idxs[done_flags], order, axis=1)
+            qfx2_raw_dist[done] = np.take_along_axis(dists[done_flags], order, axis=1)
+            pending = pending.compress(~done_flags)
+            temp_K *= 2
+        if K == 1:
+            # FLANN returns flat arrays for a single neighbor
+            qfx2_idx = qfx2_idx[:, 0]
+            qfx2_raw_dist = qfx2_raw_dist[:, 0]
+        if view.max_distance_sqrd is not None:
+            qfx2_dist = np.divide(qfx2_raw_dist, view.max_distance_sqrd)
+        else:
+            qfx2_dist = qfx2_raw_dist
+        return (qfx2_idx, qfx2_dist)
+
+    def add_support(view, *args, **kwargs):
+        raise NotImplementedError('NeighborIndexView is read-only')
+
+    def remove_support(view, *args, **kwargs):
+        raise NotImplementedError('NeighborIndexView is read-only')
+
+    def reindex(view, *args, **kwargs):
+        raise NotImplementedError('NeighborIndexView is read-only')
+
+
 def in1d_shape(arr1, arr2):
     return np.in1d(arr1, arr2).reshape(arr1.shape)
 
@@ -3,27 +3,276 @@
 NEEDS CLEANUP
 """
 from __future__ import absolute_import, division, print_function
-from os.path import join
+import collections
+import os
+import threading
+from os.path import dirname, exists, join
+import numpy as np
 import six
 import utool as ut
 from six.moves import range, zip, map  # NOQA
 from wbia.algo.hots import _pipeline_helpers as plh  # NOQA
-from wbia.algo.hots.neighbor_index import NeighborIndex, get_support_data
+from wbia.algo.hots.neighbor_index import (
+    NeighborIndex,
+    NeighborIndexView,
+    get_support_data,
+)
+from wbia.algo.hots.descriptor_store import DescriptorStore
 
 (print, rrr, profile) = ut.inject2(__name__)
 
 
 USE_HOTSPOTTER_CACHE = not ut.get_argflag('--nocache-hs')
 NOCACHE_UUIDS = ut.get_argflag('--nocache-uuids') and USE_HOTSPOTTER_CACHE
+# Keep stacked support data in memory mappable descriptor stores
+USE_NNSTORE = not ut.get_argflag('--nocache-nnstore') and USE_HOTSPOTTER_CACHE
 
-# LRU cache for nn_indexers. Ensures that only a few are ever in memory
+# LRU cache for nn_indexers. Bounded by the memory the indexers use rather than
+# by how many of them there are, so several small per-species indexes can stay
+# resident while a single huge one still evicts everything else.
 # MAX_NEIGHBOR_CACHE_SIZE = ut.get_argval('--max-neighbor-cachesize', type_=int, default=2)
-MAX_NEIGHBOR_CACHE_SIZE = ut.get_argval('--max-neighbor-cachesize', type_=int, default=1)
+MAX_NEIGHBOR_CACHE_SIZE = ut.get_argval('--max-neighbor-cachesize', type_=int, default=None)
+MAX_NEIGHBOR_CACHE_MB = ut.get_argval('--max-neighbor-cachemem', type_=float, default=4096)
+# Species whose indexers are never evicted from the memory cache
+PINNED_NEIGHBOR_SPECIES = ut.get_argval('--pin-neighbor-species', type_=list, default=[])
+# Fraction of tombstoned vectors that triggers compaction of an incremental index
+NNINDEX_COMPACT_RATIO = ut.get_argval(
+    '--nnindex-compact-ratio', type_=float, default=0.25
+)
+# Annotations that none of this many recent requests used count as tombstoned
+NNINDEX_COMPACT_WINDOW = ut.get_argval('--nnindex-compact-window', type_=int, default=8)
 # Background process for building indexes
 CURRENT_THREAD = None
 # Global map to keep track of UUID lists with prebuild indexers.
 UUID_MAP = ut.ddict(dict)
-NEIGHBOR_CACHE = ut.get_lru_cache(MAX_NEIGHBOR_CACHE_SIZE)
+# Live incremental indexers keyed by lineage cfgstr
+INCREMENTAL_NNINDEXERS = {}
+
+
+class NeighborIndexLRUCache(ut.NiceRepr):
+    """
+    Memory bounded least recently used cache of NeighborIndex objects keyed by
+    their nnindex cfgstr (see build_nnindex_cfgstr).
+
+    The cost of an entry is ``nnindexer.get_nbytes()`` (support arrays + FLANN
+    index). When an insert pushes the total over ``max_bytes`` the least
+    recently used entries are evicted until it fits again. Entries can be
+    pinned directly by key or indirectly through the species of the indexed
+    annotations; pinned entries are never evicted.
+
+    Exposes the same dict-like interface as ut.get_lru_cache so it is a drop in
+    replacement.
+
+    Args:
+        max_bytes (int): memory budget in bytes. None means unbounded.
+        max_size (int): optional bound on the number of entries
+        pinned_species (list): species texts whose indexers are pinned
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.neighbor_index_cache import *  # NOQA
+        >>> class DummyIndexer(object):
+        ...     def __init__(self, nbytes):
+        ...         self.nbytes = nbytes
+        ...     def get_nbytes(self):
+        ...         return self.nbytes
+        >>> cache = NeighborIndexLRUCache(max_bytes=100, pinned_species=['zebra'])
+        >>> cache.set('a', DummyIndexer(40), species_list=['zebra'])
+        >>> cache['b'] = DummyIndexer(40)
+        >>> cache['c'] = DummyIndexer(10)
+        >>> assert cache.has_key('b')
+        >>> assert not cache.has_key('x')
+        >>> indexer_b = cache['b']
+        >>> cache['d'] = DummyIndexer(20)
+        >>> print(sorted(cache.keys()))
+        ['a', 'b', 'd']
+        >>> print(ut.repr2(cache.get_stats(), nl=0, sorted_=True))
+        {'evictions': 1, 'hits': 1, 'max_bytes': 100, 'misses': 1, 'nbytes': 100, 'num_entries': 3, 'num_pinned': 1}
+        >>> cache['e'] = DummyIndexer(70)
+        >>> print(sorted(cache.keys()))
+        ['a', 'e']
+        >>> cache.unpin_species('zebra')
+        >>> print(sorted(cache.keys()))
+        ['e']
+    """
+
+    def __init__(self, max_bytes=None, max_size=None, pinned_species=[]):
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.pinned_species = set(pinned_species)
+        self.pinned_keys = set([])
+        self._lock = threading.RLock()
+        self._entries = collections.OrderedDict()
+        self._nbytes = {}
+        self._species = {}
+        self.total_nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __nice__(self):
+        return 'num=%d, %s / %s' % (
+            len(self),
+            ut.byte_str2(self.total_nbytes),
+            'inf' if self.max_bytes is None else ut.byte_str2(self.max_bytes),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def has_key(self, key):
+        """ Records a hit or a miss. Use ``in`` to check without counting. """
+        with self._lock:
+            flag = key in self._entries
+            if flag:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return flag
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._entries.pop(key)
+            # Move to the most recently used position
+            self._entries[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._entries[key]
+            self.total_nbytes -= self._nbytes.pop(key)
+            self._species.pop(key, None)
+
+    def set(self, key, value, species_list=None):
+        """
+        Inserts an indexer and evicts least recently used unpinned entries
+        until the cache fits its budget again.
+
+        Args:
+            key (str): nnindex cfgstr
+            value (NeighborIndex): indexer. None reserves a free slot.
+            species_list (list): species of the indexed annotations used to
+                decide if the entry is pinned
+        """
+        with self._lock:
+            if key in self._entries:
+                del self[key]
+            nbytes = 0 if value is None else int(value.get_nbytes())
+            self._entries[key] = value
+            self._nbytes[key] = nbytes
+            self._species[key] = set([] if species_list is None else species_list)
+            self.total_nbytes += nbytes
+            self._evict(keep=key)
+
+    def _is_pinned(self, key):
+        return key in self.pinned_keys or bool(
+            self._species[key].intersection(self.pinned_species)
+        )
+
+    def _is_full(self):
+        over_size = self.max_size is not None and len(self) > self.max_size
+        over_bytes = self.max_bytes is not None and self.total_nbytes > self.max_bytes
+        return over_size or over_bytes
+
+    def _evict(self, keep=None):
+        if not self._is_full():
+            return
+        candidates = [
+            key for key in self._entries if key != keep and not self._is_pinned(key)
+        ]
+        for key in candidates:
+            if not self._is_full():
+                break
+            if ut.VERBOSE:
+                print(
+                    '[nnindex.MEMCACHE] evict %s (%s)'
+                    % (key, ut.byte_str2(self._nbytes[key]))
+                )
+            del self[key]
+            self.evictions += 1
+        if self._is_full() and ut.VERBOSE:
+            print(
+                '[nnindex.MEMCACHE] pinned indexers exceed the budget: %s'
+                % (ut.byte_str2(self.total_nbytes),)
+            )
+
+    def pin(self, key):
+        with self._lock:
+            self.pinned_keys.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self.pinned_keys.discard(key)
+            self._evict()
+
+    def pin_species(self, species):
+        with self._lock:
+            self.pinned_species.add(species)
+
+    def unpin_species(self, species):
+        with self._lock:
+            self.pinned_species.discard(species)
+            self._evict()
+
+    def keys(self):
+        return list(self._entries.keys())
+
+    def values(self):
+        return list(self._entries.values())
+
+    def items(self):
+        return list(self._entries.items())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes.clear()
+            self._species.clear()
+            self.total_nbytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            num_pinned = sum(self._is_pinned(key) for key in self._entries)
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'num_entries': len(self),
+                'num_pinned': num_pinned,
+                'nbytes': self.total_nbytes,
+                'max_bytes': self.max_bytes,
+            }
+        return stats
+
+    def get_stats_str(self):
+        stats = self.get_stats()
+        total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / total if total > 0 else 0.0
+        return (
+            '[nnindex.MEMCACHE] hits=%d misses=%d (%.2f%%) evictions=%d '
+            'entries=%d pinned=%d mem=%s'
+        ) % (
+            stats['hits'],
+            stats['misses'],
+            100 * hit_rate,
+            stats['evictions'],
+            stats['num_entries'],
+            stats['num_pinned'],
+            ut.byte_str2(stats['nbytes']),
+        )
+
+
+NEIGHBOR_CACHE = NeighborIndexLRUCache(
+    max_bytes=int(MAX_NEIGHBOR_CACHE_MB * 2 ** 20),
+    max_size=MAX_NEIGHBOR_CACHE_SIZE,
+    pinned_species=PINNED_NEIGHBOR_SPECIES,
+)
 
 
 class UUIDMapHyrbridCache(object):
@@ -236,6 +485,7 @@ def build_nnindex_cfgstr(qreq_, daid_list):
 def clear_memcache():
     global NEIGHBOR_CACHE
     NEIGHBOR_CACHE.clear()
+    INCREMENTAL_NNINDEXERS.clear()
 
 
 def clear_uuid_cache(qreq_):
@@ -418,7 +668,8 @@ def request_augmented_wbia_nnindexer(
         # Write to memcache
         if ut.VERBOSE:
             print('[aug] Wrote to memcache=%r' % (nnindex_cfgstr,))
-        NEIGHBOR_CACHE[nnindex_cfgstr] = nnindexer
+        species_list = set(qreq_.ibs.get_annot_species_texts(daid_list))
+        NEIGHBOR_CACHE.set(nnindex_cfgstr, nnindexer, species_list=species_list)
         return nnindexer
     else:
         # if ut.VERBOSE:
@@ -475,6 +726,7 @@ def request_memcached_wbia_nnindexer(
     # try:
     if veryverbose:
         print('[nnindex.MEMCACHE] len(NEIGHBOR_CACHE) = %r' % (len(NEIGHBOR_CACHE),))
+        print(NEIGHBOR_CACHE.get_stats_str())
         # the lru cache wont be recognized by get_object_size_str, cast to pure python objects
         print(
             '[nnindex.MEMCACHE] size(NEIGHBOR_CACHE) = %s'
@@ -510,7 +762,8 @@ def request_memcached_wbia_nnindexer(
             # Write to memcache
             if ut.VERBOSE or ut.VERYVERBOSE:
                 print('[disk] Write to memcache=%r' % (nnindex_cfgstr,))
-            NEIGHBOR_CACHE[nnindex_cfgstr] = nnindexer
+            species_list = set(qreq_.ibs.get_annot_species_texts(daid_list))
+            NEIGHBOR_CACHE.set(nnindex_cfgstr, nnindexer, species_list=species_list)
         else:
             if ut.VERBOSE or ut.VERYVERBOSE:
                 print('[disk] Did not write to memcache=%r' % (nnindex_cfgstr,))
@@ -567,10 +820,16 @@ def request_diskcached_wbia_nnindexer(
     # if memtrack is not None:
     #    memtrack.report('[PRE SUPPORT]')
     # Get annot descriptors to index
+    store = DescriptorStore(cachedir, cfgstr) if USE_NNSTORE else None
     if prog_hook is not None:
         prog_hook.set_progress(1, 3, 'Loading support data for indexer')
-    print('[nnindex] Loading support data for indexer')
-    vecs_list, fgws_list, fxs_list = get_support_data(qreq_, daid_list)
+    if store is not None and not force_rebuild and store.exists():
+        # The stacked support data is already on disk, map it instead
+        print('[nnindex] Found support data in descriptor store')
+        vecs_list, fgws_list, fxs_list = None, None, None
+    else:
+        print('[nnindex] Loading support data for indexer')
+        vecs_list, fgws_list, fxs_list = get_support_data(qreq_, daid_list)
     if memtrack is not None:
         memtrack.report('[AFTER GET SUPPORT DATA]')
     try:
@@ -586,6 +845,7 @@ def request_diskcached_wbia_nnindexer(
             force_rebuild=force_rebuild,
             memtrack=memtrack,
             prog_hook=prog_hook,
+            store=store,
         )
     except Exception as ex:
         ut.printex(
@@ -605,6 +865,414 @@ def request_diskcached_wbia_nnindexer(
     return nnindexer
 
 
+def build_nnindex_lineage_cfgstr(qreq_, daid_list):
+    r"""
+    Like build_nnindex_cfgstr, but the data hash is replaced by the species of
+    the annotations. Indexers that share a lineage only differ in which
+    annotations they contain, so they can be updated into each other.
+    """
+    species_list = sorted(set(qreq_.ibs.get_annot_species_texts(daid_list)))
+    species_cfgstr = '_SPECIES(%s)' % (','.join(species_list),)
+    lineage_cfgstr = ''.join(
+        (
+            species_cfgstr,
+            qreq_.qparams.flann_cfgstr,
+            qreq_.qparams.featweight_cfgstr,
+            qreq_.qparams.feat_cfgstr,
+            qreq_.qparams.chip_cfgstr,
+        )
+    )
+    return lineage_cfgstr
+
+
+class NeighborIndexDeltaLog(ut.NiceRepr):
+    r"""
+    Append-only json lines log of the changes made to a base indexer.
+
+    The first record holds the aids of the base indexer, whose FLANN index and
+    support data are cached on disk. Every following record adds or removes a
+    list of aids. A restart loads the base and applies the logged changes
+    instead of rebuilding the whole index.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.neighbor_index_cache import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_nndelta')
+        >>> log = NeighborIndexDeltaLog(join(dpath, 'nndelta_test.jsonl'))
+        >>> log.reset([1, 2, 3])
+        >>> log.append('remove', [2])
+        >>> log.append('add', [4, 5])
+        >>> base_aids, ops = NeighborIndexDeltaLog(log.fpath).read()
+        >>> assert base_aids == [1, 2, 3]
+        >>> assert ops == [('remove', [2]), ('add', [4, 5])]
+        >>> assert log.get_live_aids() == [1, 3, 4, 5]
+        >>> # A partially written last record is ignored
+        >>> ut.write_to(log.fpath, ut.read_from(log.fpath, verbose=False) + '{"op": "ad', verbose=False)
+        >>> assert log.get_live_aids() == [1, 3, 4, 5]
+        >>> ut.delete(log.fpath, verbose=False)
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+
+    def __nice__(self):
+        return ut.path_ndir_split(self.fpath, n=1)
+
+    def exists(self):
+        return exists(self.fpath)
+
+    def read(self):
+        """
+        Returns:
+            tuple: (base_aids, ops) base_aids is None if there is no log
+        """
+        if not self.exists():
+            return None, []
+        records = []
+        with open(self.fpath, 'r') as file_:
+            for line in file_:
+                try:
+                    records.append(ut.from_json(line))
+                except ValueError:
+                    # interrupted while appending, nothing after this was applied
+                    break
+        if len(records) == 0 or records[0]['op'] != 'base':
+            return None, []
+        base_aids = records[0]['aids']
+        ops = [(record['op'], record['aids']) for record in records[1:]]
+        return base_aids, ops
+
+    @staticmethod
+    def replay(base_aids, ops):
+        """ Returns the aids that are live after applying ops to base_aids """
+        live_aids = set(base_aids)
+        for op, aids in ops:
+            if op == 'add':
+                live_aids.update(aids)
+            elif op == 'remove':
+                live_aids.difference_update(aids)
+        return sorted(live_aids)
+
+    def get_live_aids(self):
+        base_aids, ops = self.read()
+        if base_aids is None:
+            return None
+        return self.replay(base_aids, ops)
+
+    def reset(self, base_aids):
+        """ starts a new log for a new base indexer """
+        ut.ensuredir(dirname(self.fpath))
+        tmp_fpath = self.fpath + '.tmp'
+        record = {'op': 'base', 'aids': [int(aid) for aid in base_aids]}
+        ut.write_to(tmp_fpath, ut.to_json(record) + '\n', verbose=False)
+        os.rename(tmp_fpath, self.fpath)
+
+    def append(self, op, aids):
+        assert op in ['add', 'remove'], 'unknown op=%r' % (op,)
+        record = {'op': op, 'aids': [int(aid) for aid in aids]}
+        with open(self.fpath, 'a') as file_:
+            file_.write(ut.to_json(record) + '\n')
+            file_.flush()
+            os.fsync(file_.fileno())
+
+
+class IncrementalNeighborIndex(ut.NiceRepr):
+    r"""
+    Serves indexers for a changing set of database annotations without
+    rebuilding the FLANN index for every new set.
+
+    All requests of a lineage share one base NeighborIndex. The base only
+    grows: annotations that it does not contain yet are added to it, and
+    nothing is ever removed from it. Each request gets its own
+    NeighborIndexView of the base with its own cfgstr, in which base
+    annotations outside of the request are tombstones (their ax maps to aid
+    -1) that requery_knn and the baseline neighbor filter skip. A view is
+    never changed by later requests, and its FLANN searches are serialized
+    with the additions to the base.
+
+    The requested sets are recorded in a NeighborIndexDeltaLog. A restart
+    loads the cached base index and replays the log to add the annotations
+    that were added since. Base annotations that none of the last
+    ``compact_window`` requests used are stale. Once the stale fraction of
+    the base vectors exceeds ``compact_ratio`` an index without them is built
+    and saved in a background thread, and a later request swaps it in as the
+    new base. Alternating between a few daid sets therefore never compacts.
+
+    Args:
+        lineage_cfgstr (str): see build_nnindex_lineage_cfgstr
+        cachedir (str): flann cache directory
+        compact_ratio (float): stale vector ratio that triggers compaction
+        compact_window (int): number of requests an annotation stays fresh
+    """
+
+    def __init__(
+        self,
+        lineage_cfgstr,
+        cachedir,
+        compact_ratio=NNINDEX_COMPACT_RATIO,
+        compact_window=NNINDEX_COMPACT_WINDOW,
+    ):
+        self.lineage_cfgstr = lineage_cfgstr
+        self.cachedir = cachedir
+        self.compact_ratio = compact_ratio
+        self.compact_window = compact_window
+        fname = 'nndelta_%s.jsonl' % (ut.hashstr27(lineage_cfgstr),)
+        self.log = NeighborIndexDeltaLog(join(cachedir, fname))
+        self.logged_aids = None
+        self.base = None
+        # Number of the last request that used each ax of the base
+        self.ax2_lastuse = None
+        self.num_requests = 0
+        self.compaction = None
+        self._lock = threading.RLock()
+
+    def __nice__(self):
+        if self.base is None:
+            return 'unloaded'
+        return 'nBaseAnnots=%d, nLogged=%d%s' % (
+            self.base.num_indexed_annots(),
+            len(self.logged_aids),
+            '' if self.compaction is None else ', compacting',
+        )
+
+    def request(
+        self,
+        qreq_,
+        daid_list,
+        verbose=True,
+        force_rebuild=False,
+        memtrack=None,
+        prog_hook=None,
+    ):
+        """ Returns a NeighborIndexView that contains exactly daid_list """
+        with self._lock:
+            if self.base is None or force_rebuild:
+                self._load_base(
+                    qreq_, daid_list, verbose, force_rebuild, memtrack, prog_hook
+                )
+            self._finish_compaction(verbose=verbose)
+            view = self.apply_delta(qreq_, daid_list, verbose=verbose)
+            self._mark_used(view)
+            if self.compaction is None:
+                stale_flags = self.get_stale_flags()
+                ax2_nvecs = self.base.get_ax2_nvecs()
+                num_vecs = max(ax2_nvecs.sum(), 1)
+                stale_ratio = ax2_nvecs.compress(stale_flags).sum() / float(num_vecs)
+                if stale_ratio > self.compact_ratio:
+                    self._start_compaction(qreq_, stale_flags, verbose=verbose)
+            return view
+
+    def _mark_used(self, view):
+        self.num_requests += 1
+        num_new = len(self.base.ax2_aid) - len(self.ax2_lastuse)
+        if num_new > 0:
+            padding = np.full(num_new, self.num_requests, dtype=np.int64)
+            self.ax2_lastuse = np.hstack((self.ax2_lastuse, padding))
+        self.ax2_lastuse[view.ax2_aid != -1] = self.num_requests
+
+    def get_stale_flags(self):
+        """ flags the base axs that none of the recent requests used """
+        return self.ax2_lastuse <= self.num_requests - self.compact_window
+
+    def _reset_lastuse(self):
+        # A new base starts out fresh
+        self.ax2_lastuse = np.full(
+            len(self.base.ax2_aid), self.num_requests, dtype=np.int64
+        )
+
+    def _load_base(self, qreq_, daid_list, verbose, force_rebuild, memtrack, prog_hook):
+        base_aids, ops = (None, []) if force_rebuild else self.log.read()
+        if base_aids is None:
+            base_aids, ops = list(daid_list), []
+            self.log.reset(base_aids)
+        if verbose:
+            print(
+                '[nnindex.incr] loading base indexer with %d annots' % (len(base_aids),)
+            )
+        # Never use the memcached indexer, the base is added to in place
+        self.base = request_diskcached_wbia_nnindexer(
+            qreq_,
+            base_aids,
+            verbose=verbose,
+            force_rebuild=force_rebuild,
+            memtrack=memtrack,
+            prog_hook=prog_hook,
+        )
+        logged_aids = self.log.replay(base_aids, ops)
+        if verbose and len(ops) > 0:
+            print('[nnindex.incr] replaying %d logged changes' % (len(ops),))
+        self._add_to_base(qreq_, logged_aids, verbose=verbose)
+        self.logged_aids = set(logged_aids)
+        self._reset_lastuse()
+
+    def _add_to_base(self, qreq_, aid_list, verbose=True):
+        """ adds the aids that the base does not contain yet """
+        base_aids = set(self.base.get_indexed_aids().tolist())
+        add_aids = sorted(set(aid_list) - base_aids)
+        if len(add_aids) > 0:
+            if verbose:
+                print('[nnindex.incr] adding %d annots to the base' % (len(add_aids),))
+            vecs_list, fgws_list, fxs_list = get_support_data(qreq_, add_aids)
+            self.base.add_support(
+                add_aids, vecs_list, fgws_list, fxs_list, verbose=verbose
+            )
+
+    @profile
+    def apply_delta(self, qreq_, daid_list, verbose=True):
+        """
+        Adds the aids of daid_list that the base is missing, records the change
+        relative to the logged state and returns a view of daid_list.
+        """
+        target_aids = set(daid_list)
+        self._add_to_base(qreq_, target_aids, verbose=verbose)
+        log_remove_aids = sorted(self.logged_aids - target_aids)
+        log_add_aids = sorted(target_aids - self.logged_aids)
+        if len(log_remove_aids) > 0:
+            self.log.append('remove', log_remove_aids)
+        if len(log_add_aids) > 0:
+            self.log.append('add', log_add_aids)
+        self.logged_aids = target_aids
+        cfgstr = build_nnindex_cfgstr(qreq_, daid_list)
+        return NeighborIndexView(self.base, daid_list, cfgstr, self._lock)
+
+    def _start_compaction(self, qreq_, stale_flags, verbose=True):
+        base = self.base
+        ax2_aid = np.where(stale_flags, -1, base.ax2_aid)
+        live_aids = ax2_aid.compress(ax2_aid != -1)
+        cfgstr = build_nnindex_cfgstr(qreq_, live_aids)
+        store = DescriptorStore(self.cachedir, cfgstr) if USE_NNSTORE else None
+        # Freeze the support data, the base may grow meanwhile
+        source = NeighborIndex(base.flann_params.copy(), cfgstr)
+        source._set_support(
+            ax2_aid,
+            base.idx2_vec,
+            base.idx2_fgw,
+            base.idx2_ax,
+            base.idx2_fx,
+        )
+        if verbose:
+            print(
+                '[nnindex.incr] compacting %d annots in the background'
+                % (len(live_aids),)
+            )
+        result_list = []
+        error_list = []
+        thread = threading.Thread(
+            target=background_compact_func,
+            args=(source, self.cachedir, store, result_list, error_list),
+        )
+        thread.daemon = True
+        thread.start()
+        self.compaction = (thread, result_list, error_list)
+
+    def _finish_compaction(self, verbose=True):
+        """ swaps in a finished compacted indexer as the new base """
+        if self.compaction is None:
+            return False
+        thread, result_list, error_list = self.compaction
+        if thread.is_alive():
+            return False
+        thread.join()
+        self.compaction = None
+        if len(error_list) > 0:
+            ut.printex(error_list[0], 'background compaction failed', iswarning=True)
+            return False
+        if verbose:
+            print('[nnindex.incr] swapping in compacted indexer')
+        # Views of the old base keep using it. Annotations requested while the
+        # compacted base was being built are added back by the next request.
+        self.base = result_list[0]
+        base_aids = self.base.ax2_aid.tolist()
+        self.log.reset(base_aids)
+        self.logged_aids = set(base_aids)
+        self._reset_lastuse()
+        return True
+
+    def wait_for_compaction(self):
+        with self._lock:
+            if self.compaction is not None:
+                self.compaction[0].join()
+            return self._finish_compaction()
+
+
+def background_compact_func(source, cachedir, store, result_list, error_list):
+    r""" builds and caches a compacted indexer (runs in a background thread) """
+    try:
+        nnindexer = source.compacted()
+        if store is not None:
+            store.write_arrays(
+                nnindexer.ax2_aid,
+                nnindexer.idx2_vec,
+                nnindexer.idx2_fgw,
+                nnindexer.idx2_ax,
+                nnindexer.idx2_fx,
+            )
+        nnindexer.reindex(verbose=False)
+        nnindexer.save(cachedir, verbose=False)
+        result_list.append(nnindexer)
+    except Exception as ex:
+        error_list.append(ex)
+
+
+def request_incremental_wbia_nnindexer(
+    qreq_,
+    verbose=True,
+    use_memcache=True,
+    force_rebuild=False,
+    memtrack=None,
+    prog_hook=None,
+):
+    r"""
+    CALLED BY QUERYREQUST::LOAD_INDEXER when index_method='incremental'
+
+    Returns a view of the IncrementalNeighborIndex of the lineage of the
+    requested annotations that contains exactly the requested database aids.
+
+    CommandLine:
+        python -m wbia.algo.hots.neighbor_index_cache request_incremental_wbia_nnindexer
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.hots.neighbor_index_cache import *  # NOQA
+        >>> import wbia
+        >>> ibs = wbia.opendb('testdb1')
+        >>> ZEB_PLAIN = wbia.const.TEST_SPECIES.ZEB_PLAIN
+        >>> daid_list = ibs.get_valid_aids(species=ZEB_PLAIN)
+        >>> cfgdict = dict(index_method='incremental')
+        >>> qreq1 = ibs.new_query_request(daid_list[0:1], daid_list[:-1], cfgdict=cfgdict)
+        >>> nnindexer1 = request_incremental_wbia_nnindexer(qreq1)
+        >>> qreq2 = ibs.new_query_request(daid_list[0:1], daid_list[1:], cfgdict=cfgdict)
+        >>> nnindexer2 = request_incremental_wbia_nnindexer(qreq2)
+        >>> assert nnindexer2.get_indexed_aids().tolist() == sorted(daid_list[1:])
+        >>> assert len(nnindexer2.get_tombstone_axs()) == 1
+        >>> # The first indexer is not changed by the second request
+        >>> assert nnindexer1.get_indexed_aids().tolist() == sorted(daid_list[:-1])
+        >>> assert nnindexer1.cfgstr != nnindexer2.cfgstr
+        >>> assert nnindexer1.base is nnindexer2.base
+        >>> # Going back to the first set does not add anything to the base
+        >>> nnindexer3 = request_incremental_wbia_nnindexer(qreq1)
+        >>> assert nnindexer3.base.num_indexed_annots() == len(daid_list)
+        >>> assert nnindexer3.cfgstr == nnindexer1.cfgstr
+    """
+    daid_list = qreq_.get_internal_daids()
+    lineage_cfgstr = build_nnindex_lineage_cfgstr(qreq_, daid_list)
+    incr = INCREMENTAL_NNINDEXERS.get(lineage_cfgstr, None) if use_memcache else None
+    if incr is None:
+        cachedir = qreq_.ibs.get_flann_cachedir()
+        incr = IncrementalNeighborIndex(lineage_cfgstr, cachedir)
+        if use_memcache:
+            INCREMENTAL_NNINDEXERS[lineage_cfgstr] = incr
+    nnindexer = incr.request(
+        qreq_,
+        daid_list,
+        verbose=verbose,
+        force_rebuild=force_rebuild,
+        memtrack=memtrack,
+        prog_hook=prog_hook,
+    )
+    return nnindexer
+
+
 def group_daids_by_cached_nnindexer(
     qreq_, daid_list, min_reindex_thresh, max_covers=None
 ):
@@ -683,6 +1351,7 @@ def new_neighbor_index(
     verbose=True,
     memtrack=None,
     prog_hook=None,
+    store=None,
 ):
     r"""
     constructs neighbor index independent of wbia
@@ -695,6 +1364,9 @@ def new_neighbor_index(
         flann_cachedir (None):
         nnindex_cfgstr (str):
         use_memcache (bool):
+        store (DescriptorStore): if specified the support data is written to
+            (or, when vecs_list is None, read from) this store and mapped
+            instead of being stacked in memory.
 
     Returns:
         nnindexer
@@ -724,7 +1396,12 @@ def new_neighbor_index(
     # if memtrack is not None:
     #    memtrack.report('CREATEED NEIGHTOB INDEX')
     # Initialize neighbor with unindexed data
-    nnindexer.init_support(daid_list, vecs_list, fgws_list, fxs_list, verbose=verbose)
+    if store is None:
+        nnindexer.init_support(daid_list, vecs_list, fgws_list, fxs_list, verbose=verbose)
+    else:
+        if vecs_list is not None:
+            store.write(daid_list, vecs_list, fgws_list, fxs_list, verbose=verbose)
+        nnindexer.init_support_from_store(store, verbose=verbose)
     if memtrack is not None:
         memtrack.report('AFTER INIT SUPPORT')
     # Load or build the indexing structure
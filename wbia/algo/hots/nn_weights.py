@@ -390,13 +390,18 @@ def mark_name_valid_normalizers(qnid, neighb_topnid, neighb_normnid):
         [col1[:, None] != neighb_normnid for col1 in neighb_topnid.T]
     )
     # Mark self as invalid, if given that information
+    # (qnid can also be given per query feature when rows of several queries
+    # are stacked together)
+    qnid = np.asarray(qnid)
+    if qnid.ndim == 1:
+        qnid = qnid[:, None]
     neighb_valid = np.logical_and(neighb_normnid != qnid, neighb_valid)
     # For each query feature find its best normalizer (using negative indices)
     Knorm = neighb_normnid.shape[1]
-    neighb_validxs = [np.nonzero(normrow)[0] for normrow in neighb_valid]
-    neighb_selnorm = np.array(
-        [validxs[0] - Knorm if len(validxs) != 0 else -1 for validxs in neighb_validxs],
-        hstypes.FK_DTYPE,
+    has_valid = neighb_valid.any(axis=1)
+    first_validx = neighb_valid.argmax(axis=1)
+    neighb_selnorm = np.where(has_valid, first_validx - Knorm, -1).astype(
+        hstypes.FK_DTYPE
     )
     return neighb_selnorm
 
@@ -555,6 +560,222 @@ def normonly_fn(vdist, ndist):
     # return ndist[None, 0:1]
 
 
+# ============================
+# Batched weighting
+# ============================
+
+# normalizer rules supported by weight_neighbors_stacked
+STACKED_NORMALIZER_RULES = ['last', 'name']
+
+
+def get_lnbnn_normer(qreq_, config2_):
+    """ lazy loads the score normalizer used by the lnbnn_normer option """
+    if qreq_.lnbnn_normer is None:
+        qreq_.lnbnn_normer = vt.ScoreNormalizer()
+        # qreq_.lnbnn_normer.load(cfgstr=config2_.lnbnn_normer)
+        qreq_.lnbnn_normer.fuzzyload(partial_cfgstr=config2_.lnbnn_normer)
+    return qreq_.lnbnn_normer
+
+
+def stack_neighbors(nns_list, qxs):
+    r"""
+    Stacks the neighbor arrays of several queries into one contiguous block
+
+    Returns:
+        tuple: (neighb_idxs, neighb_dists, offsets) the rows of the i-th query
+            are ``offsets[i]:offsets[i + 1]``
+    """
+    nrows_list = [len(nns_list[qx].neighb_idxs) for qx in qxs]
+    offsets = np.zeros(len(qxs) + 1, dtype=np.int64)
+    np.cumsum(nrows_list, out=offsets[1:])
+    neighb_idxs = np.vstack([nns_list[qx].neighb_idxs for qx in qxs])
+    neighb_dists = np.vstack([nns_list[qx].neighb_dists for qx in qxs])
+    return neighb_idxs, neighb_dists, offsets
+
+
+def get_stacked_normk(qreq_, qaids, offsets, neighb_idxs, Knorm, normalizer_rule):
+    r"""
+    Stacked version of get_normk. Returns the normalizer column of every row
+    of the stacked neighbor array.
+    """
+    K = neighb_idxs.shape[1] - Knorm
+    assert K > 0, 'K=%r cannot be 0' % (K,)
+    if normalizer_rule == 'last':
+        neighb_normk = np.zeros(len(neighb_idxs), hstypes.FK_DTYPE) + (K + Knorm - 1)
+    elif normalizer_rule == 'name':
+        # The query name of each row
+        qnids = np.asarray(qreq_.get_qreq_annot_nids(qaids))
+        row_qnids = np.repeat(qnids, np.diff(offsets))
+
+        def _lookup_nids(idxs):
+            aids = qreq_.indexer.get_nn_aids(idxs)
+            nids = qreq_.get_qreq_annot_nids(aids.ravel())
+            return np.asarray(nids).reshape(aids.shape)
+
+        neighb_topnid = _lookup_nids(neighb_idxs.T[0:K].T)
+        neighb_normnid = _lookup_nids(neighb_idxs.T[-Knorm:].T)
+        neighb_selnorm = mark_name_valid_normalizers(
+            row_qnids, neighb_topnid, neighb_normnid
+        )
+        # convert form negative to pos indexes
+        neighb_normk = neighb_selnorm + (K + Knorm)
+    else:
+        raise NotImplementedError('[nn_weights] no normalizer_rule=%r' % normalizer_rule)
+    return neighb_normk
+
+
+@profile
+def weight_neighbors_stacked(qreq_, nns_list, nnvalid0_list):
+    r"""
+    Computes the weights of every active filter for a chunk of queries.
+
+    The neighbor arrays of all queries with the same number of neighbors are
+    stacked and each filter runs once over the stacked block. The per query
+    weights, valid flags and normalizer positions are returned as views into
+    the stacked results, so no per query arrays are allocated. Produces the
+    same values as the per query functions used by pipeline.weight_neighbors.
+
+    Args:
+        qreq_ (QueryRequest): hyper-parameters
+        nns_list (list): Neighbors of each query
+        nnvalid0_list (list): neighbors preflagged as valid
+
+    Returns:
+        tuple: (filtkey_list, filtweights_list, filtvalids_list,
+            filtnormks_list) in the same layout as pipeline.WeightRet_
+
+    CommandLine:
+        python -m wbia.algo.hots.nn_weights weight_neighbors_stacked
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.hots.nn_weights import *  # NOQA
+        >>> from wbia.algo.hots import pipeline
+        >>> for p in ['default:codename=vsmany,bar_l2_on=True,fg_on=False',
+        >>>           'default:bar_l2_on=True,lnbnn_on=False,fg_on=False',
+        >>>           'default:fg_on=True,ratio_thresh=.8,const_on=True,normonly_on=True',
+        >>>           'default:K=3,Knorm=3,normalizer_rule=name']:
+        >>>     qreq_, args = plh.testdata_pre(
+        >>>         'weight_neighbors', defaultdb='testdb1',
+        >>>         a=['default:qindex=0:3,dindex=0:5,hackerrors=False'], p=[p])
+        >>>     nns_list, nnvalid0_list = args
+        >>>     pipeline.BATCH_WEIGHT_NEIGHBORS = False
+        >>>     weight_ret1 = pipeline.weight_neighbors(qreq_, nns_list, nnvalid0_list)
+        >>>     pipeline.BATCH_WEIGHT_NEIGHBORS = True
+        >>>     weight_ret2 = pipeline.weight_neighbors(qreq_, nns_list, nnvalid0_list)
+        >>>     assert weight_ret1.filtkey_list == weight_ret2.filtkey_list
+        >>>     for key in ['filtweights_list', 'filtvalids_list', 'filtnormks_list']:
+        >>>         flat1 = ut.flatten(getattr(weight_ret1, key))
+        >>>         flat2 = ut.flatten(getattr(weight_ret2, key))
+        >>>         for x1, x2 in zip(flat1, flat2):
+        >>>             assert (x1 is None and x2 is None) or (
+        >>>                 x1.dtype == x2.dtype and np.array_equal(x1, x2))
+    """
+    config2_ = qreq_.extern_data_config2
+    Knorm = qreq_.qparams.Knorm
+    normalizer_rule = qreq_.qparams.normalizer_rule
+
+    filtkey_list = []
+    if config2_.lnbnn_on:
+        filtkey_list.append('lnbnn' if config2_.lnbnn_normer is None else 'lnbnn_norm')
+    if config2_.normonly_on:
+        filtkey_list.append('normonly')
+    if config2_.bar_l2_on:
+        filtkey_list.append('bar_l2')
+    if config2_.ratio_thresh:
+        filtkey_list.append('ratio')
+    if config2_.const_on:
+        filtkey_list.append('const')
+    if config2_.fg_on:
+        filtkey_list.append('fg')
+    # Every normalized weight (bar_l2 included) is a function of (vdist, ndist)
+    needs_normk = (
+        config2_.lnbnn_on
+        or config2_.normonly_on
+        or config2_.bar_l2_on
+        or config2_.ratio_thresh
+    )
+
+    nQueries = len(nns_list)
+    nFilt = len(filtkey_list)
+    filtweights_list = [[None] * nFilt for _ in range(nQueries)]
+    filtvalids_list = [[None] * nFilt for _ in range(nQueries)]
+    filtnormks_list = [[None] * nFilt for _ in range(nQueries)]
+
+    if config2_.fg_on:
+        # one lookup for the foreground weights of every query
+        qaid_list = [nn.qaid for nn in nns_list]
+        qfgws_list = qreq_.ibs.get_annot_fgweights(
+            qaid_list, ensure=False, config2_=qreq_.get_internal_query_config2()
+        )
+
+    # Queries can only be stacked when they have the same number of neighbors
+    ncols_list = [nn.neighb_idxs.shape[1] for nn in nns_list]
+    for ncols, qxs in ut.group_items(range(nQueries), ncols_list).items():
+        neighb_idxs, neighb_dists, offsets = stack_neighbors(nns_list, qxs)
+        K = ncols - Knorm
+        vdist = neighb_dists.T[0:K].T
+        if needs_normk:
+            qaids = [nns_list[qx].qaid for qx in qxs]
+            neighb_normk = get_stacked_normk(
+                qreq_, qaids, offsets, neighb_idxs, Knorm, normalizer_rule
+            )
+            ndist = vt.take_col_per_row(neighb_dists, neighb_normk)
+            ndist.shape = (len(neighb_idxs), 1)
+        else:
+            neighb_normk = None
+
+        stacked_weights = []
+        stacked_valids = []
+        stacked_normks = []
+        for filtkey in filtkey_list:
+            valid = None
+            normk = None
+            if filtkey in ['lnbnn', 'lnbnn_norm']:
+                weights = lnbnn_fn(vdist, ndist)
+                normk = neighb_normk
+                if filtkey == 'lnbnn_norm':
+                    normer = get_lnbnn_normer(qreq_, config2_)
+                    weights = normer.normalize_scores(weights.ravel()).reshape(
+                        weights.shape
+                    )
+                    valid = weights > config2_.lnbnn_norm_thresh
+            elif filtkey == 'normonly':
+                weights = normonly_fn(vdist, ndist)
+                normk = neighb_normk
+            elif filtkey == 'bar_l2':
+                weights = bar_l2_fn(vdist, ndist)
+            elif filtkey == 'ratio':
+                ratios = ratio_fn(vdist, ndist)
+                valid = ratios <= qreq_.qparams.ratio_thresh
+                # HACK TO GET 1 - RATIO AS SCORE
+                weights = np.subtract(1, ratios)
+                normk = neighb_normk
+            elif filtkey == 'const':
+                weights = np.ones((len(neighb_idxs), ncols - Knorm), dtype=np.float)
+            elif filtkey == 'fg':
+                neighb_dfgws = qreq_.indexer.get_nn_fgws(neighb_idxs.T[0:-Knorm].T)
+                qfgws = np.hstack(
+                    [qfgws_list[qx].take(nns_list[qx].qfx_list, axis=0) for qx in qxs]
+                )
+                # feature match forground weight is geometric mean
+                weights = np.sqrt(qfgws[:, None] * neighb_dfgws)
+            stacked_weights.append(weights)
+            stacked_valids.append(valid)
+            stacked_normks.append(normk)
+
+        # Hand out views of the stacked results to each query
+        for rowx, qx in enumerate(qxs):
+            start, stop = offsets[rowx], offsets[rowx + 1]
+            for fx in range(nFilt):
+                filtweights_list[qx][fx] = stacked_weights[fx][start:stop]
+                if stacked_valids[fx] is not None:
+                    filtvalids_list[qx][fx] = stacked_valids[fx][start:stop]
+                if stacked_normks[fx] is not None:
+                    filtnormks_list[qx][fx] = stacked_normks[fx][start:stop]
+    return filtkey_list, filtweights_list, filtvalids_list, filtnormks_list
+
+
 def testdata_vn_dists(nfeats=5, K=3):
     r"""
     Test voting and normalizing distances
@@ -75,6 +75,8 @@ USE_NN_MID_CACHE = (
     and USE_HOTSPOTTER_CACHE
 )
 USE_NN_MID_CACHE = False
+# Weight all queries of a chunk in one pass over their stacked neighbors
+BATCH_WEIGHT_NEIGHBORS = not ut.get_argflag('--noweight-batch')
 
 
 NN_LBL = 'Assign NN:       '
@@ -84,6 +86,8 @@ BUILDCM_LBL = 'Build Chipmatch: '
 SVER_LVL = 'SVER:            '
 
 PROGKW = dict(freq=1, time_thresh=30.0, adjust=True)
+# Maximum number of (qaid, daid) pairs sent to a spatial verification worker
+SVER_CHUNKSIZE = 8
 
 
 # Internal tuples denoting return types
@@ -530,41 +534,21 @@ def cachemiss_nn_compute_fn(
     if verbose:
         if len(qvecs_list) == 1:
             print('[hs] depth(qvecs_list) = %r' % (ut.depth_profile(qvecs_list),))
-    # Mark progress ane execute nearest indexer nearest neighbor code
-    prog_hook = None if qreq_.prog_hook is None else qreq_.prog_hook.next_subhook()
+    # Execute nearest indexer nearest neighbor code. Query descriptors are
+    # stacked into contiguous chunks so FLANN is called once per chunk instead
+    # of once per query annotation.
+    if verbose:
+        print(
+            '[hs] stacked knn search over %d queries with %d descriptors'
+            % (len(qvecs_list), sum(map(len, qvecs_list)))
+        )
     if requery:
-        # assert False, (
-        #     'need to implement part where matches with the same name are not considered'
-        # )
-        qvec_iter = ut.ProgressIter(qvecs_list, lbl=NN_LBL, prog_hook=prog_hook, **PROGKW)
-
-        """
-        # Maybe some query vector stacking would help here
-        qvecs_stack = np.vstack(qvecs_list)
-
-        # Nope, really doesn't help that much
-
-        # For 100 annotations
-        %timeit np.vstack(qvecs_list)
-        # 100 loops, best of 3: 5.15 ms per loop
-        %timeit qreq_.indexer.knn(qvecs_stack, K)
-        # 1 loop, best of 3: 18.1 s per loop
-        %timeit [qreq_.indexer.knn(qfx2_vec, K) for qfx2_vec in qvecs_list]
-        # 1 loop, best of 3: 19.4 s per loop
-        """
-
-        idx_dist_list = [
-            qreq_.indexer.requery_knn(qfx2_vec, K, pad, impossible_daids)
-            for qfx2_vec, K, pad, impossible_daids in zip(
-                qvec_iter, num_neighbors_list, Kpad_list, impossible_daids_list
-            )
-        ]
+        impossible_daids_list = ut.compress(impossible_daids_list, flags_list)
+        idx_dist_list = qreq_.indexer.requery_knn_many(
+            qvecs_list, num_neighbors_list, Kpad_list, impossible_daids_list
+        )
     else:
-        qvec_iter = ut.ProgressIter(qvecs_list, lbl=NN_LBL, prog_hook=prog_hook, **PROGKW)
-        idx_dist_list = [
-            qreq_.indexer.knn(qfx2_vec, num_neighbors)
-            for qfx2_vec, num_neighbors in zip(qvec_iter, num_neighbors_list)
-        ]
+        idx_dist_list = qreq_.indexer.knn_many(qvecs_list, num_neighbors_list)
 
     # Move into new object structure
     nns_list = [
@@ -774,8 +758,11 @@ def baseline_neighbor_filter(
         **PROGKW,
     )
     # Check to be sure that none of the matched annotations are in the impossible set
+    # and that none of them were removed from an incremental index (aid=-1)
     nnvalid0_list = [
-        vt.get_uncovered_mask(neighb_aids, impossible_daids)
+        np.logical_and(
+            vt.get_uncovered_mask(neighb_aids, impossible_daids), neighb_aids != -1
+        )
         for neighb_aids, impossible_daids in filter_iter
     ]
     return nnvalid0_list
@@ -879,6 +866,16 @@ def weight_neighbors(qreq_, nns_list, nnvalid0_list, verbose=VERB_PIPELINE):
         #              for neighb_idx, neighb_dist in nns_list]
         # nns_list = nns_list_
 
+    if (
+        BATCH_WEIGHT_NEIGHBORS
+        and qreq_.qparams.normalizer_rule in nn_weights.STACKED_NORMALIZER_RULES
+    ):
+        weight_ret = WeightRet_(
+            *nn_weights.weight_neighbors_stacked(qreq_, nns_list, nnvalid0_list)
+        )
+        assert len(weight_ret.filtkey_list) > 0, 'no feature correspondece filter keys'
+        return weight_ret
+
     if config2_.lnbnn_on:
         filtname = 'lnbnn'
         lnbnn_weight_list, normk_list = nn_weights.NN_WEIGHT_FUNC_DICT[filtname](
@@ -887,13 +884,9 @@ def weight_neighbors(qreq_, nns_list, nnvalid0_list, verbose=VERB_PIPELINE):
 
         if config2_.lnbnn_normer is not None:
             print('[hs] normalizing feat scores')
-            if qreq_.lnbnn_normer is None:
-                qreq_.lnbnn_normer = vt.ScoreNormalizer()
-                # qreq_.lnbnn_normer.load(cfgstr=config2_.lnbnn_normer)
-                qreq_.lnbnn_normer.fuzzyload(partial_cfgstr=config2_.lnbnn_normer)
-
+            lnbnn_normer = nn_weights.get_lnbnn_normer(qreq_, config2_)
             lnbnn_weight_list = [
-                qreq_.lnbnn_normer.normalize_scores(s.ravel()).reshape(s.shape)
+                lnbnn_normer.normalize_scores(s.ravel()).reshape(s.shape)
                 for s in lnbnn_weight_list
             ]
 
@@ -1338,11 +1331,97 @@ def _spatial_verification(qreq_, cm_list, verbose=VERB_PIPELINE):
         **PROGKW,
     )
 
-    cm_list_SVER = [sver_single_chipmatch(qreq_, cm) for cm in cm_progiter]
+    sver_workers = qreq_.qparams.sver_workers
+    if sver_workers > 1 and len(cm_shortlist) > 0:
+        cm_list_SVER = parallel_sver_chipmatches(
+            qreq_, cm_progiter, sver_workers, qreq_.qparams.sver_parallel
+        )
+    else:
+        cm_list_SVER = [sver_single_chipmatch(qreq_, cm) for cm in cm_progiter]
     # rescore after verification?
     return cm_list_SVER
 
 
+def parallel_sver_chipmatches(qreq_, cm_list, nworkers, parallel='process'):
+    r"""
+    Spatially verifies the shortlists of several chipmatches in a worker pool
+
+    Keypoints and feature matches are gathered in the calling process. Only
+    those arrays are sent to the workers, in tasks of at most SVER_CHUNKSIZE
+    (qaid, daid) pairs. Results are reassembled in submission order, so the
+    output is identical to the serial path.
+
+    Args:
+        qreq_ (QueryRequest): query request object with hyper-parameters
+        cm_list (list): shortlisted chipmatches
+        nworkers (int): number of worker processes or threads
+        parallel (str): 'process' or 'thread'
+
+    Returns:
+        list: cm_list_SVER
+
+    CommandLine:
+        python -m wbia.algo.hots.pipeline --test-parallel_sver_chipmatches
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.hots.pipeline import *  # NOQA
+        >>> ibs, qreq_, cm_list = plh.testdata_pre_sver('PZ_MTEST', qaid_list=[1, 18])
+        >>> cm_list1 = [sver_single_chipmatch(qreq_, cm) for cm in cm_list]
+        >>> cm_list2 = parallel_sver_chipmatches(qreq_, cm_list, 2)
+        >>> for cm1, cm2 in zip(cm_list1, cm_list2):
+        >>>     assert np.all(cm1.daid_list == cm2.daid_list)
+        >>>     assert all(np.all(fm1 == fm2) for fm1, fm2 in zip(cm1.fm_list, cm2.fm_list))
+    """
+    from concurrent import futures
+
+    if parallel == 'thread':
+        executor_cls = futures.ThreadPoolExecutor
+    elif parallel in [None, 'process']:
+        executor_cls = futures.ProcessPoolExecutor
+    else:
+        raise ValueError('unknown sver_parallel=%r' % (parallel,))
+    sver_kw = get_sver_kwargs(qreq_)
+
+    # Gather the inputs of every chipmatch and split them into tasks
+    cm_list = list(cm_list)
+    sver_inputs_list = []
+    task_list = []
+    cmx_list = []
+    for cmx, cm in enumerate(cm_list):
+        sver_inputs = get_sver_inputs(qreq_, cm)
+        sver_inputs_list.append(sver_inputs)
+        kpts1, kpts2_list, fm_list, dlen_sqrd_list, match_weight_list = sver_inputs
+        for start in range(0, len(fm_list), SVER_CHUNKSIZE):
+            sl_ = slice(start, start + SVER_CHUNKSIZE)
+            task = (
+                kpts1,
+                kpts2_list[sl_],
+                fm_list[sl_],
+                dlen_sqrd_list[sl_],
+                match_weight_list[sl_],
+                sver_kw,
+            )
+            task_list.append(task)
+            cmx_list.append(cmx)
+
+    svtups_list = [[] for _ in cm_list]
+    with executor_cls(min(nworkers, max(len(task_list), 1))) as executor:
+        result_iter = executor.map(_sver_task_worker, task_list)
+        for cmx, svtup_list in zip(cmx_list, result_iter):
+            svtups_list[cmx].extend(svtup_list)
+
+    cm_list_SVER = [
+        finish_sver_chipmatch(qreq_, cm, svtup_list, sver_inputs[3])
+        for cm, svtup_list, sver_inputs in zip(cm_list, svtups_list, sver_inputs_list)
+    ]
+    return cm_list_SVER
+
+
+def _sver_task_worker(task):
+    return compute_sver_tups(*task)
+
+
 # @profile
 def sver_single_chipmatch(qreq_, cm, verbose=False):
     r"""
@@ -1448,15 +1527,45 @@ def sver_single_chipmatch(qreq_, cm, verbose=False):
         >>>                    refine_method=refine_method)
         >>> ut.show_if_requested()
     """
+    sver_inputs = get_sver_inputs(qreq_, cm)
+    sver_kw = get_sver_kwargs(qreq_)
+    kpts1, kpts2_list, fm_list, top_dlen_sqrd_list, match_weight_list = sver_inputs
+    svtup_list = compute_sver_tups(
+        kpts1,
+        kpts2_list,
+        fm_list,
+        top_dlen_sqrd_list,
+        match_weight_list,
+        sver_kw,
+        verbose=verbose,
+    )
+    # <SENTINAL>
+    cmSV = finish_sver_chipmatch(qreq_, cm, svtup_list, top_dlen_sqrd_list)
+    return cmSV
+
+
+def get_sver_kwargs(qreq_):
+    """ the spatial verification parameters passed to vt.spatially_verify_kpts """
+    sver_kw = dict(
+        xy_thresh=qreq_.qparams.xy_thresh,
+        scale_thresh=qreq_.qparams.scale_thresh,
+        ori_thresh=qreq_.qparams.ori_thresh,
+        min_nInliers=qreq_.qparams.min_nInliers,
+        full_homog_checks=qreq_.qparams.full_homog_checks,
+        refine_method=qreq_.qparams.refine_method,
+    )
+    return sver_kw
+
+
+def get_sver_inputs(qreq_, cm):
+    r"""
+    Gathers the arrays needed to spatially verify the shortlist of a chipmatch
+
+    Returns:
+        tuple: (kpts1, kpts2_list, fm_list, top_dlen_sqrd_list, match_weight_list)
+    """
     qaid = cm.qaid
     use_chip_extent = qreq_.qparams.use_chip_extent
-    xy_thresh = qreq_.qparams.xy_thresh
-    scale_thresh = qreq_.qparams.scale_thresh
-    ori_thresh = qreq_.qparams.ori_thresh
-    min_nInliers = qreq_.qparams.min_nInliers
-    full_homog_checks = qreq_.qparams.full_homog_checks
-    refine_method = qreq_.qparams.refine_method
-    sver_output_weighting = qreq_.qparams.sver_output_weighting
     # Precompute sver cmtup_old
     kpts1 = qreq_.get_qreq_qannot_kpts(qaid).astype(np.float64)
     kpts2_list = qreq_.get_qreq_dannot_kpts(cm.daid_list)
@@ -1480,22 +1589,38 @@ def sver_single_chipmatch(qreq_, cm, verbose=False):
         match_weight_list = [qweights.take(fm.T[0]) for fm in cm.fm_list]
     else:
         match_weight_list = [np.ones(len(fm), dtype=np.float64) for fm in cm.fm_list]
+    fm_list = list(cm.fm_list)
+    return kpts1, kpts2_list, fm_list, top_dlen_sqrd_list, match_weight_list
+
+
+def compute_sver_tups(
+    kpts1,
+    kpts2_list,
+    fm_list,
+    top_dlen_sqrd_list,
+    match_weight_list,
+    sver_kw,
+    verbose=False,
+):
+    r"""
+    Runs spatial verification for each database annotation of a shortlist.
+    Only depends on numpy arrays, so it can run in a worker process.
 
+    Returns:
+        list: svtup_list - the output of vt.spatially_verify_kpts or None
+    """
+    xy_thresh = sver_kw['xy_thresh']
+    scale_thresh = sver_kw['scale_thresh']
+    ori_thresh = sver_kw['ori_thresh']
+    min_nInliers = sver_kw['min_nInliers']
+    full_homog_checks = sver_kw['full_homog_checks']
+    refine_method = sver_kw['refine_method']
     # Make an svtup for every daid in the shortlist
-    _iter1 = zip(
-        cm.daid_list,
-        cm.fm_list,
-        cm.fsv_list,
-        kpts2_list,
-        top_dlen_sqrd_list,
-        match_weight_list,
-    )
+    _iter1 = zip(fm_list, kpts2_list, top_dlen_sqrd_list, match_weight_list)
     if verbose:
-        _iter1 = ut.ProgIter(
-            _iter1, length=len(cm.daid_list), lbl='sver shortlist', freq=1
-        )
+        _iter1 = ut.ProgIter(_iter1, length=len(fm_list), lbl='sver shortlist', freq=1)
     svtup_list = []
-    for daid, fm, fsv, kpts2, dlen_sqrd2, match_weights in _iter1:
+    for fm, kpts2, dlen_sqrd2, match_weights in _iter1:
         if len(fm) == 0:
             # skip results without any matches
             sv_tup = None
@@ -1552,8 +1677,12 @@ def sver_single_chipmatch(qreq_, cm, verbose=False):
                 sv_tup = None
         svtup_list.append(sv_tup)
 
-    # <SENTINAL>
+    return svtup_list
 
+
+def finish_sver_chipmatch(qreq_, cm, svtup_list, top_dlen_sqrd_list):
+    """ builds the verified chipmatch from the output of compute_sver_tups """
+    sver_output_weighting = qreq_.qparams.sver_output_weighting
     # New way
     inliers_list = []
     for sv_tup in svtup_list:
@@ -1575,7 +1704,8 @@ def sver_single_chipmatch(qreq_, cm, verbose=False):
 
     if sver_output_weighting:
         homog_err_weight_list = []
-        xy_thresh_sqrd = dlen_sqrd2 * xy_thresh
+        # NOTE: uses the extent of the last annotation in the shortlist
+        xy_thresh_sqrd = top_dlen_sqrd_list[-1] * qreq_.qparams.xy_thresh
         for sv_tup in svtup_list_:
             (homog_inliers, homog_errors) = sv_tup[0:2]
             homog_xy_errors = homog_errors[0].take(homog_inliers, axis=0)
@@ -21,6 +21,7 @@ from wbia.algo.hots import neighbor_index_cache
 # from wbia.algo.hots import distinctiveness_normalizer
 from wbia.algo.hots import query_params
 from wbia.algo.hots import chip_match
+from wbia.algo.hots import chipmatch_store
 from wbia.algo.hots import _pipeline_helpers as plh  # NOQA
 import wbia.constants as const
 
@@ -1233,6 +1234,15 @@ class QueryRequest(ut.NiceRepr):
                     prog_hook=prog_hook,
                     **qreq_._indexer_request_params,
                 )
+            elif index_method == 'incremental':
+                if ut.VERYVERBOSE or verbose:
+                    print('[qreq] loading incremental indexer')
+                indexer = neighbor_index_cache.request_incremental_wbia_nnindexer(
+                    qreq_,
+                    verbose=verbose,
+                    prog_hook=prog_hook,
+                    **qreq_._indexer_request_params,
+                )
             # elif index_method == 'multi':
             #    if ut.VERYVERBOSE or verbose:
             #        print('[qreq] loading multi indexer normalizer')
@@ -1274,6 +1284,22 @@ class QueryRequest(ut.NiceRepr):
             fpath = join(dpath, fname)
             yield fpath
 
+    def get_chipmatch_store(qreq_, super_qres_cache=False):
+        r"""
+        Returns the chunked chipmatch cache for the config of this request
+        """
+        if super_qres_cache:
+            cfgstr = 'supercache'
+        else:
+            cfgstr = qreq_.get_cfgstr(with_input=False, with_data=True, with_pipe=True)
+        return chipmatch_store.ChipMatchStore(qreq_.get_qresdir(), cfgstr)
+
+    def get_bigcache_chunk(qreq_):
+        """ chipmatch chunk holding the results of the entire request """
+        bc_dpath, bc_fname, bc_cfgstr = qreq_.get_bigcache_info()
+        fname = '%s_%s%s' % (bc_fname, ut.hashstr27(bc_cfgstr), chipmatch_store.CHUNK_EXT)
+        return chipmatch_store.ChipMatchChunk(join(bc_dpath, fname))
+
     def execute(
         qreq_, qaids=None, prog_hook=None, use_cache=None, invalidate_supercache=None
     ):
@@ -31,14 +31,25 @@ class FinalResults(ut.NiceRepr):
 class TempQuery(ut.NiceRepr):
     """ queries that are incomplete """
 
-    def __init__(query, vecs, invalid_axs, get_neighbors, get_axs):
+    def __init__(query, vecs, invalid_axs, get_neighbors, get_axs, groupx=None):
         # Static attributes
         query.invalid_axs = invalid_axs
         query.get_neighbors = get_neighbors
         query.get_axs = get_axs
+        if groupx is not None:
+            # Stacked queries: invalid_axs is a list with one array per group.
+            # Encode (group, ax) pairs so each row is checked against its group.
+            query.invalid_keys = np.hstack(
+                [np.empty(0, dtype=np.int64)]
+                + [
+                    encode_group_axs(groupx_, np.asarray(axs, dtype=np.int64))
+                    for groupx_, axs in enumerate(invalid_axs)
+                ]
+            )
         # Dynamic attributes
         query.index = np.arange(len(vecs))
         query.vecs = vecs
+        query.groupx = groupx
 
     def __nice__(query):
         return str(query.index)
@@ -48,7 +59,11 @@ class TempQuery(ut.NiceRepr):
         idxs = vt.atleast_nd(_idxs, 2)
         dists = vt.atleast_nd(_dists, 2)
         # Flag any neighbors that are invalid
-        validflags = ~in1d_shape(query.get_axs(idxs), query.invalid_axs)
+        if query.groupx is None:
+            validflags = ~in1d_shape(query.get_axs(idxs), query.invalid_axs)
+        else:
+            keys = encode_group_axs(query.groupx[:, None], query.get_axs(idxs))
+            validflags = ~in1d_shape(keys, query.invalid_keys)
         # Store results in an object
         cand = TempResults(query.index, idxs, dists, validflags)
         return cand
@@ -56,6 +71,8 @@ class TempQuery(ut.NiceRepr):
     def compress_inplace(query, flags):
         query.index = query.index.compress(flags, axis=0)
         query.vecs = query.vecs.compress(flags, axis=0)
+        if query.groupx is not None:
+            query.groupx = query.groupx.compress(flags, axis=0)
 
 
 class TempResults(ut.NiceRepr):
@@ -114,6 +131,11 @@ def in1d_shape(arr1, arr2):
     return np.in1d(arr1, arr2).reshape(arr1.shape)
 
 
+def encode_group_axs(groupxs, axs):
+    """ packs group indices and annotation indices into a single int64 key """
+    return (np.asarray(groupxs, dtype=np.int64) << 32) + axs
+
+
 def requery_knn(
     get_neighbors,
     get_axs,
@@ -123,11 +145,16 @@ def requery_knn(
     pad=2,
     limit=4,
     recover=True,
+    qfx2_groupx=None,
 ):
     """
     Searches for `num_neighbs`, while ignoring certain matches.  K is
     increassed until enough valid neighbors are found or a limit is reached.
 
+    If `qfx2_groupx` is given then `qfx2_vec` holds the stacked descriptors of
+    several queries, `qfx2_groupx[i]` is the query that row `i` belongs to,
+    and `invalid_axs` is a list with the invalid axs of each query.
+
     Example:
         >>> # ENABLE_DOCTEST
         >>> from wbia.algo.hots.neighbor_index import *  # NOQA
@@ -193,7 +220,7 @@ def requery_knn(
     # Alloc space for final results
     shape = (len(qfx2_vec), num_neighbs)
     final = FinalResults(shape)  # NOQA
-    query = TempQuery(qfx2_vec, invalid_axs, get_neighbors, get_axs)
+    query = TempQuery(qfx2_vec, invalid_axs, get_neighbors, get_axs, qfx2_groupx)
 
     temp_K = num_neighbs + pad
     assert limit > 0, 'must have at least one iteration'
@@ -36,6 +36,109 @@ def benchmark_knn():
     )
 
 
+def benchmark_knn_many():
+    r"""
+    Compares looped per-query knn against the stacked knn_many path
+
+    CommandLine:
+        python ~/code/wbia/wbia/algo/hots/tests/bench.py benchmark_knn_many
+        python ~/code/wbia/wbia/algo/hots/tests/bench.py benchmark_knn_many --db PZ_Master1
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from bench import *  # NOQA
+        >>> result = benchmark_knn_many()
+        >>> print(result)
+    """
+    import numpy as np
+    import wbia
+
+    dbname = ut.get_argval('--db', type_=str, default='PZ_MTEST')
+    K = 4
+    pad = 2
+    rows = []
+    for num_queries in [100, 300, 1000]:
+        qreq_ = wbia.testdata_qreq_(
+            defaultdb=dbname,
+            a='default:qsize=%d' % (num_queries,),
+            t='default:K=%d' % (K,),
+            verbose=0,
+        )
+        qreq_.load_indexer()
+        indexer = qreq_.indexer
+        qannots = qreq_.internal_qannots
+        qvecs_list = qannots.vecs
+        K_list = [K] * len(qvecs_list)
+        pad_list = [pad] * len(qvecs_list)
+        impossible_aids_list = [np.array([aid]) for aid in qannots.aid]
+
+        with ut.Timer('looped knn', verbose=False) as t1:
+            for qfx2_vec, K_ in zip(qvecs_list, K_list):
+                indexer.knn(qfx2_vec, K_)
+        with ut.Timer('knn_many', verbose=False) as t2:
+            indexer.knn_many(qvecs_list, K_list)
+        with ut.Timer('looped requery_knn', verbose=False) as t3:
+            for qfx2_vec, K_, pad_, impossible_aids in zip(
+                qvecs_list, K_list, pad_list, impossible_aids_list
+            ):
+                indexer.requery_knn(qfx2_vec, K_, pad_, impossible_aids)
+        with ut.Timer('requery_knn_many', verbose=False) as t4:
+            indexer.requery_knn_many(qvecs_list, K_list, pad_list, impossible_aids_list)
+        rows.append(
+            (len(qvecs_list), t1.ellapsed, t2.ellapsed, t3.ellapsed, t4.ellapsed)
+        )
+
+    lines = ['nQ   knn      knn_many  requery  requery_many  (seconds)']
+    for row in rows:
+        lines.append('%-4d %-8.3f %-9.3f %-8.3f %-8.3f' % row)
+    result = '\n'.join(lines)
+    return result
+
+
+def benchmark_weight_neighbors():
+    r"""
+    Compares the per-filter weight_neighbors loop against the stacked path
+
+    CommandLine:
+        python ~/code/wbia/wbia/algo/hots/tests/bench.py benchmark_weight_neighbors
+        python ~/code/wbia/wbia/algo/hots/tests/bench.py benchmark_weight_neighbors --db PZ_Master1
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from bench import *  # NOQA
+        >>> result = benchmark_weight_neighbors()
+        >>> print(result)
+    """
+    from wbia.algo.hots import _pipeline_helpers as plh
+    from wbia.algo.hots import pipeline
+
+    dbname = ut.get_argval('--db', type_=str, default='PZ_MTEST')
+    rows = []
+    for num_queries in [10, 100, 300]:
+        for cfg in ['default', 'default:normalizer_rule=name,fg_on=True,ratio_thresh=.8']:
+            qreq_, args = plh.testdata_pre(
+                'weight_neighbors',
+                defaultdb=dbname,
+                a=['default:qsize=%d' % (num_queries,)],
+                p=[cfg],
+            )
+            nns_list, nnvalid0_list = args
+            pipeline.BATCH_WEIGHT_NEIGHBORS = False
+            with ut.Timer('looped', verbose=False) as t1:
+                pipeline.weight_neighbors(qreq_, nns_list, nnvalid0_list, verbose=False)
+            pipeline.BATCH_WEIGHT_NEIGHBORS = True
+            with ut.Timer('stacked', verbose=False) as t2:
+                pipeline.weight_neighbors(qreq_, nns_list, nnvalid0_list, verbose=False)
+            rule = qreq_.qparams.normalizer_rule
+            rows.append((len(nns_list), rule, t1.ellapsed, t2.ellapsed))
+
+    lines = ['nQ   rule  looped   stacked  (seconds)']
+    for row in rows:
+        lines.append('%-4d %-5s %-8.4f %-8.4f' % row)
+    result = '\n'.join(lines)
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
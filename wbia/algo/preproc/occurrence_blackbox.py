@@ -29,12 +29,17 @@ import functools
 import numpy as np
 import utool as ut
 import scipy.cluster.hierarchy
-from scipy.spatial import distance
 
 (print, rrr, profile) = ut.inject2(__name__)
 
 
 KM_PER_SEC = 0.002
+EARTH_RADIUS_KM = 6367
+# Larger problems are clustered without a pairwise distance matrix
+LINKAGE_MAXSIZE = 1000
+# Rows and distances computed at once when sweeping over sorted points
+SWEEP_BLOCKSIZE = 256
+SWEEP_MAXPAIRS = 2 ** 20
 
 
 def haversine(latlon1, latlon2):
@@ -181,6 +186,425 @@ def time_dist_km(sec1, sec2, km_per_sec=KM_PER_SEC):
     return sec_dist
 
 
+def _radians_parts(X_data, columns):
+    """ lat, lon in radians and cos(lat) of the gps columns (or None) """
+    if 'lat' not in columns:
+        return None
+    lat = np.radians(X_data[..., columns.index('lat')])
+    lon = np.radians(X_data[..., columns.index('lon')])
+    return lat, lon, np.cos(lat)
+
+
+def _timespace_dist_parts(time1, time2, rad1, rad2, thresh_units, km_per_sec):
+    """
+    Distance between the preprocessed parts of two sets of points. Uses the
+    same arithmetic as the scalar distance functions.
+    """
+    dist = None
+    if time1 is not None:
+        dist = np.abs(time1 - time2)
+        if thresh_units == 'km':
+            dist = dist * km_per_sec
+    if rad1 is not None:
+        lat1, lon1, coslat1 = rad1
+        lat2, lon2, coslat2 = rad2
+        dlon = lon2 - lon1
+        dlat = lat2 - lat1
+        a = (np.sin(dlat / 2) ** 2) + coslat1 * coslat2 * (np.sin(dlon / 2) ** 2)
+        space = EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(a)))
+        if thresh_units == 'seconds':
+            space = space / km_per_sec
+        if dist is None:
+            dist = space
+        else:
+            # (nan if points are not comparable, otherwise nansum)
+            dist = np.where(
+                np.isnan(space), dist, np.where(np.isnan(dist), space, space + dist)
+            )
+    return dist
+
+
+def timespace_dist_vec(X1, X2, columns, thresh_units='seconds', km_per_sec=KM_PER_SEC):
+    r"""
+    Vectorized version of the distance functions picked by prepare_data.
+
+    Distances are computed between corresponding rows of X1 and X2 with numpy
+    broadcasting, so passing X[:, None] and X[None, :] gives a distance matrix.
+
+    Args:
+        X1 (ndarray): points with the last axis ordered as columns
+        X2 (ndarray): points with the last axis ordered as columns
+        columns (tuple): subset of ('time', 'lat', 'lon') returned by prepare_data
+        thresh_units (str): (default = 'seconds')
+        km_per_sec (float): (default = 0.002)
+
+    Returns:
+        ndarray: distances in thresh_units
+
+    CommandLine:
+        python -m wbia.algo.preproc.occurrence_blackbox timespace_dist_vec
+
+    Doctest:
+        >>> from wbia.algo.preproc.occurrence_blackbox import *  # NOQA
+        >>> posixtimes = np.array([10, 50, np.nan, 5, 80, 0])
+        >>> latlons = np.array([
+        >>>     (42.727985, -73.683994),
+        >>>     (np.nan, np.nan),
+        >>>     (np.nan, np.nan),
+        >>>     (42.227985, -73.083994),
+        >>>     (42.258333, -73.470993),
+        >>>     (-80.21895315, -158.81099213),
+        >>> ])
+        >>> for thresh_units in ['seconds', 'km']:
+        >>>     for data in [(posixtimes, latlons), (posixtimes, None), (None, latlons)]:
+        >>>         X_data, dist_func, columns = prepare_data(
+        >>>             *data, thresh_units=thresh_units)
+        >>>         dists1 = timespace_dist_vec(
+        >>>             X_data[:, None], X_data[None, :], columns, thresh_units)
+        >>>         dists2 = np.array([[dist_func(a, b) for b in X_data] for a in X_data])
+        >>>         dists2 = dists2.reshape(dists1.shape)
+        >>>         assert np.allclose(dists1, dists2, equal_nan=True)
+    """
+    X1 = np.asarray(X1, dtype=np.float64)
+    X2 = np.asarray(X2, dtype=np.float64)
+    time1 = time2 = None
+    if 'time' in columns:
+        time1 = X1[..., columns.index('time')]
+        time2 = X2[..., columns.index('time')]
+    rad1 = _radians_parts(X1, columns)
+    rad2 = _radians_parts(X2, columns)
+    return _timespace_dist_parts(time1, time2, rad1, rad2, thresh_units, km_per_sec)
+
+
+def timespace_pdist(X_data, columns, thresh_units='seconds', km_per_sec=KM_PER_SEC):
+    """
+    Condensed pairwise distances. Same as distance.pdist with the dist_func
+    from prepare_data, without a python call for every pair.
+    """
+    X_data = np.asarray(X_data, dtype=np.float64)
+    idx1, idx2 = np.triu_indices(len(X_data), k=1)
+    return timespace_dist_vec(
+        X_data[idx1], X_data[idx2], columns, thresh_units, km_per_sec
+    )
+
+
+def cluster_threshold_components(
+    X_data, columns, thresh, thresh_units='seconds', km_per_sec=KM_PER_SEC
+):
+    r"""
+    Single linkage clustering cut at thresh without a pairwise distance matrix
+
+    Single linkage with the distance criterion puts two points in the same
+    cluster exactly when they are connected by a chain of points that are
+    each within thresh of the next, so the clusters are the connected
+    components of that threshold graph. Points are sorted by time (or by
+    latitude when there are no times) and each point is only compared to the
+    points that follow it within thresh along that axis, because the distance
+    along the axis is a lower bound on the full distance. Identical rows are
+    collapsed first, so bursts taken at the same time and place stay cheap.
+
+    When neither the time nor the gps part is known for every point, the
+    points are split by which parts they have and each group is swept on its
+    own parts. Points with both parts are linked to points with only one of
+    them through that part alone (as the distance function does), and points
+    with only a time are never linked to points with only a gps.
+
+    Args:
+        X_data (ndarray): Nxlen(columns) array returned by prepare_data
+        columns (tuple): subset of ('time', 'lat', 'lon')
+        thresh (float): threshold in thresh_units
+        thresh_units (str): (default = 'seconds')
+        km_per_sec (float): (default = 0.002)
+
+    Returns:
+        ndarray: labels numbered from 1 in order of first appearance
+
+    CommandLine:
+        python -m wbia.algo.preproc.occurrence_blackbox cluster_threshold_components
+
+    Doctest:
+        >>> from wbia.algo.preproc.occurrence_blackbox import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> num = 1500
+        >>> posixtimes = np.cumsum(rng.exponential(60, num))
+        >>> posixtimes[rng.rand(num) < .2] = 1000  # burst of identical times
+        >>> latlons = np.array([42.7, -73.7]) + np.cumsum(rng.randn(num, 2) * .01, axis=0)
+        >>> latlons[rng.rand(num) < .1] = np.nan
+        >>> # Some rows have only a time, others only a gps, most have both
+        >>> mixedtimes = posixtimes.copy()
+        >>> mixedtimes[rng.rand(num) < .1] = np.nan
+        >>> datas = [(posixtimes, latlons), (posixtimes, None), (None, latlons),
+        >>>          (mixedtimes, latlons)]
+        >>> for thresh_units, thresh in [('seconds', 300), ('km', 1.0)]:
+        >>>     for data in datas:
+        >>>         X_data, _, columns = prepare_data(*data, thresh_units=thresh_units)
+        >>>         labels1 = cluster_threshold_components(X_data, columns, thresh,
+        >>>                                                thresh_units)
+        >>>         condenced_dist_mat = timespace_pdist(X_data, columns, thresh_units)
+        >>>         condenced_dist_mat[np.isnan(condenced_dist_mat)] = 1e12
+        >>>         linkage_mat = scipy.cluster.hierarchy.linkage(
+        >>>             condenced_dist_mat, method='single')
+        >>>         labels2 = scipy.cluster.hierarchy.fcluster(
+        >>>             linkage_mat, thresh, criterion='distance')
+        >>>         # The partitions are the same
+        >>>         num_labels = len(set(labels1))
+        >>>         assert 1 < num_labels < num
+        >>>         assert num_labels == len(set(labels2))
+        >>>         assert num_labels == len(set(zip(labels1, labels2)))
+    """
+    X_data = np.asarray(X_data, dtype=np.float64)
+    if X_data.ndim == 1:
+        X_data = X_data[:, None]
+    num = len(X_data)
+    # Points without any data are never within the threshold
+    isvalid = ~np.all(np.isnan(X_data), axis=1)
+    X_valid = np.ascontiguousarray(X_data[isvalid])
+    # Collapse identical rows
+    row_dtype = np.dtype((np.void, X_valid.dtype.itemsize * X_valid.shape[1]))
+    _, unique_idx, unique_inv = np.unique(
+        X_valid.view(row_dtype).ravel(), return_index=True, return_inverse=True
+    )
+    X_unique = X_valid[unique_idx]
+    time = X_unique[:, columns.index('time')] if 'time' in columns else None
+    rad = _radians_parts(X_unique, columns)
+    num_unique = len(X_unique)
+    parent = np.arange(num_unique)
+    has_time = time is not None and not np.any(np.isnan(time))
+    has_gps = rad is not None and not np.any(np.isnan(rad[0]) | np.isnan(rad[1]))
+    if has_time or has_gps:
+        # One part is known for every point, so its differences bound every
+        # pair and a single sweep finds all links
+        _sweep_group(
+            parent, np.arange(num_unique), time, rad, thresh, thresh_units, km_per_sec
+        )
+    else:
+        _sweep_mixed_groups(parent, time, rad, thresh, thresh_units, km_per_sec)
+    unique_labels = _uf_find(parent, np.arange(num_unique)) + 1
+    raw_labels = np.empty(num, dtype=np.int64)
+    raw_labels[isvalid] = unique_labels[unique_inv.ravel()]
+    raw_labels[~isvalid] = np.arange((~isvalid).sum()) + len(unique_idx) + 1
+    # Number labels by first appearance
+    _, first_idx, label_inv = np.unique(
+        raw_labels, return_index=True, return_inverse=True
+    )
+    label_rank = np.argsort(np.argsort(first_idx, kind='mergesort'))
+    X_labels = label_rank[label_inv.ravel()] + 1
+    return X_labels
+
+
+def _uf_find(parent, idxs):
+    """ vectorized union-find root lookup with path compression """
+    roots = parent[idxs]
+    while True:
+        next_roots = parent[roots]
+        if np.array_equal(next_roots, roots):
+            break
+        roots = next_roots
+    parent[idxs] = roots
+    return roots
+
+
+def _uf_union(parent, idxs1, idxs2):
+    """ vectorized union of the sets containing each pair of indices """
+    while len(idxs1) > 0:
+        roots1 = _uf_find(parent, idxs1)
+        roots2 = _uf_find(parent, idxs2)
+        isdiff = roots1 != roots2
+        idxs1, idxs2 = idxs1[isdiff], idxs2[isdiff]
+        roots1, roots2 = roots1[isdiff], roots2[isdiff]
+        # Conflicting writes lose some unions, they are redone next iteration
+        parent[np.maximum(roots1, roots2)] = np.minimum(roots1, roots2)
+
+
+def _num_sweep_pairs(sortkey, scale, thresh):
+    """ number of pairs a sweep along sortkey would consider """
+    sortkey = np.sort(sortkey)
+    stops = np.searchsorted(sortkey, sortkey + thresh / scale, side='right')
+    return (stops - np.arange(len(sortkey))).sum()
+
+
+def _sweep_keys(time, rad, thresh_units, km_per_sec):
+    """
+    Scaled sort keys whose differences bound the time part (time_keys) and
+    the gps part (space_keys) of the distance. Only parts that are known for
+    every point give keys.
+    """
+    time_keys, space_keys = [], []
+    if time is not None and not np.any(np.isnan(time)):
+        time_keys.append((time, km_per_sec if thresh_units == 'km' else 1.0))
+    if rad is not None and not np.any(np.isnan(rad[0]) | np.isnan(rad[1])):
+        lat, lon, coslat = rad
+        space_scale = EARTH_RADIUS_KM / (
+            km_per_sec if thresh_units == 'seconds' else 1.0
+        )
+        space_keys.append((lat, space_scale))
+        space_keys.append((coslat * np.cos(lon), space_scale))
+        space_keys.append((coslat * np.sin(lon), space_scale))
+    return time_keys, space_keys
+
+
+def _sweep_group(
+    parent, ids, time, rad, thresh, thresh_units, km_per_sec, isfirst=None
+):
+    """
+    Links the points ids whose parts (time and/or rad, indexed like ids, None
+    for a part that is ignored) are within thresh. At least one part must be
+    known for every point. If isfirst is given, only pairs with one point on
+    each side of it are considered.
+    """
+    if len(ids) < 2:
+        return
+    time_keys, space_keys = _sweep_keys(time, rad, thresh_units, km_per_sec)
+    # Sweep along the axis that gives the fewest candidate pairs
+    sortkey, scale = min(
+        time_keys + space_keys, key=lambda k: _num_sweep_pairs(k[0], k[1], thresh)
+    )
+    _sweep_components(
+        parent,
+        ids,
+        sortkey,
+        scale,
+        time_keys,
+        space_keys,
+        time,
+        rad,
+        thresh,
+        thresh_units,
+        km_per_sec,
+        isfirst=isfirst,
+    )
+
+
+def _sweep_mixed_groups(parent, time, rad, thresh, thresh_units, km_per_sec):
+    """
+    Links points when no part is known for every point. Each sweep only
+    looks at the parts that both points of a pair have, which are then
+    known for every point in that sweep.
+    """
+    num = len(time) if time is not None else len(rad[0])
+    hastime = np.zeros(num, dtype=bool) if time is None else ~np.isnan(time)
+    hasgps = np.zeros(num, dtype=bool)
+    if rad is not None:
+        hasgps = ~(np.isnan(rad[0]) | np.isnan(rad[1]))
+    # (points, side of each point or None, use time, use gps)
+    sweeps = [
+        (hastime & hasgps, None, True, True),
+        (hastime & ~hasgps, None, True, False),
+        (~hastime & hasgps, None, False, True),
+        # points with both parts against points with only one of them
+        (hastime, hasgps, True, False),
+        (hasgps, hastime, False, True),
+    ]
+    for flags, sides, use_time, use_gps in sweeps:
+        ids = np.nonzero(flags)[0]
+        if len(ids) < 2:
+            continue
+        _sweep_group(
+            parent,
+            ids,
+            time[ids] if use_time else None,
+            tuple(part[ids] for part in rad) if use_gps else None,
+            thresh,
+            thresh_units,
+            km_per_sec,
+            isfirst=None if sides is None else sides[ids],
+        )
+
+
+def _sweep_components(
+    parent,
+    ids,
+    sortkey,
+    scale,
+    time_keys,
+    space_keys,
+    time,
+    rad,
+    thresh,
+    thresh_units,
+    km_per_sec,
+    isfirst=None,
+):
+    """
+    Unions the points ids in parent that are within thresh of each other.
+
+    Points are sorted by sortkey and compared in blocks to the points that
+    follow them within thresh / scale. Pairs that are already connected or
+    whose lower bound on the distance (from time_keys and space_keys) is over
+    the threshold are skipped before computing the exact distance, which
+    keeps dense bursts cheap. The keys, time and rad are indexed like ids.
+
+    If isfirst is given only pairs with one point on each side are linked.
+    Blocks of the smaller side are then compared to the points of the other
+    side within thresh / scale before and after them.
+    """
+    sortx = np.argsort(sortkey, kind='mergesort')
+    sortkey = sortkey[sortx]
+    ids = ids[sortx]
+    time_keys = [(key[sortx], kscale) for key, kscale in time_keys]
+    space_keys = [(key[sortx], kscale) for key, kscale in space_keys]
+    time = None if time is None else time[sortx]
+    rad = None if rad is None else tuple(part[sortx] for part in rad)
+    # Guard against rounding in the lower bounds
+    bound_thresh = thresh * (1 + 1e-9)
+    colsize = max(SWEEP_MAXPAIRS // SWEEP_BLOCKSIZE, 1)
+    if isfirst is None:
+        row_pos = col_pos = np.arange(len(sortkey))
+    else:
+        isfirst = isfirst[sortx]
+        row_pos, col_pos = np.nonzero(isfirst)[0], np.nonzero(~isfirst)[0]
+        if len(row_pos) > len(col_pos):
+            row_pos, col_pos = col_pos, row_pos
+    col_sortkey = sortkey[col_pos]
+    for start in range(0, len(row_pos), SWEEP_BLOCKSIZE):
+        rows = row_pos[start : start + SWEEP_BLOCKSIZE]
+        if isfirst is None:
+            wstart = start
+        else:
+            wstart = np.searchsorted(
+                col_sortkey, sortkey[rows[0]] - bound_thresh / scale, side='left'
+            )
+        wstop = np.searchsorted(
+            col_sortkey, sortkey[rows[-1]] + bound_thresh / scale, side='right'
+        )
+        for cstart in range(wstart, wstop, colsize):
+            cols = col_pos[cstart : min(cstart + colsize, wstop)]
+            roots1 = _uf_find(parent, ids[rows])
+            roots2 = _uf_find(parent, ids[cols])
+            iscand = roots1[:, None] != roots2[None, :]
+            if isfirst is None:
+                iscand &= cols[None, :] > rows[:, None]
+            lower = np.zeros(iscand.shape)
+            for key, kscale in time_keys:
+                lower += np.abs(key[None, cols] - key[rows, None]) * kscale
+            if space_keys:
+                space_lower = np.zeros(iscand.shape)
+                for key, kscale in space_keys:
+                    np.maximum(
+                        space_lower,
+                        np.abs(key[None, cols] - key[rows, None]) * kscale,
+                        out=space_lower,
+                    )
+                lower += space_lower
+            iscand &= lower <= bound_thresh
+            idx1, idx2 = np.nonzero(iscand)
+            if len(idx1) == 0:
+                continue
+            idx1 = rows[idx1]
+            idx2 = cols[idx2]
+            dists = _timespace_dist_parts(
+                None if time is None else time[idx1],
+                None if time is None else time[idx2],
+                None if rad is None else tuple(part[idx1] for part in rad),
+                None if rad is None else tuple(part[idx2] for part in rad),
+                thresh_units,
+                km_per_sec,
+            )
+            with np.errstate(invalid='ignore'):
+                islinked = dists <= thresh
+            _uf_union(parent, ids[idx1[islinked]], ids[idx2[islinked]])
+
+
 def prepare_data(posixtimes, latlons, km_per_sec=KM_PER_SEC, thresh_units='seconds'):
     r"""
     Package datas and picks distance function
@@ -332,15 +756,7 @@ def cluster_timespace_km(posixtimes, latlons, thresh_km, km_per_sec=KM_PER_SEC):
     if X_data is None:
         return None
 
-    # Compute pairwise distances between all inputs
-    dist_func = functools.partial(dist_func, km_per_sec=km_per_sec)
-    condenced_dist_mat = distance.pdist(X_data, dist_func)
-    # Compute heirarchical linkages
-    linkage_mat = scipy.cluster.hierarchy.linkage(condenced_dist_mat, method='single')
-    # Cluster linkages
-    X_labels = scipy.cluster.hierarchy.fcluster(
-        linkage_mat, thresh_km, criterion='distance'
-    )
+    X_labels = _cluster_chunk(X_data, columns, thresh_km, 'km', km_per_sec)
     return X_labels
 
 
@@ -409,7 +825,7 @@ def cluster_timespace_sec(posixtimes, latlons, thresh_sec=5, km_per_sec=KM_PER_S
     grouped_labels = []
     for xs in groupxs:
         X_part = X_data.take(xs, axis=0)
-        labels = _cluster_part(X_part, dist_func, columns, thresh_sec, km_per_sec)
+        labels = _cluster_part(X_part, columns, thresh_sec, km_per_sec)
         grouped_labels.append((labels, xs))
     # Undo grouping and rectify overlaps
     X_labels = _recombine_labels(grouped_labels)
@@ -438,14 +854,19 @@ def _recombine_labels(chunk_labels):
         combined_labels[start:stop] += offset
         offset += len(np.unique(combined_labels[start:stop]))
     # Ungroup
-    X_labels = np.empty(combined_idxs.max() + 1, dtype=np.int)
+    X_labels = np.empty(combined_idxs.max() + 1, dtype=np.int64)
     # new_labels[:] = -1
     X_labels[combined_idxs] = combined_labels
     return X_labels
 
 
-def _cluster_part(X_part, dist_func, columns, thresh_sec, km_per_sec):
-    if len(X_part) > 500 and 'time' in columns and ~np.isnan(X_part[0, 0]):
+def _cluster_part(X_part, columns, thresh_sec, km_per_sec):
+    if len(X_part) > LINKAGE_MAXSIZE:
+        # The sweep already skips points that are far apart in time
+        X_labels = cluster_threshold_components(
+            X_part, columns, thresh_sec, 'seconds', km_per_sec
+        )
+    elif len(X_part) > 500 and 'time' in columns and ~np.isnan(X_part[0, 0]):
         # Try and break problem up into smaller chunks by finding feasible
         # one-dimensional breakpoints (is this a cutting plane?)
         chunk_labels = []
@@ -453,30 +874,35 @@ def _cluster_part(X_part, dist_func, columns, thresh_sec, km_per_sec):
         for idxs in chunk_idxs:
             # print('Doing occurrence chunk {}'.format(len(idxs)))
             X_chunk = X_part.take(idxs, axis=0)
-            labels = _cluster_chunk(X_chunk, dist_func, thresh_sec)
+            labels = _cluster_chunk(X_chunk, columns, thresh_sec, 'seconds', km_per_sec)
             chunk_labels.append((labels, idxs))
         X_labels = _recombine_labels(chunk_labels)
     else:
         # Compute the whole problem
-        X_labels = _cluster_chunk(X_part, dist_func, thresh_sec)
+        X_labels = _cluster_chunk(X_part, columns, thresh_sec, 'seconds', km_per_sec)
     return X_labels
 
 
-def _cluster_chunk(X_data, dist_func, thresh_sec):
+def _cluster_chunk(X_data, columns, thresh, thresh_units, km_per_sec):
     if len(X_data) == 0:
-        X_labels = np.empty(len(X_data), dtype=np.int)
+        X_labels = np.empty(len(X_data), dtype=np.int64)
     elif len(X_data) == 1:
-        X_labels = np.ones(len(X_data), dtype=np.int)
+        X_labels = np.ones(len(X_data), dtype=np.int64)
     elif np.all(np.isnan(X_data)):
-        X_labels = np.arange(1, len(X_data) + 1, dtype=np.int)
-    else:
+        X_labels = np.arange(1, len(X_data) + 1, dtype=np.int64)
+    elif len(X_data) <= LINKAGE_MAXSIZE:
         # Compute pairwise distances between all inputs
-        condenced_dist_mat = distance.pdist(X_data, dist_func)
+        condenced_dist_mat = timespace_pdist(X_data, columns, thresh_units, km_per_sec)
         # Compute heirarchical linkages
         linkage_mat = scipy.cluster.hierarchy.linkage(condenced_dist_mat, method='single')
         # Cluster linkages
         X_labels = scipy.cluster.hierarchy.fcluster(
-            linkage_mat, thresh_sec, criterion='distance'
+            linkage_mat, thresh, criterion='distance'
+        )
+    else:
+        # Same clusters as single linkage in O(n log n) for sparse data
+        X_labels = cluster_threshold_components(
+            X_data, columns, thresh, thresh_units, km_per_sec
         )
     return X_labels
 
@@ -564,6 +990,45 @@ def _chunk_time(X_part, thresh_sec):
 #         yield idxs
 
 
+def testdata_camera_traps(num, num_cameras=50, rng=None):
+    """
+    Bursts of images from cameras scattered over a park. Some images are missing
+    their gps or time.
+    """
+    rng = np.random.RandomState(0) if rng is None else rng
+    camera_latlons = np.array([-1.5, 35.0]) + rng.rand(num_cameras, 2) * 0.5
+    num_bursts = max(num // 5, 1)
+    burst_sizes = rng.randint(1, 10, num_bursts)
+    burst_times = np.cumsum(rng.exponential(1800, num_bursts))
+    burst_cameras = rng.randint(0, num_cameras, num_bursts)
+    burstx = np.repeat(np.arange(num_bursts), burst_sizes)[:num]
+    posixtimes = burst_times[burstx] + rng.randint(0, 30, len(burstx))
+    latlons = camera_latlons[burst_cameras[burstx]] + rng.randn(len(burstx), 2) * 1e-4
+    posixtimes[rng.rand(len(burstx)) < 0.05] = np.nan
+    latlons[rng.rand(len(burstx)) < 0.05] = np.nan
+    return posixtimes, latlons
+
+
+def benchmark_cluster_timespace(num_list=[1000, 10000, 100000, 1000000]):
+    r"""
+    CommandLine:
+        python -m wbia.algo.preproc.occurrence_blackbox benchmark_cluster_timespace
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.preproc.occurrence_blackbox import *  # NOQA
+        >>> result = benchmark_cluster_timespace()
+        >>> print(ut.repr3(result, precision=3))
+    """
+    result = ut.odict()
+    for num in num_list:
+        posixtimes, latlons = testdata_camera_traps(num)
+        with ut.Timer(verbose=False) as t:
+            X_labels = cluster_timespace_sec(posixtimes, latlons, 30 * 60.0)
+        result[num] = {'seconds': t.ellapsed, 'num_clusters': len(set(X_labels))}
+    return result
+
+
 def main():
     """
     CommandLine:
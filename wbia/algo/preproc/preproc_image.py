@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 import os
+import io
+import uuid
+import hashlib
+import collections
+import itertools as it
 from os.path import splitext, basename, isabs
 import warnings
 import vtool.exif as vtexif
@@ -10,6 +15,20 @@ import six
 (print, rrr, profile) = ut.inject2(__name__)
 
 
+# Number of workers used to parse images on import (defaults to the number of cpus)
+IMPORT_WORKERS = ut.get_argval('--import-workers', type_=int, default=None)
+# Parse images on import in worker processes instead of threads
+IMPORT_PROCESSES = ut.get_argflag('--import-processes')
+# How import worker processes are started (defaults to forkserver or spawn). Forking
+# a process that runs other threads (web, job engine) can deadlock, so fork is only
+# used when it is asked for, e.g. from the command line.
+IMPORT_START_METHOD = ut.get_argval('--import-start-method', type_=str, default=None)
+# Number of images parsed by each task sent to an import worker
+IMPORT_CHUNKSIZE = ut.get_argval('--import-chunksize', type_=int, default=16)
+# Size of the buffer used to stream an image through the uuid hash
+HASH_BLOCKSIZE = ut.get_argval('--hash-blocksize', type_=int, default=2 ** 17)
+
+
 def parse_exif(pil_img):
     """ Image EXIF helper """
     exif_dict = vtexif.get_exif_dict(pil_img)
@@ -27,6 +46,81 @@ def get_standard_ext(gpath):
     return '.jpg' if ext == '.jpeg' else ext
 
 
+def get_file_uuid_and_header(fpath, blocksize=None):
+    r"""
+    Streams a file through sha1 one buffer at a time.
+
+    The uuid is identical to ut.get_file_uuid for any blocksize. The first
+    buffer is returned as well so the image header can be parsed without
+    opening the file a second time.
+
+    Args:
+        fpath (str): file path
+        blocksize (int): number of bytes read at a time (defaults to HASH_BLOCKSIZE)
+
+    Returns:
+        tuple: (uuid_, header)
+
+    CommandLine:
+        python -m wbia.algo.preproc.preproc_image --exec-get_file_uuid_and_header
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.preproc.preproc_image import *  # NOQA
+        >>> import numpy as np
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_file_uuid')
+        >>> rng = np.random.RandomState(0)
+        >>> size_list = [0, 1, 999, 1000, 1001, 2 ** 16 + 3, 2 ** 21 + 5]
+        >>> for size in size_list:
+        >>>     fpath = ut.unixjoin(dpath, 'data_%d.bin' % (size,))
+        >>>     ut.write_to(fpath, rng.bytes(size), mode='wb', verbose=False)
+        >>>     uuid_ = ut.get_file_uuid(fpath)
+        >>>     for blocksize in [1000, 2 ** 16, 2 ** 20, None]:
+        >>>         uuid2, header = get_file_uuid_and_header(fpath, blocksize)
+        >>>         assert uuid2 == uuid_, 'UUID gen method changed'
+        >>>         assert len(header) == min(size, blocksize or HASH_BLOCKSIZE)
+        >>> ut.delete(dpath, verbose=False)
+    """
+    if blocksize is None:
+        blocksize = HASH_BLOCKSIZE
+    hasher = hashlib.sha1()
+    # Reuse one buffer so large files do not allocate a new block per read
+    buf = bytearray(blocksize)
+    view = memoryview(buf)
+    with open(fpath, 'rb', buffering=0) as file_:
+        nbytes = file_.readinto(buf)
+        header = bytes(view[0:nbytes])
+        while nbytes > 0:
+            hasher.update(view[0:nbytes])
+            nbytes = file_.readinto(buf)
+    # sha1 produces 20 bytes, but UUID requires 16 bytes
+    uuid_ = uuid.UUID(bytes=hasher.digest()[0:16])
+    return uuid_, header
+
+
+def open_image_header(gpath, header):
+    """
+    Opens an image for its size and EXIF tags without decoding any pixels.
+
+    The segments of a jpeg that hold its size and EXIF come before the pixel
+    data, so they are parsed from the already read header buffer. Other
+    formats (whose metadata may follow the pixel data) and jpegs with
+    unusually large headers are opened from disk instead.
+    """
+    from PIL import Image
+
+    if get_standard_ext(gpath) == '.jpg':
+        try:
+            pil_img = Image.open(io.BytesIO(header))
+        except Exception:
+            pass
+        else:
+            if pil_img.format == 'JPEG':
+                return pil_img
+            pil_img.close()
+    return Image.open(gpath, 'r')
+
+
 @profile
 def parse_imageinfo(gpath):
     """ Worker function: gpath must be in UNIX-PATH format!
@@ -50,6 +144,7 @@ def parse_imageinfo(gpath):
         >>> print(result)
         >>> uuid = param_tup[0]
         >>> assert str(uuid) == '16008058-788c-2d48-cd50-f6029f726cbf'
+        >>> assert uuid == ut.get_file_uuid(gpath)
     """
     # Try to open the image
     from PIL import Image
@@ -133,10 +228,12 @@ def parse_imageinfo(gpath):
                 temp_file, temp_filepath = None, None
                 gpath_ = gpath
 
-            # Open image with Exif support
-            pil_img = Image.open(gpath_, 'r')
             # We cannot use pixel data as libjpeg is not determenistic (even for reads!)
-            image_uuid = ut.get_file_uuid(gpath_)  # Read file ]-hash-> guid = gid
+            # Read file ]-hash-> guid = gid
+            image_uuid, header = get_file_uuid_and_header(gpath_)
+            # Open image with Exif support
+            pil_img = open_image_header(gpath_, header)
+            del header
         except (
             AssertionError,
             IOError,
@@ -159,6 +256,7 @@ def parse_imageinfo(gpath):
     # Parse out the data
     width, height = pil_img.size  # Read width, height
     time, lat, lon, orient = parse_exif(pil_img)  # Read exif tags
+    pil_img.close()
     if orient in [6, 8]:
         width, height = height, width
     # orig_gpath = gpath
@@ -189,6 +287,174 @@ def parse_imageinfo(gpath):
     return param_tup
 
 
+def _parse_imageinfo_chunk(gpath_chunk):
+    """ Worker function: captures the error of each image instead of raising """
+    result_list = []
+    for gpath in gpath_chunk:
+        try:
+            result_list.append((parse_imageinfo(gpath), None))
+        except Exception as ex:
+            result_list.append((None, '%s: %s' % (type(ex).__name__, ex)))
+    return result_list
+
+
+def _import_mp_context(start_method=None):
+    import multiprocessing
+
+    if start_method is None:
+        start_method = IMPORT_START_METHOD
+    if start_method is None:
+        avail = multiprocessing.get_all_start_methods()
+        start_method = 'forkserver' if 'forkserver' in avail else 'spawn'
+    return multiprocessing.get_context(start_method)
+
+
+def _gen_parse_imageinfo_chunks(
+    gpath_chunks, nworkers, processes=False, start_method=None
+):
+    """
+    Yields the parsed chunks in order. At most two chunks per worker are
+    submitted at once, so memory does not grow with the size of the import.
+    """
+    import concurrent.futures
+
+    if nworkers <= 1:
+        for gpath_chunk in gpath_chunks:
+            yield _parse_imageinfo_chunk(gpath_chunk)
+        return
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            nworkers, mp_context=_import_mp_context(start_method)
+        )
+    else:
+        # Hashing and reading files release the GIL
+        executor = concurrent.futures.ThreadPoolExecutor(nworkers)
+    pending = collections.deque()
+    try:
+        chunk_iter = iter(gpath_chunks)
+        for gpath_chunk in it.islice(chunk_iter, 2 * nworkers):
+            pending.append(executor.submit(_parse_imageinfo_chunk, gpath_chunk))
+        while pending:
+            result_list = pending.popleft().result()
+            for gpath_chunk in it.islice(chunk_iter, 1):
+                pending.append(executor.submit(_parse_imageinfo_chunk, gpath_chunk))
+            yield result_list
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def parse_imageinfo_list(
+    gpath_list,
+    nworkers=None,
+    chunksize=None,
+    processes=None,
+    start_method=None,
+    verbose=True,
+):
+    r"""
+    Parses many images in a pool of worker threads or processes
+
+    An image that cannot be parsed yields None and, if it raised an
+    unexpected error, an error message. It never stops the other images.
+
+    Args:
+        gpath_list (list): image paths in UNIX-PATH format
+        nworkers (int): number of workers (defaults to IMPORT_WORKERS or the
+            number of cpus). 0 or 1 parses in the calling thread.
+        chunksize (int): images per task (defaults to IMPORT_CHUNKSIZE)
+        processes (bool): use worker processes instead of threads (defaults to
+            IMPORT_PROCESSES)
+        start_method (str): multiprocessing start method of the worker
+            processes (defaults to IMPORT_START_METHOD, forkserver, or spawn)
+        verbose (bool): show progress
+
+    Returns:
+        tuple: (params_list, error_list)
+
+    CommandLine:
+        python -m wbia.algo.preproc.preproc_image --exec-parse_imageinfo_list
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.preproc.preproc_image import *  # NOQA
+        >>> gpath_list = [ut.grab_test_imgpath(key) for key in ['patsy.jpg', 'carl.jpg']]
+        >>> gpath_list += ['doesnotexist.jpg'] + gpath_list
+        >>> params_list1, error_list1 = parse_imageinfo_list(gpath_list, nworkers=0)
+        >>> params_list2, error_list2 = parse_imageinfo_list(gpath_list, 2, chunksize=1)
+        >>> params_list3, error_list3 = parse_imageinfo_list(
+        >>>     gpath_list, 2, chunksize=1, processes=True, start_method='spawn')
+        >>> assert params_list1 == params_list2 == params_list3
+        >>> assert params_list1 == [parse_imageinfo(gpath) for gpath in gpath_list]
+        >>> assert params_list1[2] is None
+        >>> assert str(params_list1[0][0]) == '16008058-788c-2d48-cd50-f6029f726cbf'
+        >>> assert error_list1 == error_list2 == error_list3 == [None] * len(gpath_list)
+    """
+    if nworkers is None:
+        nworkers = ut.num_cpus() if IMPORT_WORKERS is None else IMPORT_WORKERS
+    if chunksize is None:
+        chunksize = IMPORT_CHUNKSIZE
+    if processes is None:
+        processes = IMPORT_PROCESSES
+    gpath_chunks = list(ut.ichunks(gpath_list, chunksize))
+    nworkers = min(nworkers, len(gpath_chunks))
+    result_iter = it.chain.from_iterable(
+        _gen_parse_imageinfo_chunks(gpath_chunks, nworkers, processes, start_method)
+    )
+    prog = ut.ProgIter(
+        result_iter, length=len(gpath_list), lbl='parse imageinfo', enabled=verbose
+    )
+    result_list = list(prog)
+    params_list = [params for params, error in result_list]
+    error_list = [error for params, error in result_list]
+    return params_list, error_list
+
+
+def benchmark_parse_imageinfo(num=400, shape=(1536, 2048), nworkers_list=[0, 2, 4]):
+    r"""
+    Times hashing and opening a batch of jpegs separately against parsing
+    them with parse_imageinfo_list in thread and process pools of different
+    sizes.
+
+    CommandLine:
+        python -m wbia.algo.preproc.preproc_image --exec-benchmark_parse_imageinfo
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.preproc.preproc_image import *  # NOQA
+        >>> benchmark_parse_imageinfo()
+    """
+    import numpy as np
+    from PIL import Image
+
+    dpath = ut.ensure_app_resource_dir('wbia', 'benchmark_parse_imageinfo')
+    rng = np.random.RandomState(0)
+    gpath_list = []
+    for index in range(num):
+        gpath = ut.unixjoin(dpath, 'img_%04d.jpg' % (index,))
+        if not ut.checkpath(gpath):
+            img = rng.randint(0, 255, shape + (3,)).astype(np.uint8)
+            Image.fromarray(img).save(gpath, quality=90)
+        gpath_list.append(gpath)
+
+    with ut.Timer('get_file_uuid') as timer:
+        uuid_list1 = [ut.get_file_uuid(gpath) for gpath in gpath_list]
+        size_list1 = [Image.open(gpath).size for gpath in gpath_list]
+    print('get_file_uuid + Image.open: %.2fs' % (timer.ellapsed,))
+    for nworkers, processes in ut.iprod(nworkers_list, [False, True]):
+        if nworkers <= 1 and processes:
+            continue
+        lbl = 'nworkers=%d processes=%r' % (nworkers, processes)
+        with ut.Timer(lbl) as timer:
+            params_list, _ = parse_imageinfo_list(
+                gpath_list, nworkers, processes=processes, verbose=False
+            )
+        print('%s: %.2fs' % (lbl, timer.ellapsed))
+        assert [params[0] for params in params_list] == uuid_list1
+        assert [params[5:7] for params in params_list] == size_list1
+
+
 # def add_images_params_gen(gpath_list):
 #     """
 #     generates values for add_images sqlcommands asychronously
@@ -7,6 +7,7 @@ from six.moves import zip, map, range
 from scipy.spatial import distance
 import scipy.cluster.hierarchy
 import sklearn.cluster
+from wbia.algo.preproc import occurrence_blackbox
 
 (print, rrr, profile) = ut.inject2(__name__, '[preproc_occurrence]')
 
@@ -94,8 +95,6 @@ def compute_occurrence_groups(ibs, gid_list, config={}, use_gps=False, verbose=N
     use_gps = config['use_gps']
     datas = prepare_X_data(ibs, gid_list, use_gps=use_gps)
 
-    from wbia.algo.preproc import occurrence_blackbox
-
     cluster_algo = config.get('cluster_algo', 'agglomerative')
     km_per_sec = config.get('km_per_sec', occurrence_blackbox.KM_PER_SEC)
     thresh_sec = config.get('seconds_thresh', 30 * 60.0)
@@ -348,7 +347,10 @@ def timespace_distance(pt1, pt2):
 
 def timespace_pdist(X_data):
     if X_data.shape[1] == 3:
-        return distance.pdist(X_data, timespace_distance)
+        # vectorized pdist(X_data, timespace_distance)
+        return occurrence_blackbox.timespace_pdist(
+            X_data, ('time', 'lat', 'lon'), thresh_units='km', km_per_sec=0.002
+        )
     if X_data.shape[1] == 1:
         return distance.pdist(X_data, 'euclidian')
 
@@ -375,7 +377,7 @@ def cluster_timespace(X_data, thresh):
         >>> ut.show_if_requested()
 
     """
-    condenced_dist_mat = distance.pdist(X_data, timespace_distance)
+    condenced_dist_mat = timespace_pdist(X_data)
     # Compute heirarchical linkages
     linkage_mat = scipy.cluster.hierarchy.linkage(condenced_dist_mat, method='centroid')
     # Cluster linkages
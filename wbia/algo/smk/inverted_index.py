@@ -10,6 +10,14 @@ from wbia.control.controller_inject import register_preprocs
 
 (print, rrr, profile) = ut.inject2(__name__)
 
+# Max number of (query word, database annot) pairs gathered at once when
+# scoring with a SparseInvertedIndex
+SMK_BATCH_MAXPAIRS = ut.get_argval('--smk-batch-maxpairs', type_=int, default=2 ** 16)
+
+# Approximate number of stacked descriptors assigned to words at once when
+# computing residuals
+SMK_ASSIGN_BLOCKSIZE = ut.get_argval('--smk-assign-blocksize', type_=int, default=2 ** 16)
+
 
 derived_attribute = register_preprocs['annot']
 
@@ -567,6 +575,211 @@ class SingleAnnot(ut.NiceRepr):
         return nbytes
 
 
+@ut.reloadable_class
+class SparseInvertedIndex(ut.NiceRepr):
+    r"""
+    The database side of an InvertedAnnots stacked into a CSR matrix with one
+    row per word. The columns of a row are the database annotations that
+    contain the word, and each nonzero stores the aggregated residual vector
+    and error flag of that annotation for that word.
+
+    This lets all database annotations be scored against a block of queries
+    at once. Each query word is scored against its row with one
+    matrix-vector product. The selectivity function, word weights, and per
+    annotation sums are then applied to all (query word, database annotation)
+    pairs together. Every word match is kept, including those that score
+    zero, so the feature correspondences of the shortlist are rebuilt from the
+    same word matches as match_kernel_agg.
+
+    Args:
+        inva (InvertedAnnots): database annotations with wx_to_weight and
+            gamma_list already computed
+
+    CommandLine:
+        python -m wbia.algo.smk.inverted_index SparseInvertedIndex
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.inverted_index import *  # NOQA
+        >>> from wbia.algo.smk.smk_pipeline import match_kernel_agg
+        >>> dinva = testdata_random_inva(num_annots=20, seed=0)
+        >>> qinva = testdata_random_inva(num_annots=3, seed=1)
+        >>> qinva.wx_to_weight = dinva.wx_to_weight
+        >>> qinva.gamma_list = qinva.compute_gammas(3.0, 0.0)
+        >>> smat = SparseInvertedIndex(dinva)
+        >>> X_list = [qinva.get_annot(aid) for aid in qinva.aids]
+        >>> results = smat.score_block(X_list, alpha=3.0, thresh=0.0)
+        >>> for X, (scores, hits, pairs) in zip(X_list, results):
+        >>>     didxs, X_idx, Y_idx, score_list = pairs
+        >>>     for didx, daid in enumerate(dinva.aids):
+        >>>         Y = dinva.get_annot(daid)
+        >>>         item = match_kernel_agg(X, Y, dinva.wx_to_weight, 3.0, 0.0)
+        >>>         assert np.isclose(scores[didx], item[0], rtol=1e-5, atol=1e-7)
+        >>>         assert hits[didx] == (len(item[3]) > 0)
+        >>>         # The same word matches, zero scoring ones included
+        >>>         flags = didxs == didx
+        >>>         got = sorted(zip(X_idx[flags], Y_idx[flags], score_list[flags]))
+        >>>         want = sorted(zip(item[3], item[4], item[1]))
+        >>>         assert [tup[0:2] for tup in got] == [tup[0:2] for tup in want]
+        >>>         got_fs, want_fs = [tup[2] for tup in got], [tup[2] for tup in want]
+        >>>         assert np.allclose(got_fs, want_fs, rtol=1e-5, atol=1e-7)
+        >>> print(smat)
+        <SparseInvertedIndex(nAnnots=20, nWords=64, nnz=...)>
+    """
+
+    def __init__(smat, inva):
+        wx_lists = inva.wx_lists
+        nwords_per_annot = np.array(ut.lmap(len, wx_lists), dtype=np.int64)
+        flat_wxs = np.hstack(wx_lists).astype(np.int64)
+        flat_didxs = np.repeat(np.arange(len(wx_lists)), nwords_per_annot)
+        flat_locals = np.hstack(ut.lmap(np.arange, nwords_per_annot))
+        # Order nonzeros by word, keeping annotations sorted within a word
+        sortx = flat_wxs.argsort(kind='stable')
+        num_words = int(flat_wxs.max()) + 1 if len(flat_wxs) else 0
+        smat.aids = np.array(inva.aids)
+        smat.int_rvec = inva.int_rvec
+        smat.indptr = np.zeros(num_words + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat_wxs, minlength=num_words), out=smat.indptr[1:])
+        smat.didxs = flat_didxs[sortx].astype(np.int32)
+        smat.locals = flat_locals[sortx].astype(np.int32)
+        smat.rvecs = np.vstack(inva.agg_rvecs)[sortx]
+        smat.flags = np.vstack(inva.agg_flags).ravel()[sortx]
+        smat.gammas = np.asarray(inva.gamma_list, dtype=np.float64)
+        smat.weights = np.array(
+            ut.take(inva.wx_to_weight, range(num_words)), dtype=np.float64
+        )
+
+    def __nice__(smat):
+        return 'nAnnots=%d, nWords=%d, nnz=%d' % (
+            len(smat.aids),
+            len(smat.indptr) - 1,
+            len(smat.didxs),
+        )
+
+    @property
+    def nbytes(smat):
+        arrs = [smat.indptr, smat.didxs, smat.locals, smat.rvecs, smat.flags]
+        return sum(arr.nbytes for arr in arrs)
+
+    def _uncast(smat, rvecs):
+        if smat.int_rvec:
+            return smk_funcs.uncast_residual_integer(rvecs)
+        return rvecs
+
+    @profile
+    def score_block(smat, X_list, alpha, thresh, maxpairs=None):
+        r"""
+        Scores a block of query annotations against every database annotation
+
+        Args:
+            X_list (list): query SingleAnnot objects
+            alpha (float): selectivity power
+            thresh (float): selectivity threshold
+            maxpairs (int): max number of word pairs held in memory at once
+
+        Returns:
+            list: one (scores, hits, pairs) tuple per query. ``scores`` and
+                ``hits`` are indexed like the database aids, ``hits`` marks
+                annotations that share at least one word with the query.
+                ``pairs`` is a tuple of (didxs, X_idx, Y_idx, score_list) for
+                every word match.
+        """
+        if maxpairs is None:
+            maxpairs = SMK_BATCH_MAXPAIRS
+        num_words = len(smat.indptr) - 1
+        num_daids = len(smat.aids)
+        num_queries = len(X_list)
+        # Flatten the words of all queries in the block
+        qwxs = [np.asarray(X.wx_list, dtype=np.int64) for X in X_list]
+        qrvecs = smat._uncast(np.vstack([X.agg_rvecs for X in X_list]))
+        qflags = np.vstack([X.agg_flags for X in X_list]).ravel()
+        qgammas = np.array([X.gamma for X in X_list], dtype=np.float64)
+        row_qx = np.repeat(np.arange(num_queries), ut.lmap(len, qwxs))
+        row_wx = np.hstack(qwxs) if len(qwxs) else np.empty(0, dtype=np.int64)
+        row_local = np.hstack([np.arange(len(wxs)) for wxs in qwxs])
+        row_ids = np.arange(len(row_wx))
+        isvalid = row_wx < num_words
+        row_qx, row_wx, row_local, row_ids = [
+            arr.compress(isvalid) for arr in (row_qx, row_wx, row_local, row_ids)
+        ]
+        row_start = smat.indptr[row_wx]
+        row_count = smat.indptr[row_wx + 1] - row_start
+
+        flat_scores = np.zeros(num_queries * num_daids, dtype=np.float64)
+        flat_hits = np.zeros(num_queries * num_daids, dtype=np.int64)
+        kept = []
+        # Process the rows in chunks that keep the gathered pairs bounded
+        row_ends = np.cumsum(row_count)
+        total = row_ends[-1] if len(row_ends) else 0
+        splits = np.searchsorted(
+            row_ends, np.arange(maxpairs, total, maxpairs), side='right'
+        )
+        chunk_bounds = np.unique(np.r_[0, splits, len(row_count)])
+        for r1, r2 in zip(chunk_bounds[:-1], chunk_bounds[1:]):
+            counts = row_count[r1:r2]
+            if counts.sum() == 0:
+                continue
+            # Index of each pair's row (within the chunk) and nonzero
+            pair_row = np.repeat(np.arange(r2 - r1), counts)
+            pair_offset = np.arange(len(pair_row)) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            pair_nz = row_start[r1:r2][pair_row] + pair_offset
+            pair_qrow = row_ids[r1:r2][pair_row]
+            pair_qx = row_qx[r1:r2][pair_row]
+            pair_didx = smat.didxs[pair_nz]
+
+            # Same as smk_funcs.match_scores_agg. The nonzeros of a word are
+            # contiguous, so each query word is one matrix-vector product, and
+            # integer database residuals are only scaled after the product.
+            u = np.empty(len(pair_nz), dtype=qrvecs.dtype)
+            pos = 0
+            for start, count, qrow in zip(row_start[r1:r2], counts, row_ids[r1:r2]):
+                if count:
+                    PhisY = smat.rvecs[start : start + count].astype(qrvecs.dtype)
+                    u[pos : pos + count] = PhisY.dot(qrvecs[qrow])
+                    pos += count
+            if smat.int_rvec:
+                u /= 255.0
+            u[qflags[pair_qrow] | smat.flags[pair_nz]] = 1
+            score_list = smk_funcs.selectivity(u, alpha, thresh, out=u)
+            norm_weights = smat.weights[row_wx[r1:r2]][pair_row]
+            norm_weights *= qgammas[pair_qx]
+            norm_weights *= smat.gammas[pair_didx]
+            score_list *= norm_weights
+
+            flat_idx = pair_qx * num_daids + pair_didx
+            flat_scores += np.bincount(
+                flat_idx, weights=score_list, minlength=len(flat_scores)
+            )
+            flat_hits += np.bincount(flat_idx, minlength=len(flat_hits))
+            kept.append(
+                (
+                    pair_qx,
+                    pair_didx,
+                    row_local[r1:r2][pair_row],
+                    smat.locals[pair_nz],
+                    score_list,
+                )
+            )
+
+        scores = flat_scores.reshape(num_queries, num_daids)
+        hits = flat_hits.reshape(num_queries, num_daids) > 0
+        if kept:
+            kept = [np.hstack(parts) for parts in zip(*kept)]
+        else:
+            kept = [np.empty(0, dtype=np.int64)] * 4 + [np.empty(0, dtype=np.float32)]
+        kept_qx, kept = kept[0], kept[1:]
+        sortx = kept_qx.argsort(kind='stable')
+        qx_bounds = np.searchsorted(kept_qx[sortx], np.arange(num_queries + 1))
+        results = []
+        for qx in range(num_queries):
+            idxs = sortx[qx_bounds[qx] : qx_bounds[qx + 1]]
+            pairs = tuple(arr.take(idxs) for arr in kept)
+            results.append((scores[qx], hits[qx], pairs))
+        return results
+
+
 @derived_attribute(
     tablename='inverted_agg_assign',
     parents=['feat', 'vocab'],
@@ -590,6 +803,7 @@ class SingleAnnot(ut.NiceRepr):
     configclass=InvertedIndexConfig,
     fname='smk/smk_agg_rvecs',
     chunksize=256,
+    parallel='process',
 )
 def compute_residual_assignments(depc, fid_list, vocab_id_list, config):
     r"""
@@ -671,31 +885,132 @@ def compute_residual_assignments(depc, fid_list, vocab_id_list, config):
     nAssign = config['nAssign']
     int_rvec = config['int_rvec']
 
-    from concurrent import futures
+    # Chunks of this table are spread over the depcache worker processes, so
+    # the residuals of each chunk are computed here in blocks.
+    for tup in gen_residual_blocks(vocab, vecs_list, nAssign, int_rvec):
+        yield tup
 
-    print('Building residual args')
-    worker = residual_worker
-    args_gen = gen_residual_args(vocab, vecs_list, nAssign, int_rvec)
-    args_gen = [
-        args for args in ut.ProgIter(args_gen, length=len(vecs_list), lbl='building args')
-    ]
-    # nprocs = ut.num_unused_cpus(thresh=10) - 1
-    nprocs = ut.num_cpus()
-    print('Creating %d processes' % (nprocs,))
-    executor = futures.ProcessPoolExecutor(nprocs)
-    try:
-        print('Submiting workers')
-        fs_chunk = [
-            executor.submit(worker, args)
-            for args in ut.ProgIter(args_gen, lbl='submit proc')
-        ]
-        for fs in ut.ProgIter(fs_chunk, lbl='getting phi result'):
-            tup = fs.result()
+
+def gen_residual_blocks(vocab, vecs_list, nAssign, int_rvec, blocksize=None):
+    r"""
+    Yields the same rows as residual_worker for each annotation. Descriptors of
+    consecutive annotations are stacked into blocks of about blocksize vectors
+    that are assigned and aggregated together.
+
+    CommandLine:
+        python -m wbia.algo.smk.inverted_index gen_residual_blocks
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.inverted_index import *  # NOQA
+        >>> from wbia.algo.smk.vocab_indexer import VisualVocab
+        >>> rng = np.random.RandomState(0)
+        >>> vocab = VisualVocab(rng.randint(0, 255, (32, 8)).astype(np.float32))
+        >>> vocab.build(verbose=False)
+        >>> nFeat_list = [40, 0, 1, 25, 60, 7]
+        >>> vecs_list = [(rng.rand(n, 8) * 255).astype(np.uint8) for n in nFeat_list]
+        >>> # A vector that is its own word has an error flag
+        >>> vecs_list[3][0] = vocab.wx_to_word[5]
+        >>> for nAssign, int_rvec in [(1, True), (2, True), (2, False)]:
+        >>>     rows1 = [residual_worker(argtup) for argtup in gen_residual_args(
+        >>>         vocab, vecs_list, nAssign, int_rvec)]
+        >>>     rows2 = list(gen_residual_blocks(vocab, vecs_list, nAssign,
+        >>>                                      int_rvec, blocksize=50))
+        >>>     assert len(rows1) == len(rows2)
+        >>>     for tup1, tup2 in zip(rows1, rows2):
+        >>>         assert tup1[0] == tup2[0]
+        >>>         assert all(np.all(a == b) for a, b in zip(tup1[1], tup2[1]))
+        >>>         assert all(np.all(a == b) for a, b in zip(tup1[2], tup2[2]))
+        >>>         assert tup1[3].dtype == tup2[3].dtype
+        >>>         assert np.all(tup1[3] == tup2[3])
+        >>>         assert np.all(tup1[4] == tup2[4])
+        >>>     assert np.any(rows2[3][4])
+    """
+    if blocksize is None:
+        blocksize = SMK_ASSIGN_BLOCKSIZE
+    nFeat_list = np.array([len(vecs) for vecs in vecs_list], dtype=np.int64)
+    # Start a new block whenever the stacked size passes a multiple of blocksize
+    blockxs = np.cumsum(nFeat_list) // max(blocksize, 1)
+    _, block_starts = np.unique(blockxs, return_index=True)
+    block_bounds = list(block_starts[1:]) + [len(vecs_list)]
+    start = 0
+    for stop in block_bounds:
+        block_vecs = vecs_list[start:stop]
+        for tup in residual_block_worker(vocab, block_vecs, nAssign, int_rvec):
             yield tup
-    except Exception:
-        raise
-    finally:
-        executor.shutdown(wait=True)
+        start = stop
+
+
+def residual_block_worker(vocab, vecs_list, nAssign, int_rvec):
+    """
+    Assigns the stacked descriptors of several annotations to words with one
+    nearest neighbor lookup and aggregates their residuals per (annot, word).
+
+    Returns:
+        list: a (wx_list, fxs_list, maws_list, agg_rvecs, agg_flags) tuple for
+            each annotation. Features of each word are in increasing order.
+    """
+    num_annots = len(vecs_list)
+    dim = vocab.wx_to_word.shape[1]
+    offsets = np.zeros(num_annots + 1, dtype=np.int64)
+    np.cumsum([len(vecs) for vecs in vecs_list], out=offsets[1:])
+    rvec_dtype = np.int8 if int_rvec else np.float64
+    if offsets[-1] == 0:
+        empty_rvecs = np.empty((0, dim), dtype=rvec_dtype)
+        empty_flags = np.empty((0, 1), dtype=bool)
+        return [([], [], [], empty_rvecs, empty_flags) for _ in range(num_annots)]
+    idx_to_vec = np.vstack([vecs for vecs in vecs_list if len(vecs)])
+    idx_to_wxs, idx_to_maws = smk_funcs.assign_to_words(vocab, idx_to_vec, nAssign)
+
+    # Flatten the valid assignments
+    valid_mask = ~np.ma.getmaskarray(idx_to_wxs)
+    flat_idxs = np.floor_divide(np.flatnonzero(valid_mask), valid_mask.shape[1])
+    flat_wxs = np.ma.getdata(idx_to_wxs)[valid_mask]
+    flat_maws = np.ma.getdata(idx_to_maws)[valid_mask].astype(np.float32)
+    flat_dxs = np.searchsorted(offsets, flat_idxs, side='right') - 1
+
+    # Group by annotation then by word. The sort is stable, so the features of
+    # each group stay in increasing order.
+    sortx = np.lexsort((flat_wxs, flat_dxs))
+    flat_idxs = flat_idxs.take(sortx)
+    flat_wxs = flat_wxs.take(sortx)
+    flat_maws = flat_maws.take(sortx)
+    flat_dxs = flat_dxs.take(sortx)
+    flat_fxs = (flat_idxs - offsets.take(flat_dxs)).astype(np.int32)
+    is_start = np.ones(len(sortx), dtype=bool)
+    np.logical_or(
+        flat_dxs[1:] != flat_dxs[:-1], flat_wxs[1:] != flat_wxs[:-1], out=is_start[1:]
+    )
+    group_starts = np.flatnonzero(is_start)
+
+    words = vocab.wx_to_word.take(flat_wxs, axis=0)
+    rvecs, error_flags = smk_funcs.compute_rvec(idx_to_vec.take(flat_idxs, axis=0), words)
+    agg_rvecs, agg_flags = smk_funcs.aggregate_grouped_rvecs(
+        rvecs, error_flags, group_starts
+    )
+    # Cast to integers for storage
+    if int_rvec:
+        agg_rvecs = smk_funcs.cast_residual_integer(agg_rvecs)
+    else:
+        agg_rvecs = agg_rvecs.astype(rvec_dtype)
+    agg_flags = agg_flags[:, None]
+
+    group_wxs = flat_wxs.take(group_starts)
+    fxs_groups = np.split(flat_fxs, group_starts[1:])
+    maws_groups = np.split(flat_maws, group_starts[1:])
+    dx_bounds = np.searchsorted(flat_dxs.take(group_starts), np.arange(num_annots + 1))
+    results = []
+    for dx in range(num_annots):
+        left, right = dx_bounds[dx], dx_bounds[dx + 1]
+        tup = (
+            list(group_wxs[left:right]),
+            fxs_groups[left:right],
+            maws_groups[left:right],
+            agg_rvecs[left:right],
+            agg_flags[left:right],
+        )
+        results.append(tup)
+    return results
 
 
 def gen_residual_args(vocab, vecs_list, nAssign, int_rvec):
@@ -766,6 +1081,97 @@ def testdata_inva():
     return qreq_, inva
 
 
+def testdata_random_inva(
+    num_annots=20, num_words=64, dim=16, words_per_annot=12, int_rvec=True, seed=0
+):
+    """
+    Random database-like InvertedAnnots that does not need a controller.
+    Word weights and gammas are computed, the residuals are random unit vectors.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.inverted_index import *  # NOQA
+        >>> inva = testdata_random_inva()
+        >>> assert len(inva.gamma_list) == len(inva.aids) == 20
+    """
+    rng = np.random.RandomState(seed)
+    inva = InvertedAnnots()
+    inva.aids = list(range(1, num_annots + 1))
+    inva.wx_lists = []
+    inva.fxs_lists = []
+    inva.maws_lists = []
+    inva.agg_rvecs = []
+    inva.agg_flags = []
+    for _ in inva.aids:
+        fx = 0
+        nwords = rng.randint(1, words_per_annot + 1)
+        wx_list = np.sort(rng.choice(num_words, nwords, replace=False)).astype(np.int32)
+        fxs_list = []
+        for _ in wx_list:
+            nfxs = rng.randint(1, 4)
+            fxs_list.append(np.arange(fx, fx + nfxs, dtype=np.uint16))
+            fx += nfxs
+        rvecs = rng.randn(nwords, dim)
+        rvecs /= np.linalg.norm(rvecs, axis=1)[:, None]
+        if int_rvec:
+            rvecs = smk_funcs.cast_residual_integer(rvecs)
+        inva.wx_lists.append(wx_list)
+        inva.fxs_lists.append(fxs_list)
+        inva.maws_lists.append([np.ones(len(fxs), dtype=np.float32) for fxs in fxs_list])
+        inva.agg_rvecs.append(rvecs)
+        inva.agg_flags.append(rng.rand(nwords, 1) < 0.05)
+    inva.aid_to_idx = ut.make_index_lookup(inva.aids)
+    inva.int_rvec = int_rvec
+    inva.wx_to_aids = inva.compute_inverted_list()
+    inva.wx_to_weight = inva.compute_word_weights('idf')
+    inva.gamma_list = inva.compute_gammas(3.0, 0.0)
+    return inva
+
+
+def benchmark_residual_assignments(
+    num_annots=500, num_words=8000, dim=128, feats_per_annot=1000, nAssign=1
+):
+    r"""
+    Measures the per-annotation residual computation against the blocked one
+    on random descriptors and a random vocabulary.
+
+    CommandLine:
+        python -m wbia.algo.smk.inverted_index benchmark_residual_assignments
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.smk.inverted_index import *  # NOQA
+        >>> result = benchmark_residual_assignments()
+        >>> print(ut.repr3(result, precision=2))
+    """
+    from wbia.algo.smk.vocab_indexer import VisualVocab
+
+    rng = np.random.RandomState(0)
+    vocab = VisualVocab(rng.randint(0, 64, (num_words, dim)).astype(np.float32))
+    vocab.build(verbose=False)
+    nFeat_list = rng.randint(feats_per_annot // 2, feats_per_annot * 3 // 2, num_annots)
+    vecs_list = [rng.randint(0, 64, (n, dim)).astype(np.uint8) for n in nFeat_list]
+    int_rvec = True
+
+    with ut.Timer('loop', verbose=False) as t_loop:
+        rows1 = [
+            residual_worker(argtup)
+            for argtup in gen_residual_args(vocab, vecs_list, nAssign, int_rvec)
+        ]
+    with ut.Timer('blocks', verbose=False) as t_blocks:
+        rows2 = list(gen_residual_blocks(vocab, vecs_list, nAssign, int_rvec))
+    for tup1, tup2 in zip(rows1, rows2):
+        assert tup1[0] == tup2[0]
+        assert np.all(tup1[3] == tup2[3])
+    result = ut.odict(
+        [
+            ('loop_annots_per_second', num_annots / t_loop.ellapsed),
+            ('block_annots_per_second', num_annots / t_blocks.ellapsed),
+        ]
+    )
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
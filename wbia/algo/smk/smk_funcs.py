@@ -340,6 +340,53 @@ def aggregate_rvecs(rvecs, maws, error_flags):
     return agg_rvec, agg_flag
 
 
+def aggregate_grouped_rvecs(rvecs, error_flags, group_starts):
+    r"""
+    Vectorized aggregate_rvecs over consecutive groups of residual vectors
+
+    Args:
+        rvecs (ndarray): stacked residual vectors sorted by group
+        error_flags (ndarray): residual error flags
+        group_starts (ndarray): index of the first rvec in each group
+
+    Returns:
+        tuple: (agg_rvecs, agg_flags) with one row per group
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.smk_funcs import *  # NOQA
+        >>> vecs, words = ut.take(testdata_rvecs(dim=8, nvecs=30), ['vecs', 'words'])
+        >>> rvecs, error_flags = compute_rvec(vecs, words[-1])
+        >>> error_flags[2:4] = True
+        >>> group_starts = np.array([0, 2, 3, 10, 11])
+        >>> tup = aggregate_grouped_rvecs(rvecs, error_flags, group_starts)
+        >>> agg_rvecs, agg_flags = tup
+        >>> bounds = list(group_starts) + [len(rvecs)]
+        >>> for gx, (left, right) in enumerate(ut.itertwo(bounds)):
+        >>>     agg_rvec, agg_flag = aggregate_rvecs(
+        >>>         rvecs[left:right], None, error_flags[left:right])
+        >>>     assert np.all(agg_rvecs[gx] == agg_rvec)
+        >>>     assert agg_flags[gx] == agg_flag
+    """
+    agg_flags = np.logical_or.reduceat(error_flags, group_starts)
+    group_sizes = np.diff(np.append(group_starts, len(rvecs)))
+    # Add the k-th residual of every group with more than k members at once.
+    # This sums in the same order as aggregate_rvecs (np.add.reduceat does not).
+    agg_rvecs = rvecs.take(group_starts, axis=0)
+    size_sortx = group_sizes.argsort(kind='mergesort')[::-1]
+    sorted_sizes = group_sizes.take(size_sortx)
+    for k in range(1, sorted_sizes[0] if len(sorted_sizes) else 0):
+        gxs = size_sortx[: np.searchsorted(-sorted_sizes, -k, side='left')]
+        agg_rvecs[gxs] += rvecs.take(group_starts.take(gxs) + k, axis=0)
+    # Single residuals are already normalized, only renormalize the sums
+    multi_flags = group_sizes > 1
+    multi_rvecs = agg_rvecs.compress(multi_flags, axis=0)
+    agg_flags[multi_flags] |= np.all(multi_rvecs == 0, axis=1)
+    vt.normalize(multi_rvecs, axis=1, out=multi_rvecs)
+    agg_rvecs[multi_flags] = multi_rvecs
+    return agg_rvecs, agg_flags
+
+
 def weight_multi_assigns(
     _idx_to_wx,
     _idx_to_wdist,
@@ -620,18 +667,18 @@ def invert_assigns(idx_to_wxs, idx_to_maws, verbose=False):
     assert isinstance(idx_to_maws, np.ma.masked_array)
 
     nrows, ncols = idx_to_wxs.shape
-    if len(idx_to_wxs.mask.shape) == 0:
-        valid_mask = np.ones((nrows, ncols), dtype=np.bool)
-    else:
-        valid_mask = ~idx_to_maws.mask
-        # idx_to_nAssign = (valid_mask).sum(axis=1)
+    # The maws mask collapses to a scalar when every assignment is valid, so
+    # the word mask decides validity for both.
+    valid_mask = ~np.ma.getmaskarray(idx_to_wxs)
+    # idx_to_nAssign = (valid_mask).sum(axis=1)
 
     _valid_x2d = np.flatnonzero(valid_mask)
     flat_idxs = np.floor_divide(_valid_x2d, ncols, dtype=np.int32)
-    flat_wxs = idx_to_wxs.compressed()
-    flat_maws = idx_to_maws.compressed()
+    flat_wxs = np.ma.getdata(idx_to_wxs)[valid_mask]
+    flat_maws = np.ma.getdata(idx_to_maws)[valid_mask]
 
-    sortx = flat_wxs.argsort()
+    # Stable, so the vectors of each word stay in increasing order
+    sortx = flat_wxs.argsort(kind='mergesort')
     flat_wxs = flat_wxs.take(sortx)
     flat_idxs = flat_idxs.take(sortx)
     flat_maws = flat_maws.take(sortx)
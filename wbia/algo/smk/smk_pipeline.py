@@ -29,6 +29,12 @@ from wbia.algo import Config as old_config
 
 (print, rrr, profile) = ut.inject2(__name__)
 
+# Score aggregated queries against the stacked inverted index instead of one
+# database annotation at a time
+SMK_BATCH = not ut.get_argflag('--nosmk-batch')
+# Number of queries scored together by the batched engine
+SMK_BATCH_QUERIES = ut.get_argval('--smk-batch-queries', type_=int, default=16)
+
 
 class MatchHeuristicsConfig(dtool.Config):
     _param_info_list = [
@@ -133,6 +139,7 @@ class SMKRequest(mc5.EstimatorRequest):
 
         qreq_.qinva = None
         qreq_.dinva = None
+        qreq_.dinva_sparse = None
         qreq_.smk = SMK()
 
         # Hack to work with existing hs code
@@ -302,6 +309,7 @@ class SMKRequest(mc5.EstimatorRequest):
 
         qreq_.qinva = qinva
         qreq_.dinva = dinva
+        qreq_.dinva_sparse = None
 
         print('loading keypoints')
         if qreq_.qparams.sv_on:
@@ -312,6 +320,13 @@ class SMKRequest(mc5.EstimatorRequest):
         print('building aid index')
         qreq_.daid_to_didx = ut.make_index_lookup(qreq_.daids)
 
+    def ensure_sparse_index(qreq_):
+        """ stacks the database inverted index for batched scoring """
+        if qreq_.dinva_sparse is None:
+            with ut.Timer('Building sparse inverted index'):
+                qreq_.dinva_sparse = inverted_index.SparseInvertedIndex(qreq_.dinva)
+        return qreq_.dinva_sparse
+
     def execute_pipeline(qreq_):
         """
         >>> from wbia.algo.smk.smk_pipeline import *  # NOQA
@@ -351,6 +366,8 @@ class SMK(ut.NiceRepr):
         # X_list = qreq_.qinva.inverted_annots(qreq_.qaids)
         # Y_list = qreq_.dinva.inverted_annots(qreq_.daids)
         # verbose = 2
+        if SMK_BATCH and qreq_.qparams['agg']:
+            return smk.predict_matches_batch(qreq_, verbose=verbose)
         _prog = ut.ProgPartial(lbl='smk query', bs=verbose <= 1, enabled=verbose)
         daids = np.array(qreq_.daids)
         cm_list = [
@@ -359,6 +376,25 @@ class SMK(ut.NiceRepr):
         ]
         return cm_list
 
+    def predict_matches_batch(smk, qreq_, verbose=True):
+        """
+        Scores blocks of queries against all database annotations with the
+        sparse inverted index. Results are the same as match_single.
+        """
+        alpha = qreq_.qparams['smk_alpha']
+        thresh = qreq_.qparams['smk_thresh']
+        smat = qreq_.ensure_sparse_index()
+        blocks = list(ut.ichunks(qreq_.qaids, SMK_BATCH_QUERIES))
+        _prog = ut.ProgPartial(lbl='smk query block', bs=verbose <= 1, enabled=verbose)
+        cm_list = []
+        for qaids in _prog(blocks):
+            X_list = [qreq_.qinva.get_annot(qaid) for qaid in qaids]
+            results = smat.score_block(X_list, alpha, thresh)
+            for X, result in zip(X_list, results):
+                cm = smk.match_scored(X, result, qreq_, verbose=verbose > 1)
+                cm_list.append(cm)
+        return cm_list
+
     @profile
     def match_single(smk, qaid, daids, qreq_, verbose=True):
         """
@@ -391,23 +427,20 @@ class SMK(ut.NiceRepr):
             >>> cm.ishow_analysis(qreq_)
             >>> ut.show_if_requested()
         """
-        from wbia.algo.hots import chip_match
-        from wbia.algo.hots import pipeline
-
         alpha = qreq_.qparams['smk_alpha']
         thresh = qreq_.qparams['smk_thresh']
         agg = qreq_.qparams['agg']
         # nAnnotPerName   = qreq_.qparams.nAnnotPerNameSVER
 
-        sv_on = qreq_.qparams.sv_on
-        if sv_on:
-            nNameShortList = qreq_.qparams.nNameShortlistSVER
-            shortsize = nNameShortList
-        else:
-            shortsize = None
+        shortsize = smk.get_shortsize(qreq_)
 
         X = qreq_.qinva.get_annot(qaid)
 
+        if SMK_BATCH and agg:
+            smat = qreq_.ensure_sparse_index()
+            result = smat.score_block([X], alpha, thresh)[0]
+            return smk.match_scored(X, result, qreq_, verbose=verbose)
+
         # Determine which database annotations need to be checked
         # with ut.Timer('searching qaid=%r' % (qaid,), verbose=verbose):
         hit_inva_wxs = ut.take(qreq_.dinva.wx_to_aids, X.wx_list)
@@ -444,8 +477,73 @@ class SMK(ut.NiceRepr):
                 Y = qreq_.dinva.get_annot(daid)
                 item = match_kernel_sep(X, Y, wx_to_weight, alpha, thresh)
                 shortlist.insert(item)
+        return smk.build_chipmatch(X, shortlist, qreq_, verbose=verbose)
+
+    def get_shortsize(smk, qreq_):
+        if qreq_.qparams.sv_on:
+            return qreq_.qparams.nNameShortlistSVER
+        return None
+
+    @profile
+    def match_scored(smk, X, result, qreq_, verbose=True):
+        """
+        Builds the chipmatch of a query scored by SparseInvertedIndex.score_block.
+        Word matches are only regrouped for the database annotations that make
+        the shortlist.
+        """
+        qaid = X.aid
+        smat = qreq_.dinva_sparse
+        scores, hits, (didxs, X_idx, Y_idx, score_list) = result
+        shortsize = smk.get_shortsize(qreq_)
+
+        # Mark impossible daids
+        hit_didxs = np.nonzero(hits)[0]
+        valid_flags = check_can_match(qaid, smat.aids.take(hit_didxs), qreq_)
+        valid_didxs = hit_didxs.compress(valid_flags)
+
+        # Same order and truncation as ut.Shortlist
+        sortx = scores.take(valid_didxs).argsort(kind='stable')
+        if shortsize is not None:
+            sortx = sortx[-shortsize:]
+        short_didxs = valid_didxs.take(sortx)
+
+        # Group the word matches of the shortlist by annotation. Zero scoring
+        # matches are kept so build_chipmatch sees the same items as the loop.
+        isshort = np.isin(didxs, short_didxs)
+        didxs, X_idx, Y_idx, score_list = [
+            arr.compress(isshort) for arr in (didxs, X_idx, Y_idx, score_list)
+        ]
+        wxs = np.asarray(X.wx_list).take(X_idx)
+        groupx = np.lexsort((wxs, didxs))
+        didxs, X_idx, Y_idx, score_list = [
+            arr.take(groupx) for arr in (didxs, X_idx, Y_idx, score_list)
+        ]
+        group_didxs, group_starts = np.unique(didxs, return_index=True)
+        group_stops = np.r_[group_starts[1:], len(didxs)]
+        didx_to_slice = {
+            didx: slice(start, stop)
+            for didx, start, stop in zip(group_didxs, group_starts, group_stops)
+        }
+
+        shortlist = []
+        for didx in short_didxs:
+            sl = didx_to_slice[didx]
+            Y = qreq_.dinva.get_annot(smat.aids[didx])
+            item = (scores[didx], score_list[sl], Y, X_idx[sl], Y_idx[sl])
+            shortlist.append(item)
+        return smk.build_chipmatch(X, shortlist, qreq_, verbose=verbose)
+
+    @profile
+    def build_chipmatch(smk, X, shortlist, qreq_, verbose=True):
+        """
+        Build chipmatches for the shortlist results
+        """
+        from wbia.algo.hots import chip_match
+        from wbia.algo.hots import pipeline
 
-        # Build chipmatches for the shortlist results
+        qaid = X.aid
+        agg = qreq_.qparams['agg']
+        sv_on = qreq_.qparams.sv_on
 
         # with ut.Timer('build cms', verbose=verbose):
         cm = chip_match.ChipMatch(qaid=qaid, fsv_col_lbls=['smk'])
@@ -588,6 +686,59 @@ def testdata_smk(*args, **kwargs):
     return ibs, smk, qreq_
 
 
+def benchmark_batch_scoring(
+    num_annots=2000, num_queries=64, num_words=8000, dim=128, words_per_annot=800
+):
+    r"""
+    Measures query throughput of the per-annotation ASMK loop and the batched
+    sparse scoring engine on a random inverted index.
+
+    CommandLine:
+        python -m wbia.algo.smk.smk_pipeline benchmark_batch_scoring
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.smk.smk_pipeline import *  # NOQA
+        >>> result = benchmark_batch_scoring()
+        >>> print(ut.repr3(result, precision=2))
+    """
+    alpha, thresh = 3.0, 0.0
+    kw = dict(num_words=num_words, dim=dim, words_per_annot=words_per_annot)
+    dinva = inverted_index.testdata_random_inva(num_annots=num_annots, seed=0, **kw)
+    qinva = inverted_index.testdata_random_inva(num_annots=num_queries, seed=1, **kw)
+    qinva.wx_to_weight = dinva.wx_to_weight
+    qinva.gamma_list = qinva.compute_gammas(alpha, thresh)
+    X_list = [qinva.get_annot(aid) for aid in qinva.aids]
+    Y_list = [dinva.get_annot(aid) for aid in dinva.aids]
+    wx_to_weight = dinva.wx_to_weight
+
+    with ut.Timer('loop', verbose=False) as t_loop:
+        loop_scores = np.array(
+            [
+                [match_kernel_agg(X, Y, wx_to_weight, alpha, thresh)[0] for Y in Y_list]
+                for X in X_list
+            ]
+        )
+    with ut.Timer('build', verbose=False) as t_build:
+        smat = inverted_index.SparseInvertedIndex(dinva)
+    with ut.Timer('batch', verbose=False) as t_batch:
+        batch_scores = []
+        for X_block in ut.ichunks(X_list, SMK_BATCH_QUERIES):
+            results = smat.score_block(X_block, alpha, thresh)
+            batch_scores.extend(scores for scores, hits, pairs in results)
+        batch_scores = np.array(batch_scores)
+    assert np.allclose(loop_scores, batch_scores, rtol=1e-5, atol=1e-7)
+    result = ut.odict(
+        [
+            ('loop_qps', num_queries / t_loop.ellapsed),
+            ('batch_qps', num_queries / t_batch.ellapsed),
+            ('build_seconds', t_build.ellapsed),
+            ('index_mb', smat.nbytes / 2 ** 20),
+        ]
+    )
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
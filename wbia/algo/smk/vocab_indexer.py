@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
+import itertools as it
+import os
+import sys
+from os.path import exists, join
 from wbia import dtool
 import utool as ut
 import vtool as vt
@@ -14,6 +18,21 @@ from wbia.control.controller_inject import register_preprocs
 
 derived_attribute = register_preprocs['annot']
 
+# Number of worker processes that assign mini-batches when training a
+# streaming vocab. Defaults to one per CPU.
+VOCAB_WORKERS = ut.get_argval('--vocab-workers', type_=int, default=None)
+# Number of mini-batch iterations between streaming vocab checkpoints
+VOCAB_CHECKPOINT_EVERY = ut.get_argval('--vocab-checkpoint-every', type_=int, default=20)
+
+# Samples and centroids of streaming vocab fits. Workers are forked after a
+# job is added, so only job ids and sample indices are sent to them.
+_TRAIN_JOBS = {}
+_TRAIN_JOB_COUNTER = it.count()
+
+
+def _not_streaming(cfg):
+    return cfg['algorithm'] != 'streaming'
+
 
 class VocabConfig(dtool.Config):
     _param_info_list = [
@@ -22,6 +41,10 @@ class VocabConfig(dtool.Config):
         ut.ParamInfo('num_words', 1000, 'n'),
         ut.ParamInfo('version', 2),
         ut.ParamInfo('n_init', 1),
+        # Options of the streaming algorithm
+        ut.ParamInfo('sample_size', 2 ** 22, 'ss', hideif=_not_streaming),
+        ut.ParamInfo('batch_size', 10000, 'bs', hideif=_not_streaming),
+        ut.ParamInfo('max_iters', 300, 'mi', hideif=_not_streaming),
     ]
 
 
@@ -151,6 +174,418 @@ class VisualVocab(ut.NiceRepr):
         return all_words
 
 
+def reservoir_update(sample, vecs, num_seen, rng):
+    r"""
+    Adds a batch of vectors to a uniform reservoir sample (Algorithm R). The
+    t-th vector seen replaces a random slot with probability len(sample) / t.
+
+    Args:
+        sample (ndarray): reservoir, filled in place
+        vecs (ndarray): next batch of vectors
+        num_seen (int): number of vectors seen before this batch
+        rng (RandomState): random number generator
+
+    Returns:
+        int: number of vectors seen including this batch
+
+    CommandLine:
+        python -m wbia.algo.smk.vocab_indexer reservoir_update
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.vocab_indexer import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> items = np.arange(100)[:, None]
+        >>> # Every item is equally likely to end up in the sample
+        >>> hist = np.zeros(100)
+        >>> for _ in range(2000):
+        >>>     sample = np.empty((10, 1), dtype=items.dtype)
+        >>>     num_seen = 0
+        >>>     for batch in ut.ichunks(items, 7):
+        >>>         num_seen = reservoir_update(sample, np.array(batch), num_seen, rng)
+        >>>     assert len(np.unique(sample)) == 10
+        >>>     hist[sample.ravel()] += 1
+        >>> assert num_seen == 100
+        >>> assert np.abs(hist / 2000 - .1).max() < .03
+    """
+    size = len(sample)
+    num_fill = min(max(size - num_seen, 0), len(vecs))
+    sample[num_seen : num_seen + num_fill] = vecs[:num_fill]
+    if num_fill < len(vecs):
+        rest = vecs[num_fill:]
+        ts = np.arange(num_seen + num_fill, num_seen + len(vecs), dtype=np.int64)
+        slots = (rng.random_sample(len(rest)) * (ts + 1)).astype(np.int64)
+        itemxs = np.flatnonzero(slots < size)
+        # When a slot is drawn more than once the last vector wins
+        slots, lastxs = np.unique(slots[itemxs][::-1], return_index=True)
+        sample[slots] = rest.take(itemxs[::-1][lastxs], axis=0)
+    return num_seen + len(vecs)
+
+
+def reservoir_sample_vecs(depc, fid_list, sample_size, rng, chunksize=256):
+    """
+    Uniformly samples at most sample_size descriptors while only chunksize
+    feature rows are loaded at a time.
+
+    Returns:
+        tuple: (sample, num_seen)
+    """
+    sample = None
+    num_seen = 0
+    num_chunks = ut.get_num_chunks(len(fid_list), chunksize)
+    for fid_chunk in ut.ProgIter(
+        ut.ichunks(fid_list, chunksize), length=num_chunks, lbl='sample vecs'
+    ):
+        vecs_list = depc.get_native('feat', fid_chunk, 'vecs')
+        vecs_list = [vecs for vecs in vecs_list if len(vecs) > 0]
+        if len(vecs_list) == 0:
+            continue
+        vecs = np.vstack(vecs_list)
+        if sample is None:
+            sample = np.empty((sample_size, vecs.shape[1]), dtype=vecs.dtype)
+        num_seen = reservoir_update(sample, vecs, num_seen, rng)
+    if sample is None:
+        raise ValueError('cannot train a vocab without descriptors')
+    return sample[: min(num_seen, sample_size)], num_seen
+
+
+def assign_to_centroids(vecs, centroids, blocksize=None):
+    """
+    Brute force nearest centroid of each vector. Vectors are processed in
+    blocks, so the distance matrix holds at most 2 ** 22 entries.
+
+    Returns:
+        tuple: (labels, sqdists)
+    """
+    centroids = np.asarray(centroids)
+    if blocksize is None:
+        blocksize = max(1, 2 ** 22 // len(centroids))
+    centroid_sqnorms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vecs), dtype=np.int32)
+    sqdists = np.empty(len(vecs), dtype=np.float32)
+    for start in range(0, len(vecs), blocksize):
+        block = np.asarray(vecs[start : start + blocksize], dtype=np.float32)
+        dists = block.dot(centroids.T)
+        dists *= -2
+        dists += centroid_sqnorms
+        block_labels = dists.argmin(axis=1)
+        block_sqdists = dists[np.arange(len(block)), block_labels]
+        block_sqdists += (block ** 2).sum(axis=1)
+        labels[start : start + len(block)] = block_labels
+        sqdists[start : start + len(block)] = np.maximum(block_sqdists, 0)
+    return labels, sqdists
+
+
+def _assign_train_worker(jobid, idxs):
+    sample, centroids = _TRAIN_JOBS[jobid]
+    return assign_to_centroids(sample.take(idxs, axis=0), centroids)
+
+
+def _peak_memory_mb():
+    """ peak resident memory of this process and its largest child """
+    try:
+        import resource
+    except ImportError:
+        # Not available on windows
+        return np.nan
+    # ru_maxrss is in kilobytes on linux and in bytes on mac
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak * unit / 2 ** 20
+
+
+class StreamingKMeans(ut.NiceRepr):
+    r"""
+    Mini-batch k-means (Sculley 2010) that spreads the assignment of each
+    mini-batch over forked worker processes and periodically checkpoints its
+    state, so an interrupted fit resumes where it stopped.
+
+    Each iteration records its wall time, peak memory and quantization error
+    (mean squared distance of the batch to its nearest centroid).
+
+    Args:
+        num_words (int): number of centroids
+        batch_size (int): vectors per mini-batch
+        max_iters (int): maximum number of mini-batch iterations
+        max_no_improvement (int): stop after this many iterations without an
+            improvement of the smoothed quantization error. None never stops
+            early.
+        random_seed (int): seed of initialization and batch sampling
+        checkpoint_fpath (str): file to checkpoint to and resume from
+        checkpoint_every (int): iterations between checkpoints
+        nworkers (int): worker processes. Zero or one assigns in this process.
+
+    CommandLine:
+        python -m wbia.algo.smk.vocab_indexer StreamingKMeans
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.algo.smk.vocab_indexer import *  # NOQA
+        >>> rng = np.random.RandomState(0)
+        >>> centers = rng.rand(8, 4) * 200
+        >>> sample = centers[rng.randint(0, 8, 2000)] + rng.randn(2000, 4)
+        >>> sample = sample.astype(np.uint8)
+        >>> kw = dict(batch_size=100, max_no_improvement=None, verbose=False)
+        >>> serial = StreamingKMeans(8, max_iters=20, nworkers=0, **kw).fit(sample)
+        >>> parallel = StreamingKMeans(8, max_iters=20, nworkers=2, **kw).fit(sample)
+        >>> assert np.allclose(serial.centroids, parallel.centroids)
+        >>> assert len(serial.history) == 20
+        >>> assert serial.history[-1]['quant_error'] < serial.history[0]['quant_error']
+        >>> # Fit 10 iterations, then resume from the checkpoint up to 20
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_streaming_kmeans')
+        >>> fpath = join(dpath, 'checkpoint.pkl')
+        >>> ut.delete(fpath, verbose=False)
+        >>> kw.update(nworkers=0, checkpoint_fpath=fpath, checkpoint_every=3)
+        >>> first = StreamingKMeans(8, max_iters=10, **kw).fit(sample)
+        >>> resumed = StreamingKMeans(8, max_iters=20, **kw).fit(sample)
+        >>> assert len(resumed.history) == 20
+        >>> assert np.allclose(resumed.centroids, serial.centroids)
+        >>> ut.delete(fpath, verbose=False)
+    """
+
+    def __init__(
+        self,
+        num_words,
+        batch_size=10000,
+        max_iters=300,
+        max_no_improvement=10,
+        reassignment_ratio=0.01,
+        random_seed=42,
+        checkpoint_fpath=None,
+        checkpoint_every=None,
+        nworkers=None,
+        verbose=True,
+    ):
+        self.num_words = num_words
+        self.batch_size = batch_size
+        self.max_iters = max_iters
+        self.max_no_improvement = max_no_improvement
+        self.reassignment_ratio = reassignment_ratio
+        self.random_seed = random_seed
+        self.checkpoint_fpath = checkpoint_fpath
+        if checkpoint_every is None:
+            checkpoint_every = VOCAB_CHECKPOINT_EVERY
+        self.checkpoint_every = checkpoint_every
+        if nworkers is None:
+            nworkers = ut.num_cpus() if VOCAB_WORKERS is None else VOCAB_WORKERS
+        self.nworkers = nworkers
+        self.verbose = verbose
+        # Fit state
+        self.centroids = None
+        self.counts = None
+        self.rng = None
+        self.iteration = 0
+        self.history = []
+        self.ewa_error = None
+        self.best_ewa_error = None
+        self.no_improvement = 0
+        self.converged = False
+
+    def __nice__(self):
+        return 'nW=%d, iter=%d' % (self.num_words, self.iteration)
+
+    def _init_state(self, sample):
+        self.rng = np.random.RandomState(self.random_seed)
+        if len(sample) < self.num_words:
+            raise ValueError(
+                'cannot fit %d words to %d vectors' % (self.num_words, len(sample))
+            )
+        initxs = np.sort(self.rng.choice(len(sample), self.num_words, replace=False))
+        self.centroids = sample.take(initxs, axis=0).astype(np.float32)
+        self.counts = np.zeros(self.num_words, dtype=np.int64)
+
+    def save_checkpoint(self):
+        state = {
+            'centroids': self.centroids,
+            'counts': self.counts,
+            'rng_state': self.rng.get_state(),
+            'iteration': self.iteration,
+            'history': self.history,
+            'ewa_error': self.ewa_error,
+            'best_ewa_error': self.best_ewa_error,
+            'no_improvement': self.no_improvement,
+            'converged': self.converged,
+        }
+        # Write then rename, so an interrupt never leaves a partial checkpoint
+        tmp_fpath = '%s.%d.tmp' % (self.checkpoint_fpath, os.getpid())
+        ut.save_cPkl(tmp_fpath, state, verbose=False)
+        os.rename(tmp_fpath, self.checkpoint_fpath)
+
+    def load_checkpoint(self):
+        state = ut.load_cPkl(self.checkpoint_fpath, verbose=False)
+        self.rng = np.random.RandomState()
+        self.rng.set_state(state.pop('rng_state'))
+        self.__dict__.update(state)
+        if self.verbose:
+            print('[vocab] resuming from iteration %d' % (self.iteration,))
+
+    def fit(self, sample):
+        r"""
+        Args:
+            sample (ndarray): training vectors. May be a memory map.
+
+        Returns:
+            StreamingKMeans: self
+        """
+        if self.checkpoint_fpath is not None and exists(self.checkpoint_fpath):
+            self.load_checkpoint()
+        else:
+            self._init_state(sample)
+        centroids = self.centroids
+        jobid = None
+        executor = None
+        if self.nworkers > 1 and self._can_fork():
+            import concurrent.futures
+            import multiprocessing
+
+            # Workers read the centroids from shared memory that is updated
+            # in place after every iteration
+            shared = multiprocessing.RawArray('f', centroids.size)
+            centroids = np.frombuffer(shared, dtype=np.float32)
+            centroids = centroids.reshape(self.centroids.shape)
+            centroids[:] = self.centroids
+            jobid = next(_TRAIN_JOB_COUNTER)
+            _TRAIN_JOBS[jobid] = (sample, centroids)
+            executor = concurrent.futures.ProcessPoolExecutor(
+                self.nworkers, mp_context=multiprocessing.get_context('fork')
+            )
+        self.centroids = centroids
+        try:
+            tt = ut.tic()
+            start_seconds = self.history[-1]['seconds'] if self.history else 0.0
+            while self.iteration < self.max_iters and not self.converged:
+                batchxs = np.sort(self.rng.randint(0, len(sample), self.batch_size))
+                batch = sample.take(batchxs, axis=0)
+                if executor is None:
+                    labels, sqdists = assign_to_centroids(batch, centroids)
+                else:
+                    fs_list = [
+                        executor.submit(_assign_train_worker, jobid, idxs)
+                        for idxs in np.array_split(batchxs, self.nworkers)
+                    ]
+                    results = [fs.result() for fs in fs_list]
+                    labels = np.hstack([labels for labels, _ in results])
+                    sqdists = np.hstack([sqdists for _, sqdists in results])
+                self._update(batch, labels, sqdists, len(sample))
+                self.iteration += 1
+                info = ut.odict(
+                    [
+                        ('iteration', self.iteration),
+                        ('seconds', start_seconds + ut.toc(tt)),
+                        ('peak_mb', _peak_memory_mb()),
+                        ('quant_error', float(sqdists.mean())),
+                    ]
+                )
+                self.history.append(info)
+                if self.verbose:
+                    print(
+                        '[vocab] iter %(iteration)d: %(seconds).1fs, '
+                        'peak %(peak_mb).0fMB, quant_error %(quant_error).2f' % info
+                    )
+                done = self.iteration >= self.max_iters or self.converged
+                if self.checkpoint_fpath is not None and (
+                    done or self.iteration % self.checkpoint_every == 0
+                ):
+                    self.save_checkpoint()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+                del _TRAIN_JOBS[jobid]
+            self.centroids = np.array(centroids)
+        return self
+
+    def _can_fork(self):
+        import multiprocessing
+
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return False
+        # Daemonic processes (e.g. depcache workers) cannot have children
+        return not multiprocessing.current_process().daemon
+
+    def _update(self, batch, labels, sqdists, num_samples):
+        """
+        Moves each centroid to the running mean of every vector assigned to it
+        """
+        centroids = self.centroids
+        sortx = labels.argsort(kind='mergesort')
+        word_xs, starts = np.unique(labels.take(sortx), return_index=True)
+        sums = np.add.reduceat(batch.take(sortx, axis=0).astype(np.float64), starts)
+        old_counts = self.counts.take(word_xs)
+        new_counts = old_counts + np.diff(np.append(starts, len(labels)))
+        new_words = centroids.take(word_xs, axis=0) * old_counts[:, None]
+        new_words += sums
+        new_words /= new_counts[:, None]
+        centroids[word_xs] = new_words
+        self.counts[word_xs] = new_counts
+
+        # Reinitialize centroids that are rarely assigned to random vectors
+        if self.reassignment_ratio and (self.iteration + 1) % 10 == 0:
+            flags = self.counts < self.reassignment_ratio * self.counts.max()
+            reassign_xs = np.flatnonzero(flags)[: len(batch) // 2]
+            if len(reassign_xs) > 0 and len(reassign_xs) < len(centroids):
+                newxs = self.rng.choice(len(batch), len(reassign_xs), replace=False)
+                centroids[reassign_xs] = batch.take(newxs, axis=0)
+                self.counts[reassign_xs] = self.counts[~flags].min()
+
+        # Early stopping on the smoothed quantization error
+        alpha = min(1.0, 2.0 * len(batch) / (num_samples + 1))
+        error = float(sqdists.mean())
+        if self.ewa_error is None:
+            self.ewa_error = error
+        else:
+            self.ewa_error = self.ewa_error * (1 - alpha) + error * alpha
+        if self.best_ewa_error is None or self.ewa_error < self.best_ewa_error:
+            self.best_ewa_error = self.ewa_error
+            self.no_improvement = 0
+        else:
+            self.no_improvement += 1
+        if self.max_no_improvement is not None:
+            self.converged = self.no_improvement >= self.max_no_improvement
+
+
+def train_streaming_vocab(depc, fid_list, config):
+    """
+    Trains vocab words on a reservoir sample of the descriptors with
+    StreamingKMeans. The sample and the centroid checkpoints are kept in the
+    depcache until the fit finishes, so an interrupted build resumes.
+    """
+    cfgstr = 'fids=%s,%s' % (ut.hashstr27(repr(list(fid_list))), config.get_cfgstr())
+    dpath = join(depc.cache_dpath, 'vocab_checkpoints')
+    ut.ensuredir(dpath)
+    prefix = join(dpath, 'vocab_%s' % (ut.hashstr27(cfgstr),))
+    sample_fpath = prefix + '_sample.npy'
+    checkpoint_fpath = prefix + '_checkpoint.pkl'
+    if exists(sample_fpath):
+        print('[vocab] loading descriptor sample')
+    else:
+        rng = np.random.RandomState(config['random_seed'])
+        sample, num_seen = reservoir_sample_vecs(
+            depc, fid_list, config['sample_size'], rng
+        )
+        print('[vocab] sampled %d of %d descriptors' % (len(sample), num_seen))
+        tmp_fpath = '%s.%d.tmp.npy' % (sample_fpath, os.getpid())
+        np.save(tmp_fpath, sample)
+        os.rename(tmp_fpath, sample_fpath)
+        del sample
+    # Workers share the pages of the mapped sample
+    sample = np.load(sample_fpath, mmap_mode='r')
+    kmeans = StreamingKMeans(
+        config['num_words'],
+        batch_size=config['batch_size'],
+        max_iters=config['max_iters'],
+        random_seed=config['random_seed'],
+        checkpoint_fpath=checkpoint_fpath,
+    )
+    kmeans.fit(sample)
+    del sample
+    ut.delete(sample_fpath, verbose=False)
+    ut.delete(checkpoint_fpath, verbose=False)
+    return kmeans.centroids
+
+
 @derived_attribute(
     tablename='vocab',
     parents=['feat*'],
@@ -236,13 +671,20 @@ def compute_vocab(depc, fid_list, config):
 
     """
     print('[IBEIS] COMPUTE_VOCAB:')
-    vecs_list = depc.get_native('feat', fid_list, 'vecs')
-    train_vecs = np.vstack(vecs_list).astype(np.float32)
     num_words = config['num_words']
-    print(
-        '[smk_index] Train Vocab(nWords=%d) using %d annots and %d descriptors'
-        % (num_words, len(fid_list), len(train_vecs))
-    )
+    if config['algorithm'] == 'streaming':
+        print(
+            '[smk_index] Train Vocab(nWords=%d) streaming %d annots'
+            % (num_words, len(fid_list))
+        )
+        words = train_streaming_vocab(depc, fid_list, config)
+    else:
+        vecs_list = depc.get_native('feat', fid_list, 'vecs')
+        train_vecs = np.vstack(vecs_list).astype(np.float32)
+        print(
+            '[smk_index] Train Vocab(nWords=%d) using %d annots and %d descriptors'
+            % (num_words, len(fid_list), len(train_vecs))
+        )
     if config['algorithm'] == 'kdtree':
         flann_params = vt.get_flann_params(random_seed=42)
         kwds = dict(max_iters=20, flann_params=flann_params)
@@ -323,6 +765,46 @@ def testdata_vocab(defaultdb='testdb1', **kwargs):
     return vocab
 
 
+def benchmark_streaming_vocab(
+    num_vecs=200000, num_words=8000, dim=128, batch_size=10000, max_iters=10
+):
+    r"""
+    Measures streaming vocab iterations with assignment in this process and in
+    worker processes on random descriptors.
+
+    CommandLine:
+        python -m wbia.algo.smk.vocab_indexer benchmark_streaming_vocab
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.algo.smk.vocab_indexer import *  # NOQA
+        >>> result = benchmark_streaming_vocab()
+        >>> print(ut.repr3(result, precision=2))
+    """
+    rng = np.random.RandomState(0)
+    sample = rng.randint(0, 128, (num_vecs, dim)).astype(np.uint8)
+    result = ut.odict()
+    for nworkers in [0, ut.num_cpus()]:
+        kmeans = StreamingKMeans(
+            num_words,
+            batch_size=batch_size,
+            max_iters=max_iters,
+            max_no_improvement=None,
+            nworkers=nworkers,
+            verbose=False,
+        )
+        kmeans.fit(sample)
+        last = kmeans.history[-1]
+        result['workers=%d' % (nworkers,)] = ut.odict(
+            [
+                ('seconds_per_iter', last['seconds'] / max_iters),
+                ('peak_mb', last['peak_mb']),
+                ('quant_error', last['quant_error']),
+            ]
+        )
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
@@ -381,7 +381,12 @@ class IBEISController(BASE_CLASS):
         print('[ibs.__init__] END new IBEISController\n')
 
     def reset_table_cache(ibs):
-        ibs.table_cache = accessor_decors.init_tablecache()
+        # The getter cache is turned on by other_cfg.api_cache or --api-cache.
+        # An explicit --api-cache-maxbytes overrides other_cfg.api_cache_maxbytes.
+        other_cfg = getattr(getattr(ibs, 'cfg', None), 'other_cfg', None)
+        enabled = accessor_decors.API_CACHE or getattr(other_cfg, 'api_cache', False)
+        maxbytes = getattr(other_cfg, 'api_cache_maxbytes', None)
+        ibs.table_cache = accessor_decors.init_tablecache(enabled, maxbytes)
 
     def clear_table_cache(ibs, tablename=None):
         print('[ibs] clearing table_cache[%r]' % (tablename,))
@@ -450,17 +455,48 @@ class IBEISController(BASE_CLASS):
 
     def get_cachestats_str(ibs):
         """
-        Returns info about the underlying SQL cache memory
+        Returns the memory use and hit rates of the getter cache
+
+        CommandLine:
+            python -m wbia.control.IBEISControl --test-get_cachestats_str
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.control.IBEISControl import *  # NOQA
+            >>> import wbia  # NOQA
+            >>> ibs = wbia.opendb('testdb1')
+            >>> ibs.table_cache.enabled = True
+            >>> aid_list = ibs.get_valid_aids()
+            >>> ibs.get_annot_semantic_uuids(aid_list)
+            >>> ibs.get_annot_semantic_uuids(aid_list)
+            >>> cachestats_str = ibs.get_cachestats_str()
+            >>> print(cachestats_str)
+            >>> assert 'hit_rate=50.0%' in cachestats_str
+            >>> ibs.reset_table_cache()
         """
-        total_size_str = ut.get_object_size_str(
-            ibs.table_cache, lbl='size(table_cache): '
+        table_cache = ibs.table_cache
+        header = 'table_cache: enabled=%r, maxbytes=%s per table' % (
+            table_cache.enabled,
+            ut.byte_str2(table_cache.maxbytes),
         )
-        total_size_str = '\nlen(table_cache) = %r' % (len(ibs.table_cache))
-        table_size_str_list = [
-            ut.get_object_size_str(val, lbl='size(table_cache[%s]): ' % (key,))
-            for key, val in six.iteritems(ibs.table_cache)
-        ]
-        cachestats_str = total_size_str + ut.indentjoin(table_size_str_list, '\n  * ')
+        table_str_list = []
+        for tblname, stats in six.iteritems(table_cache.get_stats()):
+            table_str = '%s: %d entries, %s, evictions=%d, invalidations=%d' % (
+                tblname,
+                stats['num_entries'],
+                ut.byte_str2(stats['nbytes']),
+                stats['evictions'],
+                stats['invalidations'],
+            )
+            for colname, colstats in six.iteritems(stats['columns']):
+                table_str += '\n    %s: hits=%d, misses=%d, hit_rate=%.1f%%' % (
+                    colname,
+                    colstats['hits'],
+                    colstats['misses'],
+                    100 * colstats['hit_rate'],
+                )
+            table_str_list.append(table_str)
+        cachestats_str = header + ut.indentjoin(table_str_list, '\n  * ')
         return cachestats_str
 
     def print_cachestats_str(ibs):
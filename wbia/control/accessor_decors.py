@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function
+import sys
+import threading
+import numpy as np
 import six
 import utool as ut
 from six.moves import builtins
@@ -19,21 +22,20 @@ VERB_CONTROL = ut.get_argflag(('--verb-control'))
 # DEBUG_API_CACHE = ut.get_argflag('--debug-api-cache')
 DEV_CACHE = False
 DEBUG_API_CACHE = False
-RELEASE_MODE = True
-
-if RELEASE_MODE:
-    # API Cache is only for when you can gaurentee one instance of the
-    # Controller will be running. This is not safe to use in production.  Use
-    # only for local testing.
-    # API_CACHE = ut.get_argflag('--api-cache')
-    # ASSERT_API_CACHE = not ut.get_argflag(('--noassert-api-cache', '--naac'))
-    API_CACHE = False
-    ASSERT_API_CACHE = False
-else:
-    # API_CACHE = not ut.get_argflag('--no-api-cache')
-    # ASSERT_API_CACHE = ut.get_argflag(('--assert-api-cache', '--naac'))
-    API_CACHE = False
-    ASSERT_API_CACHE = False
+
+# API Cache is only for when you can gaurentee one instance of the Controller
+# will be writing to the database. It is turned on per database with the
+# other_cfg.api_cache option or for every controller with --api-cache.
+API_CACHE = ut.get_argflag('--api-cache')
+ASSERT_API_CACHE = ut.get_argflag(('--assert-api-cache', '--aac'))
+# Memory bound of the cached values of each table. An explicit
+# --api-cache-maxbytes overrides other_cfg.api_cache_maxbytes.
+API_CACHE_MAXBYTES_ARG = ut.get_argval('--api-cache-maxbytes', type_=int, default=None)
+API_CACHE_MAXBYTES = 2 ** 26 if API_CACHE_MAXBYTES_ARG is None else API_CACHE_MAXBYTES_ARG
+# Fraction of a full table cache that is evicted at once
+API_CACHE_EVICT_FRAC = 0.25
+# Larger rowids are not cached, this bounds the size of the rowid index
+API_CACHE_MAX_ROWID = 2 ** 22
 
 
 if ut.VERBOSE:
@@ -51,10 +53,298 @@ if ut.VERBOSE:
 # DECORATORS::ADDER
 
 
-def init_tablecache():
+def _estimate_nbytes(val):
+    """ rough memory footprint of a cached getter value """
+    if isinstance(val, np.ndarray):
+        return val.nbytes + 112
+    nbytes = sys.getsizeof(val)
+    if isinstance(val, (list, tuple)):
+        for item in val:
+            if isinstance(item, np.ndarray):
+                nbytes += item.nbytes + 112
+            else:
+                nbytes += sys.getsizeof(item)
+    return nbytes
+
+
+def _as_rowid_array(rowid_list):
+    """ integer rowids as an int64 array, anything else (e.g. None) maps to -1 """
+    try:
+        return np.asarray(rowid_list, dtype=np.int64).reshape(-1)
+    except (TypeError, ValueError):
+        int_types = six.integer_types + (np.integer,)
+        return np.array(
+            [rowid if isinstance(rowid, int_types) else -1 for rowid in rowid_list],
+            dtype=np.int64,
+        )
+
+
+class RowidCache(object):
+    r"""
+    Cached values of one getter and configuration keyed by integer rowids
+
+    Rowids index into an array of slots, so a batch of rowids is looked up with
+    a single fancy index instead of one dict lookup per rowid. Each slot
+    remembers when it was last used and how large its value is, which is what
+    the owning TableCache uses for LRU eviction.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.control.accessor_decors import *  # NOQA
+        >>> cache_ = RowidCache()
+        >>> nbytes = cache_.store(np.array([3, 1, 7]), ['a', 'b', None], tick=1)
+        >>> slots = cache_.lookup(np.array([1, 2, 3, 7, -1, 10 ** 9]), tick=2)
+        >>> print(cache_.take(slots))
+        ['b', None, 'a', None, None, None]
+        >>> cache_.invalidate(np.array([3, 3]))
+        >>> print(cache_.take(cache_.lookup(np.array([1, 3]), tick=3)))
+        ['b', None]
+        >>> assert len(cache_) == 1 and cache_.nbytes == nbytes // 2
+    """
+
+    def __init__(cache_):
+        cache_.clear()
+
+    def __len__(cache_):
+        return len(cache_.slot_rowids) - len(cache_.free_slots)
+
+    def clear(cache_):
+        cache_.rowid_to_slot = np.full(0, -1, dtype=np.int64)
+        cache_.slot_rowids = np.full(0, -1, dtype=np.int64)
+        cache_.slot_ticks = np.zeros(0, dtype=np.int64)
+        cache_.slot_nbytes = np.zeros(0, dtype=np.int64)
+        cache_.slot_vals = np.empty(0, dtype=object)
+        cache_.free_slots = []
+        cache_.nbytes = 0
+
+    def lookup(cache_, rowids, tick):
+        """ returns the slot of each rowid, or -1 if it is not cached """
+        slots = np.full(len(rowids), -1, dtype=np.int64)
+        isvalid = (rowids >= 0) & (rowids < len(cache_.rowid_to_slot))
+        slots[isvalid] = cache_.rowid_to_slot[rowids[isvalid]]
+        cache_.slot_ticks[slots[slots >= 0]] = tick
+        return slots
+
+    def take(cache_, slots):
+        """ returns the value in each slot, or None where the slot is -1 """
+        vals = np.empty(len(slots), dtype=object)
+        ishit = slots >= 0
+        vals[ishit] = cache_.slot_vals[slots[ishit]]
+        return vals.tolist()
+
+    def store(cache_, rowids, vals, tick):
+        """ caches values by rowid and returns the change in nbytes """
+        prev_nbytes = cache_.nbytes
+        for rowid, val in zip(rowids.tolist(), vals):
+            if val is None or rowid < 0 or rowid >= API_CACHE_MAX_ROWID:
+                continue
+            if rowid >= len(cache_.rowid_to_slot):
+                cache_._grow_index(rowid + 1)
+            slot = cache_.rowid_to_slot[rowid]
+            if slot < 0:
+                slot = cache_._alloc_slot()
+                cache_.rowid_to_slot[rowid] = slot
+                cache_.slot_rowids[slot] = rowid
+            else:
+                cache_.nbytes -= cache_.slot_nbytes[slot]
+            nbytes = _estimate_nbytes(val)
+            cache_.slot_vals[slot] = val
+            cache_.slot_ticks[slot] = tick
+            cache_.slot_nbytes[slot] = nbytes
+            cache_.nbytes += nbytes
+        return cache_.nbytes - prev_nbytes
+
+    def invalidate(cache_, rowids):
+        slots = cache_.lookup(rowids, tick=0)
+        cache_.evict(np.unique(slots[slots >= 0]))
+
+    def evict(cache_, slots):
+        """ removes the values in the given (unique) slots """
+        if len(slots) == 0:
+            return
+        cache_.rowid_to_slot[cache_.slot_rowids[slots]] = -1
+        cache_.slot_rowids[slots] = -1
+        cache_.slot_vals[slots] = None
+        cache_.nbytes -= int(cache_.slot_nbytes[slots].sum())
+        cache_.slot_nbytes[slots] = 0
+        cache_.free_slots.extend(slots.tolist())
+
+    def live_slots(cache_):
+        return np.nonzero(cache_.slot_rowids >= 0)[0]
+
+    def _grow_index(cache_, size):
+        size = max(size, 2 * len(cache_.rowid_to_slot))
+        padding = np.full(size - len(cache_.rowid_to_slot), -1, dtype=np.int64)
+        cache_.rowid_to_slot = np.hstack([cache_.rowid_to_slot, padding])
+
+    def _alloc_slot(cache_):
+        if cache_.free_slots:
+            return cache_.free_slots.pop()
+        num = len(cache_.slot_rowids)
+        extra = max(num, 64)
+        cache_.slot_rowids = np.hstack(
+            [cache_.slot_rowids, np.full(extra, -1, dtype=np.int64)]
+        )
+        cache_.slot_ticks = np.hstack([cache_.slot_ticks, np.zeros(extra, np.int64)])
+        cache_.slot_nbytes = np.hstack([cache_.slot_nbytes, np.zeros(extra, np.int64)])
+        cache_.slot_vals = np.hstack([cache_.slot_vals, np.empty(extra, dtype=object)])
+        cache_.free_slots.extend(range(num + extra - 1, num, -1))
+        return num
+
+
+class TableCache(object):
+    r"""
+    The cached getters of one table with a shared memory bound
+
+    When the cached values grow past maxbytes the least recently used
+    API_CACHE_EVICT_FRAC of them are evicted at once. Every invalidation bumps
+    a generation counter so a getter that raced with a writer does not put the
+    values it read before the write back into the cache.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.control.accessor_decors import *  # NOQA
+        >>> tblcache = TableCache('annotations', maxbytes=2000)
+        >>> cache_ = tblcache.get_cache('annot_note', None)
+        >>> for tick in range(10):
+        >>>     rowids = np.arange(tick * 10, tick * 10 + 10)
+        >>>     tblcache.store(cache_, rowids, ['x' * 100] * 10, tick, 0)
+        >>> assert tblcache.nbytes <= tblcache.maxbytes
+        >>> assert tblcache.evictions > 0
+        >>> # the most recently used values are kept
+        >>> slots = cache_.lookup(np.array([0, 99]), tick=11)
+        >>> assert slots[0] == -1 and slots[1] >= 0
+        >>> tblcache.invalidate(['annot_note'], [99])
+        >>> assert cache_.lookup(np.array([99]), tick=12)[0] == -1
+        >>> assert tblcache.store(cache_, np.array([99]), ['x'], 12, 0) is False
+    """
+
+    def __init__(tblcache, tblname, maxbytes=API_CACHE_MAXBYTES):
+        tblcache.tblname = tblname
+        tblcache.maxbytes = maxbytes
+        # colname -> kwargs_hash -> RowidCache
+        tblcache.caches = ut.ddict(dict)
+        tblcache.hits = ut.ddict(int)
+        tblcache.misses = ut.ddict(int)
+        tblcache.evictions = 0
+        tblcache.invalidations = 0
+        tblcache.nbytes = 0
+        tblcache.tick = 0
+        tblcache.generation = 0
+        tblcache.lock = threading.RLock()
+
+    def __len__(tblcache):
+        return sum(len(cache_) for cache_ in tblcache._iter_caches())
+
+    def _iter_caches(tblcache):
+        for kwargs_cache_ in tblcache.caches.values():
+            for cache_ in kwargs_cache_.values():
+                yield cache_
+
+    def get_cache(tblcache, colname, kwargs_hash):
+        kwargs_cache_ = tblcache.caches[colname]
+        if kwargs_hash not in kwargs_cache_:
+            kwargs_cache_[kwargs_hash] = RowidCache()
+        return kwargs_cache_[kwargs_hash]
+
+    def store(tblcache, cache_, rowids, vals, tick, generation):
+        """ caches values unless the table was invalidated since generation """
+        with tblcache.lock:
+            if generation != tblcache.generation:
+                return False
+            tblcache.nbytes += cache_.store(rowids, vals, tick)
+            if tblcache.nbytes > tblcache.maxbytes:
+                tblcache._evict_lru()
+            return True
+
+    def invalidate(tblcache, colnames=None, rowid_list=None):
+        """ forgets the cached values of colnames (all by default) for rowid_list """
+        with tblcache.lock:
+            tblcache.generation += 1
+            tblcache.invalidations += 1
+            if colnames is None:
+                colnames = list(tblcache.caches.keys())
+            rowids = None if rowid_list is None else _as_rowid_array(rowid_list)
+            for colname in colnames:
+                for cache_ in tblcache.caches.get(colname, {}).values():
+                    if rowids is None:
+                        # We dont know the rowsids so clear everything
+                        cache_.clear()
+                    else:
+                        cache_.invalidate(rowids)
+            tblcache.nbytes = sum(cache_.nbytes for cache_ in tblcache._iter_caches())
+
+    def _evict_lru(tblcache):
+        caches = list(tblcache._iter_caches())
+        slots_list = [cache_.live_slots() for cache_ in caches]
+        if sum(map(len, slots_list)) == 0:
+            return
+        ticks = np.hstack([c.slot_ticks[s] for c, s in zip(caches, slots_list)])
+        sizes = np.hstack([c.slot_nbytes[s] for c, s in zip(caches, slots_list)])
+        owners = np.repeat(np.arange(len(caches)), list(map(len, slots_list)))
+        slots = np.hstack(slots_list)
+        order = np.argsort(ticks, kind='mergesort')
+        target = int(tblcache.maxbytes * (1 - API_CACHE_EVICT_FRAC))
+        num_evict = np.searchsorted(np.cumsum(sizes[order]), tblcache.nbytes - target)
+        num_evict = min(num_evict + 1, len(order))
+        evict_idxs = order[:num_evict]
+        for cx, cache_ in enumerate(caches):
+            cache_.evict(slots[evict_idxs[owners[evict_idxs] == cx]])
+        tblcache.evictions += num_evict
+        tblcache.nbytes = sum(cache_.nbytes for cache_ in caches)
+
+    def get_stats(tblcache):
+        colnames = sorted(set(tblcache.hits) | set(tblcache.misses))
+        colstats = ut.odict()
+        for colname in colnames:
+            hits, misses = tblcache.hits[colname], tblcache.misses[colname]
+            colstats[colname] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / max(hits + misses, 1),
+            }
+        stats = {
+            'num_entries': len(tblcache),
+            'nbytes': tblcache.nbytes,
+            'maxbytes': tblcache.maxbytes,
+            'evictions': tblcache.evictions,
+            'invalidations': tblcache.invalidations,
+            'columns': colstats,
+        }
+        return stats
+
+
+class APICache(dict):
+    """
+    Maps table names to their TableCache. This is ibs.table_cache.
+    """
+
+    def __init__(table_cache, enabled=API_CACHE, maxbytes=API_CACHE_MAXBYTES):
+        super(APICache, table_cache).__init__()
+        table_cache.enabled = enabled
+        table_cache.maxbytes = maxbytes
+
+    def __missing__(table_cache, tblname):
+        tblcache = table_cache[tblname] = TableCache(tblname, table_cache.maxbytes)
+        return tblcache
+
+    def get_stats(table_cache):
+        return {
+            tblname: tblcache.get_stats()
+            for tblname, tblcache in sorted(table_cache.items())
+        }
+
+
+def init_tablecache(enabled=None, maxbytes=None):
     r"""
+    Args:
+        enabled (bool): turns on the decorated getter caches
+            (default: API_CACHE)
+        maxbytes (int): memory bound for each table. --api-cache-maxbytes takes
+            precedence (default: API_CACHE_MAXBYTES)
+
     Returns:
-       defaultdict: tablecache
+       APICache: tablecache
 
     CommandLine:
         python -m wbia.control.accessor_decors --test-init_tablecache
@@ -64,10 +354,15 @@ def init_tablecache():
         >>> from wbia.control.accessor_decors import *  # NOQA
         >>> result = init_tablecache()
         >>> print(result)
+        {}
     """
-    # 4 levels of dictionaries
-    # tablename, colname, kwargs, and then rowids
-    tablecache = ut.ddict(lambda: ut.ddict(lambda: ut.ddict(dict)))
+    # tablename -> colname -> kwargs -> rowids
+    tablecache = APICache(
+        enabled=API_CACHE if enabled is None else enabled,
+        maxbytes=API_CACHE_MAXBYTES
+        if maxbytes is None or API_CACHE_MAXBYTES_ARG is not None
+        else maxbytes,
+    )
     return tablecache
 
 
@@ -77,9 +372,16 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
     the class must have a table_cache property
     varargs are currently unallowed
 
+    The getter is only cached when the table_cache is enabled (see
+    init_tablecache) or force is True. Integer rowids are cached in a
+    RowidCache for each cfgkeys configuration and every table is bounded by
+    the table_cache maxbytes.
+
     Args:
         tblname (str):
         colname (str):
+        cfgkeys (list): getter kwargs that change the returned values
+        force (bool): cache even if the table_cache is disabled
 
     Returns:
         function: closure_getter_cacher
@@ -107,20 +409,23 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
         >>> ### Test Getter (caches)
         >>> val_list1 = getter_func(ibs, rowid_list1)
         >>> val_list2 = wrp_getter_cacher(ibs, rowid_list1)
-        >>> print(ut.repr2(ibs.table_cache))
+        >>> print(ut.repr2(ibs.table_cache.get_stats()))
         >>> val_list3 = wrp_getter_cacher(ibs, rowid_list1)
         >>> val_list4 = wrp_getter_cacher(ibs, rowid_list2)
-        >>> print(ut.repr2(ibs.table_cache))
+        >>> print(ut.repr2(ibs.table_cache.get_stats()))
         >>> val_list5 = wrp_getter_cacher(ibs, rowid_list3)
         >>> val_list  = wrp_getter_cacher(ibs, rowid_list)
         >>> ut.assert_eq(val_list1, val_list2, 'run1')
-        >>> ut.assert_eq(val_list1, val_list2, 'run2')
-        >>> print(ut.repr2(ibs.table_cache))
+        >>> ut.assert_eq(val_list1, val_list3, 'run2')
+        >>> ut.assert_eq(getter_func(ibs, rowid_list), val_list, 'run3')
+        >>> stats = ibs.table_cache[tblname].get_stats()['columns'][colname]
+        >>> assert stats['hits'] > 0
+        >>> print(ut.repr2(ibs.table_cache.get_stats()))
         >>> ### Test Setter (invalidates)
         >>> setter_func = ibs.set_name_texts
         >>> wrp_cache_invalidator = cache_invalidator(tblname, force=True)(lambda *a: None)
         >>> wrp_cache_invalidator(ibs, rowid_list1)
-        >>> print(ut.repr2(ibs.table_cache))
+        >>> print(ut.repr2(ibs.table_cache.get_stats()))
 
     Example1:
         >>> # ENABLE_DOCTEST
@@ -150,12 +455,7 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
     assert colname is not None, 'must specify a single colname'
 
     def closure_getter_cacher(getter_func):
-        if not API_CACHE and not force:
-            # Turn of API Cache
-            return getter_func
-
-        def debug_cache_hits(ismiss_list, rowid_list):
-            num_miss = sum(ismiss_list)
+        def debug_cache_hits(num_miss, rowid_list):
             num_total = len(rowid_list)
             num_hit = num_total - num_miss
             print(
@@ -163,11 +463,9 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
                 % (tblname, colname, num_hit, num_total)
             )
 
-        def assert_cache_hits(ibs, ismiss_list, rowid_list, kwargs_hash, **kwargs):
-            cached_rowid_list = ut.filterfalse_items(rowid_list, ismiss_list)
-            cache_ = ibs.table_cache[tblname][colname][kwargs_hash]
-            # Load cached values for each rowid
-            cache_vals_list = ut.dict_take_list(cache_, cached_rowid_list, None)
+        def assert_cache_hits(ibs, ishit, rowid_list, vals_list, kwargs):
+            cached_rowid_list = ut.compress(rowid_list, ishit)
+            cache_vals_list = ut.compress(vals_list, ishit)
             db_vals_list = getter_func(ibs, cached_rowid_list, **kwargs)
             # Assert everything is valid
             msg_fmt = ut.codeblock(
@@ -179,121 +477,54 @@ def cache_getter(tblname, colname=None, cfgkeys=None, force=False, debug=False):
                 """
             )
             msg = msg_fmt % (tblname, colname, cfgkeys, cache_vals_list, db_vals_list,)
-            try:
-                list1 = cache_vals_list
-                list2 = db_vals_list
-                assert ut.lists_eq(list1, list2), msg
-                # if isinstance(db_vals_list, list):
-                #    assert cache_vals_list == db_vals_list, msg
-                # else:
-                #    assert np.all(cache_vals_list == db_vals_list), msg
-            except AssertionError as ex:
-                raise ex
-            except Exception as ex2:
-                print(type(cache_vals_list))
-                print(type(db_vals_list))
-                ut.printex(ex2)
-                ut.embed()
-                raise
-
-        if False:
-            # @profile cannot profile this because it is alrady being profiled by
-            def wrp_getter_cacher(ibs, rowid_list, **kwargs):
-                """
-                Wrapper function that caches rowid values in a dictionary
-                """
-                # HACK TAKE OUT GETTING DEBUG OUT OF KWARGS
-                debug_ = kwargs.pop('debug', False)
-                if cfgkeys is not None:
-                    # kwargs_hash = ut.get_dict_hashid(ut.dict_take_list(kwargs, cfgkeys, None))
-                    kwargs_hash = ut.get_dict_hashid(
-                        [kwargs.get(key, None) for key in cfgkeys]
-                    )
-                    # ut.dict_take_list(kwargs, cfgkeys, None))
-                else:
-                    kwargs_hash = None
-                # +----------------------------
-                # There are 3 levels of caches
-                # +----------------------------
-                # All caches for this table
-                # colscache_ = ibs.table_cache[tblname]
-                # # All caches for the this column
-                # kwargs_cache_ = colscache_[colname]
-                # # All caches for this kwargs configuration
-                # cache_ = kwargs_cache_[kwargs_hash]
-                cache_ = ibs.table_cache[tblname][colname][kwargs_hash]
-                # L____________________________
-
+            assert ut.lists_eq(cache_vals_list, db_vals_list), msg
+
+        def wrp_getter_cacher(ibs, rowid_list, **kwargs):
+            """
+            Wrapper function that caches rowid values in a bounded table cache
+            """
+            table_cache = ibs.table_cache
+            if not force and not table_cache.enabled:
+                return getter_func(ibs, rowid_list, **kwargs)
+            debug_ = kwargs.pop('debug', False)
+            kwargs_hash = (
+                None
+                if cfgkeys is None
+                else ut.get_dict_hashid([kwargs.get(key, None) for key in cfgkeys])
+            )
+            if not isinstance(rowid_list, (list, tuple, np.ndarray)):
+                rowid_list = list(rowid_list)
+            rowids = _as_rowid_array(rowid_list)
+            # There are 3 levels of caches: all caches for this table, caches
+            # for the this column, and caches for this kwargs configuration
+            tblcache = table_cache[tblname]
+            with tblcache.lock:
+                tblcache.tick += 1
+                tick = tblcache.tick
+                generation = tblcache.generation
+                cache_ = tblcache.get_cache(colname, kwargs_hash)
                 # Load cached values for each rowid
-                # vals_list = ut.dict_take_list(cache_, rowid_list, None)
-                vals_list = [cache_.get(rowid, None) for rowid in rowid_list]
+                slots = cache_.lookup(rowids, tick)
+                vals_list = cache_.take(slots)
                 # Mark rowids with cache misses
-                ismiss_list = [val is None for val in vals_list]
-                if debug or debug_:
-                    debug_cache_hits(ismiss_list, rowid_list)
-                    # print('[cache_getter] "debug_cache_hits" turned off')
-                # HACK !!! DEBUG THESE GETTERS BY ASSERTING INFORMATION IN CACHE IS CORRECT
-                if ASSERT_API_CACHE:
-                    assert_cache_hits(ibs, ismiss_list, rowid_list, kwargs_hash, **kwargs)
-                # END HACK
-                if any(ismiss_list):
-                    miss_indices = ut.list_where(ismiss_list)
-                    miss_rowids = ut.compress(rowid_list, ismiss_list)
-                    # call wrapped function
-                    miss_vals = getter_func(ibs, miss_rowids, **kwargs)
-                    # overwrite missed output
-                    for index, val in zip(miss_indices, miss_vals):
-                        vals_list[index] = val  # Output write
-                    # cache save
-                    for rowid, val in zip(miss_rowids, miss_vals):
-                        cache_[rowid] = val  # Cache write
-                return vals_list
-
-        else:
-
-            def handle_cache_misses(
-                ibs, getter_func, rowid_list, ismiss_list, vals_list, cache_, kwargs
-            ):
-                miss_indices = ut.list_where(ismiss_list)
-                miss_rowids = ut.compress(rowid_list, ismiss_list)
+                miss_indices = np.nonzero(slots < 0)[0]
+                num_miss = len(miss_indices)
+                tblcache.hits[colname] += len(slots) - num_miss
+                tblcache.misses[colname] += num_miss
+            if debug or debug_:
+                debug_cache_hits(num_miss, rowid_list)
+            if ASSERT_API_CACHE and num_miss < len(slots):
+                assert_cache_hits(ibs, slots >= 0, rowid_list, vals_list, kwargs)
+            if num_miss > 0:
+                miss_rowids = [rowid_list[index] for index in miss_indices]
                 # call wrapped function
                 miss_vals = getter_func(ibs, miss_rowids, **kwargs)
                 # overwrite missed output
                 for index, val in zip(miss_indices, miss_vals):
                     vals_list[index] = val  # Output write
                 # cache save
-                for rowid, val in zip(miss_rowids, miss_vals):
-                    cache_[rowid] = val  # Cache write
-
-            def wrp_getter_cacher(ibs, rowid_list, **kwargs):
-                """
-                Wrapper function that caches rowid values in a dictionary
-                """
-                kwargs.pop('debug', False)
-                kwargs_hash = (
-                    None
-                    if cfgkeys is None
-                    else ut.get_dict_hashid([kwargs.get(key, None) for key in cfgkeys])
-                )
-                # There are 3 levels of caches
-                # All caches for this table, caches for the this column, and caches for this kwargs configuration
-                cache_ = ibs.table_cache[tblname][colname][kwargs_hash]
-                # Load cached values for each rowid
-                vals_list = [cache_.get(rowid, None) for rowid in rowid_list]
-                # Mark rowids with cache misses
-                ismiss_list = [val is None for val in vals_list]
-                # END HACK
-                if any(ismiss_list):
-                    handle_cache_misses(
-                        ibs,
-                        getter_func,
-                        rowid_list,
-                        ismiss_list,
-                        vals_list,
-                        cache_,
-                        kwargs,
-                    )
-                return vals_list
+                tblcache.store(cache_, rowids[miss_indices], miss_vals, tick, generation)
+            return vals_list
 
         wrp_getter_cacher = ut.preserve_sig(wrp_getter_cacher, getter_func)
         return wrp_getter_cacher
@@ -319,13 +550,19 @@ def cache_invalidator(tblname, colnames=None, rowidx=None, force=False):
         writer_func is either a setter, deleter, or an adder, something that writes to
         the database.
         """
-        if not API_CACHE and not force:
-            return writer_func
 
         def wrp_cache_invalidator(self, *args, **kwargs):
             # the class must have a table_cache property
-            colscache_ = self.table_cache[tblname]
-            colnames_ = list(six.iterkeys(colscache_)) if colnames is None else colnames
+            table_cache = self.table_cache
+            if not force and not table_cache.enabled:
+                return writer_func(self, *args, **kwargs)
+            tblcache = table_cache[tblname]
+            rowid_list = None if rowidx is None else args[rowidx]
+            if rowid_list is not None and not isinstance(
+                rowid_list, (list, tuple, np.ndarray)
+            ):
+                rowid_list = list(rowid_list)
+                args = args[:rowidx] + (rowid_list,) + args[rowidx + 1 :]
             if DEBUG_API_CACHE:
                 indenter = ut.Indenter('[%s]' % (tblname,))
                 indenter.start()
@@ -337,34 +574,21 @@ def cache_invalidator(tblname, colnames=None, rowidx=None, force=False):
                 print('self = %r' % (self,))
                 print('args = %r' % (args,))
                 print('kwargs = %r' % (kwargs,))
-                print('colscache_ = ' + ut.repr2(colscache_, truncate=1))
-
-            # Clear the cache of any specified colname
-            # when the invalidator is called
-            if rowidx is None:
-                for colname in colnames_:
-                    kwargs_cache_ = colscache_[colname]
-                    # We dont know the rowsids so clear everything
-                    for cache_ in six.itervalues(kwargs_cache_):
-                        cache_.clear()
-            else:
-                rowid_list = args[rowidx]
-                for colname in colnames_:
-                    kwargs_cache_ = colscache_[colname]
-                    # We know the rowids to delete
-                    # iterate over all getter kwargs values
-                    for cache_ in six.itervalues(kwargs_cache_):
-                        ut.delete_dict_keys(cache_, rowid_list)
-
-            # Preform set/delete action
-            if DEBUG_API_CACHE:
-                print('After:')
-                print('colscache_ = ' + ut.repr2(colscache_, truncate=1))
-                print('L__________')
+                print('stats = ' + ut.repr2(tblcache.get_stats(), truncate=1))
 
-            writer_result = writer_func(self, *args, **kwargs)
+            # Clear the cache of any specified colname when the invalidator is
+            # called and again after the write so values read concurrently
+            # with the write are not kept either
+            tblcache.invalidate(colnames, rowid_list)
+            try:
+                writer_result = writer_func(self, *args, **kwargs)
+            finally:
+                tblcache.invalidate(colnames, rowid_list)
 
             if DEBUG_API_CACHE:
+                print('After:')
+                print('stats = ' + ut.repr2(tblcache.get_stats(), truncate=1))
+                print('L__________')
                 indenter.stop()
             return writer_result
 
@@ -244,7 +244,9 @@ def get_num_images(ibs, **kwargs):
 
 
 @register_ibs_method
-def _compute_image_uuids(ibs, gpath_list, sanitize=True, ensure=True, **kwargs):
+def _compute_image_uuids(
+    ibs, gpath_list, sanitize=True, ensure=True, nworkers=None, **kwargs
+):
     from wbia.algo.preproc import preproc_image
     from wbia.other import ibsfuncs
 
@@ -253,18 +255,17 @@ def _compute_image_uuids(ibs, gpath_list, sanitize=True, ensure=True, **kwargs):
     if sanitize:
         gpath_list = ibsfuncs.ensure_unix_gpaths(gpath_list)
 
-    # Create param_iter
+    # Parse the images in a thread pool (see --import-workers and
+    # --import-processes). Production and web requests parse in this thread.
     # params_list = list(preproc_image.add_images_params_gen(gpath_list))
-    force_serial = ibs.force_serial or ibs.production
-    params_list = list(
-        ut.generate2(
-            preproc_image.parse_imageinfo,
-            list(zip(gpath_list)),
-            nTasks=len(gpath_list),
-            ordered=True,
-            force_serial=force_serial,
-            futures_threaded=True,
-        )
+    in_web_request = (
+        controller_inject.HAS_FLASK and controller_inject.flask.has_request_context()
+    )
+    force_serial = ibs.force_serial or ibs.production or in_web_request
+    if force_serial:
+        nworkers = 0
+    params_list, error_list = preproc_image.parse_imageinfo_list(
+        gpath_list, nworkers=nworkers
     )
 
     # Error reporting
@@ -272,7 +273,16 @@ def _compute_image_uuids(ibs, gpath_list, sanitize=True, ensure=True, **kwargs):
         gpath for (gpath, params_) in zip(gpath_list, params_list) if not params_
     ]
 
-    print('\n'.join([' ! Failed reading gpath=%r' % (gpath,) for gpath in failed_list]))
+    print(
+        '\n'.join(
+            [
+                ' ! Failed reading gpath=%r' % (gpath,)
+                + ('' if error is None else ' (%s)' % (error,))
+                for (gpath, params_, error) in zip(gpath_list, params_list, error_list)
+                if not params_
+            ]
+        )
+    )
 
     if ensure and len(failed_list) > 0:
         print('Importing %d files failed: %r' % (len(failed_list), failed_list,))
@@ -48,6 +48,7 @@ Setup:
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 from six.moves import zip
+from os.path import splitext
 from vtool import image_filters
 from wbia import dtool
 import utool as ut
@@ -271,6 +272,8 @@ class ChipConfig(dtool.Config):
         # ---
         ut.ParamInfo('pad', 0, hideif=0, type_=eval),
         ut.ParamInfo('ext', '.png', hideif='.png'),
+        # decode jpegs at 1/2, 1/4, or 1/8 scale when chips are small enough
+        ut.ParamInfo('reduced_decode', False, hideif=False),
     ]
 
 
@@ -287,6 +290,7 @@ ChipImgType = dtool.ExternType(vt.imread, vt.imwrite, extkey='ext')
     fname='chipcache4',
     rm_extern_on_delete=True,
     chunksize=256,
+    lazy_extern=True,
 )
 def compute_chip(depc, aid_list, config=None):
     r"""
@@ -478,69 +482,371 @@ def gen_chip_configure_and_compute(
                 {'tileGridSize': (ksize, ksize), 'clipLimit': config['adapteq_limit']},
             )
         )
-    ipreproc = image_filters.IntensityPreproc()
 
     warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
 
     _parallel_chips = getattr(ibs, '_parallel_chips', True)
 
+    # Group annotations by image, so each image is decoded once and all of its
+    # chips are warped from the same buffer. Groups are in order of first
+    # occurrence, so chips can be yielded in input order as groups finish.
+    gid_to_idxs = ut.ddict(list)
+    for idx, gid in enumerate(gid_list):
+        gid_to_idxs[gid].append(idx)
+    unique_gids = list(gid_to_idxs.keys())
+    idxs_list = list(gid_to_idxs.values())
+    M_groups = [ut.take(M_list, idxs) for idxs in idxs_list]
+    newsize_groups = [ut.take(newsize_list, idxs) for idxs in idxs_list]
+
+    gpath_list = ibs.get_image_paths(unique_gids)
+    orient_list = ibs.get_image_orientation(unique_gids)
+    args_gen = zip(gpath_list, orient_list, M_groups, newsize_groups)
+    gen_kw = {
+        'filter_list': filter_list,
+        'warpkw': warpkw,
+        'reduced_decode': config['reduced_decode'],
+    }
     if _parallel_chips:
-        gpath_list = ibs.get_image_paths(gid_list)
-        orient_list = ibs.get_image_orientation(gid_list)
-        args_gen = zip(gpath_list, orient_list, M_list, newsize_list)
-
-        gen_kw = {'filter_list': filter_list, 'warpkw': warpkw}
-        gen = ut.generate2(
-            gen_chip_worker,
+        group_results = ut.generate2(
+            gen_image_chips_worker,
             args_gen,
             gen_kw,
             nTasks=len(gpath_list),
             force_serial=ibs.force_serial,
         )
-        for chipBGR, width, height, M in gen:
-            if greyscale:
-                chipBGR = cv2.cvtColor(chipBGR, cv2.COLOR_BGR2GRAY)
-            yield chipBGR, width, height, M
     else:
-        # arg_iter = zip(cfpath_list, gid_list, newsize_list, M_list)
-        arg_iter = zip(gid_list, M_list, newsize_list)
-        arg_list = list(arg_iter)
+        group_results = (
+            gen_image_chips_worker(*args, **gen_kw)
+            for args in ut.ProgIter(
+                args_gen, length=len(gpath_list), lbl='computing chips', bs=True
+            )
+        )
 
-        last_gid = None
-        for tup in ut.ProgIter(arg_list, lbl='computing chips', bs=True):
-            # FIXME: THE GPATH SHOULD BE PASSED HERE WITH AN ORIENTATION FLAG
-            # cfpath, gid, new_size, M = tup
-            gid, M, new_size = tup
-            # Read parent image # TODO: buffer this?
-            # If the gids are sorted, no need to load the image more than once, if so
-            if gid != last_gid:
-                imgBGR = ibs.get_images(gid)
-                last_gid = gid
-            # Warp chip
-            new_size = tuple([int(np.around(val)) for val in new_size])
-            chipBGR = cv2.warpAffine(imgBGR, M[0:2], new_size, **warpkw)
-            # Do intensity normalizations
-            if filter_list:
-                chipBGR = ipreproc.preprocess(chipBGR, filter_list)
-            width, height = vt.get_size(chipBGR)
+    # Buffer the chips of groups that finish ahead of their input position
+    buffered = {}
+    nextx = 0
+    for idxs, results in zip(idxs_list, group_results):
+        buffered.update(zip(idxs, results))
+        while nextx in buffered:
+            chipBGR, width, height, M = buffered.pop(nextx)
+            nextx += 1
             if greyscale:
                 chipBGR = cv2.cvtColor(chipBGR, cv2.COLOR_BGR2GRAY)
-            yield (chipBGR, width, height, M)
+            yield chipBGR, width, height, M
 
 
-def gen_chip_worker(gpath, orient, M, new_size, filter_list, warpkw):
-    imgBGR = vt.imread(gpath, orient=orient)
+def warp_chip(imgBGR, M, new_size, filter_list, warpkw, ipreproc=None):
     # Warp chip
     new_size = tuple([int(np.around(val)) for val in new_size])
     chipBGR = cv2.warpAffine(imgBGR, M[0:2], new_size, **warpkw)
     # Do intensity normalizations
     if filter_list:
-        ipreproc = image_filters.IntensityPreproc()
+        if ipreproc is None:
+            ipreproc = image_filters.IntensityPreproc()
         chipBGR = ipreproc.preprocess(chipBGR, filter_list)
     width, height = vt.get_size(chipBGR)
     return (chipBGR, width, height, M)
 
 
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def plan_reduced_decode(gpath, orient, M_list):
+    r"""
+    Picks how much a jpeg can be downscaled while it is decoded.
+
+    libjpeg can run the inverse DCT at 1/2, 1/4, or 1/8 scale, which is much
+    cheaper than decoding the full image when every chip is far smaller than
+    its bbox. A factor is only used if each image-to-chip warp still samples
+    the reduced image at or below one pixel per chip pixel, and if it divides
+    both image dimensions so reduced pixels map back exactly after any exif
+    rotation.
+
+    Args:
+        gpath (str): image path
+        orient: image orientation passed to vt.imread
+        M_list (list): image-to-chip transforms of every chip in the image
+
+    Returns:
+        int: factor: 1, 2, 4, or 8
+
+    CommandLine:
+        python -m wbia.core_annots plan_reduced_decode
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.core_annots import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_reduced_decode')
+        >>> gpath = ut.unixjoin(dpath, 'plan.jpg')
+        >>> cv2.imwrite(gpath, np.zeros((1080, 1920, 3), dtype=np.uint8))
+        >>> S = np.diag([1.0, 1.0, 1.0])
+        >>> factors = [plan_reduced_decode(gpath, False, [S * s + np.diag([0, 0, 1 - s])])
+        >>>            for s in [1.0, .5, .3, .25, .1, .01]]
+        >>> print(factors)
+        [1, 2, 2, 4, 8, 8]
+        >>> assert plan_reduced_decode(gpath, True, [S * .1]) == 1
+        >>> assert plan_reduced_decode(gpath, False, [S * .1, S * .6]) == 1
+        >>> ut.delete(dpath, verbose=False)
+    """
+    if orient in ['auto', 'on', True]:
+        # vt.imread decodes through PIL when auto orienting and ignores flags
+        return 1
+    if '://' in gpath or splitext(gpath)[1].lower() not in ['.jpg', '.jpeg']:
+        return 1
+    max_scale = max(np.linalg.norm(np.asarray(M)[0:2, 0:2], ord=2) for M in M_list)
+    from PIL import Image
+
+    # Only reads the header
+    with Image.open(gpath) as pil_img:
+        width, height = pil_img.size
+    for factor in [8, 4, 2]:
+        if factor * max_scale <= 1.0 and width % factor == 0 and height % factor == 0:
+            return factor
+    return 1
+
+
+def reduced_decode_transform(factor):
+    """
+    Maps pixels of an image decoded at 1 / factor scale to full resolution
+    pixels. Each reduced pixel averages a factor x factor block, so its center
+    lies in the middle of the block.
+    """
+    offset = (factor - 1) / 2.0
+    return np.array([[factor, 0, offset], [0, factor, offset], [0, 0, 1]])
+
+
+def gen_image_chips_worker(
+    gpath, orient, M_list, new_size_list, filter_list, warpkw, reduced_decode=False
+):
+    r"""
+    Decodes one image and warps every chip requested from it
+
+    If reduced_decode is True, the image may be decoded at a reduced
+    resolution (see plan_reduced_decode). The returned transforms are always
+    relative to the full resolution image.
+
+    CommandLine:
+        python -m wbia.core_annots gen_image_chips_worker
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.core_annots import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_image_chips')
+        >>> gpath_list, args_list = testdata_many_annot_images(dpath, 1, 5)
+        >>> gpath = gpath_list[0]
+        >>> M_list, new_size_list = zip(*args_list[0])
+        >>> warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
+        >>> filter_list = [('histeq', {})]
+        >>> results = gen_image_chips_worker(
+        >>>     gpath, False, M_list, new_size_list, filter_list, warpkw)
+        >>> for M, new_size, tup in zip(M_list, new_size_list, results):
+        >>>     tup1 = gen_chip_worker(gpath, False, M, new_size, filter_list, warpkw)
+        >>>     assert np.all(tup[0] == tup1[0]) and tup[1:3] == tup1[1:3]
+        >>> assert len(results) == 5
+        >>> ut.delete(dpath, verbose=False)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Chips from a reduced decode are close to full decode chips
+        >>> from wbia.core_annots import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'test_reduced_chips')
+        >>> gpath_list, args_list = testdata_many_annot_images(
+        >>>     dpath, 1, 8, dsize=(4000, 3000), box_range=(1200, 2400), dim_size=300)
+        >>> gpath = gpath_list[0]
+        >>> M_list, new_size_list = zip(*args_list[0])
+        >>> warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
+        >>> factor = plan_reduced_decode(gpath, False, M_list)
+        >>> assert factor > 1
+        >>> full = gen_image_chips_worker(gpath, False, M_list, new_size_list, [], warpkw)
+        >>> reduced = gen_image_chips_worker(
+        >>>     gpath, False, M_list, new_size_list, [], warpkw, reduced_decode=True)
+        >>> for tup1, tup2 in zip(full, reduced):
+        >>>     assert tup1[1:3] == tup2[1:3] and np.all(tup1[3] == tup2[3])
+        >>>     diff = np.abs(tup1[0].astype(np.float32) - tup2[0].astype(np.float32))
+        >>>     assert diff.mean() < 2.0, diff.mean()
+        >>> ut.delete(dpath, verbose=False)
+    """
+    factor = plan_reduced_decode(gpath, orient, M_list) if reduced_decode else 1
+    if factor > 1:
+        imgBGR = vt.imread(gpath, orient=orient, flags=REDUCED_DECODE_FLAGS[factor])
+    else:
+        imgBGR = vt.imread(gpath, orient=orient)
+    ipreproc = image_filters.IntensityPreproc() if filter_list else None
+    if factor == 1:
+        return [
+            warp_chip(imgBGR, M, new_size, filter_list, warpkw, ipreproc)
+            for M, new_size in zip(M_list, new_size_list)
+        ]
+    R = reduced_decode_transform(factor)
+    result_list = []
+    for M, new_size in zip(M_list, new_size_list):
+        chipBGR, width, height, _ = warp_chip(
+            imgBGR, M.dot(R), new_size, filter_list, warpkw, ipreproc
+        )
+        result_list.append((chipBGR, width, height, M))
+    return result_list
+
+
+def gen_chip_worker(gpath, orient, M, new_size, filter_list, warpkw):
+    imgBGR = vt.imread(gpath, orient=orient)
+    return warp_chip(imgBGR, M, new_size, filter_list, warpkw)
+
+
+def testdata_many_annot_images(
+    dpath,
+    num_images=8,
+    annots_per_image=30,
+    seed=0,
+    dsize=(1920, 1080),
+    box_range=(100, 600),
+    dim_size=700,
+):
+    """
+    Writes random jpeg images to dpath and builds chip warps for random boxes
+
+    Returns:
+        tuple: (gpath_list, args_list) where args_list[i] holds the
+            (M, new_size) of each annotation in image i
+    """
+    rng = np.random.RandomState(seed)
+    img_w, img_h = dsize
+    gpath_list = []
+    args_list = []
+    for gx in range(num_images):
+        img = rng.randint(0, 255, (img_h, img_w, 3)).astype(np.uint8)
+        # smooth the noise so the jpeg is a realistic size
+        img = cv2.GaussianBlur(img, (0, 0), 3)
+        gpath = ut.unixjoin(dpath, 'synthetic_%d.jpg' % (gx,))
+        cv2.imwrite(gpath, img)
+        gpath_list.append(gpath)
+        args = []
+        for _ in range(annots_per_image):
+            w, h = rng.randint(box_range[0], box_range[1], 2)
+            bbox = (rng.randint(0, img_w - w), rng.randint(0, img_h - h), w, h)
+            new_size = vt.ScaleStrat.maxwh(dim_size, (w, h), 0)
+            M = vt.get_image_to_chip_transform(bbox, new_size, rng.rand() - 0.5)
+            args.append((M, new_size))
+        args_list.append(args)
+    return gpath_list, args_list
+
+
+def benchmark_image_grouped_chips(num_images=8, annots_per_image=30):
+    r"""
+    Compares extracting chips one annotation at a time, which decodes the
+    source image for every annotation, with extracting them per image.
+
+    CommandLine:
+        python -m wbia.core_annots benchmark_image_grouped_chips
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.core_annots import *  # NOQA
+        >>> result = benchmark_image_grouped_chips()
+        >>> print(ut.repr3(result, precision=2))
+    """
+    dpath = ut.ensure_app_resource_dir('wbia', 'benchmark_image_grouped_chips')
+    gpath_list, args_list = testdata_many_annot_images(
+        dpath, num_images, annots_per_image
+    )
+    warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
+    filter_list = []
+    with ut.Timer('per annot', verbose=False) as t_annot:
+        for gpath, args in zip(gpath_list, args_list):
+            for M, new_size in args:
+                gen_chip_worker(gpath, False, M, new_size, filter_list, warpkw)
+    with ut.Timer('per image', verbose=False) as t_image:
+        for gpath, args in zip(gpath_list, args_list):
+            M_list, new_size_list = zip(*args)
+            gen_image_chips_worker(
+                gpath, False, M_list, new_size_list, filter_list, warpkw
+            )
+    ut.delete(dpath, verbose=False)
+    num_annots = num_images * annots_per_image
+    result = ut.odict(
+        [
+            ('per_annot_decodes', num_annots),
+            ('per_image_decodes', num_images),
+            ('per_annot_seconds', t_annot.ellapsed),
+            ('per_image_seconds', t_image.ellapsed),
+        ]
+    )
+    return result
+
+
+def benchmark_reduced_decode(num_images=4, annots_per_image=3, dim_size=700):
+    r"""
+    Compares extracting chips from full resolution decodes of large camera
+    trap sized images with extracting them from reduced decodes.
+
+    Reports the mean absolute chip difference and, if pyhesaff is available,
+    the relative difference in the number of detected features.
+
+    CommandLine:
+        python -m wbia.core_annots benchmark_reduced_decode
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.core_annots import *  # NOQA
+        >>> result = benchmark_reduced_decode()
+        >>> print(ut.repr3(result, precision=3))
+    """
+    dpath = ut.ensure_app_resource_dir('wbia', 'benchmark_reduced_decode')
+    gpath_list, args_list = testdata_many_annot_images(
+        dpath,
+        num_images,
+        annots_per_image,
+        dsize=(6000, 4000),
+        box_range=(1500, 3500),
+        dim_size=dim_size,
+    )
+    warpkw = dict(flags=cv2.INTER_LANCZOS4, borderMode=cv2.BORDER_CONSTANT)
+    results = {}
+    timers = {}
+    for reduced_decode in [False, True]:
+        results[reduced_decode] = []
+        with ut.Timer(verbose=False) as timer:
+            for gpath, args in zip(gpath_list, args_list):
+                M_list, new_size_list = zip(*args)
+                tups = gen_image_chips_worker(
+                    gpath, False, M_list, new_size_list, [], warpkw, reduced_decode
+                )
+                results[reduced_decode].append(tups)
+        timers[reduced_decode] = timer.ellapsed
+    factors = [
+        plan_reduced_decode(gpath, False, ut.take_column(args, 0))
+        for gpath, args in zip(gpath_list, args_list)
+    ]
+    chips1 = [tup[0] for tups in results[False] for tup in tups]
+    chips2 = [tup[0] for tups in results[True] for tup in tups]
+    diffs = [
+        np.abs(chip1.astype(np.float32) - chip2.astype(np.float32)).mean()
+        for chip1, chip2 in zip(chips1, chips2)
+    ]
+    result = ut.odict(
+        [
+            ('factors', factors),
+            ('full_seconds', timers[False]),
+            ('reduced_seconds', timers[True]),
+            ('max_mean_abs_chip_diff', max(diffs)),
+        ]
+    )
+    try:
+        import pyhesaff
+    except ImportError:
+        pass
+    else:
+        nfeats1 = np.array([len(pyhesaff.detect_feats_in_image(c)[0]) for c in chips1])
+        nfeats2 = np.array([len(pyhesaff.detect_feats_in_image(c)[0]) for c in chips2])
+        rel_diff = np.abs(nfeats1 - nfeats2) / np.maximum(nfeats1, 1)
+        result['max_rel_num_feat_diff'] = rel_diff.max()
+    ut.delete(dpath, verbose=False)
+    return result
+
+
 @register_subprop('chips', 'dlen_sqrd')
 def compute_dlen_sqrd(depc, aid_list, config=None):
     size_list = np.array(depc.get('chips', aid_list, ('width', 'height'), config))
@@ -985,6 +1291,7 @@ def make_hog_block_image(hog, config=None):
     configclass=HOGConfig,
     fname='hogcache',
     chunksize=32,
+    parallel='process',
 )
 def compute_hog(depc, cid_list, config=None):
     """
@@ -1084,6 +1391,7 @@ class FeatConfig(dtool.Config):
     rm_extern_on_delete=True,
     fname='featcache',
     chunksize=1024,
+    fused=True,
 )
 def compute_feats(depc, cid_list, config=None):
     """
@@ -1155,7 +1463,8 @@ def compute_feats(depc, cid_list, config=None):
     maskmethod = config['maskmethod']
 
     ut.assert_all_not_None(cid_list, 'cid_list')
-    chip_fpath_list = depc.get_native('chips', cid_list, 'img', read_extern=False)
+    # Chips computed in the same fused chunk are used without a disk round trip
+    chip_fpath_list = depc['chips'].get_extern_data_or_fpaths(cid_list, 'img')
 
     if maskmethod is not None:
         assert False
@@ -1209,7 +1518,7 @@ def gen_feat_worker(chip_fpath, probchip_fpath, hesaff_params):
     Must take in one argument to be used by multiprocessing.map_async
 
     Args:
-        chip_fpath:
+        chip_fpath: chip path, or the chip itself if it is still in memory
         probchip_fpath:
         hesaff_params:
 
@@ -1248,7 +1557,13 @@ def gen_feat_worker(chip_fpath, probchip_fpath, hesaff_params):
     """
     import pyhesaff
 
-    chip = vt.imread(chip_fpath)
+    if isinstance(chip_fpath, np.ndarray):
+        chip = chip_fpath
+        if chip.ndim == 2:
+            # Match vt.imread, which always reads chips as color
+            chip = cv2.cvtColor(chip, cv2.COLOR_GRAY2BGR)
+    else:
+        chip = vt.imread(chip_fpath)
     if probchip_fpath is not None:
         probchip = vt.imread(probchip_fpath, grayscale=True)
         probchip = vt.resize_mask(probchip, chip)
@@ -1263,6 +1578,48 @@ def gen_feat_worker(chip_fpath, probchip_fpath, hesaff_params):
     return (num_kpts, kpts, vecs)
 
 
+def benchmark_fused_feats(defaultdb='testdb1', size=None):
+    r"""
+    Compares computing the features of annotations whose chips are not cached
+    with and without fusing the chip and feature computations.
+
+    CommandLine:
+        python -m wbia.core_annots benchmark_fused_feats
+        python -m wbia.core_annots benchmark_fused_feats --db PZ_MTEST
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.core_annots import *  # NOQA
+        >>> result = benchmark_fused_feats()
+        >>> print(ut.repr3(result, precision=2))
+    """
+    from wbia.dtool import depcache_table
+
+    ibs, depc, aid_list = testdata_core(defaultdb, size)
+    extern_dpath = ut.ensuredir(depc['chips'].extern_dpath)
+    unfused_default = depcache_table.UNFUSED_DEPC
+    result = ut.odict([('num_annots', len(aid_list))])
+    vecs_lists = {}
+    for fused in [False, True]:
+        # Deleting the chips deletes the dependant features as well
+        depc.delete_property('chips', aid_list)
+        num_files = len(ut.ls(extern_dpath))
+        depcache_table.UNFUSED_DEPC = not fused
+        try:
+            with ut.Timer(verbose=False) as timer:
+                vecs_lists[fused] = depc.get('feat', aid_list, 'vecs')
+        finally:
+            depcache_table.UNFUSED_DEPC = unfused_default
+        key = 'fused' if fused else 'unfused'
+        result[key + '_seconds'] = timer.ellapsed
+        result[key + '_chip_writes'] = len(ut.ls(extern_dpath)) - num_files
+    result['num_vecs_agree'] = all(
+        len(vecs1) == len(vecs2)
+        for vecs1, vecs2 in zip(vecs_lists[False], vecs_lists[True])
+    )
+    return result
+
+
 class FeatWeightConfig(dtool.Config):
     _param_info_list = [
         ut.ParamInfo('featweight_enabled', True, 'enabled='),
@@ -1280,6 +1637,7 @@ class FeatWeightConfig(dtool.Config):
     rm_extern_on_delete=True,
     fname='featcache',
     chunksize=64 if const.CONTAINERIZED else 512,
+    fused=True,
 )
 def compute_fgweights(depc, fid_list, pcid_list, config=None):
     """
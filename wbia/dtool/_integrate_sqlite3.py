@@ -2,7 +2,9 @@
 """Integrates numpy types into sqlite3"""
 from __future__ import absolute_import, division, print_function
 import io
+import struct
 import uuid
+import zlib
 from sqlite3 import register_adapter, register_converter
 
 import numpy as np
@@ -12,7 +14,56 @@ import utool as ut
 __all__ = ()
 
 
-def _read_numpy_from_sqlite3(blob):
+# NDARRAY columns are stored as a small fixed header followed by the raw
+# C-contiguous array bytes, which are read back with np.frombuffer. Blobs
+# written with np.save (the .npy format) are still read with np.load. Both
+# formats are returned as writeable arrays that own their data.
+_NPY_MAGIC = b'\x93NUMPY'
+_NDARRAY_MAGIC = b'\x93WBA'
+_NDARRAY_VERSION = 1
+# magic, version, codec, ndim, length of the dtype string
+_NDARRAY_HEADER = struct.Struct('<4sBBBB')
+# The array data starts at a multiple of this many bytes
+_NDARRAY_ALIGN = 16
+
+_CODEC_IDS = {None: 0, 'zlib': 1, 'lz4': 2, 'zstd': 3}
+
+# Arrays of at least NDARRAY_COMPRESS_MINBYTES are compressed with this codec
+NDARRAY_COMPRESSION = ut.get_argval('--ndarray-compress', type_=str, default=None)
+NDARRAY_COMPRESS_MINBYTES = 2 ** 16
+
+_DTYPE_CACHE = {}
+
+
+def _compress(codec, data):
+    if codec == _CODEC_IDS['zlib']:
+        return zlib.compress(data, 1)
+    elif codec == _CODEC_IDS['lz4']:
+        import lz4.frame
+
+        return lz4.frame.compress(data)
+    elif codec == _CODEC_IDS['zstd']:
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError('unknown ndarray codec=%r' % (codec,))
+
+
+def _decompress(codec, data):
+    if codec == _CODEC_IDS['zlib']:
+        return zlib.decompress(data)
+    elif codec == _CODEC_IDS['lz4']:
+        import lz4.frame
+
+        return lz4.frame.decompress(data)
+    elif codec == _CODEC_IDS['zstd']:
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError('unknown ndarray codec=%r' % (codec,))
+
+
+def _read_npy_from_sqlite3(blob):
     # INVESTIGATE: Is memory freed up correctly here?
     out = io.BytesIO(blob)
     out.seek(0)
@@ -23,6 +74,71 @@ def _read_numpy_from_sqlite3(blob):
     return arr
 
 
+def _write_npy_to_sqlite3(arr):
+    out = io.BytesIO()
+    np.save(out, arr)
+    out.seek(0)
+    return memoryview(out.read())
+
+
+def _read_numpy_from_sqlite3(blob):
+    """
+    Decodes an NDARRAY blob. The array is copied out of the blob (or the
+    decompressed buffer), so it is writeable like arrays read with np.load.
+    """
+    if blob[0:4] != _NDARRAY_MAGIC:
+        return _read_npy_from_sqlite3(blob)
+    _, version, codec, ndim, dtype_len = _NDARRAY_HEADER.unpack_from(blob)
+    if version != _NDARRAY_VERSION:
+        raise ValueError('unknown ndarray blob version=%r' % (version,))
+    offset = _NDARRAY_HEADER.size
+    dtype_str = bytes(blob[offset : offset + dtype_len])
+    try:
+        dtype = _DTYPE_CACHE[dtype_str]
+    except KeyError:
+        dtype = _DTYPE_CACHE[dtype_str] = np.dtype(dtype_str.decode('ascii'))
+    offset += dtype_len
+    shape = struct.unpack_from('<%dQ' % (ndim,), blob, offset)
+    offset += 8 * ndim
+    offset += -offset % _NDARRAY_ALIGN
+    if codec:
+        data = _decompress(codec, memoryview(blob)[offset:])
+        arr = np.frombuffer(data, dtype=dtype)
+    else:
+        count = int(np.prod(shape, dtype=np.int64))
+        arr = np.frombuffer(blob, dtype=dtype, count=count, offset=offset)
+    # frombuffer views of bytes are read-only
+    return arr.reshape(shape).copy()
+
+
+def _write_numpy_to_sqlite3(arr, compression=None):
+    """
+    Encodes an ndarray as an NDARRAY blob. Object and record arrays are still
+    stored in the .npy format.
+    """
+    dtype = arr.dtype
+    if dtype.hasobject or dtype.fields is not None or dtype.itemsize == 0:
+        return _write_npy_to_sqlite3(arr)
+    if compression is None:
+        compression = NDARRAY_COMPRESSION
+    if not arr.flags.c_contiguous:
+        arr = arr.copy(order='C')
+    data = memoryview(arr.reshape(-1).view(np.uint8))
+    codec = 0
+    if compression and arr.nbytes >= NDARRAY_COMPRESS_MINBYTES:
+        compressed = _compress(_CODEC_IDS[compression], data)
+        if len(compressed) < arr.nbytes:
+            codec = _CODEC_IDS[compression]
+            data = compressed
+    dtype_str = dtype.str.encode('ascii')
+    header = _NDARRAY_HEADER.pack(
+        _NDARRAY_MAGIC, _NDARRAY_VERSION, codec, arr.ndim, len(dtype_str)
+    )
+    header += dtype_str + struct.pack('<%dQ' % (arr.ndim,), *arr.shape)
+    header += b'\x00' * (-len(header) % _NDARRAY_ALIGN)
+    return b''.join([header, data])
+
+
 def _read_bool(b):
     return None if b is None else bool(b)
 
@@ -31,13 +147,6 @@ def _write_bool(b):
     return b
 
 
-def _write_numpy_to_sqlite3(arr):
-    out = io.BytesIO()
-    np.save(out, arr)
-    out.seek(0)
-    return memoryview(out.read())
-
-
 def _read_uuid_from_sqlite3(blob):
     try:
         return uuid.UUID(bytes_le=blob)
@@ -27,6 +27,14 @@ Args:
     colnames (list): data returned by this table
     coltypes (list): types of data returned by this table
     chunksize (int): (default = None)
+    parallel (str): if 'process', dirty chunks are computed in forked worker
+        processes and written to SQL in order by the calling process. The
+        computed rows must be picklable. (default = None)
+    fused (bool): if True, rows are ensured one chunk of root inputs at a time
+        together with their ancestors. (default = False)
+    lazy_extern (bool): if True, external columns computed while a fused table
+        is ensured are kept in memory and only written to disk when their path
+        is requested. (default = False)
     configclass (dtool.TableConfig): derivative of dtool.TableConfig.
         if None, a default class will be constructed for you. (default = None)
     docstr (str): (default = None)
@@ -701,6 +709,20 @@ class _CoreDependencyCache(object):
         recompute = _kwargs.pop('recompute', _recompute_all)
         table = depc[target_tablename]
 
+        if (
+            table.fused
+            and not depcache_table.UNFUSED_DEPC
+            and depc._fused_depth == 0
+            and not _hack_rootmost
+            and not recompute
+            and _kwargs.get('ensure', True)
+        ):
+            rowids = depc._get_fused_rowids(
+                target_tablename, input_tuple, rowid_kw, _debug
+            )
+            if rowids is not None:
+                return rowids
+
         parent_rowids = depc.get_parent_rowids(
             target_tablename,
             input_tuple,
@@ -716,6 +738,84 @@ class _CoreDependencyCache(object):
             )
         return rowids
 
+    def _get_fused_rowids(depc, tablename, input_tuple, rowid_kw, _debug=False):
+        """
+        Ensures the rows of a fused table one chunk of root inputs at a time.
+
+        Every ancestor of a chunk is computed right before the chunk itself, so
+        external data of lazy_extern ancestors is consumed from memory instead of
+        being read back from disk. Deferred data that is still unwritten at the
+        end of a chunk is written then, so every stored row has its file.
+
+        Returns None if the inputs cannot be chunked (e.g. multi inputs).
+
+        CommandLine:
+            python -m dtool.depcache_control _get_fused_rowids
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.dtool.depcache_control import *  # NOQA
+            >>> from wbia.dtool import depcache_table
+            >>> from os.path import exists
+            >>> depc = DependencyCache(
+            >>>     root_tablename='dummy_annot', default_fname='fused_cache',
+            >>>     cache_dpath=ut.ensure_app_resource_dir('dtool', 'test_fused'),
+            >>>     use_globals=False, get_root_uuid=ut.hashable_to_uuid)
+            >>> ExternArr = depcache_table.ExternType(np.load, np.save, extern_ext='.npy')
+            >>> @depc.register_preproc('chip', ['dummy_annot'], ['arr'], [ExternArr],
+            >>>                        lazy_extern=True)
+            >>> def compute_chip(depc, aids, config=None):
+            >>>     for aid in aids:
+            >>>         yield (np.arange(aid),)
+            >>> @depc.register_preproc('feat', ['chip'], ['total'], [int], fused=True)
+            >>> def compute_feat(depc, cids, config=None):
+            >>>     table = depc['chip']
+            >>>     for arr in table.get_extern_data_or_fpaths(cids, 'arr'):
+            >>>         assert isinstance(arr, np.ndarray), 'chip should be in memory'
+            >>>         yield (int(arr.sum()),)
+            >>> depc.initialize()
+            >>> depc.clear_all()
+            >>> ut.delete(depc['chip'].extern_dpath, verbose=False)
+            >>> aids = list(range(1, 8))
+            >>> depcache_table.FUSED_CHUNKSIZE = 3
+            >>> totals = depc.get('feat', aids, 'total')
+            >>> depcache_table.FUSED_CHUNKSIZE = 256
+            >>> assert totals == [sum(range(aid)) for aid in aids]
+            >>> # Chips were written after their chunk and nothing is left in memory
+            >>> assert len(depc['chip'].extern_memcache) == 0
+            >>> cids = depc.get_rowids('chip', aids)
+            >>> fpaths = depc['chip'].get_row_data(
+            >>>     cids, 'arr', read_extern=False, ensure=False)
+            >>> assert all(map(exists, fpaths))
+            >>> arrs = depc.get('chip', aids, 'arr')
+            >>> assert all(np.all(arr == np.arange(aid)) for aid, arr in zip(aids, arrs))
+            >>> depc.clear_all()
+        """
+        table = depc[tablename]
+        exi_inputs = table.rootmost_inputs.total_expand()
+        if table.ismulti or len(exi_inputs.rmi_list) != 1:
+            return None
+        root_rowids = depc.rectify_input_tuple(exi_inputs, input_tuple)[0]
+        chunksize = depcache_table.FUSED_CHUNKSIZE
+        if _debug:
+            print('[depc] fused ensure of %d %s rows' % (len(root_rowids), tablename))
+        rowids = []
+        depc._fused_depth += 1
+        try:
+            for root_chunk in ut.ichunks(root_rowids, chunksize):
+                rowids.extend(depc.get_rowids(tablename, (root_chunk,), **rowid_kw))
+                depc._flush_extern_memcaches()
+        finally:
+            depc._fused_depth -= 1
+            # The rows of deferred data are already stored, so write it out
+            depc._flush_extern_memcaches()
+        return rowids
+
+    def _flush_extern_memcaches(depc):
+        for table in depc.cachetable_dict.values():
+            for uri in list(table.extern_memcache.keys()):
+                table._flush_extern(uri)
+
     @ut.accepts_scalar_input2(argx_list=[1])
     def get(
         depc,
@@ -1107,6 +1207,8 @@ class DependencyCache(_CoreDependencyCache, ut.NiceRepr):
         depc.get_root_uuid = get_root_uuid
         depc.delete_exclude_tables = {}
         depc._debug = ut.get_argflag(('--debug-depcache', '--debug-depc'))
+        # Nesting level of fused computations (see get_rowids)
+        depc._fused_depth = 0
 
     def get_tablenames(depc):
         return list(depc.cachetable_dict.keys())
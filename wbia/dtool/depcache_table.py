@@ -21,6 +21,7 @@ FIXME:
 
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
 import re
 import itertools as it
 from os.path import join, exists
@@ -31,7 +32,7 @@ import utool as ut
 import ubelt as ub
 from six.moves import zip, range
 
-from wbia.dtool.sql_control import SQLDatabaseController
+from wbia.dtool.sql_control import SQLDatabaseController, reconnect_after_fork
 from wbia.dtool.types import TYPE_TO_SQLTYPE
 
 
@@ -55,6 +56,86 @@ GRACE_PERIOD = ut.get_argval('--grace', type_=int, default=0)
 
 STORE_CFGDICT = True
 
+# Number of worker processes used by tables registered with parallel='process'
+DEPC_WORKERS = ut.get_argval('--depc-workers', type_=int, default=None)
+SERIAL_DEPC = ut.get_argflag('--serial-depc')
+
+# Number of threads that read external files of a table (1 reads serially)
+EXTERN_READERS = ut.get_argval('--extern-readers', type_=int, default=8)
+
+# Number of root inputs ensured at once by tables registered with fused=True
+FUSED_CHUNKSIZE = ut.get_argval('--fused-chunksize', type_=int, default=128)
+UNFUSED_DEPC = ut.get_argflag('--unfused-depc')
+
+# Dirty chunks of tables computed in worker processes. Workers are forked
+# after a job is added, so only job ids and chunk indices are sent to them.
+_CHUNK_JOBS = {}
+_CHUNK_JOB_COUNTER = it.count()
+_IN_CHUNK_WORKER = False
+
+
+def _init_chunk_worker():
+    global _IN_CHUNK_WORKER
+    # Tables computed from inside a worker are computed serially
+    _IN_CHUNK_WORKER = True
+    reconnect_after_fork()
+
+
+def _compute_chunk_worker(jobid, chunkx):
+    table, dirty_iter, chunksize, config_rowid, config = _CHUNK_JOBS[jobid]
+    dirty_chunk = dirty_iter[chunkx * chunksize : (chunkx + 1) * chunksize]
+    return table._compute_dirty_chunk(dirty_chunk, config_rowid, config)
+
+
+def _imap_ordered(func, arg_iter, nworkers, prefetch=None):
+    """
+    Maps func over arg_iter in a bounded pool of threads and yields results in
+    input order. At most prefetch calls are submitted ahead of the consumer.
+    A pool of one worker maps serially in the calling thread.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.dtool.depcache_table import *  # NOQA
+        >>> from wbia.dtool.depcache_table import _imap_ordered
+        >>> import time
+        >>> def func(x):
+        >>>     time.sleep((x % 3) / 1000.0)
+        >>>     return x * 2
+        >>> result1 = list(_imap_ordered(func, range(50), nworkers=4, prefetch=5))
+        >>> result2 = list(_imap_ordered(func, range(50), nworkers=1))
+        >>> assert result1 == result2 == [x * 2 for x in range(50)]
+    """
+    if nworkers <= 1:
+        for arg in arg_iter:
+            yield func(arg)
+        return
+    import concurrent.futures
+
+    if prefetch is None:
+        prefetch = 2 * nworkers
+    executor = concurrent.futures.ThreadPoolExecutor(nworkers)
+    pending = collections.deque()
+    try:
+        arg_iter = iter(arg_iter)
+        for arg in it.islice(arg_iter, max(prefetch, 1)):
+            pending.append(executor.submit(func, arg))
+        while pending:
+            result = pending.popleft().result()
+            for arg in it.islice(arg_iter, 1):
+                pending.append(executor.submit(func, arg))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _try_read(read_func, fpath):
+    try:
+        return read_func(fpath), None
+    except Exception as ex:
+        return None, ex
+
 
 class ExternType(ub.NiceRepr):
     """
@@ -1543,6 +1624,7 @@ class _TableComputeHelper(object):
         # get extern cache directory and fpaths
         extern_dpath = table.extern_dpath
         ut.ensuredir(extern_dpath, verbose=False or table.depc._debug)
+        defer_writes = table._defer_extern_writes()
         # extern_fpaths_list = [
         #     [join(extern_dpath, fname) for fname in fnames]
         #     for fnames in extern_fnames_list
@@ -1562,6 +1644,9 @@ class _TableComputeHelper(object):
             try:
                 _iter = zip(extern_data, extern_fpaths, extern_writers)
                 for obj, fpath, write_func in _iter:
+                    if defer_writes:
+                        table.extern_memcache[fpath] = (obj, write_func)
+                        continue
                     abs_fpath = join(extern_dpath, fpath)
                     # print('WRITE fpath = %r, abs_fpath = %r' % (fpath, abs_fpath, ))
                     write_func(abs_fpath, obj)
@@ -1575,6 +1660,19 @@ class _TableComputeHelper(object):
             data_new = tuple(ut.ungroup(grouped_items, groupxs, nCols - 1))
             yield data_new
 
+    def _defer_extern_writes(table):
+        # Data held in a worker process would be lost, so workers always write
+        return (
+            table.lazy_extern and table.depc._fused_depth > 0 and not _IN_CHUNK_WORKER
+        )
+
+    def _flush_extern(table, uri):
+        """ writes deferred external data to disk """
+        obj, write_func = table.extern_memcache.pop(uri)
+        abs_fpath = join(table.extern_dpath, uri)
+        write_func(abs_fpath, obj)
+        ut.assert_exists(abs_fpath, verbose=False)
+
     def get_extern_fnames(table, parent_rowids, config, extern_col_index=0):
         """
         convinience function around get_extern_fnames
@@ -1702,6 +1800,90 @@ class _TableComputeHelper(object):
         # None data means that there was an error for a specific row
         return dirty_params_iter
 
+    def _compute_dirty_chunk(table, dirty_chunk, config_rowid, config):
+        dirty_parent_ids_chunk, dirty_preproc_args_chunk = zip(*dirty_chunk)
+        dirty_params_iter = table._compute_dirty_rows(
+            dirty_parent_ids_chunk, dirty_preproc_args_chunk, config_rowid, config,
+        )
+        return list(dirty_params_iter)
+
+    def _get_chunk_workers(table, nChunks):
+        """
+        Number of worker processes to compute dirty chunks with. Zero means
+        chunks are computed in this process.
+        """
+        import multiprocessing
+
+        if table.parallel != 'process' or SERIAL_DEPC or _IN_CHUNK_WORKER:
+            return 0
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            # Workers must inherit the depcache and its preproc functions
+            return 0
+        nworkers = ut.num_cpus() if DEPC_WORKERS is None else DEPC_WORKERS
+        nworkers = min(nworkers, nChunks)
+        return nworkers if nworkers > 1 else 0
+
+    def _parallel_compute_dirty_chunks(
+        table, dirty_iter, chunksize, config_rowid, config, nworkers
+    ):
+        """
+        Computes dirty chunks in forked worker processes and yields them in
+        order, so the caller still writes them to SQL one after another.
+
+        At most two chunks per worker are submitted at once, which bounds the
+        number of computed chunks held in memory.
+
+        CommandLine:
+            python -m dtool.depcache_table _parallel_compute_dirty_chunks
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.dtool.depcache_table import *  # NOQA
+            >>> from wbia.dtool import depcache_table
+            >>> from wbia.dtool.example_depcache import testdata_depc
+            >>> import numpy as np
+            >>> depc = testdata_depc()
+            >>> depc.clear_all()
+            >>> table = depc['descriptor']
+            >>> table.chunksize = 2
+            >>> table.parallel = 'process'
+            >>> depcache_table.DEPC_WORKERS = 2
+            >>> assert table._get_chunk_workers(3) == 2
+            >>> vecs_list1 = depc.get('descriptor', [1, 2, 3, 4, 5], 'vecs')
+            >>> table.clear_table()
+            >>> table.parallel = None
+            >>> vecs_list2 = depc.get('descriptor', [1, 2, 3, 4, 5], 'vecs')
+            >>> depcache_table.DEPC_WORKERS = None
+            >>> assert all(np.all(v1 == v2) for v1, v2 in zip(vecs_list1, vecs_list2))
+            >>> assert len(depcache_table._CHUNK_JOBS) == 0
+        """
+        import concurrent.futures
+        import multiprocessing
+
+        nChunks = ut.get_num_chunks(len(dirty_iter), chunksize)
+        jobid = next(_CHUNK_JOB_COUNTER)
+        _CHUNK_JOBS[jobid] = (table, dirty_iter, chunksize, config_rowid, config)
+        executor = concurrent.futures.ProcessPoolExecutor(
+            nworkers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_chunk_worker,
+        )
+        pending = collections.deque()
+        try:
+            chunkx_iter = iter(range(nChunks))
+            for chunkx in it.islice(chunkx_iter, 2 * nworkers):
+                pending.append(executor.submit(_compute_chunk_worker, jobid, chunkx))
+            while pending:
+                dirty_params_iter = pending.popleft().result()
+                for chunkx in it.islice(chunkx_iter, 1):
+                    pending.append(executor.submit(_compute_chunk_worker, jobid, chunkx))
+                yield dirty_params_iter
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            del _CHUNK_JOBS[jobid]
+
     def _chunk_compute_dirty_rows(
         table, dirty_parent_ids, dirty_preproc_args, config_rowid, config, verbose=True
     ):
@@ -1734,12 +1916,29 @@ class _TableComputeHelper(object):
 
         # Report computation progress
         dirty_iter = list(zip(dirty_parent_ids, dirty_preproc_args))
-        prog_iter = ut.ProgChunks(
-            dirty_iter,
-            chunksize,
-            nInput,
-            lbl='[deptbl.compute] add %s chunk' % (table.tablename),
-        )
+        nChunks = ut.get_num_chunks(nInput, chunksize) if nInput else 0
+        nworkers = table._get_chunk_workers(nChunks)
+        if nworkers:
+            if verbose:
+                print('[deptbl.compute] using %d worker processes' % (nworkers,))
+            prog_iter = ut.ProgIter(
+                table._parallel_compute_dirty_chunks(
+                    dirty_iter, chunksize, config_rowid, config, nworkers
+                ),
+                length=nChunks,
+                lbl='[deptbl.compute] add %s chunk' % (table.tablename),
+            )
+        else:
+            prog_iter = (
+                table._compute_dirty_chunk(dirty_chunk, config_rowid, config)
+                for dirty_chunk in ut.ProgChunks(
+                    dirty_iter,
+                    chunksize,
+                    nInput,
+                    lbl='[deptbl.compute] add %s chunk' % (table.tablename),
+                )
+                if len(dirty_chunk) > 0
+            )
         # These are the colnames that we expect to be computed
         colnames = table.computable_colnames()
         # def unfinished_features():
@@ -1757,23 +1956,7 @@ class _TableComputeHelper(object):
         # CALL EXTERNAL PREPROCESSING / GENERATION FUNCTION
         try:
             # prog_iter = list(prog_iter)
-            for dirty_chunk in prog_iter:
-                nChunkInput = len(dirty_chunk)
-                if nChunkInput == 0:
-                    return
-                dirty_parent_ids_chunk, dirty_preproc_args_chunk = zip(*dirty_chunk)
-
-                dirty_params_iter = table._compute_dirty_rows(
-                    dirty_parent_ids_chunk,
-                    dirty_preproc_args_chunk,
-                    config_rowid,
-                    config,
-                )
-
-                DEBUG_LIST_MODE = True
-                if DEBUG_LIST_MODE:
-                    dirty_params_iter = list(dirty_params_iter)
-                    assert len(dirty_params_iter) == nChunkInput
+            for dirty_params_iter in prog_iter:
                 # TODO: Separate into func which can be specified as a callback.
                 # None data means that there was an error for a specific row
                 dirty_params_iter = ut.filter_Nones(dirty_params_iter)
@@ -1828,6 +2011,15 @@ class DependencyCacheTable(
             process multiple inputs at once.
         taggable (bool): specifies if a computed object can be disconected from
             its ancestors and accessed via a tag.
+        parallel (str): if 'process' dirty chunks are computed in a pool of
+            forked workers (see --depc-workers and --serial-depc).
+        fused (bool): if True rows are ensured a chunk of root inputs at a
+            time, so ancestors are computed right before they are used (see
+            --fused-chunksize and --unfused-depc).
+        lazy_extern (bool): if True external data computed while a fused
+            table is being ensured is held in memory instead of written to
+            disk. Files are written when their path is first requested or at
+            the end of the chunk, whichever comes first.
 
     CommandLine:
         python -m dtool.depcache_table --exec-DependencyCacheTable
@@ -1862,10 +2054,14 @@ class DependencyCacheTable(
         rm_extern_on_delete=False,
         vectorized=True,
         taggable=False,
+        parallel=None,
+        fused=False,
+        lazy_extern=False,
     ):
         """
         recieves kwargs from depc._register_prop
         """
+        assert parallel in {None, 'process'}, 'parallel=%r is unknown' % (parallel,)
         try:
             table.db = None
         except Exception:
@@ -1890,6 +2086,11 @@ class DependencyCacheTable(
         table.default_to_unpack = default_to_unpack
         table.vectorized = vectorized
         table.taggable = taggable
+        table.parallel = parallel
+        table.fused = fused
+        table.lazy_extern = lazy_extern
+        # Maps the uris of deferred external writes to (data, write_func)
+        table.extern_memcache = {}
 
         # table.store_modification_time = True
         # Use the filesystem to accomplish this
@@ -2508,6 +2709,11 @@ class DependencyCacheTable(
         extern_colattrs = ut.compress(requested_colattrs, isextern_flags)
         extern_resolve_colxs = ut.compress(nested_offsets_start, isextern_flags)
         extern_read_funcs = ut.take_column(extern_colattrs, 'read_func')
+        # Pickled classes may access the depcache when loaded (on_load), which
+        # is not safe from reader threads
+        extern_concurrent_flags = ut.not_list(
+            ut.dict_take_column(extern_colattrs, 'is_external_class', False)
+        )
         intern_colnames_ = ut.take_column(table.internal_col_attrs, 'intern_colname')
         intern_colnames = ut.unflat_take(intern_colnames_, intern_colxs)
 
@@ -2516,7 +2722,9 @@ class DependencyCacheTable(
             x1 if x2 - x1 == 1 else list(range(x1, x2))
             for x1, x2 in zip(nested_offsets_start, nested_offsets_end)
         ]
-        extern_resolve_tups = list(zip(extern_resolve_colxs, extern_read_funcs))
+        extern_resolve_tups = list(
+            zip(extern_resolve_colxs, extern_read_funcs, extern_concurrent_flags)
+        )
         flat_intern_colnames = tuple(ut.flatten(intern_colnames))
         return nesting_xs, extern_resolve_tups, flat_intern_colnames
 
@@ -2672,32 +2880,44 @@ class DependencyCacheTable(
         if nInput > 0 and len(nonNone_tbl_rowids) > 0:
             if generator_version:
 
-                def _generator_resolve_all():
-                    extern_dpath = table.extern_dpath
-                    for rawprop in raw_prop_list:
-                        if rawprop is None:
-                            raise Exception(
-                                'raw prop was None, but it should always be a tuple. '
-                                'This may indicate that the cache needs to be cleared'
-                            )
+                extern_dpath = table.extern_dpath
+
+                def _resolve_row(rawprop):
+                    if rawprop is None:
+                        raise Exception(
+                            'raw prop was None, but it should always be a tuple. '
+                            'This may indicate that the cache needs to be cleared'
+                        )
 
-                        exprop = list(rawprop)
-                        # Modify prop with external data
-                        for extern_colx, read_func in extern_resolve_tups:
-                            uri = exprop[extern_colx]
-                            uri_full = join(extern_dpath, uri)
+                    exprop = list(rawprop)
+                    # Modify prop with external data
+                    for extern_colx, read_func, _ in extern_resolve_tups:
+                        uri = exprop[extern_colx]
+                        uri_full = join(extern_dpath, uri)
+                        if uri in table.extern_memcache:
                             if read_extern:
-                                data = read_func(uri_full)
-                            else:
-                                data = uri_full
-                                if ensure:
-                                    ut.assertpath(uri_full)
-                            exprop[extern_colx] = data
-                        # nestprop = ut.unflat_take(exprop, nesting_xs)
-                        nestprop = tup_unflat_take(exprop, nesting_xs)
-                        yield nestprop
-
-                prop_gen = _generator_resolve_all()
+                                exprop[extern_colx] = table.extern_memcache[uri][0]
+                                continue
+                            table._flush_extern(uri)
+                        if read_extern:
+                            data = read_func(uri_full)
+                        else:
+                            data = uri_full
+                            if ensure:
+                                ut.assertpath(uri_full)
+                        exprop[extern_colx] = data
+                    # nestprop = ut.unflat_take(exprop, nesting_xs)
+                    nestprop = tup_unflat_take(exprop, nesting_xs)
+                    return nestprop
+
+                # Rows are read ahead of the consumer by a pool of threads
+                concurrent = (
+                    read_extern
+                    and len(extern_resolve_tups) > 0
+                    and all(ut.take_column(extern_resolve_tups, 2))
+                )
+                nreaders = EXTERN_READERS if concurrent else 1
+                prop_gen = _imap_ordered(_resolve_row, raw_prop_list, nreaders)
                 if unpack_columns:
                     prop_gen = (None if p is None else p[0] for p in prop_gen)
                 assert len(idxs2) == 0, 'noneager mode not fully worked out yet'
@@ -2767,16 +2987,37 @@ class DependencyCacheTable(
             ut.printex(ex, 'error on prop_list shape', keys=['raw_prop_list'])
             raise
 
-        for extern_colx, read_func in extern_resolve_tups:
+        for extern_colx, read_func, concurrent in extern_resolve_tups:
             if _debug:
                 print('[deptbl.get_row_data] read_func = %r' % (read_func,))
             data_list = []
             failed_list = []
-            for uri in prop_listT[extern_colx]:
+            uri_list = prop_listT[extern_colx]
+            if read_extern:
+                # Files are read ahead in order by a pool of threads
+                read_fpaths = [
+                    join(extern_dpath, uri)
+                    for uri in uri_list
+                    if uri not in table.extern_memcache
+                ]
+                nreaders = EXTERN_READERS if concurrent and len(read_fpaths) > 1 else 1
+                read_iter = _imap_ordered(
+                    ut.partial(_try_read, read_func), read_fpaths, nreaders
+                )
+            for uri in uri_list:
                 uri_full = join(extern_dpath, uri)
+                if uri in table.extern_memcache:
+                    if read_extern:
+                        failed_list.append(False)
+                        data_list.append(table.extern_memcache[uri][0])
+                        continue
+                    # The path is needed, so deferred data is written now
+                    table._flush_extern(uri)
                 try:
                     if read_extern:
-                        data = read_func(uri_full)
+                        data, read_ex = next(read_iter)
+                        if read_ex is not None:
+                            raise read_ex
                     else:
                         if ensure:
                             ut.assertpath(uri_full)
@@ -2845,7 +3086,7 @@ class DependencyCacheTable(
                 parent_ids, parent_args, config_rowid=cfgid, config=config
             )
             # Evaulate just to ensure storage
-            ut.evaluate_generator(dirty_params_iter)
+            list(dirty_params_iter)
 
     def _recompute_and_store(table, tbl_rowids, config=None):
         """
@@ -2938,6 +3179,22 @@ class DependencyCacheTable(
         )
         return prop_list
 
+    def get_extern_data_or_fpaths(table, tbl_rowids, colname):
+        """
+        Returns in-memory data for rows of an external column whose writes are
+        deferred (see lazy_extern), and ensured file paths for all other rows.
+        Consumers that accept either skip a disk round trip for fresh data.
+        """
+        uri_list = table.get_internal_columns(tbl_rowids, (colname + EXTERN_SUFFIX,))
+        memflags = [uri in table.extern_memcache for uri in uri_list]
+        disk_rowids = ut.compress(tbl_rowids, ut.not_list(memflags))
+        fpath_iter = iter(table.get_row_data(disk_rowids, colname, read_extern=False))
+        data_list = [
+            table.extern_memcache[uri][0] if flag else next(fpath_iter)
+            for uri, flag in zip(uri_list, memflags)
+        ]
+        return data_list
+
     def export_rows(table, rowid, target):
         """
         The goal of this is to export taggable data that can be used
@@ -2989,6 +3246,76 @@ class DependencyCacheTable(
         pass
 
 
+def benchmark_extern_reads(
+    num=3000, shape=(256, 128), nreaders_list=[1, 2, 4, 8], latency=0.0
+):
+    r"""
+    Times reading the external column of a few thousand rows with different
+    numbers of reader threads, both eagerly and as a generator.
+
+    Files that were just written are read from the page cache, so latency
+    seconds can be added to every read to mimic a network filesystem.
+
+    CommandLine:
+        python -m wbia.dtool.depcache_table benchmark_extern_reads
+        python -m wbia.dtool.depcache_table benchmark_extern_reads --latency=.002
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.dtool.depcache_table import *  # NOQA
+        >>> latency = ut.get_argval('--latency', type_=float, default=0.0)
+        >>> result = benchmark_extern_reads(latency=latency)
+        >>> print(ut.repr3(result, precision=3))
+    """
+    import time
+    import numpy as np
+    from wbia.dtool.depcache_control import DependencyCache
+
+    global EXTERN_READERS
+    cache_dpath = ut.ensure_app_resource_dir('dtool', 'benchmark_extern_reads')
+    depc = DependencyCache(
+        root_tablename='dummy_annot',
+        default_fname='extern_reads',
+        cache_dpath=cache_dpath,
+        use_globals=False,
+        get_root_uuid=ut.hashable_to_uuid,
+    )
+
+    def read_func(fpath):
+        if latency:
+            time.sleep(latency)
+        return np.load(fpath)
+
+    ExternArr = ExternType(read_func, np.save, extern_ext='.npy')
+
+    @depc.register_preproc('arr', ['dummy_annot'], ['arr'], [ExternArr])
+    def compute_arr(depc, aids, config=None):
+        for aid in aids:
+            yield (np.full(shape, aid, dtype=np.float32),)
+
+    depc.initialize()
+    table = depc['arr']
+    rowids = depc.get_rowids('arr', list(range(1, num + 1)))
+    default_nreaders = EXTERN_READERS
+    result = ut.odict()
+    try:
+        for nreaders in nreaders_list:
+            EXTERN_READERS = nreaders
+            with ut.Timer(verbose=False) as timer:
+                arrs = table.get_row_data(rowids, 'arr')
+            assert all(arr[0, 0] == aid for aid, arr in enumerate(arrs, start=1))
+            result['eager_nreaders=%d' % (nreaders,)] = timer.ellapsed
+            with ut.Timer(verbose=False) as timer:
+                for arr in table.get_row_data(rowids, 'arr', eager=False):
+                    pass
+            result['generator_nreaders=%d' % (nreaders,)] = timer.ellapsed
+    finally:
+        EXTERN_READERS = default_nreaders
+        depc.clear_all()
+        ut.delete(cache_dpath, verbose=False)
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
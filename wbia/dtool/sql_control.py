@@ -7,15 +7,20 @@ sql files are created with reasonable permissions.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 import collections
+import itertools as it
 import os
 import parse
+import random
 import re
 import sys
 import threading
+import time
+import weakref
 from functools import partial
 from io import StringIO
 from os.path import join, exists, dirname, basename
 
+import numpy as np
 import six
 import utool as ut
 
@@ -37,11 +42,47 @@ COPY_TO_MEMORY = ut.get_argflag(('--copy-db-to-memory'))
 
 TIMEOUT = 600  # Wait for up to 600 seconds for the database to return from a locked state
 
+# Fetch many keys with a few set based statements instead of one SELECT per key
+USE_BULK_GET = not ut.get_argflag('--nobulk-sql')
+# Number of keys bound to one IN (...) statement. Stays below the default
+# SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds.
+BULK_CHUNKSIZE = 900
+# kwargs of the per-key getters that the bulk getters can honor
+_BULK_KWARGS = {'unpack_scalars', 'keepwrap', 'eager', 'verbose', 'nInput', 'showprog'}
+_BULK_INT_TYPES = six.integer_types + (np.integer,)
+_BULK_TABLE_COUNTER = it.count()
+# Insert rows with one executemany and read the new rowids back as a range
+USE_BULK_ADD = not ut.get_argflag(('--nobulk-sql', '--nobulk-add'))
+_BULK_ADD_KWARGS = {'unpack_scalars', 'eager', 'verbose', 'nInput', 'showprog'}
+# Once a table nears the largest rowid sqlite assigns new rowids at random
+_BULK_ADD_MAX_ROWID = 2 ** 63 - 1 - 2 ** 32
+
+# Opt-in concurrency mode: WAL journaling, one pooled connection per thread
+# and process, and busy errors are retried with backoff
+CONCURRENT_SQL = ut.get_argflag(('--sql-concurrent', '--sql-wal'))
+# Page cache (KiB) and memory map (bytes) of each pooled connection
+CONCURRENT_CACHE_KIB = 64 * 1024
+CONCURRENT_MMAP_SIZE = 256 * 1024 ** 2
+# Seconds sqlite itself waits for a lock before a busy error is raised
+CONCURRENT_BUSY_TIMEOUT = 30
+BUSY_RETRIES = 8
+BUSY_RETRY_DELAY = 0.05
+BUSY_RETRY_MAXDELAY = 2.0
+
+# Live controllers, used to reconnect them in forked child processes
+_CONTROLLERS = weakref.WeakSet()
+
 SQLColumnRichInfo = collections.namedtuple(
     'SQLColumnRichInfo', ('column_id', 'name', 'type_', 'notnull', 'dflt_value', 'pk')
 )
 
 
+def _is_busy_error(ex):
+    """ True if an sqlite error means another connection holds a lock """
+    message = str(ex).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
 def _unpacker(results_):
     """ HELPER: Unpacks results if unpack_scalars is True. """
     if len(results_) == 0:
@@ -162,12 +203,17 @@ class SQLExecutionContext(object):
 
         # context.cur = context.db.cur  # OR USE DB CURSOR??
         if context.start_transaction:
+            begin = 'BEGIN'
+            if context.db.concurrent and not context.operation_type.startswith('SELECT'):
+                # Take the write lock up front. A deferred transaction that
+                # has to upgrade to a writer fails immediately when busy.
+                begin = 'BEGIN IMMEDIATE'
             # context.cur.execute('BEGIN', ())
             try:
-                context.cur.execute('BEGIN')
+                context.cur.execute(begin)
             except lite.OperationalError:
                 context.connection.rollback()
-                context.cur.execute('BEGIN')
+                context.cur.execute(begin)
         if context.verbose or VERBOSE_SQL:
             print(context.operation_lbl)
             if context.verbose:
@@ -184,6 +230,9 @@ class SQLExecutionContext(object):
         try:
             context.cur.execute(context.operation, params)
         except lite.Error as ex:
+            if context.db.concurrent and _is_busy_error(ex):
+                # Retried by the controller
+                raise
             print('Reporting SQLite Error')
             print('params = ' + ut.repr2(params, truncate=not ut.VERBOSE))
             ut.printex(ex, 'sql.Error', keys=['params'])
@@ -238,6 +287,8 @@ class SQLExecutionContext(object):
     def __exit__(context, type_, value, trace):
         """ Finalization of an SQLController call """
         if trace is not None:
+            if context.db.concurrent and _is_busy_error(value):
+                return False
             # An SQLError is a serious offence.
             print('[sql] FATAL ERROR IN QUERY CONTEXT')
             print('[sql] operation=\n' + context.operation)
@@ -256,6 +307,16 @@ class SQLExecutionContext(object):
                 print('no commit %r' % context.operation_lbl)
 
 
+def reconnect_after_fork():
+    """
+    Gives every live SQLDatabaseController a new connection. Call this first
+    thing in a child process that was forked from a process with open
+    databases.
+    """
+    for db in list(_CONTROLLERS):
+        db._reconnect_after_fork()
+
+
 def get_operation_type(operation):
     """
     Parses the operation_type from an SQL operation
@@ -375,6 +436,7 @@ class SQLDatabaseController(object):
         readonly=None,
         always_check_metadata=True,
         timeout=TIMEOUT,
+        concurrent=None,
     ):
         """ Creates db and opens connection
 
@@ -384,6 +446,9 @@ class SQLDatabaseController(object):
             inmemory (None): (default = None)
             fpath (str):  file path string(default = None)
             readonly (bool): (default = False)
+            concurrent (bool): use WAL journaling, one connection per thread
+                and process, and retry busy errors. Defaults to
+                --sql-concurrent. Ignored for in-memory databases.
 
         CommandLine:
             python -m dtool.sql_control --exec-__init__
@@ -440,15 +505,32 @@ class SQLDatabaseController(object):
 
         is_new = not exists(self.fpath)
 
+        if concurrent is None:
+            concurrent = CONCURRENT_SQL
+        if self.fname == ':memory:' or inmemory is True or (
+            inmemory is None and COPY_TO_MEMORY
+        ):
+            # Every connection to :memory: is a different database
+            concurrent = False
+        self.concurrent = concurrent
+        self._pool = {}
+        self._pool_lock = threading.Lock()
+
         self.thread_connections = {}
 
         # Create connection
         connection, uri = self._create_connection()
         self.connection = connection
         self.uri = uri
+        _CONTROLLERS.add(self)
 
         # Get a cursor which will preform sql commands / queries / executions
-        self.cur = self.connection.cursor()
+        self.cur = connection.cursor()
+        if self.concurrent:
+            if not self.readonly:
+                self.cur.execute('PRAGMA journal_mode = WAL;')
+            key = (os.getpid(), threading.get_ident())
+            self._pool[key] = (connection, self._cur, threading.current_thread())
         # self.connection.isolation_level = None  # turns sqlite3 autocommit off
         # self.connection.isolation_level = lite.IMMEDIATE  # turns sqlite3 autocommit off
         if inmemory is True or (inmemory is None and COPY_TO_MEMORY):
@@ -498,9 +580,21 @@ class SQLDatabaseController(object):
             uri = 'file:' + self.fpath
             if self.readonly:
                 uri += '?mode=ro'
-            connection = lite.connect(
-                uri, uri=True, detect_types=lite.PARSE_DECLTYPES, timeout=self.timeout
-            )
+            if self.concurrent:
+                connection = lite.connect(
+                    uri,
+                    uri=True,
+                    detect_types=lite.PARSE_DECLTYPES,
+                    timeout=min(self.timeout, CONCURRENT_BUSY_TIMEOUT),
+                    # Each pooled connection is only used by its own thread,
+                    # but close() must be able to close all of them
+                    check_same_thread=False,
+                )
+                self._tune_connection(connection)
+            else:
+                connection = lite.connect(
+                    uri, uri=True, detect_types=lite.PARSE_DECLTYPES, timeout=self.timeout
+                )
 
         # Keep track of what thead this was started in
         threadid = threading.current_thread()
@@ -508,13 +602,123 @@ class SQLDatabaseController(object):
 
         return connection, uri
 
+    def _tune_connection(self, connection):
+        """ per connection pragmas of the concurrent mode """
+        cur = connection.cursor()
+        cur.execute('PRAGMA cache_size = %d;' % (-CONCURRENT_CACHE_KIB,))
+        cur.execute('PRAGMA mmap_size = %d;' % (CONCURRENT_MMAP_SIZE,))
+        cur.execute('PRAGMA temp_store = MEMORY;')
+        # Durable at checkpoints, which is safe with WAL
+        cur.execute('PRAGMA synchronous = NORMAL;')
+        cur.close()
+
+    def _pooled(self):
+        """ the (connection, cursor, thread) of the current thread and process """
+        key = (os.getpid(), threading.get_ident())
+        thread = threading.current_thread()
+        entry = self._pool.get(key)
+        if entry is not None and entry[2] is thread:
+            return entry
+        with self._pool_lock:
+            # A new thread, or a reused ident. Close the connections of exited
+            # threads so thread churn does not leak sqlite handles.
+            self._prune_pool()
+            connection, uri = self._create_connection()
+            entry = self._pool[key] = (connection, connection.cursor(), thread)
+        return entry
+
+    def _prune_pool(self):
+        """ closes the pooled connections of this process's exited threads """
+        pid = os.getpid()
+        for key, (connection, cur, thread) in list(self._pool.items()):
+            if key[0] == pid and not thread.is_alive():
+                del self._pool[key]
+                self.thread_connections.pop(thread, None)
+                # The first connection is closed by close()
+                if connection is not self._connection:
+                    connection.close()
+
+    @property
+    def connection(self):
+        if self.concurrent:
+            return self._pooled()[0]
+        return self._connection
+
+    @connection.setter
+    def connection(self, connection):
+        self._connection = connection
+
+    @connection.deleter
+    def connection(self):
+        del self._connection
+
+    @property
+    def cur(self):
+        if self.concurrent:
+            return self._pooled()[1]
+        return self._cur
+
+    @cur.setter
+    def cur(self, cur):
+        self._cur = cur
+
+    @cur.deleter
+    def cur(self):
+        del self._cur
+
+    def _busy_retry(self, func):
+        """
+        Calls func and, in concurrent mode, rolls back and calls it again with
+        exponential backoff while the database is busy. Calls made inside an
+        open transaction are not retried because the rollback would discard
+        the work of the caller.
+        """
+        if not self.concurrent or self.connection.in_transaction:
+            return func()
+        delay = BUSY_RETRY_DELAY
+        for count in it.count(1):
+            try:
+                return func()
+            except lite.OperationalError as ex:
+                if count > BUSY_RETRIES or not _is_busy_error(ex):
+                    raise
+                self.connection.rollback()
+                if VERBOSE_SQL:
+                    print('[sql] %s is busy, retry %d' % (self.fname, count))
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(2 * delay, BUSY_RETRY_MAXDELAY)
+
     def get_fpath(self):
         return self.fpath
 
     def close(self):
         self.cur = None
-        self.connection.close()
+        self._connection.close()
+        with self._pool_lock:
+            pid = os.getpid()
+            for (pool_pid, _), (connection, _, _) in self._pool.items():
+                if pool_pid == pid:
+                    connection.close()
+            self._pool = {}
+        self.thread_connections = {}
+
+    def _reconnect_after_fork(self):
+        """
+        sqlite connections must not be used across a fork. The inherited
+        connections are kept alive (but unused) so the child never finalizes
+        them, and the child opens its own.
+        """
+        if self.concurrent:
+            # The pool opens connections per process
+            return
+        if self.fname == ':memory:' or self.cur is None:
+            # The child owns a private copy of in-memory databases
+            return
+        self._forked_connections = list(self.thread_connections.values())
+        self._forked_connections.append(self.connection)
         self.thread_connections = {}
+        self.connection, self.uri = self._create_connection()
+        self.cur = self.connection.cursor()
 
     # def reconnect(db):
     #     # Call this if we move into a new thread
@@ -661,6 +865,10 @@ class SQLDatabaseController(object):
 
     def reboot(self):
         print('[sql] reboot')
+        if self.concurrent:
+            # Pooled connections are reopened on demand
+            self.close()
+            return
         self.cur.close()
         del self.cur
         self.connection.close()
@@ -785,6 +993,12 @@ class SQLDatabaseController(object):
 
     def _add(self, tblname, colnames, params_iter, **kwargs):
         """ ADDER NOTE: use add_cleanly """
+        if USE_BULK_ADD and set(kwargs.keys()).issubset(_BULK_ADD_KWARGS):
+            return self._add_bulk(tblname, colnames, params_iter, **kwargs)
+        return self._add_executemany(tblname, colnames, params_iter, **kwargs)
+
+    def _add_executemany(self, tblname, colnames, params_iter, **kwargs):
+        """ inserts one row at a time and selects each new rowid """
         fmtdict = {
             'tblname': tblname,
             'erotemes': ', '.join(['?'] * len(colnames)),
@@ -801,6 +1015,130 @@ class SQLDatabaseController(object):
         )
         return rowid_list
 
+    @profile
+    def _add_bulk(
+        self,
+        tblname,
+        colnames,
+        params_iter,
+        unpack_scalars=True,
+        eager=True,
+        showprog=False,
+        **kwargs,
+    ):
+        r"""
+        Inserts all rows with a single executemany in one transaction
+
+        Rows inserted with a NULL rowid are assigned max(rowid) + 1 (or the
+        next AUTOINCREMENT value) one after the other, so the new rowids are
+        recovered from max(rowid) and last_insert_rowid() instead of issuing a
+        SELECT last_insert_rowid() per row. The write lock is taken before
+        max(rowid) is read, so other connections cannot interleave rows.
+
+        Returns:
+            list: rowid_list -- rowids of the new rows in input order
+
+        CommandLine:
+            python -m wbia.dtool.sql_control _add_bulk
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.dtool.sql_control import *  # NOQA
+            >>> db = SQLDatabaseController(sqldb_fname=':memory:')
+            >>> db.add_table('temptable', (
+            >>>     ('rowid', 'INTEGER PRIMARY KEY'),
+            >>>     ('key', 'TEXT'),
+            >>>     ('val', 'TEXT'),
+            >>> ), superkeys=[('key',)])
+            >>> params_list = [('a', 'x'), ('b', 'y')]
+            >>> rowids1 = db._add_bulk('temptable', ('key', 'val'), params_list)
+            >>> db.delete_rowids('temptable', [2])
+            >>> params_iter = (('k%d' % x, 'z') for x in range(3))
+            >>> rowids2 = db._add_bulk('temptable', ('key', 'val'), params_iter)
+            >>> assert db.get('temptable', ('key',), rowids2) == ['k0', 'k1', 'k2']
+            >>> # An open transaction of the caller is neither committed nor rolled back
+            >>> db.connection.execute('INSERT INTO temptable(key, val) VALUES ("t", "t")')
+            >>> rowids3 = db._add_bulk('temptable', ('key', 'val'), [('u', 'u')])
+            >>> assert db.connection.in_transaction
+            >>> db.connection.rollback()
+            >>> assert db.get('temptable', ('key',), rowids3) == [None]
+            >>> result = ('rowids1 = %r, rowids2 = %r' % (rowids1, rowids2))
+            >>> print(result)
+            rowids1 = [1, 2], rowids2 = [2, 3, 4]
+        """
+        operation = 'INSERT INTO {tblname}(rowid, {colnames}) VALUES (NULL, {erotemes})'
+        operation = operation.format(
+            tblname=tblname,
+            colnames=', '.join(colnames),
+            erotemes=', '.join(['?'] * len(colnames)),
+        )
+        if self.concurrent and not isinstance(params_iter, (list, tuple)):
+            # A busy retry needs the parameters again
+            params_iter = list(params_iter)
+        if showprog:
+            lbl = showprog if isinstance(showprog, six.string_types) else 'sqladd'
+            params_iter = ut.ProgIter(params_iter, lbl=lbl, adjust=True, freq=1)
+        rowid_list = self._busy_retry(
+            partial(self._insert_rowid_range, tblname, operation, params_iter)
+        )
+        if rowid_list is None:
+            # New rowids are no longer sequential
+            return self._add_executemany(
+                tblname,
+                colnames,
+                params_iter,
+                unpack_scalars=unpack_scalars,
+                eager=eager,
+                **kwargs,
+            )
+        if not unpack_scalars:
+            rowid_list = [[rowid] for rowid in rowid_list]
+        if not eager:
+            rowid_list = iter(rowid_list)
+        return rowid_list
+
+    def _insert_rowid_range(self, tblname, operation, params_iter):
+        """
+        Runs the insert in one transaction and returns the new rowids, or None
+        without inserting anything if they cannot be derived from a range.
+
+        If the caller already has a transaction open, the insert joins it and
+        committing or rolling back is left to the caller.
+        """
+        connection, cur = self._get_connection_and_cursor()
+        owns_transaction = not connection.in_transaction
+        if owns_transaction:
+            cur.execute('BEGIN IMMEDIATE')
+        try:
+            operation_max = 'SELECT max(rowid) FROM {tblname}'.format(tblname=tblname)
+            prev_max = cur.execute(operation_max).fetchone()[0] or 0
+            if prev_max > _BULK_ADD_MAX_ROWID:
+                if owns_transaction:
+                    connection.rollback()
+                return None
+            cur.executemany(operation, params_iter)
+            num_added = max(cur.rowcount, 0)
+            last_rowid = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
+            if num_added == 0:
+                rowid_list = []
+            elif last_rowid - prev_max == num_added:
+                rowid_list = list(range(prev_max + 1, last_rowid + 1))
+            else:
+                # AUTOINCREMENT tables may skip rowids of deleted rows, but
+                # new rowids are still increasing
+                operation_new = (
+                    'SELECT rowid FROM {tblname} WHERE rowid > ? ORDER BY rowid'
+                ).format(tblname=tblname)
+                rowid_list = [row[0] for row in cur.execute(operation_new, (prev_max,))]
+                assert len(rowid_list) == num_added, 'unable to recover new rowids'
+        except Exception:
+            if owns_transaction:
+                connection.rollback()
+            raise
+        if owns_transaction:
+            connection.commit()
+        return rowid_list
+
     def add_cleanly(
         self,
         tblname,
@@ -901,7 +1239,7 @@ class SQLDatabaseController(object):
             )
         # Add any unadded parameters to the database
         try:
-            self._add(tblname, colnames, dirty_params, **kwargs)
+            new_rowids = self._add(tblname, colnames, dirty_params, **kwargs)
         except Exception as ex:
             nInput = len(params_list)  # NOQA
             ut.printex(
@@ -915,9 +1253,30 @@ class SQLDatabaseController(object):
                 ],
             )
             raise
-        # TODO: We should only have to preform a subset of adds here
-        # (at the positions where rowid_list was None in the getter check)
-        rowid_list = get_rowid_from_superkey(*superkey_lists)
+        rowid_list = None
+        if USE_BULK_ADD and isinstance(new_rowids, list):
+            # The rowids of the new rows are known, so only duplicate inputs
+            # need to be resolved. Inputs with NULL superkeys never match a
+            # row and are left to the getter.
+            superkeys_list = list(zip(*superkey_lists))
+            added_superkeys = ut.compress(superkeys_list, needsadd_list)
+            if len(new_rowids) == len(added_superkeys) and not any(
+                ut.flag_None_items(ut.flatten(added_superkeys))
+            ):
+                superkey_to_rowid = dict(zip(added_superkeys, new_rowids))
+                rowid_list = [
+                    superkey_to_rowid.get(superkeys) if isnew else rowid
+                    for superkeys, isnew, rowid in zip(
+                        superkeys_list, isnew_list, rowid_list_
+                    )
+                ]
+                if any(
+                    rowid is None and isvalid
+                    for rowid, isvalid in zip(rowid_list, isvalid_list)
+                ):
+                    rowid_list = None
+        if rowid_list is None:
+            rowid_list = get_rowid_from_superkey(*superkey_lists)
 
         # ADD_CLEANLY_4: SANITY CHECK AND RETURN
         assert len(rowid_list) == len(params_list), 'failed sanity check'
@@ -931,6 +1290,185 @@ class SQLDatabaseController(object):
         for rowid in rowids:
             yield bool(self.cur.execute(operation, (rowid,)).fetchone()[0])
 
+    def _bulk_get_allowed(self, kwargs, op='AND'):
+        return USE_BULK_GET and op == 'AND' and set(kwargs.keys()).issubset(_BULK_KWARGS)
+
+    def _get_connection_and_cursor(self):
+        connection = self.connection
+        try:
+            cur = connection.cursor()
+        except lite.ProgrammingError:
+            # Get connection for new thread
+            connection = self.thread_connection()
+            cur = connection.cursor()
+        return connection, cur
+
+    @profile
+    def get_where_eq_bulk(
+        self,
+        tblname,
+        colnames,
+        params_iter,
+        where_colnames,
+        unpack_scalars=True,
+        eager=True,
+        keepwrap=False,
+        **kwargs,
+    ):
+        r"""
+        Set based version of get_where_eq
+
+        Returns the same values as running ``SELECT colnames FROM tblname
+        WHERE where_colnames[0]=? AND ...`` once per item of params_iter, but
+        only issues a few statements. Integer keys of a single rowid column
+        are fetched with chunked ``IN (...)`` lists. All other keys are
+        inserted into a temporary table and joined against the table, so
+        sqlite compares them exactly like the per-key statement would.
+        Results are aligned with the input, duplicate keys are allowed, and
+        missing keys return None (or [] if unpack_scalars is False).
+
+        Args:
+            tblname (str): table name
+            colnames (tuple): columns to return
+            params_iter (iterable): a tuple of key values for each query
+            where_colnames (tuple): columns the key values are compared to
+            unpack_scalars (bool): return a single result per key
+
+        CommandLine:
+            python -m wbia.dtool.sql_control get_where_eq_bulk
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.dtool.sql_control import *  # NOQA
+            >>> db = SQLDatabaseController(sqldb_fname=':memory:')
+            >>> db.add_table('temptable', (
+            >>>     ('rowid', 'INTEGER PRIMARY KEY'),
+            >>>     ('key', 'TEXT'),
+            >>>     ('num', 'INTEGER'),
+            >>>     ('val', 'TEXT'),
+            >>> ), superkeys=[('key', 'num')])
+            >>> params = [('a', 1, 'x'), ('b', 1, 'y'), ('b', 2, 'z')]
+            >>> rowids = db._add('temptable', ('key', 'num', 'val'), params)
+            >>> colnames = ('val', 'num')
+            >>> ids = [(3,), (1,), (9,), (3,)]
+            >>> result1 = db.get_where_eq_bulk('temptable', colnames, ids, ('rowid',))
+            >>> result2 = db.get_where('temptable', colnames, ids, 'rowid=?')
+            >>> assert result1 == result2 == [('z', 2), ('x', 1), None, ('z', 2)]
+            >>> keys = [('b', 2), ('c', 1), ('a', 1)]
+            >>> result3 = db.get_where_eq_bulk('temptable', ('rowid',), keys,
+            >>>                                ('key', 'num'))
+            >>> assert result3 == [3, None, 1]
+            >>> result4 = db.get_where_eq_bulk('temptable', ('val',), [('b',)], ('key',),
+            >>>                                unpack_scalars=False)
+            >>> assert result4 == [['y', 'z']]
+        """
+        keys_list = [tuple(params) for params in params_iter]
+        if len(where_colnames) == 1:
+            lookup_keys = [keys[0] for keys in keys_list]
+        else:
+            lookup_keys = None
+        if len(keys_list) == 0:
+            pairs = []
+        elif (
+            lookup_keys is not None
+            and (where_colnames[0] == 'rowid' or where_colnames[0].endswith('_rowid'))
+            and all(issubclass(t, _BULK_INT_TYPES) for t in set(map(type, lookup_keys)))
+        ):
+            select_func = partial(
+                self._bulk_select_in, tblname, colnames, lookup_keys, where_colnames[0]
+            )
+            pairs = self._busy_retry(select_func)
+        else:
+            lookup_keys = range(len(keys_list))
+            select_func = partial(
+                self._bulk_select_join, tblname, colnames, keys_list, where_colnames
+            )
+            pairs = self._busy_retry(select_func)
+
+        # Format the results the same way executemany does
+        if not keepwrap and len(colnames) == 1:
+            pairs = [(row[0], row[1]) for row in pairs]
+        else:
+            pairs = [(row[0], row[1:]) for row in pairs]
+        if unpack_scalars:
+            key_to_val = dict(pairs)
+            assert len(key_to_val) == len(pairs), 'More than one result'
+            results = [key_to_val.get(key) for key in lookup_keys]
+        else:
+            key_to_vals = {}
+            for key, val in pairs:
+                key_to_vals.setdefault(key, []).append(val)
+            results = [key_to_vals.get(key, []) for key in lookup_keys]
+        if not eager:
+            results = iter(results)
+        return results
+
+    def _bulk_select_in(self, tblname, colnames, key_list, where_colname):
+        """ fetches (key, *colnames) rows for integer keys with chunked IN lists """
+        connection, cur = self._get_connection_and_cursor()
+        operation_fmt = (
+            'SELECT {where_colname}, {colnames} FROM {tblname} '
+            'WHERE {where_colname} IN ({qmarks})'
+        )
+        pairs = []
+        for chunk in ut.ichunks(list(set(key_list)), BULK_CHUNKSIZE):
+            operation = operation_fmt.format(
+                where_colname=where_colname,
+                colnames=', '.join(colnames),
+                tblname=tblname,
+                qmarks=', '.join(['?'] * len(chunk)),
+            )
+            pairs.extend(cur.execute(operation, chunk))
+        return pairs
+
+    def _bulk_select_join(self, tblname, colnames, keys_list, where_colnames):
+        """ fetches (index, *colnames) rows by joining against a temp key table """
+        connection, cur = self._get_connection_and_cursor()
+        # A getter must not commit a transaction that the caller has open
+        owns_transaction = not connection.in_transaction
+        tmpname = '_bulk_keys_%d' % (next(_BULK_TABLE_COUNTER),)
+        keycols = ['_bulk_k%d' % (x,) for x in range(len(where_colnames))]
+
+        def _qualify(colname):
+            # rowid is ambiguous in a join, qualify plain column names
+            if re.match(r'^\w+$', colname):
+                return '%s.%s' % (tblname, colname)
+            return colname
+
+        on_clause = ' AND '.join(
+            '%s = %s.%s' % (_qualify(colname), tmpname, keycol)
+            for colname, keycol in zip(where_colnames, keycols)
+        )
+        operation_fmt = (
+            'SELECT {tmpname}._bulk_idx, {colnames} '
+            'FROM {tmpname} JOIN {tblname} ON {on_clause}'
+        )
+        operation = operation_fmt.format(
+            tmpname=tmpname,
+            colnames=', '.join(map(_qualify, colnames)),
+            tblname=tblname,
+            on_clause=on_clause,
+        )
+        cur.execute(
+            'CREATE TEMP TABLE {tmpname} '
+            '(_bulk_idx INTEGER PRIMARY KEY, {keycols})'.format(
+                tmpname=tmpname, keycols=', '.join(keycols)
+            )
+        )
+        try:
+            cur.executemany(
+                'INSERT INTO {tmpname} VALUES (?, {qmarks})'.format(
+                    tmpname=tmpname, qmarks=', '.join(['?'] * len(keycols))
+                ),
+                ((idx,) + keys for idx, keys in enumerate(keys_list)),
+            )
+            pairs = cur.execute(operation).fetchall()
+        finally:
+            cur.execute('DROP TABLE {tmpname}'.format(tmpname=tmpname))
+            if owns_transaction:
+                connection.commit()
+        return pairs
+
     def get_where_eq(
         self,
         tblname,
@@ -950,6 +1488,16 @@ class SQLDatabaseController(object):
         Kwargs:
             verbose:
         """
+        if self._bulk_get_allowed(kwargs, op):
+            return self.get_where_eq_bulk(
+                tblname,
+                colnames,
+                params_iter,
+                where_colnames,
+                unpack_scalars=unpack_scalars,
+                eager=eager,
+                **kwargs,
+            )
         andwhere_clauses = [colname + '=?' for colname in where_colnames]
         logicop_ = ' %s ' % (op,)
         where_clause = logicop_.join(andwhere_clauses)
@@ -1093,6 +1641,10 @@ class SQLDatabaseController(object):
         self, tblname, params_iter=None, superkey_colnames=None, **kwargs
     ):
         """ getter which uses the constrained superkeys instead of rowids """
+        if self._bulk_get_allowed(kwargs):
+            return self.get_where_eq_bulk(
+                tblname, ('rowid',), params_iter, tuple(superkey_colnames), **kwargs
+            )
         where_clause = ' AND '.join([colname + '=?' for colname in superkey_colnames])
         return self.get_where(tblname, ('rowid',), params_iter, where_clause, **kwargs)
 
@@ -1115,7 +1667,8 @@ class SQLDatabaseController(object):
             id_colname (str): column to be used as the search key (default: rowid)
             eager (bool): use eager evaluation
             unpack_scalars (bool): default True
-            id_colname (bool): default False. Experimental feature that could result in a 10x speedup
+            assume_unique (bool): deprecated, ids are always fetched in bulk
+                unless --nobulk-sql is specified
 
         CommandLine:
             python -m dtool.sql_control get
@@ -1129,11 +1682,11 @@ class SQLDatabaseController(object):
             eager = True
             db = ibs.db
 
-            x1 = db.get(tblname, colnames, id_iter, assume_unique=True)
-            x2 = db.get(tblname, colnames, id_iter, assume_unique=False)
+            x1 = db.get(tblname, colnames, id_iter)
+            x2 = db.get_where(tblname, colnames, [(x,) for x in id_iter], 'rowid=?')
             x1 == x2
-            %timeit  db.get(tblname, colnames, id_iter, assume_unique=True)
-            %timeit  db.get(tblname, colnames, id_iter, assume_unique=False)
+            %timeit  db.get(tblname, colnames, id_iter)
+            %timeit  db.get_where(tblname, colnames, [(x,) for x in id_iter], 'rowid=?')
 
         Example:
             >>> # ENABLE_DOCTEST
@@ -1159,33 +1712,12 @@ class SQLDatabaseController(object):
         # if isinstance(colnames, six.string_types):
         #    colnames = (colnames,)
 
-        if (
-            assume_unique
-            and id_iter is not None
-            and id_colname == 'rowid'
-            and len(colnames) == 1
-        ):
-            id_iter = list(id_iter)
-            operation_fmt = """
-                SELECT {colnames}
-                FROM {tblname}
-                WHERE rowid in ({id_repr})
-                ORDER BY rowid ASC
-                """
-            fmtdict = {
-                'tblname': tblname,
-                'colnames': ', '.join(colnames),
-                'id_repr': ','.join(map(str, id_iter)),
-            }
-            operation = operation_fmt.format(**fmtdict)
-            results = self.cur.execute(operation).fetchall()
-            import numpy as np
-
-            sortx = np.argsort(np.argsort(id_iter))
-            results = ut.take(results, sortx)
-            if kwargs.get('unpack_scalars', True):
-                results = ut.take_column(results, 0)
-            return results
+        if id_iter is not None and self._bulk_get_allowed(kwargs):
+            # The bulk path handles duplicate and missing ids
+            params_iter = [(_rowid,) for _rowid in id_iter]
+            return self.get_where_eq_bulk(
+                tblname, colnames, params_iter, (id_colname,), eager=eager, **kwargs
+            )
         else:
             if id_iter is None:
                 where_clause = None
@@ -1402,15 +1934,20 @@ class SQLDatabaseController(object):
 
     def executeone(db, operation, params=(), eager=True, verbose=VERBOSE_SQL):
         contextkw = dict(nInput=1, verbose=verbose)
-        with SQLExecutionContext(db, operation, **contextkw) as context:
-            try:
-                result_iter = context.execute_and_generate_results(params)
-                result_list = list(result_iter)
-            except Exception as ex:
-                ut.printex(ex, key_list=[(str, 'operation'), 'params'])
-                # ut.sys.exit(1)
-                raise
-        return result_list
+
+        def _executeone():
+            with SQLExecutionContext(db, operation, **contextkw) as context:
+                try:
+                    result_iter = context.execute_and_generate_results(params)
+                    result_list = list(result_iter)
+                except Exception as ex:
+                    if not (db.concurrent and _is_busy_error(ex)):
+                        ut.printex(ex, key_list=[(str, 'operation'), 'params'])
+                    # ut.sys.exit(1)
+                    raise
+            return result_list
+
+        return db._busy_retry(_executeone)
 
     @profile
     def executemany(
@@ -1458,8 +1995,13 @@ class SQLDatabaseController(object):
             'verbose': verbose,
             'keepwrap': keepwrap,
         }
-        with SQLExecutionContext(self, operation, **contextkw) as context:
-            if eager:
+        if eager and self.concurrent and not isinstance(params_iter, (list, tuple)):
+            # A busy retry needs the parameters again
+            params_iter = list(params_iter)
+
+        def _executemany():
+            with SQLExecutionContext(self, operation, **contextkw) as context:
+                params_iter_ = params_iter
                 if showprog:
                     if isinstance(showprog, six.string_types):
                         lbl = showprog
@@ -1468,10 +2010,10 @@ class SQLDatabaseController(object):
                     prog = ut.ProgPartial(
                         adjust=True, length=nInput, freq=1, lbl=lbl, bs=True
                     )
-                    params_iter = prog(params_iter)
+                    params_iter_ = prog(params_iter_)
                 results_iter = [
                     list(context.execute_and_generate_results(params))
-                    for params in params_iter
+                    for params in params_iter_
                 ]
                 if unpack_scalars:
                     # list of iterators
@@ -1479,19 +2021,24 @@ class SQLDatabaseController(object):
                     results_iter = list(map(_unpacker_, results_iter))
                 # Eager evaluation
                 results_list = list(results_iter)
-            else:
+            return results_list
+
+        if eager:
+            return self._busy_retry(_executemany)
+
+        with SQLExecutionContext(self, operation, **contextkw) as context:
 
-                def _tmpgen(context):
-                    # Temporary hack to turn off eager_evaluation
-                    for params in params_iter:
-                        # Eval results per query yeild per iter
-                        results = list(context.execute_and_generate_results(params))
-                        if unpack_scalars:
-                            yield _unpacker(results)
-                        else:
-                            yield results
-
-                results_list = _tmpgen(context)
+            def _tmpgen(context):
+                # Temporary hack to turn off eager_evaluation
+                for params in params_iter:
+                    # Eval results per query yeild per iter
+                    results = list(context.execute_and_generate_results(params))
+                    if unpack_scalars:
+                        yield _unpacker(results)
+                    else:
+                        yield results
+
+            results_list = _tmpgen(context)
         return results_list
 
     # def commit(db):
@@ -3309,6 +3856,342 @@ class SQLTable(ut.NiceRepr):
         return table.name + ', n=' + str(table.number_of_rows())
 
 
+def benchmark_bulk_get(sizes=[1000, 10000, 100000], sqldb_fname=':memory:'):
+    r"""
+    Compares the per-key executemany getters to the bulk getters
+
+    CommandLine:
+        python -m wbia.dtool.sql_control benchmark_bulk_get
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.dtool.sql_control import *  # NOQA
+        >>> result = benchmark_bulk_get()
+        >>> print(ut.repr3(result, precision=4))
+    """
+    global USE_BULK_GET
+    rng = np.random.RandomState(0)
+    db = SQLDatabaseController(sqldb_fname=sqldb_fname)
+    db.add_table(
+        'bench',
+        (
+            ('rowid', 'INTEGER PRIMARY KEY'),
+            ('name', 'TEXT'),
+            ('num', 'INTEGER'),
+            ('val', 'REAL'),
+        ),
+        superkeys=[('name', 'num')],
+    )
+    num_rows = 2 * max(sizes)
+    params_iter = (('n%d' % (x % 1000), x, x / 2.0) for x in range(num_rows))
+    db._add('bench', ('name', 'num', 'val'), params_iter)
+    orig = USE_BULK_GET
+    result = ut.odict()
+    try:
+        for size in sizes:
+            ids = rng.randint(1, num_rows + 1, size).tolist()
+            keys = [('n%d' % ((x - 1) % 1000), x - 1) for x in ids]
+            for mode, flag in [('loop', False), ('bulk', True)]:
+                USE_BULK_GET = flag
+                with ut.Timer(verbose=False) as t1:
+                    db.get('bench', ('val',), ids)
+                with ut.Timer(verbose=False) as t2:
+                    db.get_rowid_from_superkey(
+                        'bench', keys, superkey_colnames=('name', 'num')
+                    )
+                result[(size, mode)] = {'get': t1.ellapsed, 'superkey': t2.ellapsed}
+    finally:
+        USE_BULK_GET = orig
+    return result
+
+
+def benchmark_bulk_add(num=10000, sqldb_dpath=None):
+    r"""
+    Compares per-row and bulk inserts for tables shaped like the image,
+    annotation and depcache feature tables
+
+    Args:
+        num (int): number of rows to add to each table
+        sqldb_dpath (str): directory for on disk databases. Defaults to
+            in-memory databases.
+
+    CommandLine:
+        python -m wbia.dtool.sql_control benchmark_bulk_add
+        python -m wbia.dtool.sql_control benchmark_bulk_add --num=100000
+        python -m wbia.dtool.sql_control benchmark_bulk_add --dpath=/tmp
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.dtool.sql_control import *  # NOQA
+        >>> num = ut.get_argval('--num', default=10000)
+        >>> sqldb_dpath = ut.get_argval('--dpath', default=None)
+        >>> result = benchmark_bulk_add(num, sqldb_dpath)
+        >>> print(ut.repr3(result, precision=4))
+    """
+    import uuid
+
+    global USE_BULK_ADD
+    rng = np.random.RandomState(0)
+    tables = ut.odict()
+    tables['images'] = (
+        (
+            ('rowid', 'INTEGER PRIMARY KEY'),
+            ('image_uuid', 'UUID NOT NULL'),
+            ('image_uri', 'TEXT NOT NULL'),
+            ('image_ext', 'TEXT NOT NULL'),
+            ('image_width', 'INTEGER'),
+            ('image_height', 'INTEGER'),
+            ('image_time_posix', 'INTEGER'),
+            ('image_gps_lat', 'REAL'),
+            ('image_gps_lon', 'REAL'),
+            ('image_note', 'TEXT'),
+        ),
+        lambda x: (
+            uuid.UUID(int=x + 1),
+            'img_%d.jpg' % (x,),
+            '.jpg',
+            int(rng.randint(100, 4000)),
+            int(rng.randint(100, 4000)),
+            int(rng.randint(0, 2 ** 31)),
+            float(rng.rand()),
+            float(rng.rand()),
+            '',
+        ),
+    )
+    tables['annotations'] = (
+        (
+            ('rowid', 'INTEGER PRIMARY KEY'),
+            ('annot_uuid', 'UUID NOT NULL'),
+            ('image_rowid', 'INTEGER NOT NULL'),
+            ('annot_xtl', 'INTEGER NOT NULL'),
+            ('annot_ytl', 'INTEGER NOT NULL'),
+            ('annot_width', 'INTEGER NOT NULL'),
+            ('annot_height', 'INTEGER NOT NULL'),
+            ('annot_theta', 'REAL DEFAULT 0.0'),
+            ('annot_num_verts', 'INTEGER NOT NULL'),
+            ('annot_verts', 'TEXT'),
+            ('annot_viewpoint', 'TEXT'),
+        ),
+        lambda x: (
+            uuid.UUID(int=x + 1),
+            x // 2 + 1,
+            10,
+            20,
+            300,
+            200,
+            0.0,
+            4,
+            '((10, 20), (310, 20), (310, 220), (10, 220))',
+            'left',
+        ),
+    )
+    tables['feat'] = (
+        (
+            ('rowid', 'INTEGER PRIMARY KEY'),
+            ('chip_rowid', 'INTEGER NOT NULL'),
+            ('config_rowid', 'INTEGER DEFAULT 0'),
+            ('num_feats', 'INTEGER'),
+            ('kpts', 'NDARRAY'),
+            ('vecs', 'NDARRAY'),
+        ),
+        lambda x: (
+            x + 1,
+            1,
+            64,
+            rng.rand(64, 6).astype(np.float32),
+            rng.randint(0, 255, (64, 128)).astype(np.uint8),
+        ),
+    )
+    orig = USE_BULK_ADD
+    result = ut.odict()
+    try:
+        for tblname, (coldef_list, make_params) in tables.items():
+            colnames = tuple(coldef[0] for coldef in coldef_list[1:])
+            params_list = [make_params(x) for x in range(num)]
+            superkey_colnames = colnames[0:1]
+            if tblname == 'feat':
+                superkey_colnames = colnames[0:2]
+            superkey_paramx = tuple(range(len(superkey_colnames)))
+            for mode, flag in [('loop', False), ('bulk', True)]:
+                USE_BULK_ADD = flag
+                if sqldb_dpath is None:
+                    db = SQLDatabaseController(sqldb_fname=':memory:')
+                else:
+                    sqldb_fname = 'bench_add_%s_%s.sqlite3' % (tblname, mode)
+                    ut.delete(join(sqldb_dpath, sqldb_fname), verbose=False)
+                    db = SQLDatabaseController(sqldb_dpath, sqldb_fname)
+                db.add_table(tblname, coldef_list, superkeys=[superkey_colnames])
+
+                def get_rowid_from_superkey(*superkey_lists):
+                    return db.get_where_eq(
+                        tblname, ('rowid',), zip(*superkey_lists), superkey_colnames
+                    )
+
+                with ut.Timer(verbose=False) as t:
+                    db.add_cleanly(
+                        tblname,
+                        colnames,
+                        params_list,
+                        get_rowid_from_superkey,
+                        superkey_paramx,
+                    )
+                result[(tblname, mode)] = t.ellapsed
+    finally:
+        USE_BULK_ADD = orig
+    return result
+
+
+def benchmark_ndarray_codec(num=2000, nfeats=500, sqldb_fname=':memory:'):
+    r"""
+    Times reading depcache feat shaped rows stored in the .npy format versus
+    the raw NDARRAY codec
+
+    CommandLine:
+        python -m wbia.dtool.sql_control benchmark_ndarray_codec
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.dtool.sql_control import *  # NOQA
+        >>> result = benchmark_ndarray_codec()
+        >>> print(ut.repr3(result, precision=4))
+    """
+    from wbia.dtool import _integrate_sqlite3
+
+    rng = np.random.RandomState(0)
+    kpts = rng.rand(nfeats, 6).astype(np.float32)
+    vecs = rng.randint(0, 255, (nfeats, 128)).astype(np.uint8)
+    fgws = rng.rand(nfeats).astype(np.float32)
+    encoders = ut.odict(
+        [
+            ('npy', _integrate_sqlite3._write_npy_to_sqlite3),
+            ('raw', _integrate_sqlite3._write_numpy_to_sqlite3),
+        ]
+    )
+    result = ut.odict()
+    for mode, encode in encoders.items():
+        db = SQLDatabaseController(sqldb_fname=sqldb_fname)
+        db.add_table(
+            'feat',
+            (
+                ('rowid', 'INTEGER PRIMARY KEY'),
+                ('chip_rowid', 'INTEGER NOT NULL'),
+                ('num_feats', 'INTEGER'),
+                ('kpts', 'NDARRAY'),
+                ('vecs', 'NDARRAY'),
+                ('fgweight', 'NDARRAY'),
+            ),
+            superkeys=[('chip_rowid',)],
+        )
+        # Insert already encoded blobs so both formats are written
+        params = (encode(kpts), encode(vecs), encode(fgws))
+        rowids = db._add(
+            'feat',
+            ('chip_rowid', 'num_feats', 'kpts', 'vecs', 'fgweight'),
+            ((x, nfeats) + params for x in range(num)),
+        )
+        with ut.Timer(verbose=False) as t:
+            db.get('feat', ('kpts', 'vecs', 'fgweight'), rowids)
+        result[mode] = t.ellapsed
+        db.close()
+    return result
+
+
+def benchmark_concurrent_access(
+    num_readers=4, duration=3.0, chunksize=256, sqldb_dpath=None
+):
+    r"""
+    Stress test of API style readers running while a depcache style writer
+    adds chunks of feature rows, with and without the concurrent mode
+
+    Args:
+        num_readers (int): number of reader threads
+        duration (float): seconds to run each mode for
+        chunksize (int): rows added per write transaction
+        sqldb_dpath (str): directory for the databases (default: a temp dir)
+
+    CommandLine:
+        python -m wbia.dtool.sql_control benchmark_concurrent_access
+        python -m wbia.dtool.sql_control benchmark_concurrent_access --readers=8
+
+    Example:
+        >>> # DISABLE_DOCTEST
+        >>> from wbia.dtool.sql_control import *  # NOQA
+        >>> num_readers = ut.get_argval('--readers', default=4)
+        >>> result = benchmark_concurrent_access(num_readers)
+        >>> print(ut.repr3(result, precision=4))
+    """
+    import tempfile
+
+    if sqldb_dpath is None:
+        sqldb_dpath = tempfile.mkdtemp()
+    rng = np.random.RandomState(0)
+    vecs = rng.randint(0, 255, (64, 128)).astype(np.uint8)
+    coldef_list = (
+        ('rowid', 'INTEGER PRIMARY KEY'),
+        ('chip_rowid', 'INTEGER NOT NULL'),
+        ('num_feats', 'INTEGER'),
+        ('vecs', 'NDARRAY'),
+    )
+    colnames = ('chip_rowid', 'num_feats', 'vecs')
+    result = ut.odict()
+    for mode, concurrent in [('default', False), ('concurrent', True)]:
+        sqldb_fname = 'bench_concurrent_%s.sqlite3' % (mode,)
+        for suffix in ['', '-wal', '-shm']:
+            ut.delete(join(sqldb_dpath, sqldb_fname + suffix), verbose=False)
+        db = SQLDatabaseController(sqldb_dpath, sqldb_fname, concurrent=concurrent)
+        db.add_table('feat', coldef_list, superkeys=[('chip_rowid',)])
+        num_rows = it.count()
+        db._add('feat', colnames, [(next(num_rows), 64, vecs) for _ in range(10000)])
+        stop = threading.Event()
+        latencies = []
+        write_times = []
+        errors = []
+
+        def _writer():
+            try:
+                while not stop.is_set():
+                    params_list = [
+                        (next(num_rows), 64, vecs) for _ in range(chunksize)
+                    ]
+                    with ut.Timer(verbose=False) as t:
+                        db._add('feat', colnames, params_list)
+                    write_times.append(t.ellapsed)
+            except Exception as ex:
+                errors.append(ex)
+
+        def _reader(seed):
+            reader_rng = np.random.RandomState(seed)
+            try:
+                while not stop.is_set():
+                    rowids = reader_rng.randint(1, 10000, 100).tolist()
+                    with ut.Timer(verbose=False) as t:
+                        db.get('feat', ('num_feats', 'vecs'), rowids)
+                    latencies.append(t.ellapsed)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=_writer)]
+        threads += [
+            threading.Thread(target=_reader, args=(seed,)) for seed in range(num_readers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        db.close()
+        if errors:
+            raise errors[0]
+        result[mode] = {
+            'reads_per_sec': len(latencies) / duration,
+            'read_p50_ms': 1000 * np.percentile(latencies, 50),
+            'read_p99_ms': 1000 * np.percentile(latencies, 99),
+            'rows_written_per_sec': chunksize * len(write_times) / duration,
+        }
+    return result
+
+
 if __name__ == '__main__':
     r"""
     CommandLine:
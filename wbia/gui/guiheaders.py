@@ -148,9 +148,7 @@ def make_table_declarations(ibs):
 
     # dynamicly defined headers
     if not const.SIMPLIFY_INTERFACE:
-        from wbia.control import accessor_decors
-
-        if accessor_decors.API_CACHE:
+        if ibs.table_cache.enabled:
             # Too slow without api cache
             TABLE_COLNAMES[IMAGESET_TABLE].extend(
                 ['percent_annotmatch_reviewed_str', 'percent_names_with_exemplar_str']
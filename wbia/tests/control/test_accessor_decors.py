@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+import pytest
+
+from wbia.control import accessor_decors
+from wbia.control.accessor_decors import cache_getter, cache_invalidator
+
+
+class FakeController(object):
+    """ the minimal interface the cache decorators need """
+
+    def __init__(self, enabled=True, maxbytes=2 ** 20):
+        self.table_cache = accessor_decors.init_tablecache(enabled, maxbytes)
+        self.values = {rowid: 'val%d' % (rowid,) for rowid in range(1, 1001)}
+        self.num_fetched = 0
+
+    @cache_getter('test', 'value', cfgkeys=['suffix'])
+    def get_values(self, rowid_list, suffix=''):
+        rowid_list = list(rowid_list)
+        self.num_fetched += len(rowid_list)
+        return [
+            None if rowid not in self.values else self.values[rowid] + suffix
+            for rowid in rowid_list
+        ]
+
+    @cache_invalidator('test', ['value'], rowidx=0)
+    def set_values(self, rowid_list, value_list):
+        self.values.update(zip(rowid_list, value_list))
+
+    @cache_invalidator('test')
+    def delete_all(self):
+        self.values.clear()
+
+
+def _expected(ibs, rowid_list, suffix=''):
+    return [
+        None if rowid not in ibs.values else ibs.values[rowid] + suffix
+        for rowid in rowid_list
+    ]
+
+
+def test_getter_cache_hits():
+    ibs = FakeController()
+    rowid_list = [5, 1, 5, 3, None, -2, 2000]
+    assert ibs.get_values(rowid_list) == _expected(ibs, rowid_list)
+    num_fetched = ibs.num_fetched
+    assert ibs.get_values(rowid_list) == _expected(ibs, rowid_list)
+    # rowids without values are always fetched
+    assert ibs.num_fetched - num_fetched == 3
+    assert ibs.get_values(np.array([1, 3])) == ['val1', 'val3']
+    stats = ibs.table_cache.get_stats()['test']
+    assert stats['num_entries'] == 3
+    assert stats['columns']['value']['hits'] == 6
+
+
+def test_getter_cache_cfgkeys():
+    ibs = FakeController()
+    assert ibs.get_values([1, 2]) == ['val1', 'val2']
+    assert ibs.get_values([1, 2], suffix='!') == ['val1!', 'val2!']
+    assert ibs.get_values([1, 2]) == ['val1', 'val2']
+
+
+def test_getter_cache_disabled():
+    ibs = FakeController(enabled=False)
+    ibs.get_values([1, 2])
+    ibs.get_values([1, 2])
+    assert ibs.num_fetched == 4
+    assert len(ibs.table_cache) == 0
+
+
+def test_invalidators():
+    ibs = FakeController()
+    ibs.get_values(range(1, 11))
+    ibs.set_values([2, 4], ['new2', 'new4'])
+    assert ibs.get_values([1, 2, 3, 4]) == ['val1', 'new2', 'val3', 'new4']
+    ibs.delete_all()
+    assert ibs.get_values([1, 2]) == [None, None]
+
+
+@pytest.mark.parametrize('maxbytes', [2000, 20000])
+def test_getter_cache_is_bounded(maxbytes):
+    ibs = FakeController(maxbytes=maxbytes)
+    for start in range(1, 1001, 50):
+        rowid_list = list(range(start, start + 50))
+        assert ibs.get_values(rowid_list) == _expected(ibs, rowid_list)
+        assert ibs.table_cache['test'].nbytes <= maxbytes
+    assert ibs.table_cache['test'].evictions > 0
+    # The most recently used rowids survive
+    num_fetched = ibs.num_fetched
+    ibs.get_values([1000])
+    assert ibs.num_fetched == num_fetched
+    rowid_list = list(range(1, 1001))
+    assert ibs.get_values(rowid_list) == _expected(ibs, rowid_list)
+
+
+def test_concurrent_write_is_not_cached():
+    started = threading.Event()
+    resume = threading.Event()
+
+    class SlowController(FakeController):
+        @cache_getter('test', 'value')
+        def get_values(self, rowid_list):
+            vals = _expected(self, rowid_list)
+            started.set()
+            resume.wait()
+            return vals
+
+    ibs = SlowController()
+    thread = threading.Thread(target=ibs.get_values, args=([1],))
+    thread.start()
+    started.wait()
+    ibs.set_values([1], ['new1'])
+    resume.set()
+    thread.join()
+    # The value read before the write was not cached
+    assert len(ibs.table_cache['test']) == 0
+    assert ibs.get_values([1]) == ['new1']
+
+
+def test_maxbytes_flag_overrides_config(monkeypatch):
+    monkeypatch.setattr(accessor_decors, 'API_CACHE_MAXBYTES', 2 ** 26)
+    monkeypatch.setattr(accessor_decors, 'API_CACHE_MAXBYTES_ARG', None)
+    assert accessor_decors.init_tablecache(True, None).maxbytes == 2 ** 26
+    assert accessor_decors.init_tablecache(True, 5000).maxbytes == 5000
+    monkeypatch.setattr(accessor_decors, 'API_CACHE_MAXBYTES', 3000)
+    monkeypatch.setattr(accessor_decors, 'API_CACHE_MAXBYTES_ARG', 3000)
+    assert accessor_decors.init_tablecache(True, None).maxbytes == 3000
+    assert accessor_decors.init_tablecache(True, 5000).maxbytes == 3000
+
+
+def test_concurrent_hit_miss_counts():
+    ibs = FakeController()
+    num_threads, num_calls = 4, 50
+
+    def worker():
+        for _ in range(num_calls):
+            ibs.get_values(range(1, 21))
+
+    thread_list = [threading.Thread(target=worker) for _ in range(num_threads)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    tblcache = ibs.table_cache['test']
+    total = tblcache.hits['value'] + tblcache.misses['value']
+    assert total == num_threads * num_calls * 20
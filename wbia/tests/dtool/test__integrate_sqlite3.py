@@ -8,6 +8,13 @@ import pytest
 # We do not explicitly call code in this module because
 # importing the following module is execution of the code.
 import wbia.dtool._integrate_sqlite3  # noqa
+from wbia.dtool._integrate_sqlite3 import (
+    _NDARRAY_MAGIC,
+    _NPY_MAGIC,
+    _read_numpy_from_sqlite3,
+    _write_npy_to_sqlite3,
+    _write_numpy_to_sqlite3,
+)
 
 
 @pytest.fixture
@@ -130,3 +137,69 @@ def test_register_list(db):
     cur = db.execute('select x from test')
     selected_value = cur.fetchone()[0]
     assert selected_value == insert_value
+
+
+ndarray_values = (
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.zeros((0, 128), dtype=np.uint8),
+    np.array(5.0),
+    np.array([True, False]),
+    np.arange(20).reshape(4, 5)[:, ::2],
+    np.asfortranarray(np.arange(6).reshape(2, 3)),
+    np.arange(3, dtype='>i4'),
+    np.array(['spam', 'eggs']),
+)
+
+
+@pytest.mark.parametrize('insert_value', ndarray_values)
+def test_ndarray_codec(db, insert_value):
+    db.execute('create table test(x ndarray)')
+    db.execute('insert into test(x) values (?)', (insert_value,))
+    blob = db.execute('select cast(x as blob) from test').fetchone()[0]
+    assert blob.startswith(_NDARRAY_MAGIC)
+    selected_value = db.execute('select x from test').fetchone()[0]
+    assert selected_value.dtype == insert_value.dtype
+    assert selected_value.shape == insert_value.shape
+    assert (selected_value == insert_value).all()
+
+
+def test_ndarray_codec_reads_npy_blobs(db):
+    # Blobs written before the raw codec was introduced use the .npy format
+    db.execute('create table test(x ndarray)')
+    insert_value = np.array([[1, 2, 3], [4, 5, 6]], np.int32)
+    blob = _write_npy_to_sqlite3(insert_value)
+    db.execute('insert into test(x) values (?)', (blob,))
+    selected_value = db.execute('select x from test').fetchone()[0]
+    assert (selected_value == insert_value).all()
+
+
+@pytest.mark.parametrize('compression', (None, 'zlib', 'npy'))
+def test_ndarray_codec_arrays_are_writeable(compression):
+    # Arrays must be modifiable in place regardless of when the row was written
+    arr = np.zeros((1000, 128), dtype=np.uint8)
+    if compression == 'npy':
+        blob = _write_npy_to_sqlite3(arr)
+    else:
+        blob = _write_numpy_to_sqlite3(arr, compression=compression)
+    selected_value = _read_numpy_from_sqlite3(blob)
+    assert selected_value.flags.writeable
+    selected_value[0, 0] = 1
+    assert (selected_value == arr).sum() == arr.size - 1
+
+
+def test_ndarray_codec_object_arrays_use_npy():
+    blob = _write_numpy_to_sqlite3(np.array([{'a': 1}, None], dtype=object))
+    assert bytes(blob).startswith(_NPY_MAGIC)
+
+
+@pytest.mark.parametrize('compression', ('zlib', 'lz4', 'zstd'))
+def test_ndarray_codec_compression(compression):
+    if compression == 'lz4':
+        pytest.importorskip('lz4.frame')
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    arr = np.zeros((1000, 128), dtype=np.uint8)
+    arr[::7] = 3
+    blob = _write_numpy_to_sqlite3(arr, compression=compression)
+    assert len(blob) < arr.nbytes
+    assert (_read_numpy_from_sqlite3(blob) == arr).all()
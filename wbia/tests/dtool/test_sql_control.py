@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import random
+
+import numpy as np
+import pytest
+
+from wbia.dtool import sql_control
+from wbia.dtool.sql_control import SQLDatabaseController
+
+
+@pytest.fixture
+def db():
+    db = SQLDatabaseController(sqldb_fname=':memory:')
+    db.add_table(
+        'test',
+        (
+            ('rowid', 'INTEGER PRIMARY KEY'),
+            ('name', 'TEXT'),
+            ('num', 'INTEGER'),
+            ('other_rowid', 'INTEGER'),
+            ('val', 'REAL'),
+        ),
+        superkeys=[('name', 'num')],
+    )
+    params = [('n%d' % (x % 7), x, x % 5, x * 0.5) for x in range(200)]
+    db._add('test', ('name', 'num', 'other_rowid', 'val'), params)
+    yield db
+
+
+@pytest.fixture
+def use_bulk(monkeypatch):
+    def _set(flag):
+        monkeypatch.setattr(sql_control, 'USE_BULK_GET', flag)
+
+    return _set
+
+
+def _compare(use_bulk, func):
+    use_bulk(True)
+    result1 = func()
+    use_bulk(False)
+    result2 = func()
+    assert result1 == result2
+    return result1
+
+
+@pytest.mark.parametrize('colnames', [('val',), ('name', 'val'), ('rowid',)])
+def test_get_with_missing_and_duplicate_ids(db, use_bulk, colnames):
+    rng = random.Random(0)
+    ids = [rng.randint(-3, 210) for _ in range(500)] + [5, 5, 5]
+    result = _compare(use_bulk, lambda: db.get('test', colnames, ids))
+    assert len(result) == len(ids)
+    assert result[-1] is not None
+    assert None in result
+
+
+def test_get_numpy_ids(db, use_bulk):
+    ids = np.array([3, 1, 2, 3, 999], dtype=np.int64)
+    result = _compare(use_bulk, lambda: db.get('test', ('num',), ids))
+    assert result == [2, 0, 1, 2, None]
+
+
+def test_get_empty(db, use_bulk):
+    assert _compare(use_bulk, lambda: db.get('test', ('num',), [])) == []
+
+
+def test_get_rowid_from_superkey(db, use_bulk):
+    keys = [('n%d' % (x % 9), x) for x in range(-5, 220)] + [('n1', 1), ('n1', 1)]
+    result = _compare(
+        use_bulk,
+        lambda: db.get_rowid_from_superkey(
+            'test', keys, superkey_colnames=('name', 'num')
+        ),
+    )
+    assert result[-1] == result[-2] == 2
+    assert result[0] is None
+
+
+def test_bulk_get_leaves_open_transaction_alone(db, use_bulk):
+    use_bulk(True)
+    db.connection.execute('INSERT INTO test(name, num) VALUES ("pending", 1)')
+    assert db.connection.in_transaction
+    keys = [('pending', 1), ('n1', 1)]
+    result = db.get_rowid_from_superkey('test', keys, superkey_colnames=('name', 'num'))
+    assert result[0] is not None
+    assert db.connection.in_transaction
+    db.connection.rollback()
+    assert db.get_rowid_from_superkey(
+        'test', keys, superkey_colnames=('name', 'num')
+    ) == [None, result[1]]
+
+
+def test_get_where_eq_multiple_results(db, use_bulk):
+    params = [(1,), (7,), (1,), ('1',)]
+    result = _compare(
+        use_bulk,
+        lambda: db.get_where_eq(
+            'test', ('num',), params, ('other_rowid',), unpack_scalars=False
+        ),
+    )
+    assert sorted(result[0]) == sorted(result[2]) == list(range(1, 200, 5))
+    assert result[1] == []
+    # Text keys are compared using the affinity of the column
+    assert sorted(result[3]) == sorted(result[0])
+
+
+def test_get_where_eq_keepwrap(db, use_bulk):
+    params = [('n2',), ('n3',)]
+    result = _compare(
+        use_bulk,
+        lambda: db.get_where_eq(
+            'test', ('num',), params, ('name',), unpack_scalars=False, keepwrap=True
+        ),
+    )
+    assert result[0][0] == (2,)
+
+
+def test_get_where_eq_unpack_multiple_results_raises(db, use_bulk):
+    use_bulk(True)
+    with pytest.raises(AssertionError):
+        db.get_where_eq('test', ('num',), [('n2',)], ('name',))
+
+
+@pytest.fixture
+def use_bulk_add(monkeypatch):
+    def _set(flag):
+        monkeypatch.setattr(sql_control, 'USE_BULK_ADD', flag)
+
+    return _set
+
+
+def _make_add_db():
+    db = SQLDatabaseController(sqldb_fname=':memory:')
+    db.add_table(
+        'test',
+        (('rowid', 'INTEGER PRIMARY KEY'), ('name', 'TEXT'), ('val', 'REAL')),
+        superkeys=[('name',)],
+    )
+    db._add('test', ('name', 'val'), [('a', 1.0), ('b', 2.0), ('c', 3.0)])
+    db.delete_rowids('test', [2])
+    return db
+
+
+def test_add_cleanly(use_bulk_add):
+    params_list = [
+        ('d', 4.0),
+        ('a', 9.0),
+        None,
+        ('e', 5.0),
+        ('d', 6.0),
+        (None, 7.0),
+        ('b', 8.0),
+    ]
+    results = []
+    for flag in [True, False]:
+        use_bulk_add(flag)
+        db = _make_add_db()
+
+        def get_rowid_from_superkey(names):
+            return db.get_where_eq('test', ('rowid',), zip(names), ('name',))
+
+        rowid_list = db.add_cleanly(
+            'test', ('name', 'val'), params_list, get_rowid_from_superkey
+        )
+        rows = db.get('test', ('name', 'val'), db.get_all_rowids('test'))
+        results.append((rowid_list, rows))
+    assert results[0] == results[1]
+    rowid_list = results[0][0]
+    assert rowid_list[0] == rowid_list[4] == 4
+    assert rowid_list[1] == 1
+    assert rowid_list[2] is None
+    assert rowid_list[5] is None
+
+
+def test_add_bulk_autoincrement(use_bulk_add):
+    use_bulk_add(True)
+    db = SQLDatabaseController(sqldb_fname=':memory:')
+    db.add_table(
+        'test',
+        (('rowid', 'INTEGER PRIMARY KEY AUTOINCREMENT'), ('name', 'TEXT')),
+        superkeys=[('name',)],
+    )
+    assert db._add('test', ('name',), [('a',), ('b',), ('c',)]) == [1, 2, 3]
+    db.delete_rowids('test', [3])
+    rowid_list = db._add('test', ('name',), iter([('d',), ('e',)]))
+    assert rowid_list == [4, 5]
+    assert db.get('test', ('name',), rowid_list) == ['d', 'e']
+
+
+def test_add_bulk_rolls_back_on_error(use_bulk_add):
+    use_bulk_add(True)
+    db = _make_add_db()
+    with pytest.raises(sql_control.lite.IntegrityError):
+        db._add('test', ('name', 'val'), [('x', 1.0), ('a', 1.0)])
+    assert db.get_where_eq('test', ('rowid',), [('x',)], ('name',)) == [None]
+    assert db._add('test', ('name', 'val'), [('x', 1.0)]) == [4]
+
+
+def _make_concurrent_db(tmp_path):
+    db = SQLDatabaseController(str(tmp_path), 'concurrent.sqlite3', concurrent=True)
+    db.add_table(
+        'test',
+        (('rowid', 'INTEGER PRIMARY KEY'), ('name', 'TEXT'), ('num', 'INTEGER')),
+        superkeys=[('name',)],
+    )
+    return db
+
+
+def test_concurrent_mode_uses_wal_and_thread_connections(tmp_path):
+    import threading
+
+    db = _make_concurrent_db(tmp_path)
+    assert db.connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(db.connection))
+    thread.start()
+    thread.join()
+    assert connections[0] is not db.connection
+    db.close()
+
+
+def test_concurrent_connections_of_exited_threads_are_closed(tmp_path):
+    import sqlite3
+    import threading
+
+    db = _make_concurrent_db(tmp_path)
+    db._add('test', ('name', 'num'), [('a', 1)])
+    connections = []
+
+    def _read():
+        connections.append(db.connection)
+        assert db.get('test', ('num',), [1]) == [1]
+
+    for _ in range(20):
+        thread = threading.Thread(target=_read)
+        thread.start()
+        thread.join()
+    # Only the connections of the main thread and the last thread are left
+    assert len(db._pool) == 2
+    assert len(db.thread_connections) == 2
+    for connection in connections[:-1]:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute('SELECT 1')
+    assert db.get('test', ('num',), [1]) == [1]
+    db.close()
+
+
+def test_concurrent_reads_during_writes(tmp_path):
+    import threading
+
+    db = _make_concurrent_db(tmp_path)
+    db._add('test', ('name', 'num'), [('a%d' % x, x) for x in range(100)])
+    errors = []
+
+    def _write():
+        try:
+            for chunk in range(20):
+                params = [('b%d_%d' % (chunk, x), x) for x in range(50)]
+                db._add('test', ('name', 'num'), params)
+        except Exception as ex:
+            errors.append(ex)
+
+    def _read():
+        try:
+            for _ in range(20):
+                assert db.get('test', ('num',), range(1, 101)) == list(range(100))
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=_write)]
+    threads += [threading.Thread(target=_read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(db.get_all_rowids('test')) == 1100
+    db.close()
+
+
+def test_busy_retry(tmp_path, monkeypatch):
+    import sqlite3
+    import threading
+
+    monkeypatch.setattr(sql_control, 'CONCURRENT_BUSY_TIMEOUT', 0.01)
+    monkeypatch.setattr(sql_control, 'BUSY_RETRY_DELAY', 0.01)
+    db = _make_concurrent_db(tmp_path)
+    # Hold the write lock from another connection for a moment
+    other = sqlite3.connect(db.fpath, isolation_level=None, check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    timer = threading.Timer(0.2, other.rollback)
+    timer.start()
+    rowids = db._add('test', ('name', 'num'), [('a', 1), ('b', 2)])
+    timer.join()
+    other.close()
+    assert rowids == [1, 2]
+    db.close()
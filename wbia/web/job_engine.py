@@ -60,14 +60,13 @@ import time
 import zmq
 import uuid  # NOQA
 import numpy as np
-import shelve
 import random
 from datetime import datetime, timedelta
 import pytz
 import flask
-from os.path import join, exists, abspath, splitext, basename
 from functools import partial
 from wbia.control import controller_inject
+from wbia.web.job_store import JobStore, get_job_store_fpath
 import threading
 import six
 
@@ -88,17 +87,24 @@ VERBOSE_JOBS = (
     ut.get_argflag('--bg') or ut.get_argflag('--fg') or ut.get_argflag('--verbose-jobs')
 )
 
+# Warm engine workers keep a single controller (and its in-memory caches, like
+# the FLANN indexers in neighbor_index_cache) alive across jobs.  The worker is
+# recycled after a number of jobs, once its resident memory exceeds a ceiling,
+# or when the database schema version changes underneath it.
+ENGINE_WARM_WORKER = ut.get_argflag('--engine-warm')
+ENGINE_RECYCLE_NUM_JOBS = ut.get_argval('--engine-recycle-jobs', type_=int, default=100)
+ENGINE_RECYCLE_RSS_MB = ut.get_argval('--engine-recycle-rss', type_=int, default=16000)
 
-GLOBAL_SHELVE_LOCK = threading.Lock()
+
+# Serializes opening the job store between threads (JobStore.migrate_shelves
+# serializes the migration between processes)
+GLOBAL_JOB_STORE_LOCK = threading.Lock()
 
 
 TIMESTAMP_FMTSTR = '%Y-%m-%d %H:%M:%S %Z'
 TIMESTAMP_TIMEZONE = 'US/Pacific'
 
 
-JOB_STATUS_CACHE = {}
-
-
 def update_proctitle(procname, dbname=None):
     try:
         import setproctitle
@@ -114,28 +120,31 @@ def update_proctitle(procname, dbname=None):
         print('pip install setproctitle')
 
 
-def _get_engine_job_paths(ibs):
-    shelve_path = ibs.get_shelves_path()
-    ut.ensuredir(shelve_path)
-    record_filepath_list = list(ut.iglob(join(shelve_path, '*.pkl')))
-    return record_filepath_list
-
-
-def _get_engine_lock_paths(ibs):
-    shelve_path = ibs.get_shelves_path()
-    ut.ensuredir(shelve_path)
-    lock_filepath_list = list(ut.iglob(join(shelve_path, '*.lock')))
-    return lock_filepath_list
+@register_ibs_method
+def get_job_store(ibs):
+    """
+    Returns the transactional store that holds all job engine records,
+    metadata, and results for this controller.  Any legacy shelve files are
+    migrated into the store the first time it is opened.
+    """
+    store = getattr(ibs, '_job_store', None)
+    if store is None:
+        with GLOBAL_JOB_STORE_LOCK:
+            store = getattr(ibs, '_job_store', None)
+            if store is None:
+                shelve_path = ibs.get_shelves_path()
+                ut.ensuredir(shelve_path)
+                store = JobStore(get_job_store_fpath(shelve_path))
+                store.migrate_shelves(shelve_path)
+                ibs._job_store = store
+    return store
 
 
 @register_ibs_method
 def retry_job(ibs, jobid):
-    shelve_path = ibs.get_shelves_path()
-    job_record_filename = '%s.pkl' % (jobid,)
-    job_record_filepath = join(shelve_path, job_record_filename)
-    assert exists(job_record_filepath)
-
-    job_record = ut.load_cPkl(job_record_filepath)
+    store = ibs.get_job_store()
+    job_record = store.get_record(jobid)
+    assert job_record is not None
 
     job_action = job_record['request']['action']
     job_args = job_record['request']['args']
@@ -199,6 +208,9 @@ def initialize_job_manager(ibs):
     if ut.get_argflag('--web-deterministic-ports'):
         use_static_ports = True
 
+    # Migrate any legacy shelves before the collector and interface use them
+    ibs.get_job_store()
+
     if ut.get_argflag('--fg'):
         ibs.job_manager.reciever = JobBackend(use_static_ports=True)
     else:
@@ -207,12 +219,6 @@ def initialize_job_manager(ibs):
             dbdir=ibs.get_dbdir(), containerized=ibs.containerized,
         )
 
-    # Delete any leftover locks from before
-    lock_filepath_list = _get_engine_lock_paths(ibs)
-    print('Deleting %d leftover engine locks' % (len(lock_filepath_list),))
-    for lock_filepath in lock_filepath_list:
-        ut.delete(lock_filepath)
-
     ibs.job_manager.jobiface = JobInterface(
         0, ibs.job_manager.reciever.port_dict, ibs=ibs
     )
@@ -560,77 +566,6 @@ class JobBackend(object):
                 assert engine.is_alive(), 'engine died too soon'
 
 
-def get_shelve_lock_filepath(shelve_filepath):
-    shelve_lock_filepath = '%s.lock' % (shelve_filepath,)
-    return shelve_lock_filepath
-
-
-def touch_shelve_lock_file(shelve_filepath):
-    shelve_lock_filepath = get_shelve_lock_filepath(shelve_filepath)
-    assert not exists(shelve_lock_filepath)
-    ut.touch(shelve_lock_filepath, verbose=False)
-    assert exists(shelve_lock_filepath)
-
-
-def delete_shelve_lock_file(shelve_filepath):
-    shelve_lock_filepath = get_shelve_lock_filepath(shelve_filepath)
-    assert exists(shelve_lock_filepath)
-    ut.delete(shelve_lock_filepath, verbose=False)
-    assert not exists(shelve_lock_filepath)
-
-
-def wait_for_shelve_lock_file(shelve_filepath, timeout=600):
-    shelve_lock_filepath = get_shelve_lock_filepath(shelve_filepath)
-    start_time = time.time()
-    while exists(shelve_lock_filepath):
-        current_time = time.time()
-        elapsed = current_time - start_time
-        if elapsed >= timeout:
-            return False
-        time.sleep(1)
-        if int(elapsed) % 5 == 0:
-            print('Waiting for %0.02f seconds for lock so far' % (elapsed,))
-    return True
-
-
-def get_shelve_value(shelve_filepath, key):
-    wait_for_shelve_lock_file(shelve_filepath)
-    with GLOBAL_SHELVE_LOCK:
-        wait_for_shelve_lock_file(shelve_filepath)
-        touch_shelve_lock_file(shelve_filepath)
-    value = None
-    try:
-        with shelve.open(shelve_filepath, 'r') as shelf:
-            value = shelf.get(key)
-    except Exception:
-        pass
-    delete_shelve_lock_file(shelve_filepath)
-    return value
-
-
-def set_shelve_value(shelve_filepath, key, value):
-    wait_for_shelve_lock_file(shelve_filepath)
-    with GLOBAL_SHELVE_LOCK:
-        wait_for_shelve_lock_file(shelve_filepath)
-        touch_shelve_lock_file(shelve_filepath)
-    flag = False
-    try:
-        with shelve.open(shelve_filepath) as shelf:
-            shelf[key] = value
-        flag = True
-    except Exception:
-        pass
-    delete_shelve_lock_file(shelve_filepath)
-    return flag
-
-
-def get_shelve_filepaths(ibs, jobid):
-    shelve_path = ibs.get_shelves_path()
-    shelve_input_filepath = abspath(join(shelve_path, '%s.input.shelve' % (jobid,)))
-    shelve_output_filepath = abspath(join(shelve_path, '%s.output.shelve' % (jobid,)))
-    return shelve_input_filepath, shelve_output_filepath
-
-
 class JobInterface(object):
     def __init__(jobiface, id_, port_dict, ibs=None):
         jobiface.id_ = id_
@@ -689,95 +624,44 @@ class JobInterface(object):
             archive_date = now - archive_delta
             archive_timestamp = archive_date.strftime(TIMESTAMP_FMTSTR)
 
-            shelve_path = ibs.get_shelves_path()
-            shelve_path = shelve_path.rstrip('/')
-            shelve_archive_path = '%s_ARCHIVE' % (shelve_path,)
-            ut.ensuredir(shelve_archive_path)
+            store = ibs.get_job_store()
 
-            record_filepath_list = _get_engine_job_paths(ibs)
+            # Completed jobs older than the archive date are moved out of the way
+            archived_jobid_list = store.archive_completed(archive_timestamp)
+            num_archived = len(archived_jobid_list)
+            if num_archived > 0:
+                with ut.Indenter('[client %d] ' % (jobiface.id_)):
+                    print_ = partial(ut.colorprint, color='brightmagenta')
+                    print_('ARCHIVED %d JOBS' % (num_archived,))
 
             restart_jobcounter_list = []
             restart_jobid_list = []
             restart_request_list = []
 
-            completed_jobcounter = 0
-            num_registered, num_archived, num_suppressed, num_corrupted = 0, 0, 0, 0
-            print('Reloading %d engine jobs...' % (len(record_filepath_list),))
-            for record_filepath in tqdm.tqdm(record_filepath_list):
-                jobid = splitext(basename(record_filepath))[0]
-
-                # Load the engine record
-                record = ut.load_cPkl(record_filepath, verbose=False)
-
+            num_suppressed, num_corrupted = 0, 0
+            unfinished_list = list(store.iter_unfinished_records())
+            print('Reloading %d unfinished engine jobs...' % (len(unfinished_list),))
+            for jobid, record, metadata in tqdm.tqdm(unfinished_list):
                 # Load the record info
                 engine_request = record.get('request', None)
                 attempts = record.get('attempts', 0)
-                completed = record.get('completed', False)
 
                 # Check status
                 suppressed = attempts >= MAX_ATTEMPTS
                 corrupted = engine_request is None
 
-                # Load metadata
-                shelve_input_filepath, shelve_output_filepath = get_shelve_filepaths(
-                    ibs, jobid
-                )
-                metadata = get_shelve_value(shelve_input_filepath, 'metadata')
-
                 if metadata is None:
                     print('Missing metadata...corrupted')
                     corrupted = True
 
-                archive_flag = False
                 if not corrupted:
                     jobcounter = metadata.get('jobcounter', None)
-                    times = metadata.get('times', {})
 
                     if jobcounter is None:
                         print('Missing jobcounter...corrupted')
                         corrupted = True
 
-                    job_age = None
-                    if not corrupted and completed:
-                        completed_timestamp = times.get('completed', None)
-                        if completed_timestamp is not None:
-                            try:
-                                archive_elapsed = calculate_timedelta(
-                                    completed_timestamp, archive_timestamp
-                                )
-                                job_age = archive_elapsed[-1]
-                                archive_flag = job_age > 0
-                            except Exception:
-                                args = (
-                                    completed_timestamp,
-                                    archive_timestamp,
-                                )
-                                print(
-                                    '[job_engine] Could not determine archive status!\n\tCompleted: %r\n\tArchive: %r'
-                                    % args
-                                )
-
-                        if archive_flag:
-                            with ut.Indenter('[client %d] ' % (jobiface.id_)):
-                                color = 'brightmagenta'
-                                print_ = partial(ut.colorprint, color=color)
-                                print_('ARCHIVING JOB (AGE: %d SECONDS)' % (job_age,))
-                                job_scr_filepath_list = list(
-                                    ut.iglob(join(shelve_path, '%s*' % (jobid,)))
-                                )
-                                for job_scr_filepath in job_scr_filepath_list:
-                                    job_dst_filepath = job_scr_filepath.replace(
-                                        shelve_path, shelve_archive_path
-                                    )
-                                    ut.copy(
-                                        job_scr_filepath,
-                                        job_dst_filepath,
-                                        overwrite=True,
-                                    )  # ut.copy allows for overwrite, ut.move does not
-                                    ut.delete(job_scr_filepath)
-                            num_archived += 1
-
-                if not archive_flag and True not in [completed, suppressed, corrupted]:
+                if True not in [suppressed, corrupted]:
                     with ut.Indenter('[client %d] ' % (jobiface.id_)):
                         color = 'brightblue' if attempts == 0 else 'brightred'
                         print_ = partial(ut.colorprint, color=color)
@@ -786,8 +670,7 @@ class JobInterface(object):
                             'RESTARTING FAILED JOB FROM RESTART (ATTEMPT %d)'
                             % (attempts + 1,)
                         )
-                        print_(ut.repr3(record_filepath))
-                        # print_(ut.repr3(record))
+                        print_(ut.repr3(jobid))
 
                         times = metadata.get('times', {})
                         received = times['received']
@@ -799,42 +682,23 @@ class JobInterface(object):
                         restart_jobcounter_list.append(jobcounter)
                         restart_jobid_list.append(jobid)
                         restart_request_list.append(engine_request)
-                        record['attempts'] = attempts + 1
-
-                        ut.save_cPkl(record_filepath, record, verbose=False)
-
-                # We may have suppressed this for being corrupted
-                if not archive_flag and True in [completed, suppressed, corrupted]:
-                    if completed:
-                        status = 'completed'
-                    elif suppressed:
+                        store.set_attempts(jobid, attempts + 1)
+                else:
+                    # We may have suppressed this for being corrupted
+                    if suppressed:
                         status = 'suppressed'
                         num_suppressed += 1
                     else:
                         status = 'corrupted'
                         num_corrupted += 1
+                    store.set_status(jobid, status)
 
-                    reply_notify = {
-                        'jobid': jobid,
-                        'status': status,
-                        'action': 'register',
-                    }
-                    jobiface.collect_deal_sock.send_json(reply_notify)
-                    reply = jobiface.collect_deal_sock.recv_json()
-                    # jobcounter_ = reply['jobcounter']
-                    jobid_ = reply['jobid']
-                    # assert jobcounter_ == jobcounter
-                    assert jobid_ == jobid
-                    if not corrupted and jobcounter is not None:
-                        completed_jobcounter = max(completed_jobcounter, jobcounter)
-                    num_registered += 1
-
-            print('Registered %d jobs...' % (num_registered,))
             print('\t %d suppressed jobs' % (num_suppressed,))
             print('\t %d corrupted jobs' % (num_corrupted,))
             print('Archived %d jobs...' % (num_archived,))
 
             # Update the jobcounter to be up to date
+            completed_jobcounter = store.get_max_jobcounter()
             update_notify = {
                 '__set_jobcounter__': completed_jobcounter,
             }
@@ -915,17 +779,8 @@ class JobInterface(object):
 
             ibs = jobiface.ibs
             if ibs is not None:
-                shelve_path = ibs.get_shelves_path()
-                ut.ensuredir(shelve_path)
-
-                record_filename = '%s.pkl' % (jobid,)
-                record_filepath = join(shelve_path, record_filename)
-                record = {
-                    'request': engine_request,
-                    'attempts': 0,
-                    'completed': False,
-                }
-                ut.save_cPkl(record_filepath, record, verbose=False)
+                store = ibs.get_job_store()
+                store.add_record(jobid, engine_request)
 
             # Release memor
             action = None
@@ -1259,6 +1114,8 @@ def engine_queue_loop(port_dict):
                                 'turnaround': None,
                                 'runtime_sec': None,
                                 'turnaround_sec': None,
+                                'startup_mode': None,
+                                'startup_sec': None,
                             },
                         },
                         'action': 'metadata',
@@ -1322,7 +1179,62 @@ def engine_queue_loop(port_dict):
             print('Exiting %s queue' % (loop_name,))
 
 
-def engine_loop(id_, port_dict, dbdir, containerized):
+def _engine_schema_versions(ibs):
+    """ Returns the schema versions a warm engine controller was opened with """
+    return (
+        ibs.db.get_db_version(ensure=False),
+        ibs.staging.get_db_version(ensure=False),
+    )
+
+
+def _engine_recycle_reason(ibs, num_jobs, schema_versions=None):
+    """
+    Checks if a warm engine controller should be released and reopened.
+
+    Args:
+        ibs (IBEISController): the warm controller
+        num_jobs (int): number of jobs served by this controller
+        schema_versions (tuple): versions when the controller was opened, if
+            given the live database is checked for a schema change
+
+    Returns:
+        str: reason for recycling or None if the controller is still good
+    """
+    if ENGINE_RECYCLE_NUM_JOBS > 0 and num_jobs >= ENGINE_RECYCLE_NUM_JOBS:
+        return 'served %d jobs' % (num_jobs,)
+    if ENGINE_RECYCLE_RSS_MB > 0:
+        try:
+            rss_mb = ut.current_memory_usage() / (2.0 ** 20)
+        except ImportError:
+            rss_mb = None
+        if rss_mb is not None and rss_mb >= ENGINE_RECYCLE_RSS_MB:
+            return 'rss=%0.1f MB exceeds %d MB' % (rss_mb, ENGINE_RECYCLE_RSS_MB)
+    if schema_versions is not None:
+        current_versions = _engine_schema_versions(ibs)
+        if current_versions != schema_versions:
+            return 'schema changed from %r to %r' % (schema_versions, current_versions)
+    return None
+
+
+def _engine_release_memory():
+    # Explicitly try to release GPU memory
+    try:
+        import torch
+
+        torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+    # Explicitly release Python memory
+    try:
+        import gc
+
+        gc.collect()
+    except Exception:
+        pass
+
+
+def engine_loop(id_, port_dict, dbdir, containerized, warm=None):
     r"""
     IBEIS:
         This will be part of a worker process with its own IBEISController
@@ -1332,11 +1244,20 @@ def engine_loop(id_, port_dict, dbdir, containerized):
 
     The engine_loop - receives messages, performs some action, and sends a reply,
     preserving the leading two message parts as routing identities
+
+    By default a fresh controller is opened for every job (cold mode).  With
+    ``--engine-warm`` the controller and its caches are kept alive across jobs
+    and only recycled according to ``--engine-recycle-jobs``,
+    ``--engine-recycle-rss`` (in MB) or when the schema version changes.  The
+    startup cost of each job is reported to the collector in either mode.
     """
     # NAME: engine_
     # CALLED_FROM: engine_queue
     import wbia
 
+    if warm is None:
+        warm = ENGINE_WARM_WORKER
+
     # base_print = print  # NOQA
     print = partial(ut.colorprint, color='darkred')
     with ut.Indenter('[engine %d] ' % (id_)):
@@ -1354,16 +1275,43 @@ def engine_loop(id_, port_dict, dbdir, containerized):
 
         if VERBOSE_JOBS:
             print('connect collect_url1 = %r' % (port_dict['collect_url1'],))
-            print('engine is initialized')
+            print('engine is initialized (warm=%r)' % (warm,))
+
+        ibs = None
+        num_jobs = 0
+        schema_versions = None
+        startup_sec = None
 
         try:
             while True:
-                # ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False, force_serial=True)
-                ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False)
-                update_proctitle('engine_loop', dbname=ibs.dbname)
+                if ibs is None:
+                    # Cold start, (re)open the controller
+                    with ut.Timer(verbose=False) as startup_timer:
+                        # ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False, force_serial=True)
+                        ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False)
+                        if warm:
+                            schema_versions = _engine_schema_versions(ibs)
+                    startup_sec = startup_timer.ellapsed
+                    startup_mode = 'cold'
+                    num_jobs = 0
+                    update_proctitle('engine_loop', dbname=ibs.dbname)
 
                 idents, engine_request = rcv_multipart_json(engine_rout_sock, print=print)
 
+                if warm and startup_sec is None:
+                    # Warm start, only verify the schema did not change
+                    with ut.Timer(verbose=False) as startup_timer:
+                        reason = _engine_recycle_reason(ibs, num_jobs, schema_versions)
+                        if reason is not None:
+                            print('Recycling engine controller (%s)' % (reason,))
+                            ibs = None
+                            _engine_release_memory()
+                            ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False)
+                            schema_versions = _engine_schema_versions(ibs)
+                            num_jobs = 0
+                    startup_sec = startup_timer.ellapsed
+                    startup_mode = 'warm' if reason is None else 'cold'
+
                 action = engine_request['action']
                 jobid = engine_request['jobid']
                 args = engine_request['args']
@@ -1371,11 +1319,17 @@ def engine_loop(id_, port_dict, dbdir, containerized):
                 callback_url = engine_request['callback_url']
                 callback_method = engine_request['callback_method']
 
+                print(
+                    'Starting jobid %s with %s controller (startup %0.3f sec.)'
+                    % (jobid, startup_mode, startup_sec)
+                )
+
                 # Notify start working
                 reply_notify = {
                     'jobid': jobid,
                     'status': 'working',
                     'action': 'notification',
+                    'startup': {'mode': startup_mode, 'sec': startup_sec},
                 }
                 collect_deal_sock.send_json(reply_notify)
 
@@ -1420,24 +1374,19 @@ def engine_loop(id_, port_dict, dbdir, containerized):
                 engine_result = None
                 collect_request = None
 
-                # Release the IBEIS controller for each job, hopefully freeing memory
-                ibs = None
-
-                # Explicitly try to release GPU memory
-                try:
-                    import torch
-
-                    torch.cuda.empty_cache()
-                except Exception:
-                    pass
-
-                # Explicitly release Python memory
-                try:
-                    import gc
+                num_jobs += 1
+                startup_sec = None
+                if warm:
+                    # Keep the controller unless it has reached its recycle limits
+                    reason = _engine_recycle_reason(ibs, num_jobs)
+                    if reason is not None:
+                        print('Recycling engine controller (%s)' % (reason,))
+                        ibs = None
+                else:
+                    # Release the IBEIS controller for each job, hopefully freeing memory
+                    ibs = None
 
-                    gc.collect()
-                except Exception:
-                    pass
+                _engine_release_memory()
 
         except KeyboardInterrupt:
             print('Caught ctrl+c in engine loop. Gracefully exiting')
@@ -1498,10 +1447,7 @@ def collector_loop(port_dict, dbdir, containerized):
         ibs = wbia.opendb(dbdir=dbdir, use_cache=False, web=False)
         update_proctitle('collector_loop', dbname=ibs.dbname)
 
-        shelve_path = ibs.get_shelves_path()
-        ut.ensuredir(shelve_path)
-
-        collector_data = {}
+        store = ibs.get_job_store()
 
         try:
             while True:
@@ -1516,11 +1462,7 @@ def collector_loop(port_dict, dbdir, containerized):
                 )
                 try:
                     reply = on_collect_request(
-                        ibs,
-                        collect_request,
-                        collector_data,
-                        shelve_path,
-                        containerized=containerized,
+                        ibs, collect_request, store, containerized=containerized,
                     )
                 except Exception as ex:
                     import traceback
@@ -1554,19 +1496,6 @@ def _timestamp():
     return timestamp
 
 
-def invalidate_global_cache(jobid):
-    global JOB_STATUS_CACHE
-    JOB_STATUS_CACHE.pop(jobid, None)
-
-
-def get_collector_shelve_filepaths(collector_data, jobid):
-    if jobid is None:
-        return None, None
-    shelve_input_filepath = collector_data.get(jobid, {}).get('input', None)
-    shelve_output_filepath = collector_data.get(jobid, {}).get('output', None)
-    return shelve_input_filepath, shelve_output_filepath
-
-
 def convert_to_date(timestamp):
     TIMESTAMP_FMTSTR_ = ' '.join(TIMESTAMP_FMTSTR.split(' ')[:-1])
     timestamp_ = ' '.join(timestamp.split(' ')[:-1])
@@ -1591,9 +1520,7 @@ def calculate_timedelta(start, end):
     return hours, minutes, seconds, total_seconds
 
 
-def on_collect_request(
-    ibs, collect_request, collector_data, shelve_path, containerized=False
-):
+def on_collect_request(ibs, collect_request, store, containerized=False):
     """ Run whenever the collector recieves a message """
     import requests
 
@@ -1606,46 +1533,16 @@ def on_collect_request(
         'jobid': jobid,
     }
 
-    # Ensure we have a collector record for the jobid
-    if jobid is not None:
-        if jobid not in collector_data:
-            collector_data[jobid] = {
-                'status': None,
-                'input': None,
-                'output': None,
-            }
-        runtime_lock_filepath = join(shelve_path, '%s.lock' % (jobid,))
-    else:
-        runtime_lock_filepath = None
-
-    args = get_collector_shelve_filepaths(collector_data, jobid)
-    collector_shelve_input_filepath, collector_shelve_output_filepath = args
-
     if action == 'notification':
-        assert None not in [jobid, runtime_lock_filepath]
-
-        collector_data[jobid]['status'] = status
-
-        print('Notify %s' % ut.repr3(collector_data[jobid]))
-        invalidate_global_cache(jobid)
-
-        if status == 'received':
-            ut.touch(runtime_lock_filepath)
+        assert None not in [jobid]
 
-        if status == 'completed':
-            if exists(runtime_lock_filepath):
-                ut.delete(runtime_lock_filepath)
+        # Marks the engine request as finished when the status is completed
+        store.set_status(jobid, status)
 
-            # Mark the engine request as finished
-            record_filename = '%s.pkl' % (jobid,)
-            record_filepath = join(shelve_path, record_filename)
-            record = ut.load_cPkl(record_filepath, verbose=False)
-            record['completed'] = True
-            ut.save_cPkl(record_filepath, record, verbose=False)
-            record = None
+        print('Notify %s' % ut.repr3({'jobid': jobid, 'status': status}))
 
-        # Update relevant times in the shelf
-        metadata = get_shelve_value(collector_shelve_input_filepath, 'metadata')
+        # Update relevant times in the store
+        metadata = store.get_metadata(jobid)
         if metadata is not None:
             times = metadata.get('times', {})
             times['updated'] = _timestamp()
@@ -1653,6 +1550,12 @@ def on_collect_request(
             if status == 'working':
                 times['started'] = _timestamp()
 
+                # Cold vs. warm engine controller startup for this job
+                startup = collect_request.get('startup', None)
+                if startup is not None:
+                    times['startup_mode'] = startup.get('mode', None)
+                    times['startup_sec'] = startup.get('sec', None)
+
             if status == 'completed':
                 times['completed'] = _timestamp()
 
@@ -1690,51 +1593,21 @@ def on_collect_request(
                 times['turnaround_sec'] = total_seconds
 
             metadata['times'] = times
-            set_shelve_value(collector_shelve_input_filepath, 'metadata', metadata)
+            store.set_metadata(jobid, metadata)
 
             metadata = None  # Release memory
 
-    elif action == 'register':
-        assert None not in [jobid]
-
-        invalidate_global_cache(jobid)
-
-        shelve_input_filepath, shelve_output_filepath = get_shelve_filepaths(ibs, jobid)
-        metadata = get_shelve_value(shelve_input_filepath, 'metadata')
-        engine_result = get_shelve_value(shelve_output_filepath, 'result')
-
-        if status == 'completed':
-            # Ensure we can read the data we expect out of a completed job
-            if None in [metadata, engine_result]:
-                status = 'corrupted'
-
-        collector_data[jobid] = {
-            'status': status,
-            'input': shelve_input_filepath,
-            'output': shelve_output_filepath,
-        }
-        print('Register %s' % ut.repr3(collector_data[jobid]))
-
-        metadata, engine_result = None, None  # Release memory
-
     elif action == 'metadata':
-        invalidate_global_cache(jobid)
-
         # From the Engine
         metadata = collect_request.get('metadata', None)
 
-        shelve_input_filepath, shelve_output_filepath = get_shelve_filepaths(ibs, jobid)
-        collector_data[jobid]['input'] = shelve_input_filepath
-
-        set_shelve_value(shelve_input_filepath, 'metadata', metadata)
+        store.set_metadata(jobid, metadata)
 
-        print('Stored Metadata %s' % ut.repr3(collector_data[jobid]))
+        print('Stored Metadata %s' % ut.repr3({'jobid': jobid}))
 
         metadata = None  # Release memory
 
     elif action == 'store':
-        invalidate_global_cache(jobid)
-
         # From the Engine
         engine_result = collect_request.get('engine_result', None)
         callback_url = collect_request.get('callback_url', None)
@@ -1742,14 +1615,11 @@ def on_collect_request(
 
         # Get the engine result jobid
         jobid = engine_result.get('jobid', jobid)
-        assert jobid in collector_data
-
-        shelve_input_filepath, shelve_output_filepath = get_shelve_filepaths(ibs, jobid)
-        collector_data[jobid]['output'] = shelve_output_filepath
+        assert store.has_job(jobid)
 
-        set_shelve_value(shelve_output_filepath, 'result', engine_result)
+        store.set_result(jobid, engine_result)
 
-        print('Stored Result %s' % ut.repr3(collector_data[jobid]))
+        print('Stored Result %s' % ut.repr3({'jobid': jobid}))
 
         engine_result = None  # Release memory
 
@@ -1804,78 +1674,31 @@ def on_collect_request(
                 print('Callback FAILED!')
 
     elif action == 'job_status':
-        reply['jobstatus'] = collector_data.get(jobid, {}).get('status', 'unknown')
+        jobstatus = store.get_status(jobid)
+        reply['jobstatus'] = 'unknown' if jobstatus is None else jobstatus
 
     elif action == 'job_status_dict':
-        json_result = {}
+        json_result = store.get_status_dict()
 
-        for jobid in collector_data:
-
-            if jobid in JOB_STATUS_CACHE:
-                job_status_data = JOB_STATUS_CACHE.get(jobid, None)
-            else:
-                status = collector_data[jobid]['status']
-
-                shelve_input_filepath, shelve_output_filepath = get_shelve_filepaths(
-                    ibs, jobid
-                )
-                metadata = get_shelve_value(shelve_input_filepath, 'metadata')
-
-                cache = True
-                if metadata is None:
-                    if status in ['corrupted']:
-                        status = 'corrupted'
-                    elif status in ['suppressed']:
-                        status = 'suppressed'
-                    elif status in ['completed']:
-                        status = 'corrupted'
-                    else:
-                        # status = 'pending'
-                        cache = False
-                    metadata = {
-                        'jobcounter': -1,
-                    }
-
-                times = metadata.get('times', {})
-                request = metadata.get('request', {})
-
-                # Support legacy jobs
-                if request is None:
-                    request = {}
-
-                job_status_data = {
-                    'status': status,
-                    'jobcounter': metadata.get('jobcounter', None),
-                    'action': metadata.get('action', None),
-                    'endpoint': request.get('endpoint', None),
-                    'function': request.get('function', None),
-                    'time_received': times.get('received', None),
-                    'time_started': times.get('started', None),
-                    'time_runtime': times.get('runtime', None),
-                    'time_updated': times.get('updated', None),
-                    'time_completed': times.get('completed', None),
-                    'time_turnaround': times.get('turnaround', None),
-                    'time_runtime_sec': times.get('runtime_sec', None),
-                    'time_turnaround_sec': times.get('turnaround_sec', None),
-                }
-                if cache:
-                    JOB_STATUS_CACHE[jobid] = job_status_data
-
-            json_result[jobid] = job_status_data
+        for jobid, job_status_data in json_result.items():
+            if job_status_data['jobcounter'] is None:
+                # Metadata is missing
+                status = job_status_data['status']
+                if status in ['completed']:
+                    job_status_data['status'] = 'corrupted'
+                job_status_data['jobcounter'] = -1
 
         reply['json_result'] = json_result
 
-        metadata = None  # Release memory
-
     elif action == 'job_id_list':
-        reply['jobid_list'] = sorted(list(collector_data.keys()))
+        reply['jobid_list'] = sorted(store.get_jobids())
 
     elif action == 'job_input':
-        if jobid not in collector_data:
+        if not store.has_job(jobid):
             reply['status'] = 'invalid'
             metadata = None
         else:
-            metadata = get_shelve_value(collector_shelve_input_filepath, 'metadata')
+            metadata = store.get_metadata(jobid)
             if metadata is None:
                 reply['status'] = 'corrupted'
 
@@ -1884,13 +1707,13 @@ def on_collect_request(
         metadata = None  # Release memory
 
     elif action == 'job_result':
-        if jobid not in collector_data:
+        if not store.has_job(jobid):
             reply['status'] = 'invalid'
             result = None
         else:
-            status = collector_data[jobid]['status']
+            status = store.get_status(jobid)
 
-            engine_result = get_shelve_value(collector_shelve_output_filepath, 'result')
+            engine_result = store.get_result(jobid)
 
             if engine_result is None:
                 if status in ['corrupted']:
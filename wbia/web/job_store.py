@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+Transactional storage for job engine records, metadata, and results.
+
+All jobs live in a single WAL-mode SQLite database inside the engine shelves
+directory.  The columns needed to report job status are stored explicitly (and
+indexed) so status lookups are single queries, while the request, metadata,
+and result payloads are stored as pickled blobs.
+
+This replaces the previous layout of one ``<jobid>.pkl`` record plus
+``<jobid>.input.shelve`` / ``<jobid>.output.shelve`` files per job, which were
+guarded by lock files.  Existing shelve layouts are migrated once by
+:func:`JobStore.migrate_shelves`.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import utool as ut
+import pickle
+import shelve
+import sqlite3
+import threading
+from os.path import join, exists, splitext, basename
+
+print, rrr, profile = ut.inject2(__name__)
+
+
+JOB_STORE_FNAME = 'engine_jobs.sqlite3'
+JOB_STORE_VERSION = '1'
+
+# Columns of the jobs table that are reported by get_status_dict
+JOB_STATUS_COLUMNS = [
+    ('status', 'TEXT'),
+    ('jobcounter', 'INTEGER'),
+    ('action', 'TEXT'),
+    ('endpoint', 'TEXT'),
+    ('function', 'TEXT'),
+    ('time_received', 'TEXT'),
+    ('time_started', 'TEXT'),
+    ('time_runtime', 'TEXT'),
+    ('time_updated', 'TEXT'),
+    ('time_completed', 'TEXT'),
+    ('time_turnaround', 'TEXT'),
+    ('time_runtime_sec', 'INTEGER'),
+    ('time_turnaround_sec', 'INTEGER'),
+    ('time_startup_mode', 'TEXT'),
+    ('time_startup_sec', 'REAL'),
+]
+
+# Maps metadata['times'] keys to their status column
+TIMES_KEY_TO_COLUMN = {
+    'received': 'time_received',
+    'started': 'time_started',
+    'runtime': 'time_runtime',
+    'updated': 'time_updated',
+    'completed': 'time_completed',
+    'turnaround': 'time_turnaround',
+    'runtime_sec': 'time_runtime_sec',
+    'turnaround_sec': 'time_turnaround_sec',
+    'startup_mode': 'time_startup_mode',
+    'startup_sec': 'time_startup_sec',
+}
+
+JOB_TABLES = ['jobs', 'jobs_archive']
+
+
+def _dumps(obj):
+    if obj is None:
+        return None
+    return sqlite3.Binary(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _loads(blob):
+    if blob is None:
+        return None
+    return pickle.loads(blob)
+
+
+def _completed_date(timestamp):
+    """
+    Strips the timezone from a job timestamp so it sorts lexicographically
+    (see job_engine.convert_to_date)
+    """
+    if timestamp is None:
+        return None
+    return ' '.join(timestamp.split(' ')[:-1])
+
+
+class JobStore(object):
+    """
+    Single-file transactional store for job engine state
+
+    Args:
+        fpath (str): path to the SQLite database file
+        timeout (float): seconds to wait on a locked database
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from wbia.web.job_store import *  # NOQA
+        >>> dpath = ut.ensure_app_resource_dir('wbia', 'tests', 'job_store')
+        >>> fpath = join(dpath, 'test_' + JOB_STORE_FNAME)
+        >>> ut.delete(fpath, verbose=False)
+        >>> store = JobStore(fpath)
+        >>> store.add_record('job1', {'action': 'helloworld'})
+        >>> store.set_status('job1', 'received')
+        >>> metadata = {'jobcounter': 1, 'action': 'helloworld', 'request': {},
+        >>>             'times': {'received': '2020-01-01 00:00:00 PST'}}
+        >>> store.set_metadata('job1', metadata)
+        >>> store.set_result('job1', {'exec_status': 'completed', 'json_result': '1'})
+        >>> store.set_status('job1', 'completed')
+        >>> metadata['times']['completed'] = '2020-01-01 00:05:00 PST'
+        >>> store.set_metadata('job1', metadata)
+        >>> assert store.get_status('job1') == 'completed'
+        >>> assert store.get_status('badjob') is None
+        >>> assert store.get_record('job1')['completed']
+        >>> assert store.get_metadata('job1') == metadata
+        >>> status_dict = store.get_status_dict()
+        >>> result = ut.repr2(ut.dict_subset(status_dict['job1'], ['status', 'jobcounter', 'time_received']))
+        >>> print(result)
+        {'status': 'completed', 'jobcounter': 1, 'time_received': '2020-01-01 00:00:00 PST'}
+        >>> assert store.archive_completed('2020-01-02 00:00:00 PST') == ['job1']
+        >>> assert store.get_jobids() == []
+        >>> store.close()
+    """
+
+    def __init__(store, fpath, timeout=60.0):
+        store.fpath = fpath
+        # The job interface, collector, and engine threads share one process
+        store._lock = threading.RLock()
+        store.connection = sqlite3.connect(
+            fpath, timeout=timeout, check_same_thread=False, isolation_level=None
+        )
+        store.connection.execute('PRAGMA journal_mode = WAL')
+        store.connection.execute('PRAGMA synchronous = NORMAL')
+        store._ensure_schema()
+
+    def __del__(store):
+        store.close()
+
+    def close(store):
+        connection = getattr(store, 'connection', None)
+        if connection is not None:
+            connection.close()
+            store.connection = None
+
+    def _ensure_schema(store):
+        status_coldefs = ', '.join(
+            '%s %s' % (colname, coltype) for colname, coltype in JOB_STATUS_COLUMNS
+        )
+        with store.transaction() as cur:
+            for tablename in JOB_TABLES:
+                cur.execute(
+                    '''
+                    CREATE TABLE IF NOT EXISTS {tablename} (
+                        jobid TEXT PRIMARY KEY,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        completed INTEGER NOT NULL DEFAULT 0,
+                        completed_date TEXT,
+                        {status_coldefs},
+                        request BLOB,
+                        metadata BLOB,
+                        result BLOB
+                    )
+                    '''.format(
+                        tablename=tablename, status_coldefs=status_coldefs
+                    )
+                )
+            cur.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+            cur.execute(
+                'CREATE INDEX IF NOT EXISTS jobs_completed ON jobs (completed, completed_date)'
+            )
+            cur.execute(
+                'CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)'
+            )
+            cur.execute(
+                'INSERT OR IGNORE INTO metadata (key, value) VALUES (?, ?)',
+                ('version', JOB_STORE_VERSION),
+            )
+
+    def transaction(store):
+        return _JobStoreTransaction(store)
+
+    def _query(store, operation, params=()):
+        with store._lock:
+            return store.connection.execute(operation, params).fetchall()
+
+    def _upsert(store, jobid, **colvals):
+        """ Creates the job row if needed and sets the given columns """
+        colnames = sorted(colvals.keys())
+        assignments = ', '.join('%s = ?' % (colname,) for colname in colnames)
+        params = [colvals[colname] for colname in colnames]
+        with store.transaction() as cur:
+            cur.execute('INSERT OR IGNORE INTO jobs (jobid) VALUES (?)', (jobid,))
+            if len(colnames) > 0:
+                cur.execute(
+                    'UPDATE jobs SET %s WHERE jobid = ?' % (assignments,),
+                    params + [jobid],
+                )
+
+    def get_metaval(store, key, default=None):
+        rows = store._query('SELECT value FROM metadata WHERE key = ?', (key,))
+        return rows[0][0] if len(rows) > 0 else default
+
+    def set_metaval(store, key, value):
+        with store.transaction() as cur:
+            cur.execute(
+                'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)', (key, value)
+            )
+
+    # --- Engine records ---
+
+    def add_record(store, jobid, request, attempts=0, completed=False):
+        colvals = {'request': _dumps(request), 'attempts': attempts}
+        if completed:
+            # Never reset the flag, the collector may have finished the job already
+            colvals['completed'] = 1
+        store._upsert(jobid, **colvals)
+
+    def get_record(store, jobid):
+        """
+        Returns:
+            dict: with the keys ``request``, ``attempts`` and ``completed`` or
+                None if the jobid is unknown
+        """
+        rows = store._query(
+            'SELECT request, attempts, completed FROM jobs WHERE jobid = ?', (jobid,)
+        )
+        if len(rows) == 0:
+            return None
+        request, attempts, completed = rows[0]
+        record = {
+            'request': _loads(request),
+            'attempts': attempts,
+            'completed': bool(completed),
+        }
+        return record
+
+    def set_attempts(store, jobid, attempts):
+        store._upsert(jobid, attempts=attempts)
+
+    def iter_unfinished_records(store):
+        """
+        Yields:
+            tuple: (jobid, record, metadata) for every job that is not completed
+        """
+        rows = store._query(
+            'SELECT jobid FROM jobs WHERE completed = 0 ORDER BY jobcounter'
+        )
+        for (jobid,) in rows:
+            yield jobid, store.get_record(jobid), store.get_metadata(jobid)
+
+    # --- Status ---
+
+    def get_status(store, jobid):
+        rows = store._query('SELECT status FROM jobs WHERE jobid = ?', (jobid,))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def set_status(store, jobid, status):
+        colvals = {'status': status}
+        if status == 'completed':
+            colvals['completed'] = 1
+        store._upsert(jobid, **colvals)
+
+    def get_jobids(store):
+        return [jobid for (jobid,) in store._query('SELECT jobid FROM jobs')]
+
+    def has_job(store, jobid):
+        rows = store._query('SELECT 1 FROM jobs WHERE jobid = ?', (jobid,))
+        return len(rows) > 0
+
+    def get_max_jobcounter(store):
+        """ Returns the largest jobcounter of all jobs that will not be restarted """
+        rows = store._query(
+            """
+            SELECT MAX(jobcounter) FROM jobs
+            WHERE completed = 1 OR status IN ('suppressed', 'corrupted')
+            """
+        )
+        jobcounter = rows[0][0] if len(rows) > 0 else None
+        return 0 if jobcounter is None else jobcounter
+
+    def get_status_dict(store):
+        """
+        Returns:
+            dict: mapping from each jobid to its status columns
+        """
+        colnames = [colname for colname, _ in JOB_STATUS_COLUMNS]
+        rows = store._query('SELECT jobid, %s FROM jobs' % (', '.join(colnames),))
+        status_dict = {row[0]: dict(zip(colnames, row[1:])) for row in rows}
+        return status_dict
+
+    # --- Input metadata and output results ---
+
+    def get_metadata(store, jobid):
+        rows = store._query('SELECT metadata FROM jobs WHERE jobid = ?', (jobid,))
+        return _loads(rows[0][0]) if len(rows) > 0 else None
+
+    def set_metadata(store, jobid, metadata):
+        colvals = {'metadata': _dumps(metadata)}
+        if metadata is not None:
+            request = metadata.get('request', None)
+            if request is None:
+                request = {}
+            times = metadata.get('times', {})
+            colvals['jobcounter'] = metadata.get('jobcounter', None)
+            colvals['action'] = metadata.get('action', None)
+            colvals['endpoint'] = request.get('endpoint', None)
+            colvals['function'] = request.get('function', None)
+            for key, colname in TIMES_KEY_TO_COLUMN.items():
+                colvals[colname] = times.get(key, None)
+            colvals['completed_date'] = _completed_date(times.get('completed', None))
+        store._upsert(jobid, **colvals)
+
+    def get_result(store, jobid):
+        rows = store._query('SELECT result FROM jobs WHERE jobid = ?', (jobid,))
+        return _loads(rows[0][0]) if len(rows) > 0 else None
+
+    def set_result(store, jobid, engine_result):
+        store._upsert(jobid, result=_dumps(engine_result))
+
+    # --- Maintenance ---
+
+    def archive_completed(store, archive_timestamp):
+        """
+        Moves completed jobs finished before ``archive_timestamp`` into the
+        archive table.
+
+        Returns:
+            list: the archived jobids
+        """
+        archive_date = _completed_date(archive_timestamp)
+        with store.transaction() as cur:
+            cur.execute(
+                'SELECT jobid FROM jobs WHERE completed = 1 AND completed_date < ?',
+                (archive_date,),
+            )
+            jobid_list = [jobid for (jobid,) in cur.fetchall()]
+            cur.execute(
+                '''
+                INSERT OR REPLACE INTO jobs_archive
+                SELECT * FROM jobs WHERE completed = 1 AND completed_date < ?
+                ''',
+                (archive_date,),
+            )
+            cur.execute(
+                'DELETE FROM jobs WHERE completed = 1 AND completed_date < ?',
+                (archive_date,),
+            )
+        return jobid_list
+
+    def migrate_shelves(store, shelve_path, verbose=True):
+        """
+        One-shot migration of the legacy ``<jobid>.pkl`` record and
+        ``<jobid>.{input,output}.shelve`` layout into the store.
+
+        Checking, migrating, and marking the migration as done happen in one
+        ``BEGIN IMMEDIATE`` transaction, so when several processes open the
+        store at once exactly one of them migrates the jobs.  Migrated files
+        are moved to ``<shelve_path>_MIGRATED`` only after that transaction
+        commits.  Files that are already gone (moved by another process) are
+        skipped, so calling this again is harmless.
+
+        Returns:
+            int: number of migrated jobs
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> from wbia.web.job_store import *  # NOQA
+            >>> import multiprocessing
+            >>> dpath = ut.ensure_app_resource_dir('wbia', 'tests', 'job_store_migrate')
+            >>> shelve_path = join(dpath, 'engine_shelves')
+            >>> ut.delete(dpath, verbose=False)
+            >>> ut.ensuredir(shelve_path)
+            >>> jobid_list = ['job%d' % (index,) for index in range(20)]
+            >>> for jobid in jobid_list:
+            >>>     record = {'request': {'action': jobid}, 'completed': True}
+            >>>     ut.save_cPkl(join(shelve_path, jobid + '.pkl'), record, verbose=False)
+            >>>     with shelve.open(join(shelve_path, jobid + '.input.shelve')) as shelf:
+            >>>         shelf['metadata'] = {'jobcounter': 1, 'times': {}}
+            >>>     lock_fpath = join(shelve_path, jobid + '.input.shelve.lock')
+            >>>     ut.touch(lock_fpath, verbose=False)
+            >>> fpath = get_job_store_fpath(shelve_path)
+            >>> def _migrate(queue):
+            >>>     store = JobStore(fpath)
+            >>>     queue.put(store.migrate_shelves(shelve_path, verbose=False))
+            >>> ctx = multiprocessing.get_context('fork')
+            >>> queue = ctx.Queue()
+            >>> procs = [ctx.Process(target=_migrate, args=(queue,)) for _ in range(4)]
+            >>> for proc in procs:
+            >>>     proc.start()
+            >>> num_list = sorted(queue.get() for _ in procs)
+            >>> for proc in procs:
+            >>>     proc.join()
+            >>> assert all(proc.exitcode == 0 for proc in procs)
+            >>> assert num_list == [0, 0, 0, len(jobid_list)], num_list
+            >>> store = JobStore(fpath)
+            >>> assert sorted(store.get_jobids()) == sorted(jobid_list)
+            >>> assert store.get_record('job3')['request'] == {'action': 'job3'}
+            >>> assert store.get_metadata('job3')['jobcounter'] == 1
+            >>> assert ut.glob(shelve_path, '*.pkl') == []
+            >>> assert ut.glob(shelve_path, '*.lock') == []
+            >>> assert len(ut.glob(shelve_path + '_MIGRATED', '*.pkl')) == len(jobid_list)
+            >>> assert store.migrate_shelves(shelve_path, verbose=False) == 0
+            >>> store.close()
+        """
+        shelve_path = shelve_path.rstrip('/')
+        migrated_path = '%s_MIGRATED' % (shelve_path,)
+        num_migrated = 0
+        # The writes below join this transaction, which also keeps other
+        # processes from migrating until it commits
+        with store.transaction():
+            if store.get_metaval('shelves_migrated', None) is None:
+                num_migrated = store._migrate_shelve_records(shelve_path, verbose)
+                store.set_metaval('shelves_migrated', ut.get_timestamp())
+        store._move_legacy_shelves(shelve_path, migrated_path)
+        if verbose and num_migrated > 0:
+            print('Migrated %d legacy engine jobs' % (num_migrated,))
+        return num_migrated
+
+    def _migrate_shelve_records(store, shelve_path, verbose):
+        record_fpath_list = list(ut.iglob(join(shelve_path, '*.pkl')))
+        if verbose:
+            print('Migrating %d legacy engine jobs...' % (len(record_fpath_list),))
+        num_migrated = 0
+        for record_fpath in ut.ProgIter(
+            record_fpath_list, lbl='migrating jobs', enabled=verbose
+        ):
+            jobid = splitext(basename(record_fpath))[0]
+            try:
+                record = ut.load_cPkl(record_fpath, verbose=False)
+            except Exception:
+                record = {}
+            input_fpath = join(shelve_path, '%s.input.shelve' % (jobid,))
+            output_fpath = join(shelve_path, '%s.output.shelve' % (jobid,))
+            metadata = _read_legacy_shelve_value(input_fpath, 'metadata')
+            engine_result = _read_legacy_shelve_value(output_fpath, 'result')
+
+            completed = record.get('completed', False)
+            if completed:
+                status = 'completed'
+            elif engine_result is not None:
+                status = engine_result.get('exec_status', None)
+            else:
+                # Interrupted, will be restarted by queue_interrupted_jobs
+                status = None
+
+            store.add_record(
+                jobid,
+                record.get('request', None),
+                attempts=record.get('attempts', 0),
+                completed=completed,
+            )
+            store.set_metadata(jobid, metadata)
+            store.set_result(jobid, engine_result)
+            store._upsert(jobid, status=status)
+            num_migrated += 1
+        return num_migrated
+
+    def _move_legacy_shelves(store, shelve_path, migrated_path):
+        legacy_fpath_list = (
+            list(ut.iglob(join(shelve_path, '*.pkl')))
+            + list(ut.iglob(join(shelve_path, '*.shelve*')))
+            + list(ut.iglob(join(shelve_path, '*.lock')))
+        )
+        if len(legacy_fpath_list) == 0:
+            return
+        ut.ensuredir(migrated_path)
+        for legacy_fpath in legacy_fpath_list:
+            if legacy_fpath.endswith('.lock'):
+                ut.delete(legacy_fpath, verbose=False)
+            elif not ut.move(legacy_fpath, migrated_path, verbose=False):
+                # Another process may have moved the file first
+                if exists(legacy_fpath):
+                    print('[job_store] failed to move %r' % (legacy_fpath,))
+
+
+class _JobStoreTransaction(object):
+    """ Context manager for a single BEGIN IMMEDIATE ... COMMIT transaction """
+
+    def __init__(self, store):
+        self.store = store
+        self.cur = None
+        self.owns_transaction = False
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        self.cur = self.store.connection.cursor()
+        # A nested transaction joins the one that is already open
+        self.owns_transaction = not self.store.connection.in_transaction
+        if self.owns_transaction:
+            self.cur.execute('BEGIN IMMEDIATE')
+        return self.cur
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        try:
+            if not self.owns_transaction:
+                pass
+            elif exc_type is None:
+                self.cur.execute('COMMIT')
+            else:
+                self.cur.execute('ROLLBACK')
+        finally:
+            self.cur.close()
+            self.cur = None
+            self.store._lock.release()
+
+
+def _read_legacy_shelve_value(shelve_fpath, key):
+    value = None
+    candidates = [shelve_fpath, shelve_fpath + '.db', shelve_fpath + '.dat']
+    if not any(exists(fpath) for fpath in candidates):
+        return value
+    try:
+        with shelve.open(shelve_fpath, 'r') as shelf:
+            value = shelf.get(key)
+    except Exception:
+        pass
+    return value
+
+
+def get_job_store_fpath(shelve_path):
+    return join(shelve_path, JOB_STORE_FNAME)
@@ -56,6 +56,11 @@ PROMETHEUS_DATA = {
         'Number of turnaround seconds for the current working job',
         ['name', 'endpoint'],
     ),
+    'startup': Gauge(
+        'wbia_startup_seconds',
+        'Number of engine controller startup seconds for the most recent job',
+        ['name', 'endpoint', 'mode'],
+    ),
     'api': Counter('wbia_api_counter', 'Number of calls per IBEIS API', ['name', 'tag'],),
     'route': Counter(
         'wbia_route_counter', 'Number of calls per IBEIS route endpoint', ['name', 'tag'],
@@ -302,6 +307,23 @@ def prometheus_update(ibs, *args, **kwargs):
                     except Exception:
                         pass
 
+                    try:
+                        startup_sec = job_status.get('time_startup_sec', None)
+                        startup_mode = job_status.get('time_startup_mode', None)
+                        if (
+                            startup_sec is not None
+                            and 'startup' not in PROMETHUS_JOB_CACHE_DICT[job_uuid]
+                        ):
+                            PROMETHUS_JOB_CACHE_DICT[job_uuid]['startup'] = startup_sec
+                            PROMETHEUS_DATA['startup'].labels(
+                                name=container_name, endpoint=endpoint, mode=startup_mode
+                            ).set(startup_sec)
+                            PROMETHEUS_DATA['startup'].labels(
+                                name=container_name, endpoint='*', mode=startup_mode
+                            ).set(startup_sec)
+                    except Exception:
+                        pass
+
                 try:
                     if working_endpoint is None:
                         PROMETHEUS_DATA['elapsed'].labels(